@@ -13,56 +13,257 @@
 # limitations under the License.
 
 import datetime
+import json
 import logging
 import os
 import posixpath
 import subprocess
 import tarfile
+import threading
 
+from perfkitbenchmarker import background_tasks
 from perfkitbenchmarker.providers.aws.util import AWS_PATH
 
+# Name of the file in the run directory that records which files have been
+# archived in chunks. It is not archived itself.
+MANIFEST_FILE_NAME = 'archive_manifest.json'
+_MANIFEST_VERSION = 1
+
+
+def _GetCopyCommand(source, target_bucket, object_name, gsutil_path,
+                    aws_path):
+  """Returns the command that copies source ('-' for stdin) to a bucket."""
+  prefix_len = 5
+  prefixes = {
+      's3://': [aws_path, 's3', 'cp'],
+      'gs://': [gsutil_path, 'cp']
+  }
+
+  assert all(len(key) == prefix_len for key in prefixes), prefixes
+
+  try:
+    return (prefixes[target_bucket[:prefix_len]] +
+            [source, posixpath.join(target_bucket, object_name)])
+  except KeyError:
+    raise ValueError('Unsupported bucket name: {0}'.format(target_bucket))
+
+
+def _StreamTarball(cmd, paths, recursive=False):
+  """Streams a gzipped tarball of paths to the stdin of cmd.
+
+  Args:
+    cmd: list of strings. Command that reads the tarball from stdin.
+    paths: list of (path, name in the archive) tuples.
+    recursive: bool. Whether to add the contents of directories.
+
+  Raises:
+    subprocess.CalledProcessError: If cmd fails.
+  """
+  p = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+
+  with p.stdin:
+    with tarfile.open(mode='w:gz', fileobj=p.stdin) as tar:
+      for path, arcname in paths:
+        tar.add(path, arcname, recursive=recursive)
+
+  status = p.wait()
+  if status:
+    raise subprocess.CalledProcessError(status, cmd)
+
 
 def ArchiveRun(run_temp_directory, target_bucket,
                prefix='',
                gsutil_path='gsutil',
-               aws_path=AWS_PATH):
+               aws_path=AWS_PATH,
+               chunk_size=None,
+               max_concurrency=1):
   """Archive a run directory to GCS or S3.
 
+  By default the directory is streamed to the bucket as a single gzipped
+  tarball. If chunk_size is set, it is archived in chunks instead (see
+  _ArchiveRunInChunks).
+
   Args:
     run_temp_directory: str. directory to archive.
     target_bucket: str. Either a gs:// or s3:// path to an extant bucket.
     prefix: str. prefix for the file.
     gsutil_path: str. Path to the gsutil tool.
     aws_path: str. Path to the aws command line tool.
+    chunk_size: int. If set, the approximate number of bytes of files in each
+        chunk.
+    max_concurrency: int. The number of chunks compressed and uploaded at the
+        same time.
   """
   if not os.path.isdir(run_temp_directory):
     raise ValueError('{0} is not a directory.'.format(run_temp_directory))
 
+  if chunk_size:
+    _ArchiveRunInChunks(run_temp_directory, target_bucket, prefix,
+                        gsutil_path, aws_path, chunk_size, max_concurrency)
+    return
+
   tar_file_name = '{}{}.tar.gz'.format(
       prefix, datetime.datetime.now().strftime('%Y%m%d%H%M%S'))
+  cmd = _GetCopyCommand('-', target_bucket, tar_file_name, gsutil_path,
+                        aws_path)
 
-  prefix_len = 5
-  prefixes = {
-      's3://': [aws_path, 's3', 'cp'],
-      'gs://': [gsutil_path, 'cp']
-  }
+  logging.info('Streaming %s to %s\n%s', run_temp_directory, tar_file_name,
+               ' '.join(cmd))
+  _StreamTarball(
+      cmd, [(run_temp_directory, os.path.basename(run_temp_directory))],
+      recursive=True)
 
-  assert all(len(key) == prefix_len for key in prefixes), prefixes
 
-  try:
-    cmd = (prefixes[target_bucket[:prefix_len]] +
-           ['-', posixpath.join(target_bucket, tar_file_name)])
-  except KeyError:
-    raise ValueError('Unsupported bucket name: {0}'.format(target_bucket))
+class _Manifest(object):
+  """Records the archived version of each file in a run directory.
 
-  logging.info('Streaming %s to %s\n%s', run_temp_directory, tar_file_name,
-               ' '.join(cmd))
-  p = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+  Attributes:
+    destination: string. Bucket path that the chunks were uploaded to.
+    files: dict mapping the path of each archived file, relative to the run
+        directory, to a dict with its 'size' and 'mtime' when it was archived
+        and the name of the 'chunk' that holds it.
+  """
 
-  with p.stdin:
-    with tarfile.open(mode='w:gz', fileobj=p.stdin) as tar:
-      tar.add(run_temp_directory, os.path.basename(run_temp_directory))
+  def __init__(self, path, destination):
+    self._path = path
+    self._lock = threading.Lock()
+    self.destination = destination
+    self.files = {}
+    try:
+      with open(path) as fp:
+        contents = json.load(fp)
+    except (IOError, ValueError):
+      return
+    if (contents.get('version') == _MANIFEST_VERSION and
+        contents.get('destination') == destination):
+      self.files = contents['files']
+    else:
+      logging.info('Ignoring %s, which was written for a different archive.',
+                   path)
 
-  status = p.wait()
-  if status:
-    raise subprocess.CalledProcessError(status, cmd)
+  def IsArchived(self, relative_path, stat):
+    entry = self.files.get(relative_path)
+    return bool(entry and entry['size'] == stat.st_size and
+                entry['mtime'] == stat.st_mtime)
+
+  def AddChunk(self, chunk_name, files):
+    """Records that a chunk was uploaded and saves the manifest.
+
+    Args:
+      chunk_name: string. Name of the uploaded chunk.
+      files: list of (relative path, os.stat_result) tuples of the files in
+          the chunk, as they were when the chunk was created.
+    """
+    with self._lock:
+      for relative_path, stat in files:
+        self.files[relative_path] = {'size': stat.st_size,
+                                     'mtime': stat.st_mtime,
+                                     'chunk': chunk_name}
+      self.Save()
+
+  def Save(self):
+    # Written to a temporary file first, so that an interrupted write leaves
+    # the previous manifest intact.
+    temp_path = self._path + '.tmp'
+    with open(temp_path, 'w') as fp:
+      json.dump({'version': _MANIFEST_VERSION,
+                 'destination': self.destination,
+                 'files': self.files}, fp, indent=1, sort_keys=True)
+    os.rename(temp_path, self._path)
+
+
+def _ListFiles(directory):
+  """Returns (relative path, os.stat_result) tuples of the files to archive."""
+  files = []
+  for dirpath, dirnames, filenames in os.walk(directory):
+    dirnames.sort()
+    for filename in sorted(filenames):
+      path = os.path.join(dirpath, filename)
+      relative_path = os.path.relpath(path, directory)
+      if relative_path in (MANIFEST_FILE_NAME, MANIFEST_FILE_NAME + '.tmp'):
+        continue
+      try:
+        stat = os.lstat(path)
+      except OSError:
+        continue  # Removed while listing.
+      files.append((relative_path, stat))
+  return files
+
+
+def _GroupIntoChunks(files, chunk_size):
+  """Splits files into lists holding about chunk_size bytes each.
+
+  Files larger than chunk_size are in a chunk of their own.
+  """
+  chunks = []
+  current_chunk = []
+  current_size = 0
+  for relative_path, stat in files:
+    if current_chunk and current_size + stat.st_size > chunk_size:
+      chunks.append(current_chunk)
+      current_chunk = []
+      current_size = 0
+    current_chunk.append((relative_path, stat))
+    current_size += stat.st_size
+  if current_chunk:
+    chunks.append(current_chunk)
+  return chunks
+
+
+def _ArchiveRunInChunks(run_temp_directory, target_bucket, prefix, gsutil_path,
+                        aws_path, chunk_size, max_concurrency):
+  """Archive a run directory as gzipped tarball chunks, uploaded in parallel.
+
+  Chunks are uploaded to '<prefix>archive/' in the bucket and together hold
+  the same paths as the single tarball that ArchiveRun uploads by default.
+  Each chunk is compressed in its own thread and streamed to its own
+  gsutil/aws process.
+
+  A manifest in the run directory records the size and modification time of
+  every file that has been uploaded. Files that are unchanged since they were
+  uploaded are skipped, so archiving the same run again, e.g. after later
+  stages or after an interrupted archive, only uploads new and changed files.
+  The manifest is also uploaded, to map each file to the chunk holding its
+  latest version.
+
+  Raises:
+    errors.VmUtil.ThreadException: If any chunk could not be uploaded. The
+        other chunks are still uploaded and recorded in the manifest.
+  """
+  archive_dir = '{0}archive'.format(prefix)
+  manifest_path = os.path.join(run_temp_directory, MANIFEST_FILE_NAME)
+  manifest = _Manifest(manifest_path,
+                       posixpath.join(target_bucket, archive_dir))
+  files = _ListFiles(run_temp_directory)
+  to_archive = [(relative_path, stat) for relative_path, stat in files
+                if not manifest.IsArchived(relative_path, stat)]
+  logging.info('Archiving %s of %s files in %s to %s.', len(to_archive),
+               len(files), run_temp_directory, manifest.destination)
+  if not to_archive:
+    return
+
+  timestamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+  base_name = os.path.basename(run_temp_directory)
+  chunks = _GroupIntoChunks(to_archive, chunk_size)
+
+  def UploadChunk(index):
+    chunk = chunks[index]
+    chunk_name = '{0}-{1:05d}.tar.gz'.format(timestamp, index)
+    cmd = _GetCopyCommand('-', target_bucket,
+                          posixpath.join(archive_dir, chunk_name),
+                          gsutil_path, aws_path)
+    logging.info('Streaming %s files to %s', len(chunk), chunk_name)
+    _StreamTarball(cmd, [(os.path.join(run_temp_directory, relative_path),
+                          os.path.join(base_name, relative_path))
+                         for relative_path, _ in chunk])
+    manifest.AddChunk(chunk_name, chunk)
+
+  try:
+    background_tasks.RunThreaded(UploadChunk, range(len(chunks)),
+                                 max_concurrent_threads=max_concurrency)
+  finally:
+    cmd = _GetCopyCommand(manifest_path, target_bucket,
+                          posixpath.join(archive_dir, MANIFEST_FILE_NAME),
+                          gsutil_path, aws_path)
+    if os.path.isfile(manifest_path) and subprocess.call(cmd):
+      logging.warning('Could not upload %s.', manifest_path)
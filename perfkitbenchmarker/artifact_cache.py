@@ -0,0 +1,286 @@
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Cache of downloaded artifacts and their distribution to VMs.
+
+Fetch downloads a URL once to --package_cache_dir on the machine running PKB.
+Downloads are stored by the SHA-256 of their contents, and a small index maps
+each URL to the hash of its download, so the same URL is only downloaded once
+across runs and two URLs serving the same file share one copy.
+
+Stage copies a cached artifact or any other local file to a staging directory
+on a VM. By default every VM gets its copy from the machine running PKB. With
+--artifact_distribution=peer, VMs of the same benchmark that already hold the
+file also serve it to other VMs with scp, so the number of copies of a file
+doubles each round instead of all of them being uploaded by PKB. Each holder,
+including PKB itself, serves at most --artifact_fanout copies at a time. A
+failed copy from a peer is retried from PKB.
+"""
+
+import hashlib
+import logging
+import os
+import posixpath
+import threading
+import urlparse
+
+from perfkitbenchmarker import context
+from perfkitbenchmarker import errors
+from perfkitbenchmarker import flags
+from perfkitbenchmarker import os_types
+from perfkitbenchmarker import vm_util
+
+FLAGS = flags.FLAGS
+
+CONTROLLER = 'controller'
+PEER = 'peer'
+
+flags.DEFINE_string('package_cache_dir', None,
+                    'If set, a directory on the machine running PKB where '
+                    'tarballs and other files that packages download are '
+                    'cached. Each file is downloaded once and copied to the '
+                    'VMs that need it instead of every VM downloading it.')
+flags.DEFINE_enum('artifact_distribution', CONTROLLER, [CONTROLLER, PEER],
+                  'How cached packages and data files are copied to VMs. '
+                  '"controller" copies them to every VM from the machine '
+                  'running PKB. "peer" also lets VMs that already hold a file '
+                  'copy it to other VMs, so that it spreads in a tree.')
+flags.DEFINE_integer('artifact_fanout', 2,
+                     'With --artifact_distribution=peer, the number of copies '
+                     'of a file that the machine running PKB and each VM '
+                     'holding it serve at the same time.', lower_bound=1)
+
+# Directory on the VMs holding staged files, by hash.
+STAGING_DIR = posixpath.join(vm_util.VM_TMP_DIR, 'artifacts')
+
+_url_locks = {}
+_url_locks_lock = threading.Lock()
+_file_hashes = {}
+_file_hashes_lock = threading.Lock()
+
+
+def _HashFile(path):
+  """Returns the SHA-256 of a local file, hashing each version only once."""
+  stat = os.stat(path)
+  key = path, stat.st_size, stat.st_mtime
+  with _file_hashes_lock:
+    if key in _file_hashes:
+      return _file_hashes[key]
+  sha256 = hashlib.sha256()
+  with open(path, 'rb') as fp:
+    for block in iter(lambda: fp.read(1 << 20), b''):
+      sha256.update(block)
+  with _file_hashes_lock:
+    _file_hashes[key] = sha256.hexdigest()
+  return _file_hashes[key]
+
+
+def GetUrlName(url):
+  """Returns the file name at the end of the path of a URL."""
+  return posixpath.basename(urlparse.urlparse(url).path) or 'index'
+
+
+def Fetch(url, sha256=None):
+  """Downloads a URL to --package_cache_dir, unless it is already there.
+
+  Args:
+    url: string. URL to download.
+    sha256: string. If set, the expected SHA-256 of the download. A cached
+        download of the URL with a different hash is downloaded again.
+
+  Returns:
+    The path of the cached file.
+
+  Raises:
+    errors.Error: If the download doesn't match sha256.
+  """
+  cache_dir = FLAGS.package_cache_dir
+  url_path = os.path.join(cache_dir, 'urls',
+                          hashlib.sha1(url).hexdigest())
+  with _url_locks_lock:
+    lock = _url_locks.setdefault(url, threading.Lock())
+  with lock:
+    if os.path.exists(url_path):
+      with open(url_path) as fp:
+        cached_sha256 = fp.read().strip()
+      blob_path = os.path.join(cache_dir, 'sha256', cached_sha256)
+      if os.path.exists(blob_path) and sha256 in (None, cached_sha256):
+        return blob_path
+    for directory in ('urls', 'sha256', 'tmp'):
+      if not os.path.isdir(os.path.join(cache_dir, directory)):
+        os.makedirs(os.path.join(cache_dir, directory))
+    temp_path = os.path.join(cache_dir, 'tmp', os.path.basename(url_path))
+    logging.info('Downloading %s to %s.', url, cache_dir)
+    vm_util.IssueRetryableCommand(['curl', '-fsSL', '-o', temp_path, url])
+    downloaded_sha256 = _HashFile(temp_path)
+    if sha256 is not None and downloaded_sha256 != sha256:
+      os.remove(temp_path)
+      raise errors.Error('{0} has SHA-256 {1}, expected {2}.'.format(
+          url, downloaded_sha256, sha256))
+    blob_path = os.path.join(cache_dir, 'sha256', downloaded_sha256)
+    os.rename(temp_path, blob_path)
+    with open(url_path + '.tmp', 'w') as fp:
+      fp.write(downloaded_sha256)
+    os.rename(url_path + '.tmp', url_path)
+    return blob_path
+
+
+class _StagedFile(object):
+  """The VMs holding a staged file and the copies they are serving.
+
+  Attributes:
+    holders: list of VMs holding the file, in the order they got it.
+    serving: dict mapping each source (a VM or CONTROLLER) to the number of
+        copies it is serving.
+  """
+
+  def __init__(self):
+    self.holders = []
+    self.serving = {}
+
+
+class Distributor(object):
+  """Tracks which VMs hold staged files, to copy them between VMs."""
+
+  def __init__(self):
+    self._files = {}
+    self._condition = threading.Condition()
+
+  def __getstate__(self):
+    return {'_files': self._files}
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self._condition = threading.Condition()
+
+  def _AcquireSource(self, staged, use_peers):
+    """Waits for a source that can serve a copy of a file and returns it.
+
+    Must be called while holding self._condition. Sources serving the fewest
+    copies are preferred, and VMs are preferred over PKB.
+    """
+    while True:
+      sources = list(staged.holders) if use_peers else []
+      sources.append(CONTROLLER)
+      limit = FLAGS.artifact_fanout if use_peers else None
+      for source in sorted(sources, key=lambda s: staged.serving.get(s, 0)):
+        if limit is None or staged.serving.get(source, 0) < limit:
+          staged.serving[source] = staged.serving.get(source, 0) + 1
+          return source
+      self._condition.wait()
+
+  def Stage(self, vm, local_path, staging_path, key):
+    """Copies a local file to a VM, unless the VM already holds it.
+
+    Args:
+      vm: BaseVirtualMachine. The VM to copy the file to.
+      local_path: string. Path of the file on the machine running PKB.
+      staging_path: string. Path of the file on the VM.
+      key: hashable. Identifies the contents of the file.
+    """
+    use_peers = (FLAGS.artifact_distribution == PEER and
+                 vm.OS_TYPE in os_types.LINUX_OS_TYPES)
+    with self._condition:
+      staged = self._files.setdefault(key, _StagedFile())
+      if vm in staged.holders:
+        return
+      source = self._AcquireSource(staged, use_peers)
+    holder = None
+    try:
+      vm.RemoteCommand('mkdir -p {0}'.format(posixpath.dirname(staging_path)))
+      if source is not CONTROLLER:
+        try:
+          source.MoveFile(vm, staging_path, staging_path)
+        except errors.VirtualMachine.RemoteCommandError as e:
+          logging.warning('Copying %s from %s to %s failed, copying it from '
+                          'PKB instead: %s', staging_path, source, vm, e)
+          source = self._Release(staged, source, next_source=CONTROLLER)
+      if source is CONTROLLER:
+        vm.RemoteCopy(local_path, staging_path)
+      holder = vm
+    finally:
+      self._Release(staged, source, holder=holder)
+
+  def _Release(self, staged, source, next_source=None, holder=None):
+    """Marks a copy from a source as finished.
+
+    Args:
+      staged: _StagedFile.
+      source: the source that served the copy.
+      next_source: if set, a source that serves the copy instead.
+      holder: if set, a VM that now holds the file.
+
+    Returns:
+      next_source.
+    """
+    with self._condition:
+      staged.serving[source] -= 1
+      if next_source is not None:
+        staged.serving[next_source] = staged.serving.get(next_source, 0) + 1
+      if holder is not None and holder not in staged.holders:
+        staged.holders.append(holder)
+      self._condition.notify_all()
+    return next_source
+
+
+def _GetDistributor():
+  spec = context.GetThreadBenchmarkSpec()
+  return getattr(spec, 'artifact_distributor', None)
+
+
+def Stage(vm, local_path, name):
+  """Copies a local file to the staging directory of a VM.
+
+  Files are staged once per VM. With --artifact_distribution=peer, they may be
+  copied from other VMs of the benchmark that already hold them.
+
+  Args:
+    vm: BaseVirtualMachine. The VM to copy the file to.
+    local_path: string. Path of the file on the machine running PKB.
+    name: string. Name of the file on the VM.
+
+  Returns:
+    The path of the staged file on the VM.
+  """
+  sha256 = _HashFile(local_path)
+  staging_path = posixpath.join(STAGING_DIR, sha256, name)
+  distributor = _GetDistributor()
+  if distributor is None:
+    vm.RemoteCommand('mkdir -p {0}'.format(posixpath.dirname(staging_path)))
+    vm.RemoteCopy(local_path, staging_path)
+  else:
+    distributor.Stage(vm, local_path, staging_path, (sha256, name))
+  return staging_path
+
+
+def PushFile(vm, local_path, remote_path=''):
+  """Copies a local file to a VM, from a peer if possible.
+
+  With --artifact_distribution=peer, regular files are staged on Linux VMs and
+  then copied to remote_path on the VM. Otherwise this is the same as
+  vm.RemoteCopy.
+
+  Args:
+    vm: BaseVirtualMachine. The VM to copy the file to.
+    local_path: string. Path of the file or directory on the machine running
+        PKB.
+    remote_path: string. The destination of the file on the VM, default is
+        the home directory.
+  """
+  if (FLAGS.artifact_distribution != PEER or
+      vm.OS_TYPE not in os_types.LINUX_OS_TYPES or
+      not os.path.isfile(local_path) or _GetDistributor() is None):
+    vm.RemoteCopy(local_path, remote_path)
+    return
+  staging_path = Stage(vm, local_path, os.path.basename(local_path))
+  vm.RemoteCommand('cp -p {0} {1}'.format(staging_path, remote_path or '.'))
@@ -17,6 +17,7 @@
 import contextlib
 import copy
 import copy_reg
+import functools
 import logging
 import os
 import pickle
@@ -24,7 +25,9 @@ import thread
 import threading
 import uuid
 
+from perfkitbenchmarker import artifact_cache
 from perfkitbenchmarker import benchmark_status
+from perfkitbenchmarker import command_tasks
 from perfkitbenchmarker import context
 from perfkitbenchmarker import disk
 from perfkitbenchmarker import dpb_service
@@ -33,7 +36,11 @@ from perfkitbenchmarker import flags
 from perfkitbenchmarker import os_types
 from perfkitbenchmarker import provider_info
 from perfkitbenchmarker import providers
+from perfkitbenchmarker import remote_agent
+from perfkitbenchmarker import resource_graph
+from perfkitbenchmarker import retry_policy
 from perfkitbenchmarker import spark_service
+from perfkitbenchmarker import ssh_connection_pool
 from perfkitbenchmarker import stages
 from perfkitbenchmarker import static_virtual_machine as static_vm
 from perfkitbenchmarker import virtual_machine
@@ -110,6 +117,11 @@ class BenchmarkSpec(object):
     self.always_call_cleanup = False
     self.spark_service = None
     self.dpb_service = None
+    # Samples describing the critical path of resource creation.
+    self.provisioning_samples = []
+    # Counts the tries of functions wrapped by vm_util.Retry.
+    self.retry_stats = retry_policy.RetryStats()
+    self.artifact_distributor = artifact_cache.Distributor()
 
     self._zone_index = 0
 
@@ -298,30 +310,40 @@ class BenchmarkSpec(object):
 
   def Provision(self):
     """Prepares the VMs and networks necessary for the benchmark to run."""
-    # Sort networks into a guaranteed order of creation based on dict key.
-    # There is a finite limit on the number of threads that are created to
-    # provision networks. Until support is added to provision resources in an
-    # order based on dependencies, this key ordering can be used to avoid
-    # deadlock by placing dependent networks later and their dependencies
-    # earlier. As an example, AWS stores both per-region and per-zone objects
-    # in this dict, and each per-zone object depends on a corresponding
-    # per-region object, so the per-region objects are given keys that come
-    # first when sorted.
-    networks = [self.networks[key] for key in sorted(self.networks.iterkeys())]
-    vm_util.RunThreaded(lambda net: net.Create(), networks)
+    graph = resource_graph.ResourceGraph()
+    # Resources that do not depend on each other are created in the order
+    # they are added, so keep the network order stable.
+    for key in sorted(self.networks.iterkeys()):
+      graph.AddResource(self.networks[key], self.networks[key].Create,
+                        'network %s' % ':'.join(str(part) for part in key),
+                        resource_graph.NETWORK)
+    for vm in self.vms:
+      graph.AddResource(vm, functools.partial(self.PrepareVm, vm), vm.name,
+                        resource_graph.VM)
+    if self.spark_service:
+      graph.AddResource(self.spark_service, self.spark_service.Create,
+                        'spark_service', resource_graph.SPARK_SERVICE)
+    if self.dpb_service:
+      graph.AddResource(self.dpb_service, self.dpb_service.Create,
+                        'dpb_service', resource_graph.DPB_SERVICE)
+    try:
+      graph.Create()
+    finally:
+      self.provisioning_samples = graph.GenerateSamples()
 
     if self.vms:
-      vm_util.RunThreaded(self.PrepareVm, self.vms)
       sshable_vms = [vm for vm in self.vms if vm.OS_TYPE != os_types.WINDOWS]
       sshable_vm_groups = {}
       for group_name, group_vms in self.vm_groups.iteritems():
         sshable_vm_groups[group_name] = [vm for vm in group_vms
                                          if vm.OS_TYPE != os_types.WINDOWS]
       vm_util.GenerateSSHConfig(sshable_vms, sshable_vm_groups)
-    if self.spark_service:
-      self.spark_service.Create()
-    if self.dpb_service:
-      self.dpb_service.Create()
+      # Retire any pooled SSH connection that did not survive provisioning
+      # (e.g. because the VM rebooted) before the benchmark starts using them.
+      pools = ssh_connection_pool.GetPools(sshable_vms)
+      if pools:
+        command_tasks.RunMultiplexed(
+            lambda pool: pool.CheckHealthTask(), pools)
 
   def Delete(self):
     if self.deleted:
@@ -427,6 +449,10 @@ class BenchmarkSpec(object):
     """
     if vm.is_static and vm.install_packages:
       vm.PackageCleanup()
+    for agent in remote_agent.GetAgents([vm]):
+      agent.Close()
+    for pool in ssh_connection_pool.GetPools([vm]):
+      pool.Close()
     vm.Delete()
     vm.DeleteScratchDisks()
 
@@ -0,0 +1,233 @@
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Copies many files to or from VMs as a single tar stream.
+
+scp pays a round trip per file, so copying trees of small files to or from a
+distant VM is slow. SendTarball and ReceiveTarball instead stream a tarball,
+optionally gzipped, through the stdin or stdout of a single command, usually
+ssh running tar on the VM. They back the PushFiles and PullFiles methods of
+Linux VMs, and PushToVms and PullFromVms run those on many VMs at once.
+
+With --bulk_copy_max_mbps, all tar streams together are limited to that
+bandwidth, so copying to many VMs at once doesn't saturate the link of the
+machine running PKB.
+"""
+
+import os
+import posixpath
+import subprocess
+import tarfile
+import tempfile
+import threading
+import time
+
+from perfkitbenchmarker import errors
+from perfkitbenchmarker import flags
+from perfkitbenchmarker import vm_util
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_float('bulk_copy_max_mbps', None,
+                   'If set, the combined bandwidth in megabits per second of '
+                   'all files copied to or from VMs with PushFiles and '
+                   'PullFiles.', lower_bound=0.001)
+
+# The size of the blocks read from tar streams.
+_BLOCK_SIZE = 1 << 16
+
+
+class _Throttle(object):
+  """A token bucket of bytes, shared by all tar streams.
+
+  Attributes:
+    rate: float. Bytes per second.
+  """
+
+  def __init__(self, rate):
+    self.rate = float(rate)
+    self._next_time = time.time()
+    self._lock = threading.Lock()
+
+  def Acquire(self, num_bytes):
+    """Waits until num_bytes may be transferred."""
+    with self._lock:
+      now = time.time()
+      # Allow a burst of up to a second of unused bandwidth.
+      start = max(self._next_time, now - 1)
+      self._next_time = start + num_bytes / self.rate
+      wait_time = self._next_time - now
+    if wait_time > 0:
+      time.sleep(wait_time)
+
+
+_throttle = None
+_throttle_lock = threading.Lock()
+
+
+def _GetThrottle():
+  """Returns the _Throttle shared by all streams, or None if not limited."""
+  global _throttle
+  if not FLAGS.bulk_copy_max_mbps:
+    return None
+  rate = FLAGS.bulk_copy_max_mbps * 1e6 / 8
+  with _throttle_lock:
+    if _throttle is None or _throttle.rate != rate:
+      _throttle = _Throttle(rate)
+    return _throttle
+
+
+class _ThrottledFile(object):
+  """Wraps a pipe to limit the bandwidth of reads and writes."""
+
+  def __init__(self, fileobj, throttle):
+    self._fileobj = fileobj
+    self._throttle = throttle
+
+  def read(self, size=-1):
+    data = self._fileobj.read(size)
+    if self._throttle:
+      self._throttle.Acquire(len(data))
+    return data
+
+  def write(self, data):
+    if self._throttle:
+      self._throttle.Acquire(len(data))
+    self._fileobj.write(data)
+
+
+def _AddPath(tar, path, name):
+  """Adds a file or a directory tree to a tarball.
+
+  Unlike TarFile.add, absolute names are kept, so that 'tar -P' extracts
+  them to the same absolute path.
+  """
+  tarinfo = tar.gettarinfo(path, name)
+  tarinfo.name = name
+  if tarinfo.isreg():
+    with open(path, 'rb') as fp:
+      tar.addfile(tarinfo, fp)
+    return
+  tar.addfile(tarinfo)
+  if tarinfo.isdir():
+    for entry in sorted(os.listdir(path)):
+      _AddPath(tar, os.path.join(path, entry), posixpath.join(name, entry))
+
+
+def SendTarball(cmd, paths, compress=False):
+  """Streams a tarball of local files to the stdin of a command.
+
+  Args:
+    cmd: list of strings. Command that reads the tarball from stdin, like
+        'tar -xPf -' run over ssh.
+    paths: list of (local path, name in the tarball) tuples. Directories are
+        added with their contents.
+    compress: bool. Whether to gzip the tarball.
+
+  Returns:
+    A tuple of the stderr and the return code of cmd.
+  """
+  with tempfile.TemporaryFile() as stderr_file:
+    p = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=stderr_file)
+    try:
+      with p.stdin:
+        fileobj = _ThrottledFile(p.stdin, _GetThrottle())
+        with tarfile.open(mode='w|gz' if compress else 'w|',
+                          fileobj=fileobj) as tar:
+          for path, name in paths:
+            _AddPath(tar, path, name)
+    except IOError:
+      # The command exited early, which the caller reports.
+      if not p.wait():
+        raise
+    retcode = p.wait()
+    stderr_file.seek(0)
+    return stderr_file.read(), retcode
+
+
+def ReceiveTarball(cmd, local_dir, compress=False):
+  """Extracts a tarball streamed by the stdout of a command.
+
+  Args:
+    cmd: list of strings. Command that writes a tarball to stdout, like
+        'tar -cf - ...' run over ssh.
+    local_dir: string. Local directory to extract the tarball to.
+    compress: bool. Whether the tarball is gzipped.
+
+  Returns:
+    A tuple of the stderr and the return code of cmd.
+
+  Raises:
+    errors.VirtualMachine.RemoteCommandError: If the tarball holds files
+        outside of local_dir.
+  """
+  if not os.path.isdir(local_dir):
+    os.makedirs(local_dir)
+  with tempfile.TemporaryFile() as stderr_file:
+    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file)
+    with p.stdout:
+      fileobj = _ThrottledFile(p.stdout, _GetThrottle())
+      try:
+        with tarfile.open(mode='r|gz' if compress else 'r|',
+                          fileobj=fileobj) as tar:
+          for tarinfo in tar:
+            if (posixpath.isabs(tarinfo.name) or
+                '..' in tarinfo.name.split('/')):
+              p.kill()
+              p.wait()
+              raise errors.VirtualMachine.RemoteCommandError(
+                  'Refusing to extract %s from %s.' %
+                  (tarinfo.name, ' '.join(cmd)))
+            tar.extract(tarinfo, local_dir)
+      except tarfile.ReadError:
+        # An empty or truncated stream, because the command failed.
+        if not p.wait():
+          raise
+      # Read the padding after the end of the tarball, so that the command
+      # doesn't fail writing it.
+      for _ in iter(lambda: p.stdout.read(_BLOCK_SIZE), b''):
+        pass
+    retcode = p.wait()
+    stderr_file.seek(0)
+    return stderr_file.read(), retcode
+
+
+def PushToVms(vms, files, compress=False):
+  """Copies the same local files to many VMs at once.
+
+  Args:
+    vms: list of BaseVirtualMachines.
+    files: list of (local path, remote path) tuples, as taken by
+        vm.PushFiles.
+    compress: bool. Whether to compress the files while copying them.
+  """
+  vm_util.RunThreaded(lambda vm: vm.PushFiles(files, compress=compress), vms)
+
+
+def PullFromVms(vms, local_dir, remote_paths, remote_dir='.',
+                compress=False):
+  """Copies the same files from many VMs at once.
+
+  Args:
+    vms: list of BaseVirtualMachines.
+    local_dir: string. Local directory. The files of each VM are copied to
+        a subdirectory named after the VM.
+    remote_paths: list of strings. Paths or globs, as taken by vm.PullFiles.
+    remote_dir: string. The directory on the VMs that remote_paths are
+        relative to.
+    compress: bool. Whether to compress the files while copying them.
+  """
+  def Pull(vm):
+    vm.PullFiles(os.path.join(local_dir, vm.name), remote_paths,
+                 remote_dir=remote_dir, compress=compress)
+  vm_util.RunThreaded(Pull, vms)
@@ -0,0 +1,248 @@
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compressed columnar files of samples.
+
+Row-oriented results, like newline delimited JSON, repeat the metadata of
+every sample on every row, so reading them means parsing each sample's labels.
+A columnar file instead stores each field of the samples in its own column:
+
+  * 'timestamp' and 'value' are arrays of doubles. Values that are not
+    numbers are stored as NaN.
+  * Every other field, e.g. 'metric' or 'run_uri', and each metadata key,
+    stored as 'metadata.<key>', is a dictionary-encoded column: the distinct
+    values of the field, as UTF-8 strings, and an array of int32 codes that
+    index them, one per sample. The code of a sample that lacks the field is
+    -1. The values are stored concatenated, with an array of their offsets,
+    so that a few large values, like JSON histograms, don't pad every other
+    value to their size.
+
+The file is a compressed numpy .npz archive, which also holds a JSON schema
+that names the columns. ReadFiles loads any number of these files, e.g. one
+per run, into a single set of columns.
+"""
+
+import array
+import collections
+import json
+
+import numpy
+
+TIMESTAMP = 'timestamp'
+VALUE = 'value'
+METADATA_PREFIX = 'metadata.'
+FORMAT_VERSION = 1
+
+_SCHEMA_KEY = 'schema'
+_MISSING = -1
+
+DictionaryColumn = collections.namedtuple('DictionaryColumn',
+                                          ['codes', 'dictionary'])
+
+
+def _ToString(value):
+  if isinstance(value, unicode):
+    return value.encode('utf-8')
+  return str(value)
+
+
+def _ToFloat(value):
+  try:
+    return float(value)
+  except (TypeError, ValueError):
+    return float('nan')
+
+
+class _DictionaryColumnBuilder(object):
+  """Dictionary-encodes the values of a field as they are added."""
+
+  def __init__(self):
+    self.codes = array.array('i')
+    self.dictionary = []
+    self._code_by_value = {}
+
+  def Set(self, row, value):
+    """Sets the value of the field in a row after the last row that was set."""
+    self.Pad(row)
+    if value is None:
+      self.codes.append(_MISSING)
+      return
+    value = _ToString(value)
+    code = self._code_by_value.get(value)
+    if code is None:
+      code = self._code_by_value[value] = len(self.dictionary)
+      self.dictionary.append(value)
+    self.codes.append(code)
+
+  def Pad(self, num_rows):
+    """Marks the field as missing in the rows up to num_rows."""
+    if len(self.codes) < num_rows:
+      self.codes.extend([_MISSING] * (num_rows - len(self.codes)))
+
+
+class ColumnarWriter(object):
+  """Accumulates sample dicts in columns and writes them to a file."""
+
+  def __init__(self):
+    self._timestamps = array.array('d')
+    self._values = array.array('d')
+    self._columns = collections.OrderedDict()
+
+  def __len__(self):
+    return len(self._values)
+
+  def _GetColumn(self, name):
+    column = self._columns.get(name)
+    if column is None:
+      column = self._columns[name] = _DictionaryColumnBuilder()
+    return column
+
+  def Add(self, samples):
+    """Adds sample dicts, as published by SamplePublishers."""
+    for sample in samples:
+      row = len(self._values)
+      self._timestamps.append(_ToFloat(sample.get(TIMESTAMP)))
+      self._values.append(_ToFloat(sample.get(VALUE)))
+      for key, value in sample.iteritems():
+        if key not in (TIMESTAMP, VALUE, 'metadata'):
+          self._GetColumn(key).Set(row, value)
+      for key, value in sample.get('metadata', {}).iteritems():
+        self._GetColumn(METADATA_PREFIX + key).Set(row, value)
+
+  def Write(self, fp):
+    """Writes the samples to a file.
+
+    Args:
+      fp: string or file-like object. Path of the file, or the file.
+    """
+    if isinstance(fp, basestring):
+      with open(fp, 'wb') as f:
+        self.Write(f)
+      return
+    arrays = {TIMESTAMP: numpy.frombuffer(self._timestamps, dtype=float),
+              VALUE: numpy.frombuffer(self._values, dtype=float)}
+    for i, column in enumerate(self._columns.itervalues()):
+      column.Pad(len(self))
+      arrays['codes%d' % i] = numpy.frombuffer(column.codes, dtype=numpy.int32)
+      arrays['dictionary%d' % i] = numpy.frombuffer(
+          b''.join(column.dictionary), dtype=numpy.uint8)
+      lengths = [0] + [len(value) for value in column.dictionary]
+      arrays['offsets%d' % i] = numpy.cumsum(lengths, dtype=numpy.int64)
+    schema = {'version': FORMAT_VERSION, 'columns': list(self._columns)}
+    arrays[_SCHEMA_KEY] = numpy.array(json.dumps(schema))
+    numpy.savez_compressed(fp, **arrays)
+
+
+def _ReadDictionary(npz, index):
+  """Returns the dictionary of a column as an object array of strings."""
+  data = npz['dictionary%d' % index].tobytes()
+  offsets = npz['offsets%d' % index].tolist()
+  dictionary = numpy.empty(len(offsets) - 1, dtype=object)
+  dictionary[:] = [data[start:end]
+                   for start, end in zip(offsets[:-1], offsets[1:])]
+  return dictionary
+
+
+def _ReadFile(path):
+  """Returns the number of rows and the columns stored in a file."""
+  with numpy.load(path) as npz:
+    schema = json.loads(npz[_SCHEMA_KEY].item())
+    if schema['version'] != FORMAT_VERSION:
+      raise ValueError('%s has unsupported format version %s.' %
+                       (path, schema['version']))
+    columns = {TIMESTAMP: npz[TIMESTAMP], VALUE: npz[VALUE]}
+    for i, name in enumerate(schema['columns']):
+      columns[name] = DictionaryColumn(npz['codes%d' % i],
+                                       _ReadDictionary(npz, i))
+  return len(columns[VALUE]), columns
+
+
+def _MergeDictionaryColumns(columns, sizes):
+  """Merges columns from several files into a single DictionaryColumn.
+
+  Args:
+    columns: list of DictionaryColumns, or None where a file lacks the column.
+    sizes: list of ints. The number of rows in each file.
+
+  Returns:
+    A DictionaryColumn.
+  """
+  dictionary = []
+  code_by_value = {}
+  codes = []
+  for column, size in zip(columns, sizes):
+    if column is None:
+      codes.append(numpy.full(size, _MISSING, dtype=numpy.int32))
+      continue
+    # Maps the codes of the file to merged codes, with the missing code
+    # mapped by the last entry.
+    mapping = numpy.empty(len(column.dictionary) + 1, dtype=numpy.int32)
+    mapping[-1] = _MISSING
+    for i, value in enumerate(column.dictionary):
+      code = code_by_value.get(value)
+      if code is None:
+        code = code_by_value[value] = len(dictionary)
+        dictionary.append(value)
+      mapping[i] = code
+    codes.append(mapping[column.codes])
+  merged_dictionary = numpy.empty(len(dictionary), dtype=object)
+  merged_dictionary[:] = dictionary
+  return DictionaryColumn(
+      numpy.concatenate(codes) if codes else numpy.empty(0, numpy.int32),
+      merged_dictionary)
+
+
+def Decode(column):
+  """Returns the values of a DictionaryColumn as an array of objects.
+
+  Missing values are None.
+  """
+  values = numpy.empty(len(column.dictionary) + 1, dtype=object)
+  values[:-1] = column.dictionary
+  return values[column.codes]
+
+
+def ReadFiles(paths, decode=True):
+  """Reads the samples in columnar files into a single set of columns.
+
+  Args:
+    paths: list of strings. Paths of files written by ColumnarWriter.
+    decode: boolean. If true, dictionary-encoded columns are returned as
+        arrays of strings, with None where samples lack the field. Otherwise
+        they are returned as DictionaryColumns, which are faster to filter
+        and group by.
+
+  Returns:
+    A dict mapping column names to numpy arrays or DictionaryColumns, with one
+    entry per sample in the order of the files.
+  """
+  sizes = []
+  files = []
+  names = set()
+  for path in paths:
+    size, columns = _ReadFile(path)
+    sizes.append(size)
+    files.append(columns)
+    names.update(columns)
+  if not files:
+    return {TIMESTAMP: numpy.empty(0), VALUE: numpy.empty(0)}
+  result = {}
+  for name in names:
+    if name in (TIMESTAMP, VALUE):
+      result[name] = numpy.concatenate([file_columns[name]
+                                        for file_columns in files])
+      continue
+    column = _MergeDictionaryColumns(
+        [file_columns.get(name) for file_columns in files], sizes)
+    result[name] = Decode(column) if decode else column
+  return result
@@ -0,0 +1,416 @@
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Runs many command-bound tasks concurrently on a single thread.
+
+vm_util.RunThreaded starts a thread for every call, even though most calls
+only block waiting for ssh or scp processes. RunMultiplexed instead runs
+tasks written as generators: a task yields a Command whenever it needs to run
+one and is resumed with the command's (stdout, stderr, retcode) once it has
+finished. The commands of all tasks are serviced by the calling thread, so
+fanning out to hundreds of VMs does not require hundreds of threads.
+
+A task may also yield another task (a generator), which runs to completion
+before the yielding task is resumed with its result. Since generators cannot
+return values in Python 2, a task returns a value by raising Return:
+
+  def _GetHostname(vm):
+    stdout, _ = yield vm.RemoteCommandTask('hostname')
+    raise command_tasks.Return(stdout.strip())
+
+  hostnames = command_tasks.RunMultiplexed(_GetHostname, vms)
+
+Each task runs with its own copy of the caller's log context and benchmark
+spec, as it would in a thread started by RunThreaded.
+"""
+
+import collections
+import functools
+import logging
+import os
+import sys
+import traceback
+import types
+
+from perfkitbenchmarker import background_tasks
+from perfkitbenchmarker import context
+from perfkitbenchmarker import errors
+from perfkitbenchmarker import flags
+from perfkitbenchmarker import log_util
+from perfkitbenchmarker import vm_util
+
+FLAGS = flags.FLAGS
+
+MULTIPLEXED = 'multiplexed'
+THREADS = 'threads'
+
+flags.DEFINE_enum('command_task_executor', MULTIPLEXED, [MULTIPLEXED, THREADS],
+                  'How RunMultiplexed executes tasks. "multiplexed" runs all '
+                  'of them on a single thread. "threads" runs each of them '
+                  'in its own thread like RunThreaded, which is always the '
+                  'case on Windows.')
+
+# How long to wait before retrying to start a command whose lock is held by
+# another command.
+_LOCK_RETRY_INTERVAL = 0.05
+
+
+class Return(Exception):
+  """Raised by a task to return a value to whatever is running it."""
+
+  def __init__(self, value=None):
+    super(Return, self).__init__(value)
+    self.value = value
+
+
+class Command(object):
+  """A command that a task waits for by yielding it.
+
+  Attributes:
+    cmd: A list of strings such as is given to the subprocess.Popen()
+        constructor.
+    force_info_log: See vm_util.IssueCommand.
+    suppress_warning: See vm_util.IssueCommand.
+    env: See vm_util.IssueCommand.
+    timeout: See vm_util.IssueCommand.
+    input: See vm_util.IssueCommand.
+    lock: threading.Lock or None. If provided, the command is not started
+        until the lock can be acquired, and the lock is held until the command
+        has finished.
+  """
+
+  def __init__(self, cmd, force_info_log=False, suppress_warning=False,
+               env=None, timeout=vm_util.DEFAULT_TIMEOUT, input=None,
+               lock=None):
+    self.cmd = cmd
+    self.force_info_log = force_info_log
+    self.suppress_warning = suppress_warning
+    self.env = env
+    self.timeout = timeout
+    self.input = input
+    self.lock = lock
+
+  def Issue(self):
+    """Runs the command on the calling thread.
+
+    Returns:
+      A tuple of stdout, stderr, and retcode from running the command.
+    """
+    if self.lock:
+      self.lock.acquire()
+    try:
+      return vm_util.IssueCommand(
+          self.cmd, force_info_log=self.force_info_log,
+          suppress_warning=self.suppress_warning, env=self.env,
+          timeout=self.timeout, input=self.input)
+    finally:
+      if self.lock:
+        self.lock.release()
+
+  def Start(self, command_group, callback):
+    """Starts the command in a vm_util.CommandGroup.
+
+    Returns:
+      False if the command's lock is held elsewhere and it was not started.
+    """
+    if self.lock and not self.lock.acquire(False):
+      return False
+
+    def _Finished(*result):
+      if self.lock:
+        self.lock.release()
+      callback(*result)
+
+    try:
+      command_group.Start(
+          self.cmd, _Finished, force_info_log=self.force_info_log,
+          suppress_warning=self.suppress_warning, env=self.env,
+          timeout=self.timeout, input=self.input)
+    except BaseException:
+      if self.lock:
+        self.lock.release()
+      raise
+    return True
+
+
+def BlockingTask(function, *args, **kwargs):
+  """A task that calls a function which does not have a task equivalent.
+
+  The function runs on the thread that is running the task, so when tasks are
+  multiplexed, every other task is blocked until it returns.
+  """
+  raise Return(function(*args, **kwargs))
+  yield  # pylint: disable=unreachable
+
+
+def _TargetTask(target, args, kwargs):
+  """Calls a target, running the task it returns if it is a generator."""
+  result = target(*args, **kwargs)
+  if isinstance(result, types.GeneratorType):
+    result = yield result
+  raise Return(result)
+
+
+class _TaskRunner(object):
+  """Steps a task and the tasks it delegates to.
+
+  Attributes:
+    return_value: The value returned by the task once it has finished.
+  """
+
+  def __init__(self, task, log_context=None, benchmark_spec=None):
+    """Initializes the _TaskRunner.
+
+    Args:
+      task: A generator as described in the module docstring.
+      log_context: log_util.ThreadLogContext to install while stepping the
+          task, or None to leave the calling thread's context in place.
+      benchmark_spec: BenchmarkSpec to install while stepping the task. Only
+          used when log_context is provided.
+    """
+    self._stack = [task]
+    self.return_value = None
+    self._log_context = log_context
+    self._benchmark_spec = benchmark_spec
+
+  def Step(self, value=None, exc_info=None):
+    """Resumes the task until it waits for a command or finishes.
+
+    Args:
+      value: Value sent to the task.
+      exc_info: sys.exc_info() tuple of an exception to raise in the task
+          instead of sending it a value.
+
+    Returns:
+      The Command the task is waiting for, or None if it finished.
+
+    Raises:
+      Exception: The exception raised by the task.
+    """
+    if self._log_context is None:
+      return self._Step(value, exc_info)
+    saved_log_context = log_util.GetThreadLogContext()
+    saved_benchmark_spec = context.GetThreadBenchmarkSpec()
+    log_util.SetThreadLogContext(self._log_context)
+    context.SetThreadBenchmarkSpec(self._benchmark_spec)
+    try:
+      return self._Step(value, exc_info)
+    finally:
+      log_util.SetThreadLogContext(saved_log_context)
+      context.SetThreadBenchmarkSpec(saved_benchmark_spec)
+
+  def _Step(self, value, exc_info):
+    while self._stack:
+      generator = self._stack[-1]
+      try:
+        if exc_info:
+          yielded = generator.throw(*exc_info)
+        else:
+          yielded = generator.send(value)
+      except (Return, StopIteration) as e:
+        self._stack.pop()
+        value = e.value if isinstance(e, Return) else None
+        exc_info = None
+        continue
+      except Exception:
+        self._stack.pop()
+        if not self._stack:
+          raise
+        exc_info = sys.exc_info()
+        continue
+      value = exc_info = None
+      if isinstance(yielded, Command):
+        return yielded
+      elif isinstance(yielded, types.GeneratorType):
+        self._stack.append(yielded)
+      else:
+        try:
+          raise TypeError('Tasks must yield a Command or another task, not '
+                          '%r.' % (yielded,))
+        except TypeError:
+          exc_info = sys.exc_info()
+    self.return_value = value
+    return None
+
+  def Close(self):
+    """Stops the task, running its finally clauses."""
+    while self._stack:
+      self._stack.pop().close()
+
+
+def RunSync(task):
+  """Runs a task on the calling thread, issuing one command at a time.
+
+  Args:
+    task: A generator as described in the module docstring.
+
+  Returns:
+    The task's return value.
+  """
+  runner = _TaskRunner(task)
+  command = runner.Step()
+  while command:
+    try:
+      result = command.Issue()
+    except Exception:
+      command = runner.Step(exc_info=sys.exc_info())
+    else:
+      command = runner.Step(result)
+  return runner.return_value
+
+
+def _RunInThreads(target_arg_tuples, max_concurrency):
+  def _RunTarget(target, args, kwargs):
+    return RunSync(_TargetTask(target, args, kwargs))
+
+  return vm_util.RunParallelThreads(
+      [(_RunTarget, (target, args, kwargs), {})
+       for target, args, kwargs in target_arg_tuples],
+      max_concurrency)
+
+
+def RunParallelTasks(target_arg_tuples, max_concurrency):
+  """Runs tasks concurrently, servicing their commands from a single thread.
+
+  Args:
+    target_arg_tuples: list of (target, args, kwargs) tuples. Each tuple
+        contains the generator function to call and the arguments to pass it.
+    max_concurrency: int. The maximum number of unfinished tasks.
+
+  Returns:
+    list of task return values in the order corresponding to the order of
+    target_arg_tuples.
+
+  Raises:
+    errors.VmUtil.ThreadException: When an exception occurred in any of the
+        tasks.
+  """
+  if FLAGS.command_task_executor == THREADS or vm_util.RunningOnWindows():
+    return _RunInThreads(target_arg_tuples, max_concurrency)
+
+  parent_log_context = log_util.GetThreadLogContext()
+  benchmark_spec = context.GetThreadBenchmarkSpec()
+  results = [None] * len(target_arg_tuples)
+  error_strings = []
+  runners = {}
+  # (index, Command) tuples of commands that have yet to be started.
+  pending_commands = collections.deque()
+  command_group = vm_util.CommandGroup()
+
+  def _Advance(index, value=None, exc_info=None):
+    """Steps a task and queues the command it waits for."""
+    try:
+      command = runners[index].Step(value, exc_info)
+    except Exception:
+      # The task failed, but it may still be a long time until all remaining
+      # tasks complete. Log the failure immediately.
+      call_string = background_tasks._GetCallString(target_arg_tuples[index])
+      msg = 'Exception occurred while calling {0}:{1}{2}'.format(
+          call_string, os.linesep, traceback.format_exc())
+      logging.error(msg)
+      error_strings.append(msg)
+      del runners[index]
+      return
+    if command:
+      pending_commands.append((index, command))
+    else:
+      results[index] = runners.pop(index).return_value
+
+  def _CommandFinished(index, *result):
+    _Advance(index, result)
+
+  started_task_count = 0
+  try:
+    while started_task_count < len(target_arg_tuples) or runners:
+      while (started_task_count < len(target_arg_tuples) and
+             len(runners) < max_concurrency):
+        index = started_task_count
+        started_task_count += 1
+        target, args, kwargs = target_arg_tuples[index]
+        runners[index] = _TaskRunner(
+            _TargetTask(target, args, kwargs),
+            log_util.ThreadLogContext(parent_log_context), benchmark_spec)
+        _Advance(index)
+
+      blocked_commands = []
+      while pending_commands:
+        index, command = pending_commands.popleft()
+        try:
+          started = command.Start(
+              command_group, functools.partial(_CommandFinished, index))
+        except Exception:
+          _Advance(index, exc_info=sys.exc_info())
+          continue
+        if not started:
+          blocked_commands.append((index, command))
+      pending_commands.extend(blocked_commands)
+
+      if runners:
+        command_group.Wait(
+            _LOCK_RETRY_INTERVAL if pending_commands else None)
+  except KeyboardInterrupt:
+    logging.error('Received KeyboardInterrupt while running tasks. Killing '
+                  'the commands of %s tasks.', len(runners))
+    command_group.KillAll()
+    for runner in runners.itervalues():
+      runner.Close()
+    raise
+
+  if error_strings:
+    raise errors.VmUtil.ThreadException(
+        'The following exceptions occurred during parallel execution:'
+        '{0}{1}'.format(os.linesep, os.linesep.join(error_strings)))
+  return results
+
+
+def RunMultiplexed(target, thread_params, max_concurrent_tasks=200):
+  """Runs the target generator function once per item in thread_params.
+
+  Accepts the same thread_params as vm_util.RunThreaded, but runs the tasks
+  with RunParallelTasks.
+
+  Args:
+    target: The generator function to call. A plain function may also be
+        passed, but it blocks every other task until it returns.
+    thread_params: A task is started for each value in the list. The items
+        in the list can either be a singleton or a (args, kwargs) tuple/list.
+        Usually this is a list of VMs.
+    max_concurrent_tasks: The maximum number of unfinished tasks.
+
+  Returns:
+    List of the same length as thread_params. Contains the return value of
+    each task in the corresponding order as thread_params.
+
+  Raises:
+    ValueError: when thread_params is not valid.
+    errors.VmUtil.ThreadException: When an exception occurred in any of the
+        tasks.
+  """
+  if not isinstance(thread_params, list):
+    raise ValueError('Param "thread_params" must be a list')
+
+  if not thread_params:
+    # Nothing to do.
+    return []
+
+  if not isinstance(thread_params[0], tuple):
+    target_arg_tuples = [(target, (arg,), {}) for arg in thread_params]
+  elif (not isinstance(thread_params[0][0], tuple) or
+        not isinstance(thread_params[0][1], dict)):
+    raise ValueError('If Param is a tuple, the tuple must be (tuple, dict)')
+  else:
+    target_arg_tuples = [(target, args, kwargs)
+                         for args, kwargs in thread_params]
+
+  return RunParallelTasks(target_arg_tuples,
+                          max_concurrency=max_concurrent_tasks)
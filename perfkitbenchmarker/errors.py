@@ -132,6 +132,10 @@ class VmUtil(object):
   class CalledProcessException(Error):
     pass
 
+  class ThrottledCommandError(CalledProcessException):
+    """A command failed because an API rate limit or quota was exceeded."""
+    pass
+
 
 class Benchmarks(object):
   """Errors raised by individual benchmark."""
@@ -183,3 +187,10 @@ class Juju(object):
 
   class UnitErrorException(Error):
     pass
+
+
+class Publisher(object):
+  """Errors raised while publishing samples."""
+  class PublishError(Error):
+    """Raised when samples could not be published."""
+    pass
@@ -184,9 +184,7 @@ def _GetDefaultProject():
 
 def _Install(vm):
   """Install YCSB and HBase on 'vm'."""
-  vm.Install('hbase')
-  vm.Install('ycsb')
-  vm.Install('curl')
+  vm.InstallAll(['hbase', 'ycsb', 'curl'])
 
   instance_name = (FLAGS.google_bigtable_instance_name or
                    'pkb-bigtable-{0}'.format(FLAGS.run_uri))
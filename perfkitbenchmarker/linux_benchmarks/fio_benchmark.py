@@ -20,6 +20,7 @@ Quick howto: http://www.bluestop.org/fio/HOWTO.txt
 
 import json
 import logging
+import os
 import posixpath
 import re
 import time
@@ -150,6 +151,34 @@ flags.DEFINE_integer('fio_log_avg_msec', 1000,
                      'log an entry for every IO that completes, this can grow '
                      'very quickly in size and can cause performance overhead.',
                      lower_bound=0)
+flags.DEFINE_integer('fio_status_interval', 0,
+                     'If positive, fio reports its status every this many '
+                     'seconds. The reports are parsed as they arrive into '
+                     'samples of the bandwidth, IOPS and latency percentiles '
+                     'of each interval, in addition to the final results.',
+                     lower_bound=0)
+flags.DEFINE_integer('fio_log_window_sec', 10,
+                     'The fio latency, bandwidth and IOPS logs are summarized '
+                     'on the VM into samples of their percentiles or mean '
+                     'value in windows of this many seconds.',
+                     lower_bound=1)
+flags.DEFINE_boolean('fio_archive_logs', False,
+                     'Whether to copy the raw fio latency, bandwidth and IOPS '
+                     'logs to the run\'s temporary directory. They are always '
+                     'summarized on the VM, and are otherwise deleted there.')
+flags.DEFINE_boolean('fio_all_disks', False,
+                     'Whether to run fio against every scratch disk of every '
+                     'VM at once, rather than against the first disk of the '
+                     'first VM. The disks are filled in parallel, fio starts '
+                     'at the same time on all of them, and their results are '
+                     'aggregated in addition to being reported per disk.')
+flags.DEFINE_integer('fio_start_delay_sec', 10,
+                     'With --fio_all_disks, the number of seconds after the '
+                     'job files are copied at which fio starts on all disks. '
+                     'The start time is taken from the clock of the machine '
+                     'running PKB, so it relies on the clocks of the VMs '
+                     'being synchronized.',
+                     lower_bound=0)
 
 
 FLAGS_IGNORED_FOR_CUSTOM_JOBFILE = {
@@ -388,15 +417,13 @@ def GetConfig(user_config):
   return config
 
 
-def GetLogFlags():
+def GetLogFlags(filename_base):
   collect_logs = FLAGS.fio_lat_log or FLAGS.fio_bw_log or FLAGS.fio_iops_log
   fio_log_flags = [(FLAGS.fio_lat_log, '--write_lat_log=%(filename)s',),
                    (FLAGS.fio_bw_log, '--write_bw_log=%(filename)s',),
                    (FLAGS.fio_iops_log, '--write_iops_log=%(filename)s',),
                    (collect_logs, '--log_avg_msec=%(interval)d',)]
   fio_command_flags = ' '.join([flag for given, flag in fio_log_flags if given])
-  now = time.time()
-  filename_base = '%s_%s' % (PKB_FIO_LOG_FILE_NAME, str(now))
   return fio_command_flags % {'filename': filename_base,
                               'interval': FLAGS.fio_log_avg_msec}
 
@@ -406,25 +433,33 @@ def CheckPrerequisites(benchmark_config):
   WarnOnBadFlags()
 
 
-def Prepare(benchmark_spec):
-  """Prepare the virtual machine to run FIO.
-
-     This includes installing fio, bc, and libaio1 and pre-filling the
-     attached disk. We also make sure the job file is always located
-     at the same path on the local machine.
+def _GetTargets(benchmark_spec):
+  """Returns the disks that fio runs against.
 
   Args:
-    benchmark_spec: The benchmark specification. Contains all data that is
-        required to run the benchmark.
+    benchmark_spec: The benchmark specification.
 
+  Returns:
+    A list of (vm, disk, index) tuples, where index is the position of the
+    disk in vm.scratch_disks. Unless --fio_all_disks is given, only the first
+    disk of the first VM is returned.
   """
-  vm = benchmark_spec.vms[0]
-  logging.info('FIO prepare on %s', vm)
-  vm.Install('fio')
+  if not FLAGS.fio_all_disks:
+    first_vm = benchmark_spec.vms[0]
+    return [(first_vm, first_vm.scratch_disks[0], 0)]
+  return [(vm, disk, index) for vm in benchmark_spec.vms
+          for index, disk in enumerate(vm.scratch_disks)]
 
-  # Choose a disk or file name and optionally fill it
-  disk = vm.scratch_disks[0]
 
+def _PrepareDisk(vm, disk, index, num_disks):
+  """Fills a disk and mounts it if necessary.
+
+  Args:
+    vm: The VM the disk is attached to.
+    disk: The disk.BaseDisk to prepare.
+    index: int. The position of the disk in vm.scratch_disks.
+    num_disks: int. The number of disks fio runs against on the VM.
+  """
   if FillTarget():
     logging.info('Fill device %s on %s', disk.GetDevicePath(), vm)
     FillDevice(vm, disk, FLAGS.fio_fill_size)
@@ -435,66 +470,207 @@ def Prepare(benchmark_spec):
   # without fill, it was never unmounted (see GetConfig()).
   if FLAGS.fio_target_mode == AGAINST_FILE_WITH_FILL_MODE:
     disk.mount_point = FLAGS.scratch_dir or MOUNT_POINT
+    if num_disks > 1:
+      disk.mount_point += str(index)
     vm.FormatDisk(disk.GetDevicePath())
     vm.MountDisk(disk.GetDevicePath(), disk.mount_point)
 
 
-def Run(benchmark_spec):
-  """Spawn fio and gather the results.
+def Prepare(benchmark_spec):
+  """Prepare the virtual machine to run FIO.
+
+     This includes installing fio, bc, and libaio1 and pre-filling the
+     attached disk. We also make sure the job file is always located
+     at the same path on the local machine. With --fio_all_disks, this is
+     done on all VMs and disks in parallel.
 
   Args:
     benchmark_spec: The benchmark specification. Contains all data that is
         required to run the benchmark.
 
-  Returns:
-    A list of sample.Sample objects.
   """
-  vm = benchmark_spec.vms[0]
-  logging.info('FIO running on %s', vm)
-
-  disk = vm.scratch_disks[0]
-  mount_point = disk.mount_point
-
-  job_file_string = GetOrGenerateJobFileString(
-      FLAGS.fio_jobfile,
-      FLAGS.fio_generate_scenarios,
-      AgainstDevice(),
-      disk,
-      FLAGS.fio_io_depths,
-      FLAGS.fio_num_jobs,
-      FLAGS.fio_working_set_size,
-      FLAGS.fio_blocksize,
-      FLAGS.fio_runtime,
-      FLAGS.fio_parameters)
-  job_file_path = vm_util.PrependTempDir(LOCAL_JOB_FILE_NAME)
-  with open(job_file_path, 'w') as job_file:
-    job_file.write(job_file_string)
-    logging.info('Wrote fio job file at %s', job_file_path)
-
-  vm.PushFile(job_file_path, REMOTE_JOB_FILE_PATH)
-
-  if AgainstDevice():
-    fio_command = 'sudo %s --output-format=json --filename=%s %s' % (
-        fio.FIO_PATH, disk.GetDevicePath(), REMOTE_JOB_FILE_PATH)
-  else:
-    fio_command = 'sudo %s --output-format=json --directory=%s %s' % (
-        fio.FIO_PATH, mount_point, REMOTE_JOB_FILE_PATH)
+  targets = _GetTargets(benchmark_spec)
+  vms = []
+  for vm, _, _ in targets:
+    if vm not in vms:
+      vms.append(vm)
+  for vm in vms:
+    logging.info('FIO prepare on %s', vm)
+  vm_util.RunThreaded(lambda vm: vm.Install('fio'), vms)
+
+  # Choose a disk or file name and optionally fill it
+  vm_util.RunThreaded(
+      _PrepareDisk,
+      [((vm, disk, index, len([t for t in targets if t[0] is vm])), {})
+       for vm, disk, index in targets])
+
+
+class _FioRun(object):
+  """A run of fio against one disk.
+
+  Attributes:
+    vm: The VM that runs fio.
+    disk: The disk.BaseDisk fio runs against.
+    metadata: dict. Metadata identifying the disk in the samples, or None if
+        fio runs against a single disk.
+    job_file_string: string. The contents of the job file.
+    remote_job_file_path: string. The path of the job file on the VM.
+    result: dict. fio's JSON result, once it has run.
+  """
+
+  def __init__(self, vm, disk, index, fan_out):
+    self.vm = vm
+    self.disk = disk
+    self.metadata = None
+    self.job_file_string = None
+    self.result = None
+    self._fan_out = fan_out
+    self._index = index
+    if fan_out:
+      self.metadata = {'fio_vm': vm.name,
+                       'fio_disk': disk.GetDevicePath()}
+      self._local_job_file_name = 'fio-%s-%d.job' % (vm.name, index)
+    else:
+      self._local_job_file_name = LOCAL_JOB_FILE_NAME
+    if index:
+      self.remote_job_file_path = posixpath.join(vm_util.VM_TMP_DIR,
+                                                 'fio-%d.job' % index)
+    else:
+      self.remote_job_file_path = REMOTE_JOB_FILE_PATH
+    self._command = None
+    self._log_file_base = None
+
+  def Prepare(self):
+    """Writes the job file and copies it to the VM."""
+    vm = self.vm
+    disk = self.disk
+    mount_point = disk.mount_point
+
+    self.job_file_string = GetOrGenerateJobFileString(
+        FLAGS.fio_jobfile,
+        FLAGS.fio_generate_scenarios,
+        AgainstDevice(),
+        disk,
+        FLAGS.fio_io_depths,
+        FLAGS.fio_num_jobs,
+        FLAGS.fio_working_set_size,
+        FLAGS.fio_blocksize,
+        FLAGS.fio_runtime,
+        FLAGS.fio_parameters)
+    job_file_path = vm_util.PrependTempDir(self._local_job_file_name)
+    with open(job_file_path, 'w') as job_file:
+      job_file.write(self.job_file_string)
+      logging.info('Wrote fio job file at %s', job_file_path)
+
+    vm.PushFile(job_file_path, self.remote_job_file_path)
+
+    if AgainstDevice():
+      fio_command = 'sudo %s --output-format=json --filename=%s %s' % (
+          fio.FIO_PATH, disk.GetDevicePath(), self.remote_job_file_path)
+    else:
+      fio_command = 'sudo %s --output-format=json --directory=%s %s' % (
+          fio.FIO_PATH, mount_point, self.remote_job_file_path)
+
+    collect_logs = any([FLAGS.fio_lat_log, FLAGS.fio_bw_log,
+                        FLAGS.fio_iops_log])
+    if collect_logs:
+      self._log_file_base = '%s_%s' % (PKB_FIO_LOG_FILE_NAME, str(time.time()))
+      if self._fan_out:
+        self._log_file_base += '_disk%d' % self._index
+      fio_command = ' '.join([fio_command,
+                              GetLogFlags(self._log_file_base)])
+
+    if FLAGS.fio_status_interval:
+      fio_command = '%s --status-interval=%d' % (fio_command,
+                                                 FLAGS.fio_status_interval)
+    self._command = fio_command
+
+  def Run(self, start_time=None):
+    """Runs fio and gathers the results.
+
+    Args:
+      start_time: int or None. If given, fio starts at this Unix time on the
+          clock of the VM, so that runs against several disks start together.
+
+    Returns:
+      A list of sample.Sample objects.
+    """
+    vm = self.vm
+    logging.info('FIO running on %s', vm)
+    fio_command = self._command
+    if start_time is not None:
+      fio_command = 'sleep $((%d - $(date +%%s))) 2>/dev/null; %s' % (
+          start_time, fio_command)
+
+    if FLAGS.fio_status_interval:
+      # Interval results are logged and parsed as fio prints them.
+      parser = fio.StatusParser(self.job_file_string,
+                                base_metadata=self.metadata)
+      vm.RobustRemoteCommand(fio_command, stdout_callback=parser.Feed)
+      self.result = parser.last_result
+      samples = fio.ParseResults(self.job_file_string, self.result,
+                                 base_metadata=self.metadata)
+      samples.extend(parser.samples)
+    else:
+      # Without --fio_status_interval, results are only reported when fio
+      # exits.
+      logging.info('FIO Results:')
+      stdout, stderr = vm.RobustRemoteCommand(fio_command, should_log=True)
+      self.result = json.loads(stdout)
+      samples = fio.ParseResults(self.job_file_string, self.result,
+                                 base_metadata=self.metadata)
+
+    if self._log_file_base:
+      # The logs can be gigabytes, so they are summarized on the VM, and only
+      # copied back if asked for.
+      samples.extend(fio.ReduceLogs(
+          vm, self.job_file_string, self.remote_job_file_path,
+          self._log_file_base, FLAGS.fio_log_window_sec,
+          base_metadata=self.metadata))
+      if FLAGS.fio_archive_logs:
+        local_dir = vm_util.GetTempDir()
+        if self._fan_out:
+          local_dir = os.path.join(local_dir, vm.name)
+        vm.PullFiles(local_dir, ['%s_*.log' % self._log_file_base],
+                     compress=True)
+      vm.RemoteCommand('rm -f %s_*.log' % self._log_file_base)
+
+    return samples
 
-  collect_logs = any([FLAGS.fio_lat_log, FLAGS.fio_bw_log, FLAGS.fio_iops_log])
-  if collect_logs:
-    fio_command = ' '.join([fio_command, GetLogFlags()])
 
-  # TODO(user): This only gives results at the end of a job run
-  #      so the program pauses here with no feedback to the user.
-  #      This is a pretty lousy experience.
-  logging.info('FIO Results:')
+def Run(benchmark_spec):
+  """Spawn fio and gather the results.
 
-  stdout, stderr = vm.RobustRemoteCommand(fio_command, should_log=True)
-  samples = fio.ParseResults(job_file_string, json.loads(stdout))
+  With --fio_all_disks, fio runs against all disks at once, and the results
+  of all disks are aggregated in addition to the samples of each disk.
 
-  if collect_logs:
-    vm.PullFile(vm_util.GetTempDir(), '%s_*.log' % PKB_FIO_LOG_FILE_NAME)
+  Args:
+    benchmark_spec: The benchmark specification. Contains all data that is
+        required to run the benchmark.
 
+  Returns:
+    A list of sample.Sample objects.
+  """
+  fio_runs = [_FioRun(vm, disk, index, FLAGS.fio_all_disks)
+              for vm, disk, index in _GetTargets(benchmark_spec)]
+  if len(fio_runs) == 1:
+    fio_runs[0].Prepare()
+    return fio_runs[0].Run()
+
+  vm_util.RunThreaded(lambda fio_run: fio_run.Prepare(), fio_runs)
+  # Copying the job files takes longer on some VMs than on others, so fio is
+  # started at the same time everywhere rather than as soon as possible.
+  start_time = int(time.time()) + FLAGS.fio_start_delay_sec
+  logging.info('Starting fio on %d disks at %s.', len(fio_runs),
+               time.strftime('%H:%M:%S', time.localtime(start_time)))
+  samples_per_run = vm_util.RunThreaded(
+      lambda fio_run: fio_run.Run(start_time), fio_runs)
+  samples = []
+  for run_samples in samples_per_run:
+    samples.extend(run_samples)
+  samples.extend(fio.AggregateResults(
+      fio_runs[0].job_file_string,
+      [fio_run.result for fio_run in fio_runs]))
   return samples
 
 
@@ -505,10 +681,12 @@ def Cleanup(benchmark_spec):
     benchmark_spec: The benchmark specification. Contains all data that is
         required to run the benchmark.
   """
-  vm = benchmark_spec.vms[0]
-  logging.info('FIO Cleanup up on %s', vm)
-  vm.RemoveFile(REMOTE_JOB_FILE_PATH)
-  if not AgainstDevice() and not FLAGS.fio_jobfile:
-    # If the user supplies their own job file, then they have to clean
-    # up after themselves, because we don't know their temp file name.
-    vm.RemoveFile(posixpath.join(vm.GetScratchDir(), DEFAULT_TEMP_FILE_NAME))
+  for vm, disk, index in _GetTargets(benchmark_spec):
+    logging.info('FIO Cleanup up on %s', vm)
+    fio_run = _FioRun(vm, disk, index, FLAGS.fio_all_disks)
+    vm.RemoveFile(fio_run.remote_job_file_path)
+    if not AgainstDevice() and not FLAGS.fio_jobfile:
+      # If the user supplies their own job file, then they have to clean
+      # up after themselves, because we don't know their temp file name.
+      vm.RemoveFile(posixpath.join(disk.mount_point or vm.GetScratchDir(),
+                                   DEFAULT_TEMP_FILE_NAME))
@@ -14,14 +14,24 @@
 
 """Runs mesh network benchmarks.
 
-Runs TCP_RR, TCP_STREAM benchmarks from netperf and compute total throughput
-and average latency inside mesh network.
+Runs TCP_RR, TCP_STREAM benchmarks from netperf between every ordered pair of
+VMs in a mesh network, and reports the throughput and latency of each pair in
+an N x N matrix, their percentiles, the slowest pair, and the total
+throughput and average latency inside the mesh.
+
+The tests between pairs are scheduled in rounds. With
+--mesh_network_schedule=round_robin, the rounds are those of a round-robin
+tournament: in each round every VM sends to and receives from at most one
+other VM, so tests don't compete for the network of a VM, and the mesh is
+covered in N - 1 rounds (N if N is odd). With the default concurrent
+schedule, up to --mesh_network_concurrency tests run at once.
 """
 
 
+import collections
+import json
 import logging
 import re
-import threading
 
 from perfkitbenchmarker import configs
 from perfkitbenchmarker import errors
@@ -30,6 +40,8 @@ from perfkitbenchmarker import sample
 from perfkitbenchmarker import vm_util
 from perfkitbenchmarker.linux_packages import netperf
 
+CONCURRENT = 'concurrent'
+ROUND_ROBIN = 'round_robin'
 
 flags.DEFINE_integer('num_connections', 1,
                      'Number of connections between each pair of vms.')
@@ -37,6 +49,19 @@ flags.DEFINE_integer('num_connections', 1,
 flags.DEFINE_integer('num_iterations', 1,
                      'Number of iterations for each run.')
 
+flags.DEFINE_enum('mesh_network_schedule', CONCURRENT,
+                  [CONCURRENT, ROUND_ROBIN],
+                  'How the netperf tests between pairs of VMs are scheduled. '
+                  '"concurrent" runs up to --mesh_network_concurrency tests '
+                  'at once. "round_robin" runs them in rounds in which each '
+                  'VM sends to and receives from at most one other VM.')
+
+flags.DEFINE_integer('mesh_network_concurrency', 0,
+                     'The maximum number of netperf tests between pairs of '
+                     'VMs that run at once with '
+                     '--mesh_network_schedule=concurrent. 0 runs the tests '
+                     'between all pairs at once.', lower_bound=0)
+
 
 FLAGS = flags.FLAGS
 
@@ -53,8 +78,10 @@ mesh_network:
 """
 
 NETPERF_BENCHMARKSS = ['TCP_RR', 'TCP_STREAM']
-VALUE_INDEX = 1
-RESULT_LOCK = threading.Lock()
+PERCENTILES = [1, 10, 50, 90, 99]
+# The lines of output of each netperf process are prefixed with the index of
+# its server.
+RESULT_REGEX = re.compile(r'^(\d+) (\d+(?:\.\d+)?)\s*$', re.MULTILINE)
 
 
 def GetConfig(user_config):
@@ -90,50 +117,160 @@ def Prepare(benchmark_spec):
   vm_util.RunThreaded(PrepareVM, vms, len(vms))
 
 
-def RunNetperf(vm, benchmark_name, servers, result):
-  """Spawns netperf on a remote VM, parses results.
+def GetRoundRobinRounds(num_vms):
+  """Pairs up VMs like the players of a round-robin tournament.
+
+  Uses the circle method: one VM stays in place while the others rotate, and
+  in each round the VMs on opposite sides of the circle are paired. If the
+  number of VMs is odd, the VM paired with the missing one sits the round
+  out.
+
+  Args:
+    num_vms: int. The number of VMs.
+
+  Returns:
+    A list of rounds, each a list of (index, index) tuples. Every pair of VMs
+    is in exactly one round, and every VM is in at most one pair per round.
+  """
+  circle = range(num_vms) + ([None] if num_vms % 2 else [])
+  rounds = []
+  for _ in xrange(len(circle) - 1):
+    pairs = [(circle[i], circle[-1 - i]) for i in xrange(len(circle) // 2)]
+    rounds.append([(min(pair), max(pair)) for pair in pairs
+                   if None not in pair])
+    circle = circle[:1] + circle[-1:] + circle[1:-1]
+  return rounds
+
+
+def _GetRounds(num_vms):
+  """Returns the lists of (client, server) index pairs that are tested at once.
+  """
+  if FLAGS.mesh_network_schedule == ROUND_ROBIN:
+    return [[(a, b) for pair in pairs for a, b in (pair, pair[::-1])]
+            for pairs in GetRoundRobinRounds(num_vms)]
+  # Within each run of num_vms pairs, every VM is a client once and a server
+  # once, so that concurrent tests are spread over the VMs.
+  pairs = [(i, (i + offset) % num_vms)
+           for offset in xrange(1, num_vms) for i in xrange(num_vms)]
+  concurrency = FLAGS.mesh_network_concurrency or len(pairs)
+  return [pairs[i:i + concurrency] for i in xrange(0, len(pairs), concurrency)]
+
+
+def RunNetperf(vm, benchmark_name, servers):
+  """Spawns netperf on a remote VM against several servers, parses results.
 
   Args:
     vm: The VM running netperf.
     benchmark_name: The netperf benchmark to run.
-    servers: VMs running netserver.
-    result: The result variable shared by all threads.
+    servers: VMs running netserver. netperf is run against all of them at once.
+
+  Returns:
+    A list with the result for each server: the throughput in Mbits/sec for
+    TCP_STREAM, summed over the connections, or the average latency in ms for
+    TCP_RR.
   """
-  cmd = ''
   if FLAGS.duration_in_seconds:
     cmd_duration_suffix = '-l %s' % FLAGS.duration_in_seconds
   else:
     cmd_duration_suffix = ''
-  for server in servers:
-    if vm != server:
-      cmd += ('./netperf -t '
-              '{benchmark_name} -H {server_ip} -i {iterations} '
-              '{cmd_suffix} & ').format(
-                  benchmark_name=benchmark_name,
-                  server_ip=server.internal_ip,
-                  iterations=FLAGS.num_iterations,
-                  cmd_suffix=cmd_duration_suffix)
-  netperf_cmd = ''
-  for _ in range(FLAGS.num_connections):
-    netperf_cmd += cmd
-  netperf_cmd += 'wait'
-  output, _ = vm.RemoteCommand(netperf_cmd)
+  cmds = []
+  for index, server in enumerate(servers):
+    cmd = ('./netperf -t {benchmark_name} -H {server_ip} -i {iterations} '
+           '{cmd_suffix} -P 0 -- -o THROUGHPUT | sed "s/^/{index} /" &').format(
+               benchmark_name=benchmark_name,
+               server_ip=server.internal_ip,
+               iterations=FLAGS.num_iterations,
+               cmd_suffix=cmd_duration_suffix,
+               index=index)
+    cmds.extend([cmd] * FLAGS.num_connections)
+  output, _ = vm.RemoteCommand(' '.join(cmds + ['wait']))
   logging.info(output)
 
-  match = re.findall(r'(\d+\.\d+)\s+\n', output)
-  value = 0
-  expected_num_match = (len(servers) - 1) * FLAGS.num_connections
-  if len(match) != expected_num_match:
-    raise errors.Benchmarks.RunError(
-        'Netserver not reachable. Expecting %s results, got %s.' %
-        (expected_num_match, len(match)))
-  for res in match:
+  values = collections.defaultdict(list)
+  for index, value in RESULT_REGEX.findall(output):
+    values[int(index)].append(float(value))
+  results = []
+  for index, server in enumerate(servers):
+    if len(values[index]) != FLAGS.num_connections:
+      raise errors.Benchmarks.RunError(
+          'Netserver on %s not reachable from %s. Expecting %s results, got '
+          '%s.' % (server.name, vm.name, FLAGS.num_connections,
+                   len(values[index])))
     if benchmark_name == 'TCP_RR':
-      value += 1.0 / float(res) * 1000.0
+      results.append(sum(1.0 / float(res) * 1000.0 for res in values[index]) /
+                     FLAGS.num_connections)
     else:
-      value += float(res)
-  with RESULT_LOCK:
-    result[VALUE_INDEX] += value
+      results.append(sum(values[index]))
+  return results
+
+
+def _RunRound(vms, pairs, benchmark_name, matrix):
+  """Runs netperf between pairs of VMs at once.
+
+  Args:
+    vms: list of VMs.
+    pairs: list of (client, server) tuples of indexes into vms.
+    benchmark_name: The netperf benchmark to run.
+    matrix: list of lists. matrix[client][server] is set to the result of
+        each pair.
+  """
+  servers_by_client = collections.OrderedDict()
+  for client, server in pairs:
+    servers_by_client.setdefault(client, []).append(server)
+  args = [((vms[client], benchmark_name, [vms[server] for server in servers]),
+           {})
+          for client, servers in servers_by_client.iteritems()]
+  results = vm_util.RunThreaded(RunNetperf, args, len(args))
+  for (client, servers), values in zip(servers_by_client.iteritems(),
+                                       results):
+    for server, value in zip(servers, values):
+      matrix[client][server] = value
+
+
+def _MakeSamples(benchmark_name, vms, matrix, metadata):
+  """Creates the samples of the results of a netperf benchmark in a mesh.
+
+  Args:
+    benchmark_name: The netperf benchmark that was run.
+    vms: list of VMs.
+    matrix: list of lists. matrix[client][server] is the result of the pair.
+    metadata: dict. Metadata of the samples.
+
+  Returns:
+    A list of sample.Sample objects.
+  """
+  pairs = [(value, client, server)
+           for client, row in enumerate(matrix)
+           for server, value in enumerate(row) if client != server]
+  values = [value for value, _, _ in pairs]
+  if benchmark_name == 'TCP_STREAM':
+    name = 'TCP_STREAM_Throughput'
+    unit = 'Mbits/sec'
+    results = [sample.Sample('TCP_STREAM_Total_Throughput', sum(values), unit,
+                             metadata)]
+    slowest = min(pairs)
+  else:
+    name = 'TCP_RR_Latency'
+    unit = 'ms'
+    results = [sample.Sample('TCP_RR_Average_Latency',
+                             sum(values) / len(values), unit, metadata)]
+    slowest = max(pairs)
+
+  matrix_metadata = metadata.copy()
+  matrix_metadata['matrix'] = json.dumps(matrix)
+  matrix_metadata['vms'] = json.dumps([vm.name for vm in vms])
+  results.append(sample.Sample(name + '_Matrix', 0, unit, matrix_metadata))
+  stats = sample.PercentileCalculator(values, PERCENTILES)
+  for stat in ['p%s' % percentile for percentile in PERCENTILES] + ['stddev']:
+    results.append(sample.Sample('%s_%s' % (name, stat), stats[stat], unit,
+                                 metadata))
+  value, client, server = slowest
+  slowest_metadata = metadata.copy()
+  slowest_metadata.update(sending_vm=vms[client].name,
+                          receiving_vm=vms[server].name)
+  results.append(sample.Sample(name + '_Slowest_Pair', value, unit,
+                               slowest_metadata))
+  return results
 
 
 def Run(benchmark_spec):
@@ -144,38 +281,26 @@ def Run(benchmark_spec):
         required to run the benchmark.
 
   Returns:
-    Total throughput, average latency in the form of tuple. The tuple contains
-        the sample metric (string), value (float), unit (string).
+    A list of sample.Sample objects: for each netperf benchmark, the total
+    throughput or average latency, the matrix and percentiles of the results
+    of all pairs, and the result of the slowest pair.
   """
   vms = benchmark_spec.vms
   num_vms = len(vms)
+  rounds = _GetRounds(num_vms)
   results = []
   for netperf_benchmark in NETPERF_BENCHMARKSS:
-    args = []
     metadata = {
         'number_machines': num_vms,
-        'number_connections': FLAGS.num_connections
+        'number_connections': FLAGS.num_connections,
+        'mesh_network_schedule': FLAGS.mesh_network_schedule,
+        'number_rounds': len(rounds),
+        'max_concurrent_pairs': max(len(pairs) for pairs in rounds)
     }
-
-    if netperf_benchmark == 'TCP_STREAM':
-      metric = 'TCP_STREAM_Total_Throughput'
-      unit = 'Mbits/sec'
-      value = 0.0
-    else:
-      metric = 'TCP_RR_Average_Latency'
-      unit = 'ms'
-      value = 0.0
-    result = [metric, value, unit, metadata]
-    args = [((source, netperf_benchmark, vms, result), {}) for source in vms]
-    vm_util.RunThreaded(RunNetperf, args, num_vms)
-    result = sample.Sample(*result)
-    if netperf_benchmark == 'TCP_RR':
-      denom = ((num_vms - 1) *
-               num_vms *
-               FLAGS.num_connections)
-      result = result._replace(value=result.value / denom)
-
-    results.append(result)
+    matrix = [[None] * num_vms for _ in xrange(num_vms)]
+    for pairs in rounds:
+      _RunRound(vms, pairs, netperf_benchmark, matrix)
+    results.extend(_MakeSamples(netperf_benchmark, vms, matrix, metadata))
   logging.info(results)
   return results
 
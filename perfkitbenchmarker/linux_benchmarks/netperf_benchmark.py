@@ -37,6 +37,7 @@ from perfkitbenchmarker import flags
 from perfkitbenchmarker import sample
 from perfkitbenchmarker import vm_util
 from perfkitbenchmarker.linux_packages import netperf
+from perfkitbenchmarker.scripts import stats_util
 
 flags.DEFINE_integer('netperf_max_iter', None,
                      'Maximum number of iterations to run during '
@@ -149,35 +150,9 @@ def _HistogramStatsCalculator(histogram, percentiles=PERCENTILES):
   Returns:
     A dict mapping stat names to their values.
   """
-  stats = {}
-
-  # Histogram data in list form sorted by key
-  by_value = sorted([(value, count) for value, count in histogram.items()],
-                    key=lambda x: x[0])
-  total_count = sum(histogram.values())
-
-  cur_value_index = 0  # Current index in by_value
-  cur_index = 0  # Number of values we've passed so far
-  for p in percentiles:
-    index = int(float(total_count) * float(p) / 100.0)
-    index = min(index, total_count - 1)  # Handle 100th percentile
-    for value, count in by_value[cur_value_index:]:
-      if cur_index + count > index:
-        stats['p%s' % str(p)] = by_value[cur_value_index][0]
-        break
-      else:
-        cur_index += count
-        cur_value_index += 1
-
-  # Compute stddev
-  value_sum = float(sum([value * count for value, count in histogram.items()]))
-  average = value_sum / float(total_count)
-  if total_count > 1:
-    total_of_squares = sum([(value - average) ** 2 * count
-                            for value, count in histogram.items()])
-    stats['stddev'] = (total_of_squares / (total_count - 1)) ** 0.5
-  else:
-    stats['stddev'] = 0
+  stats = stats_util.CalculateHistogramStats(histogram, percentiles)
+  # Only the percentiles and stddev are reported.
+  del stats['average']
   return stats
 
 
@@ -48,6 +48,7 @@ from perfkitbenchmarker import errors
 from perfkitbenchmarker import flags
 from perfkitbenchmarker import flag_util
 from perfkitbenchmarker import object_storage_service
+from perfkitbenchmarker import quantile_sketch
 from perfkitbenchmarker import sample
 from perfkitbenchmarker import units
 from perfkitbenchmarker import vm_util
@@ -163,6 +164,8 @@ API_TEST_SCRIPT_FILES = ['object_storage_api_tests.py',
                          'object_storage_interface.py',
                          'azure_flags.py',
                          's3_flags.py']
+# Modules in perfkitbenchmarker/scripts that the API test scripts import.
+API_TEST_SCRIPT_DEPENDENCIES = ['stats_util.py']
 
 # Various constants to name the result metrics.
 THROUGHPUT_UNIT = 'Mbps'
@@ -410,6 +413,12 @@ def _ProcessMultiStreamResults(start_times, latencies, sizes, operation,
       latency_prefix,
       LATENCY_UNIT,
       distribution_metadata)
+  # Unlike the percentiles, the sketch can be merged with those of other runs.
+  latency_sketch = quantile_sketch.QuantileSketch()
+  for stream_latencies in active_latencies:
+    latency_sketch.AddMany(stream_latencies)
+  results.append(latency_sketch.CreateSample(
+      '%s sketch' % latency_prefix, LATENCY_UNIT, distribution_metadata))
 
   # Publish by-size and full-distribution stats even if there's only
   # one size in the distribution, because it simplifies postprocessing
@@ -1072,6 +1081,8 @@ def PrepareVM(vm, service):
     path = data.ResourcePath(os.path.join(API_TEST_SCRIPTS_DIR, file_name))
     logging.info('Uploading %s to %s', path, vm)
     vm.PushFile(path, '/tmp/run/')
+  for file_name in API_TEST_SCRIPT_DEPENDENCIES:
+    vm.PushDataFile(file_name, '/tmp/run/')
 
   service.PrepareVM(vm)
 
@@ -26,6 +26,15 @@ uninstall function.  If the package manually places files in other locations
 (e.g. /usr/bin, /opt/pkb), then it also needs to define uninstall functions
 (e.g.  YumUninstall(vm)).
 
+Packages that only install packages through the package manager can instead
+declare them in APT_PACKAGES and YUM_PACKAGES strings (e.g.
+APT_PACKAGES = 'curl'), without defining install functions. Packages may also
+list the names of the PerfKit packages they depend on in DEPENDENCIES. The
+declared OS packages of a set of PerfKit packages and their dependencies are
+installed in a single package manager transaction by
+BaseLinuxMixin.InstallAll, which BaseLinuxMixin.Install also uses for packages
+that declare DEPENDENCIES.
+
 Package installation should persist across reboots.
 
 All functions in each package module should be prefixed with the type of package
@@ -36,12 +45,135 @@ See perfkitbenchmarker/package_managers.py for more information on how to use
 packages in benchmarks.
 """
 
+from perfkitbenchmarker import artifact_cache
+from perfkitbenchmarker import flags
 from perfkitbenchmarker import import_util
+from perfkitbenchmarker import sample
 
+FLAGS = flags.FLAGS
 
 # Place to install stuff. Persists across reboots.
 INSTALL_DIR = '/opt/pkb'
 
+# Key of the OS packages installed by BaseLinuxMixin.InstallAll in a single
+# transaction, in BaseLinuxMixin.package_install_times.
+BATCHED_OS_PACKAGES = 'os_packages'
+
+
+def GetOsPackages(package_name, package_manager):
+  """Returns the OS packages declared by a PerfKit package.
+
+  Args:
+    package_name: string. Name of the PerfKit package.
+    package_manager: string. 'Apt' or 'Yum'.
+
+  Returns:
+    A string of space-separated OS packages, or None if the package doesn't
+    declare any for the package manager.
+  """
+  return getattr(PACKAGES[package_name],
+                 '{0}_PACKAGES'.format(package_manager.upper()), None)
+
+
+def ResolveDependencies(package_names):
+  """Returns PerfKit packages and their declared dependencies in install order.
+
+  Args:
+    package_names: iterable of PerfKit package names.
+
+  Returns:
+    A list of package names without duplicates, in which each package comes
+    after its DEPENDENCIES.
+  """
+  resolved = []
+  visited = set()
+
+  def Visit(package_name):
+    if package_name in visited:
+      return
+    visited.add(package_name)
+    for dependency in getattr(PACKAGES[package_name], 'DEPENDENCIES', ()):
+      Visit(dependency)
+    resolved.append(package_name)
+
+  for package_name in package_names:
+    Visit(package_name)
+  return resolved
+
+
+def _StageUrl(vm, url, sha256):
+  return artifact_cache.Stage(vm, artifact_cache.Fetch(url, sha256),
+                              artifact_cache.GetUrlName(url))
+
+
+def ExtractTarball(vm, url, target_dir, sha256=None):
+  """Extracts a gzipped tarball at a URL into a directory on a VM.
+
+  The top-level directory of the tarball is stripped. If --package_cache_dir
+  is set, the tarball is downloaded once to the cache and staged on the VM
+  (see artifact_cache). Otherwise the VM downloads it with curl.
+
+  Args:
+    vm: BaseLinuxMixin. The VM to extract the tarball on.
+    url: string. URL of the tarball.
+    target_dir: string. Directory on the VM to extract the tarball into.
+    sha256: string. If set, the expected SHA-256 of the cached tarball.
+  """
+  if not FLAGS.package_cache_dir:
+    vm.RemoteCommand(('mkdir -p {0} && curl -L {1} | '
+                      'tar -C {0} --strip-components=1 -xzf -').format(
+                          target_dir, url))
+    return
+  vm.RemoteCommand('mkdir -p {0} && tar -C {0} --strip-components=1 '
+                   '-xzf {1}'.format(target_dir, _StageUrl(vm, url, sha256)))
+
+
+def DownloadFile(vm, url, remote_dir, sha256=None):
+  """Downloads a file at a URL into a directory on a VM.
+
+  If --package_cache_dir is set, the file is downloaded once to the cache and
+  staged on the VM (see artifact_cache), keeping the name from the URL.
+  Otherwise the VM downloads it with curl, which names it after the
+  Content-Disposition header if there is one.
+
+  Args:
+    vm: BaseLinuxMixin. The VM to download the file to.
+    url: string. URL of the file.
+    remote_dir: string. Directory on the VM to download the file into.
+    sha256: string. If set, the expected SHA-256 of the cached file.
+  """
+  if not FLAGS.package_cache_dir:
+    vm.RemoteCommand('cd {0} && curl -LJO {1}'.format(remote_dir, url))
+    return
+  vm.RemoteCommand('cp {0} {1}'.format(_StageUrl(vm, url, sha256),
+                                       remote_dir))
+
+
+def GenerateInstallTimeSamples(vms):
+  """Generates samples of how long it took to install each package.
+
+  Args:
+    vms: list of BaseVirtualMachines.
+
+  Returns:
+    A list of 'Package install time' Samples, one per package installed on
+    any of the VMs, with the longest install time across the VMs. Install
+    times include the dependencies installed by the package.
+  """
+  times_by_package = {}
+  for vm in vms:
+    for package_name, seconds in getattr(vm, 'package_install_times',
+                                         {}).iteritems():
+      times_by_package.setdefault(package_name, []).append(seconds)
+  samples = []
+  for package_name, times in sorted(times_by_package.iteritems()):
+    samples.append(sample.Sample(
+        'Package install time', max(times), 'seconds',
+        {'package': package_name,
+         'num_vms': len(times),
+         'mean_install_time': sum(times) / len(times)}))
+  return samples
+
 
 def _LoadPackages():
   packages = dict([(module.__name__.split('.')[-1], module) for module in
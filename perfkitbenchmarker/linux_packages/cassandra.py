@@ -29,6 +29,7 @@ from perfkitbenchmarker import errors
 from perfkitbenchmarker import flags
 from perfkitbenchmarker import os_types
 from perfkitbenchmarker import vm_util
+from perfkitbenchmarker.linux_packages import DownloadFile
 from perfkitbenchmarker.linux_packages import INSTALL_DIR
 from perfkitbenchmarker.linux_packages.ant import ANT_HOME_DIR
 
@@ -45,6 +46,8 @@ CASSANDRA_OUT = posixpath.join(CASSANDRA_DIR, 'cassandra.out')
 CASSANDRA_ERR = posixpath.join(CASSANDRA_DIR, 'cassandra.err')
 NODETOOL = posixpath.join(CASSANDRA_DIR, 'bin', 'nodetool')
 
+DEPENDENCIES = ('ant', 'build_tools', 'openjdk', 'curl')
+
 
 # Number of times to attempt to start the cluster.
 CLUSTER_START_TRIES = 10
@@ -71,10 +74,8 @@ def CheckPrerequisites():
 
 def _Install(vm):
   """Installs Cassandra from a tarball."""
-  vm.Install('ant')
-  vm.Install('build_tools')
-  vm.Install('openjdk')
-  vm.Install('curl')
+  for dependency in DEPENDENCIES:
+    vm.Install(dependency)
   vm.RemoteCommand(
       'cd {0}; git clone {1}; cd {2}; git checkout {3}; {4}/bin/ant'.format(
           INSTALL_DIR,
@@ -83,9 +84,7 @@ def _Install(vm):
           CASSANDRA_VERSION,
           ANT_HOME_DIR))
   # Add JNA
-  vm.RemoteCommand('cd {0} && curl -LJO {1}'.format(
-      posixpath.join(CASSANDRA_DIR, 'lib'),
-      JNA_JAR_URL))
+  DownloadFile(vm, JNA_JAR_URL, posixpath.join(CASSANDRA_DIR, 'lib'))
 
 
 def YumInstall(vm):
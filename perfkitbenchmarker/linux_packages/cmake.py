@@ -14,17 +14,5 @@
 
 """Module containing cmake installation and cleanup functions."""
 
-
-def _Install(vm):
-  """Installs the cmake package on the VM."""
-  vm.InstallPackages('cmake')
-
-
-def YumInstall(vm):
-  """Installs the cmake package on the VM."""
-  _Install(vm)
-
-
-def AptInstall(vm):
-  """Installs the cmake package on the VM."""
-  _Install(vm)
+APT_PACKAGES = 'cmake'
+YUM_PACKAGES = 'cmake'
@@ -19,6 +19,9 @@ import csv
 import itertools
 import numpy as np
 
+APT_PACKAGES = 'dstat'
+YUM_PACKAGES = 'dstat'
+
 
 def ParseCsvFile(fp):
   """Parse dstat results file in csv format.
@@ -75,18 +78,3 @@ def ParseCsvFile(fp):
                             len(labels), len(row), i, row))
     data.append(row)
   return labels, np.array(data, dtype=float)
-
-
-def _Install(vm):
-  """Installs the dstat package on the VM."""
-  vm.InstallPackages('dstat')
-
-
-def YumInstall(vm):
-  """Installs the dstat package on the VM."""
-  _Install(vm)
-
-
-def AptInstall(vm):
-  """Installs the dstat package on the VM."""
-  _Install(vm)
@@ -15,12 +15,5 @@
 
 """Module containing libevent installation and cleanup functions."""
 
-
-def YumInstall(vm):
-  """Installs the libevent package on the VM."""
-  vm.InstallPackages('libevent-devel')
-
-
-def AptInstall(vm):
-  """Installs the libevent package on the VM."""
-  vm.InstallPackages('libevent-dev')
+APT_PACKAGES = 'libevent-dev'
+YUM_PACKAGES = 'libevent-devel'
@@ -13,12 +13,19 @@
 # limitations under the License.
 
 """Module containing fio installation, cleanup, parsing functions."""
+import collections
 import ConfigParser
 import io
+import json
+import logging
+import posixpath
 import time
 
+from perfkitbenchmarker import data
+from perfkitbenchmarker import quantile_sketch
 from perfkitbenchmarker import regex_util
 from perfkitbenchmarker import sample
+from perfkitbenchmarker import vm_util
 from perfkitbenchmarker.linux_packages import INSTALL_DIR
 
 FIO_DIR = '%s/fio' % INSTALL_DIR
@@ -35,6 +42,15 @@ CMD_PARAMETER_REGEX = r'--([\S]+)\s*'
 CMD_PARAMETER_REPL_REGEX = r'\1\n'
 CMD_STONEWALL_PARAMETER = '--stonewall'
 JOB_STONEWALL_PARAMETER = 'stonewall'
+IO_MODES = ('read', 'write', 'trim')
+# Completion latency percentiles reported for each status interval.
+INTERVAL_PERCENTILES = (('p50', '50.000000'), ('p90', '90.000000'),
+                        ('p99', '99.000000'), ('p99.9', '99.900000'))
+# The script that summarizes fio logs on the VM, and the modules it imports.
+REDUCE_LOGS_SCRIPT = 'fio_reduce_logs.py'
+REDUCE_LOGS_DEPENDENCIES = ['stats_util.py']
+# Percentiles of the values in fio latency logs.
+LOG_PERCENTILES = (50, 90, 99, 99.9)
 
 
 def _Install(vm):
@@ -131,10 +147,9 @@ def ParseResults(job_file, fio_json_result, base_metadata=None):
   # come from the same fio run.
   timestamp = time.time()
   parameter_metadata = ParseJobFile(job_file)
-  io_modes = ['read', 'write', 'trim']
   for job in fio_json_result['jobs']:
     job_name = job['jobname']
-    for mode in io_modes:
+    for mode in IO_MODES:
       if job[mode]['io_bytes']:
         metric_name = '%s:%s' % (job_name, mode)
         parameters = parameter_metadata[job_name]
@@ -203,6 +218,299 @@ def ParseResults(job_file, fio_json_result, base_metadata=None):
   return samples
 
 
+class StatusParser(object):
+  """Parses the JSON reports of fio run with --status-interval as they arrive.
+
+  fio prints a complete JSON report every status interval, and once more when
+  it exits. Reports hold the statistics of each job since it started, so the
+  bandwidth and IOPS of an interval are computed from the difference between
+  consecutive reports. fio doesn't report latencies per interval, so the
+  latency percentiles of each interval sample are those since the job
+  started.
+
+  Attributes:
+    samples: list of sample.Sample objects for the intervals parsed so far.
+    last_result: dict. The last complete report, which is the final result
+        once fio has exited.
+  """
+
+  def __init__(self, job_file, base_metadata=None):
+    self.samples = []
+    self.last_result = None
+    self._parameter_metadata = ParseJobFile(job_file)
+    self._base_metadata = base_metadata or {}
+    self._buffer = ''
+    self._decoder = json.JSONDecoder()
+    # Maps (job name, mode) to the runtime in msec, KB transferred and IOs
+    # completed as of the previous report.
+    self._previous = {}
+
+  def Feed(self, data):
+    """Parses the reports completed by a chunk of fio's stdout.
+
+    Args:
+      data: string. The next chunk of stdout.
+    """
+    self._buffer += data
+    while True:
+      start = self._buffer.find('{')
+      if start < 0:
+        self._buffer = ''
+        return
+      try:
+        result, end = self._decoder.raw_decode(self._buffer, start)
+      except ValueError:
+        # The rest of the report hasn't arrived yet.
+        self._buffer = self._buffer[start:]
+        return
+      self._buffer = self._buffer[end:]
+      self.last_result = result
+      self._AddIntervalSamples(result)
+
+  def _AddIntervalSamples(self, result):
+    timestamp = time.time()
+    for job in result.get('jobs', []):
+      job_name = job['jobname']
+      for mode in IO_MODES:
+        stats = job.get(mode)
+        if not stats or not stats['io_bytes']:
+          continue
+        runtime = stats['runtime']
+        total_ios = stats.get('total_ios', stats['iops'] * runtime / 1000.0)
+        previous_runtime, previous_bytes, previous_ios = self._previous.get(
+            (job_name, mode), (0, 0, 0))
+        if runtime <= previous_runtime:
+          continue
+        self._previous[job_name, mode] = runtime, stats['io_bytes'], total_ios
+        interval = (runtime - previous_runtime) / 1000.0
+        bandwidth = (stats['io_bytes'] - previous_bytes) / interval
+        iops = (total_ios - previous_ios) / interval
+        metadata = self._parameter_metadata.get(job_name, {}).copy()
+        metadata.update(self._base_metadata)
+        metadata.update({'fio_job': job_name,
+                         'interval_start': previous_runtime / 1000.0,
+                         'interval_end': runtime / 1000.0})
+        metric_name = '%s:%s:interval' % (job_name, mode)
+        self.samples.append(sample.Sample(
+            '%s:bandwidth' % metric_name, bandwidth, 'KB/s', metadata,
+            timestamp))
+        self.samples.append(sample.Sample(
+            '%s:iops' % metric_name, iops, '', metadata, timestamp))
+        percentiles = stats['clat']['percentile']
+        for stat_name, key in INTERVAL_PERCENTILES:
+          if key in percentiles:
+            self.samples.append(sample.Sample(
+                '%s:latency:%s' % (metric_name, stat_name), percentiles[key],
+                'usec', metadata, timestamp))
+        logging.info('fio %s %s at %ds: %.0f KB/s, %.0f IOPS, p99 latency '
+                     '%s usec', job_name, mode, runtime / 1000,
+                     bandwidth, iops, percentiles.get('99.000000'))
+
+
+def GetLatencySketch(stats):
+  """Estimates the distribution of the completion latencies of a job.
+
+  fio's JSON output doesn't hold the latency of every IO, so the sketch is
+  built from its percentile table: the IOs between two consecutive
+  percentiles are counted at the latency of the higher one, and those above
+  the highest at the maximum latency. If fio was run with
+  --output-format=json+, its latency histogram is used instead.
+
+  Args:
+    stats: dict. The statistics of a job for one IO mode, e.g.
+        job['read'] in fio's JSON output.
+
+  Returns:
+    A quantile_sketch.QuantileSketch of the latencies in usec.
+  """
+  clat = stats['clat']
+  if clat.get('bins'):
+    return quantile_sketch.QuantileSketch.FromHistogram(
+        (float(value), count) for value, count in clat['bins'].iteritems())
+  total_ios = stats.get('total_ios')
+  if total_ios is None:
+    total_ios = int(round(stats['iops'] * stats['runtime'] / 1000.0))
+  histogram = []
+  previous_count = 0
+  for percentile, value in sorted(
+      (float(percentile), value)
+      for percentile, value in clat.get('percentile', {}).iteritems()):
+    count = int(round(total_ios * percentile / 100))
+    histogram.append((value, count - previous_count))
+    previous_count = count
+  histogram.append((clat['max'], total_ios - previous_count))
+  return quantile_sketch.QuantileSketch.FromHistogram(histogram)
+
+
+def AggregateResults(job_file, fio_json_results, base_metadata=None):
+  """Combines the results of fio runs against several disks into samples.
+
+  For each job and IO mode, the bandwidth and IOPS of all runs are summed,
+  and the latency sketches of all runs are merged (see GetLatencySketch).
+  The metrics are those of ParseResults with ':aggregate' after the mode,
+  e.g. 'sequential_read:read:aggregate:latency:p99'.
+
+  Args:
+    job_file: The contents of the fio job file.
+    fio_json_results: list of fio results in json format, one per disk.
+    base_metadata: Extra metadata to annotate the samples with.
+
+  Returns:
+    A list of sample.Sample objects.
+  """
+  timestamp = time.time()
+  parameter_metadata = ParseJobFile(job_file)
+  # Maps (job name, mode) to the summed bandwidth and IOPS, the merged sketch
+  # and the number of disks.
+  totals = collections.OrderedDict()
+  for fio_json_result in fio_json_results:
+    for job in fio_json_result['jobs']:
+      for mode in IO_MODES:
+        stats = job[mode]
+        if not stats['io_bytes']:
+          continue
+        key = job['jobname'], mode
+        if key not in totals:
+          totals[key] = [0, 0, quantile_sketch.QuantileSketch(), 0]
+        total = totals[key]
+        total[0] += stats['bw']
+        total[1] += stats['iops']
+        total[2].Merge(GetLatencySketch(stats))
+        total[3] += 1
+
+  samples = []
+  for (job_name, mode), (bandwidth, iops, sketch, disks) in totals.items():
+    metric_name = '%s:%s:aggregate' % (job_name, mode)
+    metadata = parameter_metadata.get(job_name, {}).copy()
+    metadata.update(base_metadata or {})
+    metadata.update({'fio_job': job_name, 'fio_disks': disks})
+    samples.append(sample.Sample('%s:bandwidth' % metric_name, bandwidth,
+                                 'KB/s', metadata, timestamp))
+    samples.append(sample.Sample('%s:iops' % metric_name, iops, '',
+                                 metadata, timestamp))
+    if not sketch.count:
+      continue
+    samples.append(sketch.CreateSample('%s:latency' % metric_name, 'usec',
+                                       metadata))
+    percentiles = sketch.GetPercentiles(LOG_PERCENTILES)
+    for percentile in LOG_PERCENTILES:
+      stat_name = 'p%s' % percentile
+      samples.append(sample.Sample(
+          '%s:latency:%s' % (metric_name, stat_name), percentiles[stat_name],
+          'usec', metadata, timestamp))
+  return samples
+
+
+def ReduceLogs(vm, job_file, remote_job_file_path, log_file_base, window_sec,
+               base_metadata=None):
+  """Summarizes the logs written by fio on the VM, and parses the summary.
+
+  The logs are reduced by REDUCE_LOGS_SCRIPT on the VM, so that only their
+  histograms, percentiles and per-window values are copied back, rather than
+  the logs themselves.
+
+  Args:
+    vm: The VM that ran fio.
+    job_file: The contents of the fio job file.
+    remote_job_file_path: string. The path of the job file on the VM, used to
+        name the jobs of each log.
+    log_file_base: string. The path, relative to the home directory on the
+        VM, that was passed to fio's --write_*_log options.
+    window_sec: number. The length of the time windows in seconds.
+    base_metadata: Extra metadata to annotate the samples with.
+
+  Returns:
+    A list of sample.Sample objects, as returned by ParseReducedLogs.
+  """
+  vm.RemoteCommand('mkdir -p %s' % vm_util.VM_TMP_DIR)
+  vm.PushFiles([(data.ResourcePath(file_name),
+                 posixpath.join(vm_util.VM_TMP_DIR, file_name))
+                for file_name in [REDUCE_LOGS_SCRIPT] +
+                REDUCE_LOGS_DEPENDENCIES])
+  stdout, _ = vm.RemoteCommand(
+      'python %s --window_sec %s --percentiles %s --job_file %s %s_*.log' % (
+          posixpath.join(vm_util.VM_TMP_DIR, REDUCE_LOGS_SCRIPT), window_sec,
+          ','.join(str(percentile) for percentile in LOG_PERCENTILES),
+          remote_job_file_path, log_file_base))
+  return ParseReducedLogs(job_file, json.loads(stdout), base_metadata)
+
+
+def ParseReducedLogs(job_file, reduced_logs, base_metadata=None):
+  """Parses the output of REDUCE_LOGS_SCRIPT into samples.
+
+  For each latency log, job and direction there is one sample whose metric
+  is '<job>:<direction>:<log>_log:histogram' with the histogram of the logged
+  latencies in its metadata, then samples of their percentiles, mean and
+  standard deviation, and then of those within each time window, like
+  '<job>:<direction>:<log>_log:window:p99'. For each bandwidth and IOPS log,
+  job and direction there are samples of the mean, min and max value over
+  the time windows, and then of the value in each time window, like
+  '<job>:<direction>:bw_log:window'. Window samples have 'interval_start' and
+  'interval_end' metadata, in seconds since the job started.
+
+  Args:
+    job_file: The contents of the fio job file.
+    reduced_logs: dict. The parsed JSON output of REDUCE_LOGS_SCRIPT.
+    base_metadata: Extra metadata to annotate the samples with.
+
+  Returns:
+    A list of sample.Sample objects.
+  """
+  samples = []
+  timestamp = time.time()
+  parameter_metadata = ParseJobFile(job_file)
+  stat_names = ['p%s' % percentile for percentile in LOG_PERCENTILES]
+  stat_names.extend(['average', 'stddev'])
+
+  def GetMetadata(series, window=None):
+    metadata = parameter_metadata.get(series['job'], {}).copy()
+    metadata.update(base_metadata or {})
+    metadata.update({'fio_job': series['job'], 'fio_log': series['log']})
+    if window:
+      metadata.update({'interval_start': window['start'],
+                       'interval_end': window['end']})
+    return metadata
+
+  for series in reduced_logs['latency']:
+    metric_name = '%s:%s:%s_log' % (series['job'], series['direction'],
+                                    series['log'])
+    metadata = GetMetadata(series)
+    histogram = {int(value): count
+                 for value, count in series['histogram'].iteritems()}
+    histogram_metadata = metadata.copy()
+    histogram_metadata['histogram'] = json.dumps(histogram, sort_keys=True)
+    samples.append(sample.Sample('%s:histogram' % metric_name, 0, 'usec',
+                                 histogram_metadata, timestamp))
+    for stat_name in stat_names:
+      samples.append(sample.Sample(
+          '%s:%s' % (metric_name, stat_name), series['stats'][stat_name],
+          'usec', metadata, timestamp))
+    for window in series['windows']:
+      metadata = GetMetadata(series, window)
+      for stat_name in stat_names:
+        samples.append(sample.Sample(
+            '%s:window:%s' % (metric_name, stat_name),
+            window['stats'][stat_name], 'usec', metadata, timestamp))
+
+  for series in reduced_logs['throughput']:
+    metric_name = '%s:%s:%s_log' % (series['job'], series['direction'],
+                                    series['log'])
+    unit = 'KB/s' if series['log'] == 'bw' else ''
+    values = [window['value'] for window in series['windows']]
+    if not values:
+      continue
+    metadata = GetMetadata(series)
+    for stat_name, value in (('mean', sum(values) / len(values)),
+                             ('min', min(values)), ('max', max(values))):
+      samples.append(sample.Sample('%s:%s' % (metric_name, stat_name), value,
+                                   unit, metadata, timestamp))
+    for window in series['windows']:
+      samples.append(sample.Sample(
+          '%s:window' % metric_name, window['value'], unit,
+          GetMetadata(series, window), timestamp))
+  return samples
+
+
 def DeleteParameterFromJobFile(job_file, parameter):
   """Delete all occurance of parameter from job_file.
 
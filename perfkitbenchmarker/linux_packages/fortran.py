@@ -14,18 +14,11 @@
 
 """Module containing fortran installation and cleanup functions."""
 
+APT_PACKAGES = 'gfortran'
+YUM_PACKAGES = 'gcc-gfortran libgfortran'
+
 
 def GetLibPath(vm):
   """Get fortran library path."""
   out, _ = vm.RemoteCommand('find /usr/lib/ | grep fortran.a')
   return out[:-1]
-
-
-def YumInstall(vm):
-  """Installs the fortran package on the VM."""
-  vm.InstallPackages('gcc-gfortran libgfortran')
-
-
-def AptInstall(vm):
-  """Installs the fortan package on the VM."""
-  vm.InstallPackages('gfortran')
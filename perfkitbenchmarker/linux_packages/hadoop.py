@@ -26,6 +26,7 @@ import time
 from perfkitbenchmarker import data
 from perfkitbenchmarker import regex_util
 from perfkitbenchmarker import vm_util
+from perfkitbenchmarker.linux_packages import ExtractTarball
 from perfkitbenchmarker.linux_packages import INSTALL_DIR
 
 HADOOP_VERSION = '2.5.2'
@@ -43,6 +44,8 @@ HADOOP_SBIN = posixpath.join(HADOOP_DIR, 'sbin')
 HADOOP_CONF_DIR = posixpath.join(HADOOP_DIR, 'etc', 'hadoop')
 HADOOP_PRIVATE_KEY = posixpath.join(HADOOP_CONF_DIR, 'hadoop_keyfile')
 
+DEPENDENCIES = ('openjdk', 'curl')
+
 
 def CheckPrerequisites():
   """Verifies that the required resources are present.
@@ -55,11 +58,9 @@ def CheckPrerequisites():
 
 
 def _Install(vm):
-  vm.Install('openjdk')
-  vm.Install('curl')
-  vm.RemoteCommand(('mkdir {0} && curl -L {1} | '
-                    'tar -C {0} --strip-components=1 -xzf -').format(
-                        HADOOP_DIR, HADOOP_URL))
+  for dependency in DEPENDENCIES:
+    vm.Install(dependency)
+  ExtractTarball(vm, HADOOP_URL, HADOOP_DIR)
 
 
 def YumInstall(vm):
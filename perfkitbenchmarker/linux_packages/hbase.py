@@ -25,6 +25,7 @@ import urllib2
 
 from perfkitbenchmarker import data
 from perfkitbenchmarker import vm_util
+from perfkitbenchmarker.linux_packages import ExtractTarball
 from perfkitbenchmarker.linux_packages import hadoop
 from perfkitbenchmarker.linux_packages import INSTALL_DIR
 
@@ -61,10 +62,7 @@ def CheckPrerequisites():
 def _Install(vm):
   vm.Install('hadoop')
   vm.Install('curl')
-  hbase_url = _GetHBaseURL()
-  vm.RemoteCommand(('mkdir {0} && curl -L {1} | '
-                    'tar -C {0} --strip-components=1 -xzf -').format(
-                        HBASE_DIR, hbase_url))
+  ExtractTarball(vm, _GetHBaseURL(), HBASE_DIR)
 
 
 def YumInstall(vm):
@@ -15,12 +15,5 @@
 
 """Module containing lua installation and cleanup functions."""
 
-
-def YumInstall(vm):
-  """Installs lua on the VM."""
-  vm.InstallPackages('lua lua-devel lua-static')
-
-
-def AptInstall(vm):
-  """Installs lua on the VM."""
-  vm.InstallPackages('lua5.1 liblua5.1-dev')
+APT_PACKAGES = 'lua5.1 liblua5.1-dev'
+YUM_PACKAGES = 'lua lua-devel lua-static'
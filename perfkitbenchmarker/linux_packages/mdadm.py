@@ -15,17 +15,5 @@
 
 """Module containing mdadm installation and cleanup functions."""
 
-
-def _Install(vm):
-  """Installs the mdadm package on the VM."""
-  vm.InstallPackages('mdadm')
-
-
-def YumInstall(vm):
-  """Installs the mdadm package on the VM."""
-  _Install(vm)
-
-
-def AptInstall(vm):
-  """Installs the mdadm package on the VM."""
-  _Install(vm)
+APT_PACKAGES = 'mdadm'
+YUM_PACKAGES = 'mdadm'
@@ -14,12 +14,5 @@
 
 """Module containing multilib installation and cleanup functions."""
 
-
-def YumInstall(vm):
-  """Installs multilib packages on the VM."""
-  vm.InstallPackages('glibc-devel.i686 libstdc++-devel.i686')
-
-
-def AptInstall(vm):
-  """Installs multilib packages on the VM."""
-  vm.InstallPackages('gcc-multilib g++-multilib')
+APT_PACKAGES = 'gcc-multilib g++-multilib'
+YUM_PACKAGES = 'glibc-devel.i686 libstdc++-devel.i686'
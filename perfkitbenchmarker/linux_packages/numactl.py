@@ -14,17 +14,5 @@
 
 """Module containing numactl installation and cleanup functions."""
 
-
-def _Install(vm):
-  """Installs the numactl package on the VM."""
-  vm.InstallPackages('numactl')
-
-
-def YumInstall(vm):
-  """Installs the numactl package on the VM."""
-  _Install(vm)
-
-
-def AptInstall(vm):
-  """Installs the numactl package on the VM."""
-  _Install(vm)
+APT_PACKAGES = 'numactl'
+YUM_PACKAGES = 'numactl'
@@ -15,12 +15,5 @@
 
 """Module containing OpenSSL installation and cleanup functions."""
 
-
-def YumInstall(vm):
-  """Installs OpenSSL on the VM."""
-  vm.InstallPackages('openssl openssl-devel openssl-static')
-
-
-def AptInstall(vm):
-  """Installs OpenSSL on the VM."""
-  vm.InstallPackages('openssl libssl-dev')
+APT_PACKAGES = 'openssl libssl-dev'
+YUM_PACKAGES = 'openssl openssl-devel openssl-static'
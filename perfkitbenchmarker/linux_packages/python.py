@@ -15,12 +15,5 @@
 
 """Module containing python 2.7 installation and cleanup functions."""
 
-
-def YumInstall(vm):
-  """Installs the package on the VM."""
-  vm.InstallPackages('python-2.7.5')
-
-
-def AptInstall(vm):
-  """Installs the package on the VM."""
-  vm.InstallPackages('python2.7')
+APT_PACKAGES = 'python2.7'
+YUM_PACKAGES = 'python-2.7.5'
@@ -15,12 +15,5 @@
 
 """Module containing unzip installation and cleanup functions."""
 
-
-def YumInstall(vm):
-  """Installs the unzip package on the VM."""
-  vm.InstallPackages('unzip')
-
-
-def AptInstall(vm):
-  """Installs the unzip package on the VM."""
-  vm.InstallPackages('unzip')
+APT_PACKAGES = 'unzip'
+YUM_PACKAGES = 'unzip'
@@ -35,10 +35,10 @@ By default, this runs YCSB workloads A and B against the database, 32 threads
 per client VM, with an initial database size of 1GB (1k records).
 Each workload runs for at most 30 minutes.
 """
+import array
 import bisect
 import collections
 import copy
-import csv
 import io
 import itertools
 import math
@@ -52,8 +52,10 @@ import time
 from perfkitbenchmarker import data
 from perfkitbenchmarker import events
 from perfkitbenchmarker import flags
+from perfkitbenchmarker import quantile_sketch
 from perfkitbenchmarker import sample
 from perfkitbenchmarker import vm_util
+from perfkitbenchmarker.linux_packages import ExtractTarball
 from perfkitbenchmarker.linux_packages import INSTALL_DIR
 
 FLAGS = flags.FLAGS
@@ -64,8 +66,17 @@ YCSB_TAR_URL = ('https://github.com/brianfrankcooper/YCSB/releases/'
 YCSB_DIR = posixpath.join(INSTALL_DIR, 'ycsb')
 YCSB_EXE = posixpath.join(YCSB_DIR, 'bin', 'ycsb')
 
+DEPENDENCIES = ('openjdk', 'curl')
+
 _DEFAULT_PERCENTILES = 50, 75, 90, 95, 99, 99.9
 
+# Matches "[OPERATION], name, value" lines of YCSB output. The groups are the
+# operation, the histogram bucket (if the name is a number, optionally prefixed
+# by ">"), the statistic name (otherwise), and the value as an integer or as a
+# float.
+_RESULT_LINE_RE = re.compile(
+    r'\[([A-Z]+)\],\s*(?:>?(\d+)|([^,]*?))\s*,\s*(?:(-?\d+)|([^,\s]+))\s*$')
+
 # Binary operators to aggregate reported statistics.
 # Statistics with operator 'None' will be dropped.
 AGGREGATE_OPERATORS = {
@@ -119,6 +130,11 @@ flags.DEFINE_integer('ycsb_record_count', 1000000, 'Pre-load with a total '
                      'dataset of records total.')
 flags.DEFINE_integer('ycsb_operation_count', 1000000, 'Number of operations '
                      '*per client VM*.')
+flags.DEFINE_integer('ycsb_result_parse_processes', 1, 'Number of processes '
+                     'used to parse the output of the YCSB client VMs. With '
+                     'more than one, the outputs of multiple client VMs are '
+                     'parsed in parallel once all of them have finished.',
+                     lower_bound=1)
 flags.DEFINE_integer('ycsb_timelimit', 1800, 'Maximum amount of time to run '
                      'each workload / client count combination. Set to 0 for '
                      'unlimited time.')
@@ -152,11 +168,9 @@ def CheckPrerequisites():
 
 def _Install(vm):
   """Installs the YCSB package on the VM."""
-  vm.Install('openjdk')
-  vm.Install('curl')
-  vm.RemoteCommand(('mkdir -p {0} && curl -L {1} | '
-                    'tar -C {0} --strip-components=1 -xzf -').format(
-                        YCSB_DIR, YCSB_TAR_URL))
+  for dependency in DEPENDENCIES:
+    vm.Install(dependency)
+  ExtractTarball(vm, YCSB_TAR_URL, YCSB_DIR)
 
 
 def YumInstall(vm):
@@ -169,7 +183,7 @@ def AptInstall(vm):
   _Install(vm)
 
 
-def ParseResults(ycsb_result_string, data_type='histogram'):
+def ParseResults(ycsb_result, data_type='histogram'):
   """Parse YCSB results.
 
   Example input:
@@ -190,8 +204,12 @@ def ParseResults(ycsb_result_string, data_type='histogram'):
     [UPDATE], 2, 532078
     ...
 
+  The output is parsed in a single pass, one line at a time, so it can be
+  streamed from a file without reading all of it into memory. To parse output
+  as it arrives, use a ResultParser.
+
   Args:
-    ycsb_result_string: str. Text output from YCSB.
+    ycsb_result: str or iterable of lines. Text output from YCSB.
     data_type: Either 'histogram' or 'timeseries'.
 
   Returns:
@@ -205,78 +223,159 @@ def ParseResults(ycsb_result_string, data_type='histogram'):
           [(0, 530), (19, 1)]
         indicates that 530 ops took between 0ms and 1ms, and 1 took between
         19ms and 20ms. Empty bins are not reported.
+
+  Raises:
+    IOError: If the output does not contain YCSB results.
   """
+  parser = ResultParser(data_type)
+  if isinstance(ycsb_result, basestring):
+    ycsb_result = io.BytesIO(ycsb_result)
+  parser.FeedLines(ycsb_result)
+  return parser.Finish()
 
-  # TODO: YCSB 0.9.0 output client and command line string to stderr, so
-  # we need to support it in the future.
-  lines = []
-  client_string = 'YCSB'
-  command_line = 'unknown'
-  fp = io.BytesIO(ycsb_result_string)
-  result_string = next(fp).strip()
-
-  def IsHeadOfResults(line):
-      return line.startswith('YCSB Client 0.') or line.startswith('[OVERALL]')
-
-  while not IsHeadOfResults(result_string):
-    result_string = next(fp).strip()
-
-  if result_string.startswith('YCSB Client 0.'):
-    client_string = result_string
-    command_line = next(fp).strip()
-    if not command_line.startswith('Command line:'):
-      raise IOError('Unexpected second line: {0}'.format(command_line))
-  elif result_string.startswith('[OVERALL]'):  # YCSB > 0.7.0.
-    lines.append(result_string)
-  else:
-    # Received unexpected header
-    raise IOError('Unexpected header: {0}'.format(client_string))
-
-  # Some databases print additional output to stdout.
-  # YCSB results start with [<OPERATION_NAME>];
-  # filter to just those lines.
-  def LineFilter(line):
-    return re.search(r'^\[[A-Z]+\]', line) is not None
-  lines = itertools.chain(lines, itertools.ifilter(LineFilter, fp))
-
-  r = csv.reader(lines)
-
-  by_operation = itertools.groupby(r, operator.itemgetter(0))
-
-  result = collections.OrderedDict([
-      ('client', client_string),
-      ('command_line', command_line),
-      ('groups', collections.OrderedDict())])
-
-  for operation, lines in by_operation:
-    operation = operation[1:-1].lower()
-
-    if operation == 'cleanup':
-      continue
-
-    op_result = {
-        'group': operation,
-        data_type: [],
-        'statistics': {}
-    }
-    for _, name, val in lines:
-      name = name.strip()
-      val = val.strip()
-      # Drop ">" from ">1000"
-      if name.startswith('>'):
-        name = name[1:]
-      val = float(val) if '.' in val else int(val)
-      if name.isdigit():
-        if val:
-          op_result[data_type].append((int(name), val))
+
+class ResultParser(object):
+  """Parses YCSB output in chunks, as it arrives.
+
+  Feed can be passed as the stdout_callback of RobustRemoteCommand, so that
+  the output of a client is parsed while it runs. See ParseResults for the
+  format of the result that Finish returns.
+  """
+
+  def __init__(self, data_type='histogram'):
+    self._data_type = data_type
+    self._buffer = ''
+    self._client_string = 'YCSB'
+    self._command_line = 'unknown'
+    # True until the version line or the first result line has been parsed.
+    self._in_header = True
+    self._expect_command_line = False
+    self._groups = collections.OrderedDict()
+    self._operation = None
+    self._bins = self._statistics = None
+
+  def Feed(self, data):
+    """Parses the lines completed by a chunk of output.
+
+    Args:
+      data: string. The next chunk of output.
+    """
+    lines = (self._buffer + data).split('\n')
+    self._buffer = lines.pop()
+    self.FeedLines(lines)
+
+  def FeedLines(self, lines):
+    """Parses complete lines of output.
+
+    Args:
+      lines: iterable of strings.
+
+    Raises:
+      IOError: If the version line isn't followed by the command line.
+    """
+    lines = iter(lines)
+    if self._in_header:
+      lines = self._ParseHeader(lines)
+      if lines is None:
+        return
+
+    # Some databases print additional output to stdout. YCSB results start
+    # with [<OPERATION_NAME>]; other lines are skipped.
+    data_type = self._data_type
+    groups = self._groups
+    current_operation = self._operation
+    bins = self._bins
+    statistics = self._statistics
+    match_line = _RESULT_LINE_RE.match
+    for line in lines:
+      match = match_line(line)
+      if match is None:
+        continue
+      operation, bucket, name, int_value, float_value = match.groups()
+      if operation != current_operation:
+        current_operation = operation
+        group = operation.lower()
+        if group == 'cleanup':
+          bins = statistics = None
+          continue
+        bins = []
+        statistics = {}
+        groups[group] = {
+            'group': group,
+            data_type: bins,
+            'statistics': statistics}
+      elif bins is None:  # CLEANUP
+        continue
+
+      if int_value is not None:
+        value = int(int_value)
+      else:
+        value = float(float_value)
+      if bucket is not None:
+        if value:
+          bins.append((int(bucket), value))
       else:
         if '(us)' in name:
           name = name.replace('(us)', '(ms)')
-          val /= 1000.0
-        op_result['statistics'][name] = val
+          value /= 1000.0
+        statistics[name] = value
+    self._operation = current_operation
+    self._bins = bins
+    self._statistics = statistics
 
-    result['groups'][operation] = op_result
-  return result
+  def _ParseHeader(self, lines):
+    """Parses lines until the results start.
+
+    Returns:
+      An iterator over the remaining lines, starting with the first result
+      line, or None if all lines were consumed before the results started.
+    """
+    for line in lines:
+      line = line.strip()
+      if self._expect_command_line:
+        if not line.startswith('Command line:'):
+          raise IOError('Unexpected second line: {0}'.format(line))
+        self._command_line = line
+        self._in_header = False
+        return lines
+      elif line.startswith('YCSB Client 0.'):
+        self._client_string = line
+        self._expect_command_line = True
+      elif line.startswith('[OVERALL]'):  # YCSB > 0.7.0.
+        self._in_header = False
+        return itertools.chain([line], lines)
+    return None
+
+  def Finish(self, stderr=''):
+    """Parses the last line of output and returns the result.
+
+    Args:
+      stderr: string. The stderr of YCSB, if only its stdout was fed. The
+          client version and command line are taken from it if present.
+
+    Returns:
+      A dict. See ParseResults.
+
+    Raises:
+      IOError: If the output does not contain YCSB results.
+    """
+    if self._buffer:
+      self.FeedLines([self._buffer])
+      self._buffer = ''
+    if stderr:
+      # YCSB 0.9.0 prints the client version and command line to stderr.
+      header = ResultParser(self._data_type)
+      header.FeedLines(io.BytesIO(stderr))
+      if not header._in_header:
+        self._in_header = False
+        self._client_string = header._client_string
+        self._command_line = header._command_line
+    if self._in_header:
+      raise IOError('No YCSB results found.')
+    return collections.OrderedDict([
+        ('client', self._client_string),
+        ('command_line', self._command_line),
+        ('groups', self._groups)])
 
 
 def _CumulativeSum(xs):
@@ -307,11 +406,14 @@ def _WeightedQuantile(x, weights, p):
   if len(x) != len(weights):
     raise ValueError('Lengths do not match: {0} != {1}'.format(
         len(x), len(weights)))
+  return _QuantileFromCumulativeWeights(x, list(_CumulativeSum(weights)), p)
+
+
+def _QuantileFromCumulativeWeights(x, cumulative, p):
+  """Like _WeightedQuantile, but takes the cumulative sums of the weights."""
   if p < 0 or p > 1:
     raise ValueError('Invalid quantile: {0}'.format(p))
-  n = sum(weights)
-  target = n * float(p)
-  cumulative = list(_CumulativeSum(weights))
+  target = cumulative[-1] * float(p)
 
   # Find the first cumulative weight >= target
   i = bisect.bisect_left(cumulative, target)
@@ -332,25 +434,116 @@ def _PercentilesFromHistogram(ycsb_histogram, percentiles=_DEFAULT_PERCENTILES):
     dict, mapping from percentile to value.
   """
   result = collections.OrderedDict()
-  histogram = sorted(ycsb_histogram)
+  latencies, freqs = zip(*sorted(ycsb_histogram))
+  cumulative = list(_CumulativeSum(freqs))
   for percentile in percentiles:
     if percentile < 0 or percentile > 100:
       raise ValueError('Invalid percentile: {0}'.format(percentile))
     if math.modf(percentile)[0] < 1e-7:
       percentile = int(percentile)
     label = 'p{0}'.format(percentile)
-    latencies, freqs = zip(*histogram)
-    time_ms = _WeightedQuantile(latencies, freqs, percentile * 0.01)
+    time_ms = _QuantileFromCumulativeWeights(latencies, cumulative,
+                                             percentile * 0.01)
     result[label] = time_ms
   return result
 
 
+def _AddLatencySketches(ycsb_result):
+  """Adds a QuantileSketch of each group's histogram to a YCSB result.
+
+  The sketches are merged by _CombineResults and published by _CreateSamples.
+
+  Args:
+    ycsb_result: dict. Result of ParseResults, with histograms.
+
+  Returns:
+    ycsb_result.
+  """
+  for group in ycsb_result['groups'].itervalues():
+    group['latency_sketch'] = quantile_sketch.QuantileSketch.FromHistogram(
+        group.get('histogram', []))
+  return ycsb_result
+
+
+def _ParseOutput(output):
+  """Parses the output of a YCSB client and adds its latency sketches."""
+  return _AddLatencySketches(ParseResults(output))
+
+
+def _RunClient(vm, command, parse):
+  """Runs a YCSB client command on a VM.
+
+  Args:
+    vm: The client VM.
+    command: string. The YCSB command.
+    parse: boolean. Whether stdout is parsed as it arrives, with the result
+        returned as by _ParseOutput. Otherwise the unparsed output is
+        returned, e.g. for _ParseOutputs.
+
+  Returns:
+    The parsed result, or the combined stderr and stdout of the client.
+  """
+  if not parse:
+    # YCSB version greater than 0.7.0 output some of the info we need to
+    # stderr. So we have to combine these 2 output to get expected results.
+    stdout, stderr = vm.RobustRemoteCommand(command)
+    return str(stderr + stdout)
+  parser = ResultParser()
+  _, stderr = vm.RobustRemoteCommand(command, stdout_callback=parser.Feed)
+  return _AddLatencySketches(parser.Finish(stderr=str(stderr)))
+
+
+def _ParseOutputToArrays(output):
+  """Like _ParseOutput, but returns each histogram as a pair of arrays.
+
+  The arrays are returned as strings, which are much cheaper to send between
+  processes than lists of tuples.
+  """
+  result = _ParseOutput(output)
+  for group in result['groups'].itervalues():
+    histogram = group['histogram']
+    times = array.array('l', [time_ms for time_ms, _ in histogram])
+    counts = [count for _, count in histogram]
+    typecode = 'l' if all(isinstance(c, (int, long)) for c in counts) else 'd'
+    group['histogram'] = (times.tostring(), typecode,
+                          array.array(typecode, counts).tostring())
+  return result
+
+
+def _HistogramFromArrays(times_string, typecode, counts_string):
+  """Restores a histogram converted by _ParseOutputToArrays."""
+  times = array.array('l')
+  times.fromstring(times_string)
+  counts = array.array(typecode)
+  counts.fromstring(counts_string)
+  return zip(times.tolist(), counts.tolist())
+
+
+def _ParseOutputs(outputs):
+  """Parses the outputs of several YCSB clients in parallel processes.
+
+  Args:
+    outputs: list of strings. Text output from each YCSB client.
+
+  Returns:
+    list of results, as returned by _ParseOutput, in the order of outputs.
+  """
+  results = vm_util.RunParallelProcesses(
+      [(_ParseOutputToArrays, (output,), {}) for output in outputs],
+      FLAGS.ycsb_result_parse_processes)
+  for result in results:
+    for group in result['groups'].itervalues():
+      group['histogram'] = _HistogramFromArrays(*group['histogram'])
+  return results
+
+
 def _CombineResults(result_list, combine_histograms=True):
   """Combine results from multiple YCSB clients.
 
   Reduces a list of YCSB results (the output of ParseResults)
   into a single result. Histogram bin counts, operation counts, and throughput
-  are summed; RunTime is replaced by the maximum runtime of any result.
+  are summed; RunTime is replaced by the maximum runtime of any result. Latency
+  sketches (see _AddLatencySketches) are merged.
 
   Args:
     result_list: List of ParseResults outputs.
@@ -366,24 +559,34 @@ def _CombineResults(result_list, combine_histograms=True):
       for k in drop_keys:
         group['statistics'].pop(k, None)
 
-  def CombineHistograms(hist1, hist2):
-    h1 = dict(hist1)
-    h2 = dict(hist2)
-    keys = sorted(frozenset(h1) | frozenset(h2))
-    result = []
-    for k in keys:
-      result.append((k, h1.get(k, 0) + h2.get(k, 0)))
-    return result
+  def CopyGroup(group):
+    """Deep copies a group, except for its histogram of immutable tuples."""
+    return copy.deepcopy(group, {id(group['histogram']): group['histogram']})
 
-  result = copy.deepcopy(result_list[0])
+  def AddHistogram(group_name, histogram):
+    combined = histograms[group_name]
+    get = combined.get
+    for time_ms, count in histogram:
+      combined[time_ms] = get(time_ms, 0) + count
+
+  result = copy.copy(result_list[0])
+  result['groups'] = copy.copy(result['groups'])
+  for group_name, group in result['groups'].iteritems():
+    result['groups'][group_name] = CopyGroup(group)
   DropUnaggregated(result)
 
+  # Histogram bins are summed across all results and sorted once at the end.
+  histograms = collections.defaultdict(dict)
+  for group_name, group in result['groups'].iteritems():
+    AddHistogram(group_name, group['histogram'])
+
   for indiv in result_list[1:]:
     for group_name, group in indiv['groups'].iteritems():
       if group_name not in result['groups']:
         logging.warn('Found result group "%s" in individual YCSB result, '
                      'but not in accumulator.', group_name)
-        result['groups'][group_name] = copy.deepcopy(group)
+        result['groups'][group_name] = CopyGroup(group)
+        AddHistogram(group_name, group['histogram'])
         continue
 
       # Combine reported statistics.
@@ -409,17 +612,28 @@ def _CombineResults(result_list, combine_histograms=True):
             op(result['groups'][group_name]['statistics'][k], v))
 
       if combine_histograms:
-        result['groups'][group_name]['histogram'] = CombineHistograms(
-            result['groups'][group_name]['histogram'],
-            group['histogram'])
+        AddHistogram(group_name, group['histogram'])
       else:
         result['groups'][group_name].pop('histogram', None)
+
+      # Sketches are merged even if histograms are not.
+      if 'latency_sketch' in group:
+        combined_sketch = result['groups'][group_name].get('latency_sketch')
+        if combined_sketch is None:
+          result['groups'][group_name]['latency_sketch'] = copy.deepcopy(
+              group['latency_sketch'])
+        else:
+          combined_sketch.Merge(group['latency_sketch'])
     result['client'] = ' '.join((result['client'], indiv['client']))
     result['command_line'] = ';'.join((result['command_line'],
                                        indiv['command_line']))
     if 'target' in result and 'target' in indiv:
       result['target'] += indiv['target']
 
+  for group_name, group in result['groups'].iteritems():
+    if 'histogram' in group:
+      group['histogram'] = sorted(histograms[group_name].iteritems())
+
   return result
 
 
@@ -484,6 +698,10 @@ def _CreateSamples(ycsb_result, include_histogram=True, **kwargs):
         yield sample.Sample(' '.join([group_name, label, 'latency']),
                             value, 'ms', meta)
 
+    if group.get('latency_sketch'):
+      yield group['latency_sketch'].CreateSample(
+          ' '.join([group_name, 'latency sketch']), 'ms', meta)
+
     if include_histogram:
       for time_ms, count in group['histogram']:
         yield sample.Sample(
@@ -566,14 +784,16 @@ class YCSBExecutor(object):
 
   def _Load(self, vm, **kwargs):
     """Execute 'ycsb load' on 'vm'."""
+    return _RunClient(vm, self._LoadCommand(**kwargs), parse=True)
+
+  def _LoadCommand(self, **kwargs):
+    """Returns the 'ycsb load' command."""
     kwargs.setdefault('threads', self._default_preload_threads)
     kwargs.setdefault('recordcount', FLAGS.ycsb_record_count)
     for pv in FLAGS.ycsb_load_parameters:
       param, value = pv.split('=', 1)
       kwargs[param] = value
-    command = self._BuildCommand('load', **kwargs)
-    stdout, stderr = vm.RobustRemoteCommand(command)
-    return ParseResults(str(stderr + stdout))
+    return self._BuildCommand('load', **kwargs)
 
   def _LoadThreaded(self, vms, workload_file, **kwargs):
     """Runs "Load" in parallel for each VM in VMs.
@@ -612,6 +832,10 @@ class YCSBExecutor(object):
     vm_util.RunThreaded(PushWorkload, vms)
 
     kwargs['parameter_files'] = [remote_path]
+    # Outputs are parsed by each thread as its client prints them, or by
+    # separate processes once all clients have finished.
+    parse_in_threads = (FLAGS.ycsb_result_parse_processes == 1 or
+                        len(vms) == 1)
 
     def _Load(loader_index):
       start = sum(loader_counts[:loader_index])
@@ -620,7 +844,8 @@ class YCSBExecutor(object):
                 insertcount=loader_counts[loader_index])
       if self.perclientparam is not None:
         kw.update(self.perclientparam[loader_index])
-      results.append(self._Load(vms[loader_index], **kw))
+      results.append(_RunClient(vms[loader_index], self._LoadCommand(**kw),
+                                parse=parse_in_threads))
       logging.info('VM %d (%s) finished', loader_index, vms[loader_index])
 
     start = time.time()
@@ -632,6 +857,8 @@ class YCSBExecutor(object):
     if len(results) != len(vms):
       raise IOError('Missing results: only {0}/{1} reported\n{2}'.format(
           len(results), len(vms), results))
+    if not parse_in_threads:
+      results = _ParseOutputs(results)
 
     samples = []
     if FLAGS.ycsb_include_individual_results and len(results) > 1:
@@ -651,15 +878,14 @@ class YCSBExecutor(object):
 
   def _Run(self, vm, **kwargs):
     """Run a single workload from a client vm."""
+    return _RunClient(vm, self._RunCommand(**kwargs), parse=True)
+
+  def _RunCommand(self, **kwargs):
+    """Returns the 'ycsb run' command."""
     for pv in FLAGS.ycsb_run_parameters:
       param, value = pv.split('=', 1)
       kwargs[param] = value
-    command = self._BuildCommand('run', **kwargs)
-    # YCSB version greater than 0.7.0 output some of the
-    # info we need to stderr. So we have to combine these 2
-    # output to get expected results.
-    stdout, stderr = vm.RobustRemoteCommand(command)
-    return ParseResults(str(stderr + stdout))
+    return self._BuildCommand('run', **kwargs)
 
   def _RunThreaded(self, vms, **kwargs):
     """Run a single workload using `vms`."""
@@ -673,6 +899,8 @@ class YCSBExecutor(object):
       targets = [target for _ in vms]
 
     results = []
+    parse_in_threads = (FLAGS.ycsb_result_parse_processes == 1 or
+                        len(vms) == 1)
 
     if self.shardkeyspace:
       record_count = int(self.workload_meta.get('recordcount', '1000'))
@@ -692,13 +920,16 @@ class YCSBExecutor(object):
         end = start + loader_counts[loader_index]
         params.update(insertstart=start,
                       recordcount=end)
-      results.append(self._Run(vm, **params))
+      results.append(_RunClient(vm, self._RunCommand(**params),
+                                parse=parse_in_threads))
       logging.info('VM %d (%s) finished', loader_index, vm)
     vm_util.RunThreaded(_Run, range(len(vms)))
 
     if len(results) != len(vms):
       raise IOError('Missing results: only {0}/{1} reported\n{2}'.format(
           len(results), len(vms), results))
+    if not parse_in_threads:
+      results = _ParseOutputs(results)
 
     return results
 
@@ -36,11 +36,16 @@ import time
 import uuid
 import yaml
 
+from perfkitbenchmarker import bulk_copy
+from perfkitbenchmarker import command_tasks
+from perfkitbenchmarker import data
 from perfkitbenchmarker import disk
 from perfkitbenchmarker import errors
 from perfkitbenchmarker import flags
 from perfkitbenchmarker import linux_packages
 from perfkitbenchmarker import os_types
+from perfkitbenchmarker import remote_agent
+from perfkitbenchmarker import ssh_connection_pool
 from perfkitbenchmarker import virtual_machine
 from perfkitbenchmarker import vm_util
 
@@ -99,6 +104,10 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
   # Serializing calls to ssh with the -t option fixes the problem.
   _pseudo_tty_lock = threading.Lock()
 
+  # Name of the package manager, which prefixes the install functions and the
+  # OS package declarations of PerfKit packages (e.g. 'Apt').
+  _PACKAGE_MANAGER = None
+
   def __init__(self):
     super(BaseLinuxMixin, self).__init__()
     self.ssh_port = DEFAULT_SSH_PORT
@@ -107,6 +116,13 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
 
     self._remote_command_script_upload_lock = threading.Lock()
     self._has_remote_command_script = False
+    # Created by the first RobustRemoteCommand with --remote_command_agent.
+    self.remote_command_agent = None
+
+    # Pool of multiplexed SSH connections. Created upon the first SSH command
+    # because the IP address is not known until the VM has been created.
+    self.ssh_connection_pool = None
+    self._ssh_connection_pool_lock = threading.Lock()
 
   def _PushRobustCommandScripts(self):
     """Pushes the scripts required by RobustRemoteCommand to this VM.
@@ -115,14 +131,64 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
     """
     with self._remote_command_script_upload_lock:
       if not self._has_remote_command_script:
-        for f in (EXECUTE_COMMAND, WAIT_FOR_COMMAND):
-          self.PushDataFile(f, os.path.join(vm_util.VM_TMP_DIR,
-                                            os.path.basename(f)))
+        self.PushFiles([(data.ResourcePath(f),
+                         os.path.join(vm_util.VM_TMP_DIR, os.path.basename(f)))
+                        for f in (EXECUTE_COMMAND, WAIT_FOR_COMMAND)])
         self._has_remote_command_script = True
 
-  def RobustRemoteCommand(self, command, should_log=False):
+  def RobustRemoteCommand(self, command, should_log=False,
+                          stdout_callback=None):
     """Runs a command on the VM in a more robust way than RemoteCommand.
 
+    With --remote_command_agent, the command is run by a persistent agent on
+    the VM (see remote_agent), which keeps running it if the ssh connection
+    drops. Otherwise it is run with _RobustRemoteCommandWithScripts.
+
+    Args:
+      command: A valid bash command, or a list of its arguments.
+      should_log: A boolean indicating whether the command result should be
+          logged at the info level. Even if it is false, the results will
+          still be logged at the debug level.
+      stdout_callback: If set, a function called with the stdout of the
+          command. With the agent, it is called with each chunk of stdout as
+          it arrives, otherwise once with all of stdout after the command
+          exits.
+
+    Returns:
+      A tuple of stdout and stderr from running the command.
+
+    Raises:
+      RemoteCommandError: If the command failed.
+    """
+    if not isinstance(command, basestring):
+      command = ' '.join(command)
+    if not FLAGS.remote_command_agent:
+      return self._RobustRemoteCommandWithScripts(command, should_log,
+                                                  stdout_callback)
+
+    with self._remote_command_script_upload_lock:
+      if self.remote_command_agent is None:
+        self.remote_command_agent = remote_agent.RemoteAgent(self)
+    logging.info('Running on %s through the command agent: %s', self.name,
+                 command)
+    stdout, stderr, retcode = self.remote_command_agent.Run(
+        command, stdout_callback=stdout_callback)
+    debug_text = ('Ran %s on %s. Got return code (%s).\nSTDOUT: %s\n'
+                  'STDERR: %s' % (command, self.name, retcode, stdout, stderr))
+    if should_log or retcode:
+      logging.info(debug_text)
+    else:
+      logging.debug(debug_text)
+    if retcode:
+      raise errors.VirtualMachine.RemoteCommandError(
+          'Got non-zero return code (%s) executing %s\nSTDOUT: %sSTDERR: %s' %
+          (retcode, command, stdout, stderr))
+    return stdout, stderr
+
+  def _RobustRemoteCommandWithScripts(self, command, should_log=False,
+                                      stdout_callback=None):
+    """Runs a command on the VM through a pair of scripts.
+
     Executes a command via a pair of scripts on the VM:
 
     * EXECUTE_COMMAND, which runs 'command' in a nohupped background process.
@@ -135,6 +201,8 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
 
     If should_log is True, log the command's output at the info
     level. If False, log the command's output at the debug level.
+    If stdout_callback is set, it is called with all of stdout once the
+    command has completed.
     """
     self._PushRobustCommandScripts()
 
@@ -150,9 +218,6 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
     stderr_file = file_base + '.stderr'
     status_file = file_base + '.status'
 
-    if not isinstance(command, basestring):
-      command = ' '.join(command)
-
     start_command = ['nohup', 'python', execute_path,
                      '--stdout', stdout_file,
                      '--stderr', stderr_file,
@@ -168,7 +233,8 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
                     '--status', status_file,
                     '--delete']
     try:
-      return self.RemoteCommand(' '.join(wait_command), should_log=should_log)
+      stdout, stderr = self.RemoteCommand(' '.join(wait_command),
+                                          should_log=should_log)
     except errors.VirtualMachine.RemoteCommandError:
       # In case the error was with the wrapper script itself, print the log.
       stdout, _ = self.RemoteCommand('cat %s' % wrapper_log, should_log=False)
@@ -176,6 +242,9 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
         logging.warn('Exception during RobustRemoteCommand. '
                      'Wrapper script log:\n%s', stdout)
       raise
+    if stdout_callback:
+      stdout_callback(stdout)
+    return stdout, stderr
 
   def SetupRemoteFirewall(self):
     """Sets up IP table configurations on the VM."""
@@ -253,6 +322,88 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
     """Restores the currently installed packages to those snapshotted."""
     pass
 
+  def _PrepareToInstall(self):
+    """Prepares the package manager before the first package is installed."""
+    pass
+
+  def _GetInstallFunction(self, package_name):
+    """Returns the install function of a PerfKit package, or None."""
+    package = linux_packages.PACKAGES[package_name]
+    return getattr(package, self._PACKAGE_MANAGER + 'Install',
+                   getattr(package, 'Install', None))
+
+  def _InstallPackage(self, package_name):
+    """Installs a PerfKit package with the package manager of the VM.
+
+    Records how long the installation took in package_install_times.
+
+    Raises:
+      KeyError: If the package has no install method for the package manager.
+    """
+    if package_name in self._installed_packages:
+      return
+    start_time = time.time()
+    install_function = self._GetInstallFunction(package_name)
+    if install_function:
+      install_function(self)
+    else:
+      os_packages = linux_packages.GetOsPackages(package_name,
+                                                 self._PACKAGE_MANAGER)
+      if os_packages is None:
+        raise KeyError('Package %s has no install method for %s.' %
+                       (package_name, self.OS_TYPE))
+      self.InstallPackages(os_packages)
+    self._installed_packages.add(package_name)
+    self.package_install_times[package_name] = time.time() - start_time
+
+  def Install(self, package_name):
+    """Installs a PerfKit package on the VM.
+
+    A package that declares DEPENDENCIES is installed with InstallAll, so that
+    the OS packages of its dependencies are installed in a single transaction.
+    """
+    if not self.install_packages:
+      return
+    if getattr(linux_packages.PACKAGES[package_name], 'DEPENDENCIES', None):
+      self.InstallAll([package_name])
+      return
+    self._PrepareToInstall()
+    self._InstallPackage(package_name)
+
+  def InstallAll(self, package_names):
+    """Installs PerfKit packages and their dependencies on the VM.
+
+    The OS packages declared by the PerfKit packages and their DEPENDENCIES
+    are installed in a single package manager transaction, instead of one
+    transaction per PerfKit package. The remaining packages are then installed
+    in dependency order.
+
+    Args:
+      package_names: list of PerfKit package names.
+    """
+    if not self.install_packages:
+      return
+    self._PrepareToInstall()
+    package_names = [
+        package_name
+        for package_name in linux_packages.ResolveDependencies(package_names)
+        if package_name not in self._installed_packages]
+    batched = [package_name for package_name in package_names
+               if not self._GetInstallFunction(package_name) and
+               linux_packages.GetOsPackages(package_name,
+                                            self._PACKAGE_MANAGER)]
+    if batched:
+      start_time = time.time()
+      self.InstallPackages(' '.join(
+          linux_packages.GetOsPackages(package_name, self._PACKAGE_MANAGER)
+          for package_name in batched))
+      self._installed_packages.update(batched)
+      self.package_install_times[linux_packages.BATCHED_OS_PACKAGES] = (
+          self.package_install_times.get(linux_packages.BATCHED_OS_PACKAGES,
+                                         0) + time.time() - start_time)
+    for package_name in package_names:
+      self._InstallPackage(package_name)
+
   def PackageCleanup(self):
     """Cleans up all installed packages.
 
@@ -298,9 +449,28 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
                'sudo chown -R $USER:$USER {1};').format(device_path, mount_path)
     self.RemoteHostCommand(mnt_cmd)
 
+  def _SshConnection(self):
+    """Returns a context manager that leases an SSH connection to the VM.
+
+    The context manager yields a lease whose options should be added to a
+    single ssh or scp command line. Unless --ssh_connection_pooling is enabled,
+    the lease has no options and the command opens its own connection.
+    """
+    with self._ssh_connection_pool_lock:
+      pool = self.ssh_connection_pool
+      if pool is None or pool.ip_address != self.ip_address:
+        pool = self.ssh_connection_pool = ssh_connection_pool.CreatePool(
+            self.user_name, self.ip_address, self.ssh_port)
+    if pool is None:
+      return ssh_connection_pool.DirectConnection()
+    return pool.Connection()
+
   def RemoteCopy(self, file_path, remote_path='', copy_to=True):
     self.RemoteHostCopy(file_path, remote_path, copy_to)
 
+  def RemoteCopyTask(self, file_path, remote_path='', copy_to=True):
+    return self.RemoteHostCopyTask(file_path, remote_path, copy_to)
+
   def RemoteHostCopy(self, file_path, remote_path='', copy_to=True):
     """Copies a file to or from the VM.
 
@@ -312,6 +482,11 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
     Raises:
       RemoteCommandError: If there was a problem copying the file.
     """
+    command_tasks.RunSync(
+        self.RemoteHostCopyTask(file_path, remote_path, copy_to))
+
+  def RemoteHostCopyTask(self, file_path, remote_path='', copy_to=True):
+    """Task version of RemoteHostCopy (see command_tasks)."""
     if vm_util.RunningOnWindows():
       if ':' in file_path:
         # scp doesn't like colons in paths.
@@ -324,11 +499,17 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
     scp_cmd = ['scp', '-P', str(self.ssh_port), '-pr']
     scp_cmd.extend(vm_util.GetSshOptions(self.ssh_private_key))
     if copy_to:
-      scp_cmd.extend([file_path, remote_location])
+      file_args = [file_path, remote_location]
     else:
-      scp_cmd.extend([remote_location, file_path])
+      file_args = [remote_location, file_path]
 
-    stdout, stderr, retcode = vm_util.IssueCommand(scp_cmd, timeout=None)
+    with self._SshConnection() as connection:
+      scp_cmd.extend(connection.options)
+      scp_cmd.extend(file_args)
+      stdout, stderr, retcode = yield command_tasks.Command(scp_cmd,
+                                                            timeout=None)
+      if retcode == 255:
+        connection.MarkFailed()
 
     if retcode:
       full_cmd = ' '.join(scp_cmd)
@@ -337,6 +518,86 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
                     (retcode, full_cmd, stdout, stderr))
       raise errors.VirtualMachine.RemoteCommandError(error_text)
 
+  def PushFiles(self, files, compress=False):
+    """Copies many files or directories to the VM in a single tarball.
+
+    The tarball is streamed to tar on the VM over one ssh connection, so
+    copying many small files doesn't take a round trip per file.
+
+    Args:
+      files: list of (local path, remote path) tuples. A remote path that is
+          empty or ends with '/' is a directory to copy the file into.
+          Relative remote paths are relative to the home directory.
+      compress: bool. Whether to gzip the tarball.
+
+    Raises:
+      RemoteCommandError: If there was a problem copying the files.
+    """
+    paths = []
+    for local_path, remote_path in files:
+      if not remote_path or remote_path.endswith('/'):
+        remote_path = posixpath.join(
+            remote_path, os.path.basename(local_path.rstrip(os.sep)))
+      paths.append((local_path, remote_path))
+    self._StreamTarball(bulk_copy.SendTarball,
+                        'tar -xP{0}f -'.format('z' if compress else ''),
+                        paths, compress)
+
+  def PullFiles(self, local_dir, remote_paths, remote_dir='.',
+                compress=False):
+    """Copies many files or directories from the VM in a single tarball.
+
+    Args:
+      local_dir: string. The local directory to copy the files to.
+      remote_paths: list of strings. Paths or globs of the files, relative to
+          remote_dir. Files keep these relative paths in local_dir.
+      remote_dir: string. The directory on the VM that remote_paths are
+          relative to.
+      compress: bool. Whether to gzip the tarball.
+
+    Raises:
+      RemoteCommandError: If there was a problem copying the files.
+    """
+    # tar exits with status 1 if files changed while they were read, e.g.
+    # logs still being written, which is fine.
+    command = 'cd {0} && {{ tar -c{1}f - {2}; [ $? -le 1 ]; }}'.format(
+        remote_dir, 'z' if compress else '', ' '.join(remote_paths))
+    self._StreamTarball(bulk_copy.ReceiveTarball, command, local_dir,
+                        compress)
+
+  def _StreamTarball(self, stream, command, *args):
+    """Runs a command on the VM that reads or writes a tarball.
+
+    Args:
+      stream: bulk_copy.SendTarball or bulk_copy.ReceiveTarball.
+      command: string. The tar command to run on the VM.
+      *args: The arguments of stream after the command line.
+
+    Raises:
+      RemoteCommandError: If the command failed.
+    """
+    ssh_cmd = self.GetSshCommand()
+    for _ in range(SSH_RETRIES):
+      with self._SshConnection() as connection:
+        stderr, retcode = stream(ssh_cmd + connection.options + [command],
+                                 *args)
+        if retcode == 255:
+          connection.MarkFailed()
+      if retcode != 255:  # Retry on 255 because this indicates an SSH failure
+        break
+
+    if retcode:
+      raise errors.VirtualMachine.RemoteCommandError(
+          'Got non-zero return code (%s) executing %s\nSTDERR: %s' %
+          (retcode, command, stderr))
+
+  def GetSshCommand(self):
+    """Returns the ssh command line, without the command to run on the VM."""
+    user_host = '%s@%s' % (self.user_name, self.ip_address)
+    ssh_cmd = ['ssh', '-A', '-p', str(self.ssh_port), user_host]
+    ssh_cmd.extend(vm_util.GetSshOptions(self.ssh_private_key))
+    return ssh_cmd
+
   def RemoteCommand(self, command,
                     should_log=False, retries=SSH_RETRIES,
                     ignore_failure=False, login_shell=False,
@@ -345,6 +606,14 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
                                   ignore_failure, login_shell,
                                   suppress_warning, timeout)
 
+  def RemoteCommandTask(self, command,
+                        should_log=False, retries=SSH_RETRIES,
+                        ignore_failure=False, login_shell=False,
+                        suppress_warning=False, timeout=None):
+    return self.RemoteHostCommandTask(command, should_log, retries,
+                                      ignore_failure, login_shell,
+                                      suppress_warning, timeout)
+
   def RemoteHostCommand(self, command,
                         should_log=False, retries=SSH_RETRIES,
                         ignore_failure=False, login_shell=False,
@@ -372,41 +641,51 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
     Raises:
       RemoteCommandError: If there was a problem establishing the connection.
     """
+    return command_tasks.RunSync(self.RemoteHostCommandTask(
+        command, should_log, retries, ignore_failure, login_shell,
+        suppress_warning, timeout))
+
+  def RemoteHostCommandTask(self, command,
+                            should_log=False, retries=SSH_RETRIES,
+                            ignore_failure=False, login_shell=False,
+                            suppress_warning=False, timeout=None):
+    """Task version of RemoteHostCommand (see command_tasks)."""
     if vm_util.RunningOnWindows():
       # Multi-line commands passed to ssh won't work on Windows unless the
       # newlines are escaped.
       command = command.replace('\n', '\\n')
 
-    user_host = '%s@%s' % (self.user_name, self.ip_address)
-    ssh_cmd = ['ssh', '-A', '-p', str(self.ssh_port), user_host]
-    ssh_cmd.extend(vm_util.GetSshOptions(self.ssh_private_key))
-    try:
-      if login_shell:
-        ssh_cmd.extend(['-t', '-t', 'bash -l -c "%s"' % command])
-        self._pseudo_tty_lock.acquire()
-      else:
-        ssh_cmd.append(command)
-
-      for _ in range(retries):
-        stdout, stderr, retcode = vm_util.IssueCommand(
-            ssh_cmd, force_info_log=should_log,
+    ssh_cmd = self.GetSshCommand()
+    if login_shell:
+      command_args = ['-t', '-t', 'bash -l -c "%s"' % command]
+      lock = self._pseudo_tty_lock
+    else:
+      command_args = [command]
+      lock = None
+
+    for _ in range(retries):
+      # Each attempt leases a connection so that a failed pooled connection
+      # is replaced before the command is retried.
+      with self._SshConnection() as connection:
+        stdout, stderr, retcode = yield command_tasks.Command(
+            ssh_cmd + connection.options + command_args,
+            force_info_log=should_log,
             suppress_warning=suppress_warning,
-            timeout=timeout)
-        if retcode != 255:  # Retry on 255 because this indicates an SSH failure
-          break
-    finally:
-      if login_shell:
-        self._pseudo_tty_lock.release()
+            timeout=timeout, lock=lock)
+        if retcode == 255:
+          connection.MarkFailed()
+      if retcode != 255:  # Retry on 255 because this indicates an SSH failure
+        break
 
     if retcode:
-      full_cmd = ' '.join(ssh_cmd)
+      full_cmd = ' '.join(ssh_cmd + command_args)
       error_text = ('Got non-zero return code (%s) executing %s\n'
                     'Full command: %s\nSTDOUT: %sSTDERR: %s' %
                     (retcode, command, full_cmd, stdout, stderr))
       if not ignore_failure:
         raise errors.VirtualMachine.RemoteCommandError(error_text)
 
-    return stdout, stderr
+    raise command_tasks.Return((stdout, stderr))
 
   def MoveFile(self, target, source_path, remote_path=''):
     self.MoveHostFile(target, source_path, remote_path)
@@ -607,6 +886,7 @@ class RhelMixin(BaseLinuxMixin):
   """Class holding RHEL specific VM methods and attributes."""
 
   OS_TYPE = os_types.RHEL
+  _PACKAGE_MANAGER = 'Yum'
 
   def OnStartup(self):
     """Eliminates the need to have a tty to run sudo commands."""
@@ -667,21 +947,6 @@ class RhelMixin(BaseLinuxMixin):
     """Installs a 'package group' using the yum package manager."""
     self.RemoteCommand('sudo yum groupinstall -y "%s"' % package_group)
 
-  def Install(self, package_name):
-    """Installs a PerfKit package on the VM."""
-    if not self.install_packages:
-      return
-    if package_name not in self._installed_packages:
-      package = linux_packages.PACKAGES[package_name]
-      if hasattr(package, 'YumInstall'):
-        package.YumInstall(self)
-      elif hasattr(package, 'Install'):
-        package.Install(self)
-      else:
-        raise KeyError('Package %s has no install method for RHEL.' %
-                       package_name)
-      self._installed_packages.add(package_name)
-
   def Uninstall(self, package_name):
     """Uninstalls a PerfKit package on the VM."""
     package = linux_packages.PACKAGES[package_name]
@@ -724,6 +989,7 @@ class DebianMixin(BaseLinuxMixin):
   """Class holding Debian specific VM methods and attributes."""
 
   OS_TYPE = os_types.DEBIAN
+  _PACKAGE_MANAGER = 'Apt'
 
   def __init__(self, *args, **kwargs):
     super(DebianMixin, self).__init__(*args, **kwargs)
@@ -786,26 +1052,12 @@ class DebianMixin(BaseLinuxMixin):
       self.AptUpdate()
       raise e
 
-  def Install(self, package_name):
-    """Installs a PerfKit package on the VM."""
-    if not self.install_packages:
-      return
-
+  def _PrepareToInstall(self):
+    """Updates the package lists before the first package is installed."""
     if not self._apt_updated:
       self.AptUpdate()
       self._apt_updated = True
 
-    if package_name not in self._installed_packages:
-      package = linux_packages.PACKAGES[package_name]
-      if hasattr(package, 'AptInstall'):
-        package.AptInstall(self)
-      elif hasattr(package, 'Install'):
-        package.Install(self)
-      else:
-        raise KeyError('Package %s has no install method for Debian.' %
-                       package_name)
-      self._installed_packages.add(package_name)
-
   def Uninstall(self, package_name):
     """Uninstalls a PerfKit package on the VM."""
     package = linux_packages.PACKAGES[package_name]
@@ -931,13 +1183,23 @@ class ContainerizedDebianMixin(DebianMixin):
     Returns:
       A tuple of stdout and stderr from running the command.
     """
+    return command_tasks.RunSync(self.RemoteCommandTask(
+        command, should_log, retries, ignore_failure, login_shell,
+        suppress_warning))
+
+  def RemoteCommandTask(self, command,
+                        should_log=False, retries=SSH_RETRIES,
+                        ignore_failure=False, login_shell=False,
+                        suppress_warning=False, timeout=None):
+    """Task version of RemoteCommand (see command_tasks)."""
     # Escapes bash sequences
     command = command.replace("'", r"'\''")
 
     logging.info('Docker running: %s' % command)
     command = "sudo docker exec %s bash -c '%s'" % (self.docker_id, command)
-    return self.RemoteHostCommand(command, should_log, retries,
-                                  ignore_failure, login_shell, suppress_warning)
+    return self.RemoteHostCommandTask(command, should_log, retries,
+                                      ignore_failure, login_shell,
+                                      suppress_warning)
 
   def ContainerCopy(self, file_name, container_path='', copy_to=True):
     """Copies a file to and from container_path to the host's vm_util.VM_TMP_DIR.
@@ -966,6 +1228,28 @@ class ContainerizedDebianMixin(DebianMixin):
       command = 'cp %s %s' % (container_path, destination_path)
       self.RemoteCommand(command)
 
+  def RemoteCopyTask(self, file_path, remote_path='', copy_to=True):
+    # Copies to and from containers take several retried steps.
+    return command_tasks.BlockingTask(self.RemoteCopy, file_path, remote_path,
+                                      copy_to)
+
+  def RobustRemoteCommand(self, command, should_log=False,
+                          stdout_callback=None):
+    # The agent would run commands on the host rather than in the container.
+    if not isinstance(command, basestring):
+      command = ' '.join(command)
+    return self._RobustRemoteCommandWithScripts(command, should_log,
+                                                stdout_callback)
+
+  def PushFiles(self, files, compress=False):
+    # Files are copied into the container one at a time (see RemoteCopy).
+    virtual_machine.BaseOsMixin.PushFiles(self, files, compress)
+
+  def PullFiles(self, local_dir, remote_paths, remote_dir='.',
+                compress=False):
+    virtual_machine.BaseOsMixin.PullFiles(self, local_dir, remote_paths,
+                                          remote_dir, compress)
+
   @vm_util.Retry(
       poll_interval=1, max_retries=3,
       retryable_exceptions=(errors.VirtualMachine.RemoteCommandError,))
@@ -1197,15 +1481,7 @@ class JujuMixin(DebianMixin):
     except AttributeError as e:
       logging.warn('Failed to install package %s, falling back to Apt (%s)'
                    % (package_name, e))
-      if package_name not in self._installed_packages:
-        if hasattr(package, 'AptInstall'):
-          package.AptInstall(self)
-        elif hasattr(package, 'Install'):
-          package.Install(self)
-        else:
-          raise KeyError('Package %s has no install method for Juju machines.' %
-                         package_name)
-        self._installed_packages.add(package_name)
+      self._InstallPackage(package_name)
 
   def SetupPackageManager(self):
     if self.is_controller:
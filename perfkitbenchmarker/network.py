@@ -123,6 +123,10 @@ class BaseNetwork(object):
         benchmark_spec.networks[key] = cls(spec)
       return benchmark_spec.networks[key]
 
+  def GetResourceDependencies(self):
+    """Returns the networks that must be created before this network."""
+    return []
+
   def Create(self):
     """Creates the actual network."""
     pass
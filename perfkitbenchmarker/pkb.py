@@ -78,10 +78,13 @@ from perfkitbenchmarker import events
 from perfkitbenchmarker import flags
 from perfkitbenchmarker import flag_util
 from perfkitbenchmarker import linux_benchmarks
+from perfkitbenchmarker import linux_packages
 from perfkitbenchmarker import log_util
 from perfkitbenchmarker import os_types
+from perfkitbenchmarker import prepared_images
 from perfkitbenchmarker import requirements
 from perfkitbenchmarker import spark_service
+from perfkitbenchmarker import ssh_connection_pool
 from perfkitbenchmarker import stages
 from perfkitbenchmarker import static_virtual_machine
 from perfkitbenchmarker import timing_util
@@ -106,6 +109,16 @@ flags.DEFINE_list('benchmarks', [benchmark_sets.STANDARD_SET],
                   'benchmark_sets.py.')
 flags.DEFINE_string('archive_bucket', None,
                     'Archive results to the given S3/GCS bucket.')
+flags.DEFINE_integer('archive_chunk_size_mb', None,
+                     'If set, --archive_bucket archives the run directory in '
+                     'gzipped tarball chunks of about this many MB of files, '
+                     'which are compressed and uploaded in parallel. Files '
+                     'that are unchanged since a previous archive of the run '
+                     'are skipped, so an interrupted archive resumes where '
+                     'it stopped.', lower_bound=1)
+flags.DEFINE_integer('archive_parallelism', 8,
+                     'The number of chunks compressed and uploaded at the same '
+                     'time with --archive_chunk_size_mb.', lower_bound=1)
 flags.DEFINE_string('project', None, 'GCP project ID under which '
                     'to create the virtual machines')
 flags.DEFINE_list(
@@ -375,6 +388,8 @@ def DoProvisionPhase(spec, timer):
   spec.ConstructSparkService()
   spec.ConstructDpbService()
   spec.ConstructVirtualMachines()
+  if FLAGS.use_prepared_images:
+    prepared_images.UsePreparedImages(spec)
   # Pickle the spec before we try to create anything so we can clean
   # everything up on a second run if something goes wrong.
   spec.Pickle()
@@ -402,6 +417,9 @@ def DoPreparePhase(spec, timer):
     spec.Prepare()
   with timer.Measure('Benchmark Prepare'):
     spec.BenchmarkPrepare(spec)
+  if FLAGS.use_prepared_images:
+    with timer.Measure('Prepared Image Creation'):
+      prepared_images.CaptureImages(spec)
   spec.StartBackgroundWorkload()
 
 
@@ -523,6 +541,14 @@ def RunBenchmark(spec, collector):
         if timing_util.RuntimeMeasurementsEnabled():
           collector.AddSamples(
               detailed_timer.GenerateSamples(), spec.name, spec)
+          collector.AddSamples(spec.provisioning_samples, spec.name, spec)
+          collector.AddSamples(
+              linux_packages.GenerateInstallTimeSamples(spec.vms), spec.name,
+              spec)
+        collector.AddSamples(
+            ssh_connection_pool.GenerateSamples(spec.vms), spec.name, spec)
+        collector.AddSamples(
+            spec.retry_stats.GenerateSamples(), spec.name, spec)
 
       except:
         # Resource cleanup (below) can take a long time. Log the error to give
@@ -542,19 +568,27 @@ def RunBenchmark(spec, collector):
   spec.status = benchmark_status.SUCCEEDED
 
 
+def _GetSampleSpoolPath(spec):
+  """Returns the path of the file that a benchmark's samples are spooled to."""
+  return vm_util.PrependTempDir('samples-%s.spool' % spec.uid)
+
+
 def RunBenchmarkTask(spec):
   """Task that executes RunBenchmark.
 
-  This is designed to be used with RunParallelProcesses.
+  This is designed to be used with RunParallelProcesses. Samples that have not
+  been published are spooled to the file named by _GetSampleSpoolPath, rather
+  than returned, so that they do not all have to be held in memory and pickled
+  back to the parent process.
 
   Arguments:
     spec: BenchmarkSpec. The spec to call RunBenchmark with.
 
   Returns:
-    A tuple of BenchmarkSpec, list of samples.
+    The BenchmarkSpec.
   """
   if _TEARDOWN_EVENT.is_set():
-    return spec, []
+    return spec
 
   # Many providers name resources using run_uris. When running multiple
   # benchmarks in parallel, this causes name collisions on resources.
@@ -562,7 +596,7 @@ def RunBenchmarkTask(spec):
   if FLAGS.run_processes > 1:
     spec.config.flags['run_uri'] = FLAGS.run_uri + str(spec.sequence_number)
 
-  collector = SampleCollector()
+  collector = SampleCollector(spool_path=_GetSampleSpoolPath(spec))
   try:
     RunBenchmark(spec, collector)
   except BaseException as e:
@@ -574,10 +608,11 @@ def RunBenchmarkTask(spec):
     else:
       logging.error('%s Execution will continue.', msg)
   finally:
-    # We need to return both the spec and samples so that we know
-    # the status of the test and can publish any samples that
-    # haven't yet been published.
-    return spec, collector.samples
+    # We need to return the spec so that we know the status of the test, and
+    # spool any samples that haven't yet been published.
+    collector.FlushSamples()
+    collector.FinishStreaming()
+    return spec
 
 
 def _LogCommandLineFlags():
@@ -653,14 +688,15 @@ def RunBenchmarks():
   try:
     tasks = [(RunBenchmarkTask, (spec,), {})
              for spec in benchmark_specs]
-    spec_sample_tuples = background_tasks.RunParallelProcesses(
+    benchmark_specs = background_tasks.RunParallelProcesses(
         tasks, FLAGS.run_processes)
-    benchmark_specs, sample_lists = zip(*spec_sample_tuples)
-    for sample_list in sample_lists:
-      collector.samples.extend(sample_list)
 
   finally:
-    if collector.samples:
+    # Samples that were spooled before a benchmark process died are published
+    # too.
+    for spec in benchmark_specs:
+      collector.AddSpooledSamples(_GetSampleSpoolPath(spec))
+    if collector.HasSamples():
       collector.PublishSamples()
 
     if benchmark_specs:
@@ -677,7 +713,10 @@ def RunBenchmarks():
   if FLAGS.archive_bucket:
     archive.ArchiveRun(vm_util.GetTempDir(), FLAGS.archive_bucket,
                        gsutil_path=FLAGS.gsutil_path,
-                       prefix=FLAGS.run_uri + '_')
+                       prefix=FLAGS.run_uri + '_',
+                       chunk_size=(FLAGS.archive_chunk_size_mb and
+                                   FLAGS.archive_chunk_size_mb << 20),
+                       max_concurrency=FLAGS.archive_parallelism)
   all_benchmarks_succeeded = all(spec.status == benchmark_status.SUCCEEDED
                                  for spec in benchmark_specs)
   return 0 if all_benchmarks_succeeded else 1
@@ -0,0 +1,206 @@
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Images of prepared VMs, to skip installing packages in later runs.
+
+With --use_prepared_images, an image of the boot disk of a VM is created
+after the Prepare phase, and recorded in a registry together with the PerfKit
+packages installed on the VM. Later runs of the same benchmark boot the VMs
+of the same VM group, cloud, zone, OS type and base image from that image,
+and skip installing the recorded packages.
+
+A recorded image is only used if its fingerprint still matches: the PKB
+version, the source of the recorded package modules and of the benchmark
+module, and the values of the flags they define. Otherwise the VMs boot from
+their base image, and a new image replaces the stale one after Prepare.
+
+Only files on the boot disk are captured. Anything a benchmark builds on its
+scratch disks is rebuilt in every run.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from perfkitbenchmarker import errors
+from perfkitbenchmarker import flags
+from perfkitbenchmarker import linux_packages
+from perfkitbenchmarker import os_types
+from perfkitbenchmarker import version
+from perfkitbenchmarker import vm_util
+from perfkitbenchmarker import windows_packages
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_boolean('use_prepared_images', False,
+                     'If true, VMs boot from an image of a VM prepared for '
+                     'the same benchmark in an earlier run, if one exists, '
+                     'and skip installing the packages it holds. If there is '
+                     'none, or its packages or flags have changed, an image '
+                     'is created after the Prepare phase.')
+flags.DEFINE_string('prepared_image_registry', None,
+                    'Path of the JSON file recording prepared images. '
+                    'Defaults to prepared_images.json in --temp_dir.')
+
+_registry_lock = threading.Lock()
+
+
+def _GetRegistryPath():
+  return FLAGS.prepared_image_registry or os.path.join(
+      FLAGS.temp_dir, 'prepared_images.json')
+
+
+def _LoadRegistry():
+  try:
+    with open(_GetRegistryPath()) as fp:
+      return json.load(fp)
+  except (IOError, ValueError):
+    return {}
+
+
+def _UpdateRegistry(key, entry):
+  """Records an image in the registry, keeping entries added by other runs."""
+  path = _GetRegistryPath()
+  with _registry_lock:
+    registry = _LoadRegistry()
+    registry[key] = entry
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+      os.makedirs(directory)
+    with open(path + '.tmp', 'w') as fp:
+      json.dump(registry, fp, indent=2, sort_keys=True)
+    os.rename(path + '.tmp', path)
+
+
+def _GetImageKey(spec, group_name, vm):
+  """Returns the registry key of the image for a VM."""
+  key = [spec.name, group_name, vm.CLOUD, vm.OS_TYPE, vm.zone, vm.image]
+  return hashlib.sha1(json.dumps(key)).hexdigest()
+
+
+def _GetModuleFingerprint(module, flags_by_module):
+  """Returns a list describing the source of a module and its flag values."""
+  path = getattr(module, '__file__', None)
+  if path is None:
+    return [repr(module)]
+  path = os.path.splitext(path)[0] + '.py'
+  try:
+    with open(path, 'rb') as fp:
+      source_hash = hashlib.sha1(fp.read()).hexdigest()
+  except IOError:
+    source_hash = None
+  flag_values = sorted((flag.name, repr(flag.value))
+                       for flag in flags_by_module.get(module.__name__, ()))
+  return [module.__name__, source_hash, flag_values]
+
+
+def _GetFingerprint(spec, vm, package_names):
+  """Returns a hash of everything that affects what Prepare installs."""
+  if vm.OS_TYPE in os_types.WINDOWS_OS_TYPES:
+    packages = windows_packages.PACKAGES
+  else:
+    packages = linux_packages.PACKAGES
+  flags_by_module = FLAGS.FlagsByModuleDict()
+  fingerprint = [version.VERSION, _GetModuleFingerprint(
+      sys.modules[spec.BenchmarkPrepare.__module__], flags_by_module)]
+  for package_name in sorted(package_names):
+    if package_name not in packages:
+      return None
+    fingerprint.append(_GetModuleFingerprint(packages[package_name],
+                                             flags_by_module))
+  return hashlib.sha1(json.dumps(fingerprint)).hexdigest()
+
+
+def _GetImageCandidates(spec):
+  """Yields (group name, VM) pairs of VMs that can use prepared images."""
+  for group_name, vms in sorted(spec.vm_groups.iteritems()):
+    for vm in vms:
+      if not vm.is_static and vm.install_packages:
+        yield group_name, vm
+
+
+def UsePreparedImages(spec):
+  """Boots VMs from the images recorded for them, if they are up to date.
+
+  Must be called after the VMs are constructed and before they are created.
+
+  Args:
+    spec: BenchmarkSpec.
+  """
+  registry = _LoadRegistry()
+  for group_name, vm in _GetImageCandidates(spec):
+    key = _GetImageKey(spec, group_name, vm)
+    vm.prepared_image_key = key
+    entry = registry.get(key)
+    if entry is None:
+      continue
+    if entry['fingerprint'] != _GetFingerprint(spec, vm, entry['packages']):
+      logging.info('Not using prepared image %s for %s, because packages, '
+                   'flags or PKB changed since it was created.',
+                   entry['image'], vm.name)
+      continue
+    logging.info('Booting %s from prepared image %s.', vm.name, entry['image'])
+    vm.UseImage(entry['image'])
+    vm.prepared_image = entry['image']
+    vm._installed_packages.update(entry['packages'])
+
+
+def CaptureImages(spec):
+  """Creates and records images of prepared VMs.
+
+  One image is created for each key of VMs that didn't boot from an up to
+  date prepared image.
+
+  Args:
+    spec: BenchmarkSpec.
+  """
+  vms_by_key = {}
+  for _, vm in _GetImageCandidates(spec):
+    key = getattr(vm, 'prepared_image_key', None)
+    if key and not getattr(vm, 'prepared_image', None):
+      vms_by_key.setdefault(key, vm)
+  registry = _LoadRegistry()
+
+  def Capture(key, vm):
+    image_name = 'pkb-prepared-{0}-{1}'.format(key[:10], FLAGS.run_uri)
+    if vm.OS_TYPE in os_types.LINUX_OS_TYPES:
+      vm.RemoteCommand('sync')
+    try:
+      image = vm.CreateImage(image_name)
+    except NotImplementedError:
+      logging.info('Not creating a prepared image of %s, because %s does not '
+                   'support images.', vm.name, vm.CLOUD)
+      return
+    packages = sorted(vm._installed_packages)
+    _UpdateRegistry(key, {
+        'image': image,
+        'packages': packages,
+        'fingerprint': _GetFingerprint(spec, vm, packages),
+        'benchmark': spec.name,
+        'cloud': vm.CLOUD,
+        'created': time.time()})
+    logging.info('Created prepared image %s of %s.', image, vm.name)
+    stale_entry = registry.get(key)
+    if stale_entry:
+      try:
+        vm.DeleteImage(stale_entry['image'])
+      except (NotImplementedError, errors.Error) as e:
+        logging.warning('Could not delete stale prepared image %s: %s',
+                        stale_entry['image'], e)
+
+  vm_util.RunThreaded(Capture, [(item, {})
+                                for item in sorted(vms_by_key.iteritems())])
@@ -120,6 +120,9 @@ class AwsEMR(spark_service.BaseSparkService):
       self.network = None
     self.bucket_to_delete = None
 
+  def GetResourceDependencies(self):
+    return [self.network] if self.network else []
+
   def _CreateLogBucket(self):
     bucket_name = 's3://pkb-{0}-emr'.format(FLAGS.run_uri)
     cmd = self.cmd_prefix + ['s3', 'mb', bucket_name]
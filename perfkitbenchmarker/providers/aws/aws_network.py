@@ -534,6 +534,9 @@ class AwsNetwork(network.BaseNetwork):
     self.subnet = None
     self.placement_group = AwsPlacementGroup(self.region)
 
+  def GetResourceDependencies(self):
+    return [self.regional_network]
+
   def Create(self):
     """Creates the network."""
     self.regional_network.Create()
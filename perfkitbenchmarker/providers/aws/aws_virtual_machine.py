@@ -30,6 +30,7 @@ from perfkitbenchmarker import errors
 from perfkitbenchmarker import flags
 from perfkitbenchmarker import linux_virtual_machine
 from perfkitbenchmarker import resource
+from perfkitbenchmarker import status_poller
 from perfkitbenchmarker import virtual_machine
 from perfkitbenchmarker import vm_util
 from perfkitbenchmarker import windows_virtual_machine
@@ -69,6 +70,42 @@ HOST_EXISTS_STATES = frozenset(
     ['available', 'under-assessment', 'permanent-failure'])
 HOST_RELEASED_STATES = frozenset(['released', 'released-permanent-failure'])
 KNOWN_HOST_STATES = HOST_EXISTS_STATES | HOST_RELEASED_STATES
+# The maximum number of values in a describe-instances filter.
+_MAX_FILTER_VALUES = 200
+
+
+def _ListInstances(region, client_tokens):
+  """Lists EC2 instances in a region, for status_poller.StatusPoller.
+
+  Args:
+    region: string. The region to list.
+    client_tokens: frozenset of the client tokens of the instances to list.
+
+  Returns:
+    dict mapping the client tokens of the instances that exist to their
+    descriptions.
+  """
+  instances = {}
+  client_tokens = sorted(client_tokens)
+  for i in xrange(0, len(client_tokens), _MAX_FILTER_VALUES):
+    describe_cmd = util.AWS_PREFIX + [
+        'ec2',
+        'describe-instances',
+        '--region=%s' % region,
+        '--filter=Name=client-token,Values=%s' % ','.join(
+            client_tokens[i:i + _MAX_FILTER_VALUES])]
+    stdout, _ = util.IssueRetryableCommand(describe_cmd)
+    response = json.loads(stdout)
+    for reservation in response['Reservations']:
+      for instance in reservation['Instances']:
+        client_token = instance['ClientToken']
+        assert client_token not in instances, (
+            'Too many instances with client token %s.' % client_token)
+        instances[client_token] = instance
+  return instances
+
+
+_INSTANCE_POLLER = status_poller.StatusPoller(_ListInstances)
 
 
 def GetRootBlockDeviceSpecForImage(image_id, region):
@@ -370,19 +407,22 @@ class AwsVirtualMachine(virtual_machine.BaseVirtualMachine):
       if self.region in self.imported_keyfile_set:
         self.imported_keyfile_set.remove(self.region)
 
+  def _GetInstance(self):
+    """Returns the description of the instance, or None if it doesn't exist.
+
+    The instances of all VMs in a region are described together.
+    """
+    return _INSTANCE_POLLER.GetStatus(self.region, self.client_token)
+
   @vm_util.Retry()
   def _PostCreate(self):
     """Get the instance's data and tag it."""
-    describe_cmd = util.AWS_PREFIX + [
-        'ec2',
-        'describe-instances',
-        '--region=%s' % self.region,
-        '--instance-ids=%s' % self.id]
     logging.info('Getting instance %s public IP. This will fail until '
                  'a public IP is available, but will be retried.', self.id)
-    stdout, _ = util.IssueRetryableCommand(describe_cmd)
-    response = json.loads(stdout)
-    instance = response['Reservations'][0]['Instances'][0]
+    instance = self._GetInstance()
+    if instance is None:
+      raise errors.Resource.RetryableCreationError(
+          'Instance %s not found.' % self.id)
     self.ip_address = instance['PublicIpAddress']
     self.internal_ip = instance['PrivateIpAddress']
     if util.IsRegion(self.zone):
@@ -477,21 +517,11 @@ class AwsVirtualMachine(virtual_machine.BaseVirtualMachine):
 
   def _Exists(self):
     """Returns true if the VM exists."""
-    describe_cmd = util.AWS_PREFIX + [
-        'ec2',
-        'describe-instances',
-        '--region=%s' % self.region,
-        '--filter=Name=client-token,Values=%s' % self.client_token]
-    stdout, _ = util.IssueRetryableCommand(describe_cmd)
-    response = json.loads(stdout)
-    reservations = response['Reservations']
-    assert len(reservations) < 2, 'Too many reservations.'
-    if not reservations:
+    instance = self._GetInstance()
+    if instance is None:
       return False
-    instances = reservations[0]['Instances']
-    assert len(instances) == 1, 'Wrong number of instances.'
-    status = instances[0]['State']['Name']
-    self.id = instances[0]['InstanceId']
+    status = instance['State']['Name']
+    self.id = instance['InstanceId']
     assert status in INSTANCE_KNOWN_STATUSES, status
     return status in INSTANCE_EXISTS_STATUSES
 
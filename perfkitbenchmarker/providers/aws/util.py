@@ -78,7 +78,9 @@ def AddDefaultTags(resource_id, region):
   AddTags(resource_id, region, **tags)
 
 
-@vm_util.Retry()
+@vm_util.Retry(policies=((errors.VmUtil.ThrottledCommandError,
+                          vm_util.THROTTLING_RETRY_POLICY),),
+               budget=vm_util.GetCommandRetryBudgetName)
 def IssueRetryableCommand(cmd, env=None):
   """Tries running the provided command until it succeeds or times out.
 
@@ -95,6 +97,8 @@ def IssueRetryableCommand(cmd, env=None):
     A tuple of stdout and stderr from running the provided command.
   """
   stdout, stderr, retcode = vm_util.IssueCommand(cmd, env=env)
+  if retcode or stderr:
+    vm_util.RaiseIfThrottled(stderr)
   if retcode:
     raise errors.VmUtil.CalledProcessException(
         'Command returned a non-zero exit code.\n')
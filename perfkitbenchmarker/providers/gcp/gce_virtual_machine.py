@@ -24,6 +24,7 @@ All VM specifics are self-contained and the class provides methods to
 operate on the VM: boot, shutdown, etc.
 """
 
+import collections
 import json
 import logging
 import re
@@ -35,6 +36,7 @@ from perfkitbenchmarker import flags
 from perfkitbenchmarker import flag_util
 from perfkitbenchmarker import linux_virtual_machine as linux_vm
 from perfkitbenchmarker import providers
+from perfkitbenchmarker import status_poller
 from perfkitbenchmarker import virtual_machine
 from perfkitbenchmarker import vm_util
 from perfkitbenchmarker import windows_virtual_machine
@@ -52,6 +54,31 @@ UBUNTU_IMAGE = 'ubuntu-14-04'
 RHEL_IMAGE = 'rhel-7'
 WINDOWS_IMAGE = 'windows-2012-r2'
 
+# Scope of the instance listings used to poll the status of VMs.
+_InstanceScope = collections.namedtuple('_InstanceScope', ['project', 'zone'])
+
+
+def _ListInstances(scope, names):
+  """Lists GCE instances in a zone, for status_poller.StatusPoller.
+
+  Args:
+    scope: _InstanceScope. The project and zone to list.
+    names: frozenset of the names of the instances to list.
+
+  Returns:
+    dict mapping the names of the instances that exist to their descriptions.
+  """
+  list_cmd = util.GcloudCommand(scope, 'compute', 'instances', 'list')
+  # 'instances list' takes a list of zones instead of a single zone.
+  list_cmd.flags['zones'] = list_cmd.flags.pop('zone')
+  list_cmd.flags['filter'] = 'name:({0})'.format(' '.join(sorted(names)))
+  stdout, _ = list_cmd.IssueRetryable()
+  return {instance['name']: instance for instance in json.loads(stdout)
+          if instance['name'] in names}
+
+
+_INSTANCE_POLLER = status_poller.StatusPoller(_ListInstances)
+
 
 class MemoryDecoder(option_decoders.StringDecoder):
   """Verifies and decodes a config option value specifying a memory size."""
@@ -260,6 +287,7 @@ class GceVirtualMachine(virtual_machine.BaseVirtualMachine):
     self.boot_metadata = {}
     self.cpus = vm_spec.cpus
     self.image = self.image or self.DEFAULT_IMAGE
+    self.image_project = FLAGS.image_project
     self.max_local_disks = vm_spec.num_local_ssds
     self.memory_mib = vm_spec.memory
     self.preemptible = vm_spec.preemptible
@@ -285,8 +313,8 @@ class GceVirtualMachine(virtual_machine.BaseVirtualMachine):
       cmd.flags['network'] = self.network.network_resource.name
     cmd.flags['image'] = self.image
     cmd.flags['boot-disk-auto-delete'] = True
-    if FLAGS.image_project:
-      cmd.flags['image-project'] = FLAGS.image_project
+    if self.image_project:
+      cmd.flags['image-project'] = self.image_project
     cmd.flags['boot-disk-size'] = self.boot_disk_size or self.BOOT_DISK_SIZE_GB
     cmd.flags['boot-disk-type'] = self.boot_disk_type or self.BOOT_DISK_TYPE
     if self.machine_type is None:
@@ -344,6 +372,29 @@ class GceVirtualMachine(virtual_machine.BaseVirtualMachine):
       create_cmd = self._GenerateCreateCommand(tf.name)
       create_cmd.Issue()
 
+  def CreateImage(self, image_name):
+    """Creates an image of the VM's boot disk.
+
+    The image is created from the running VM, so callers should flush its
+    file systems first.
+    """
+    cmd = util.GcloudCommand(self, 'compute', 'images', 'create', image_name)
+    cmd.flags.pop('zone', None)
+    cmd.flags['source-disk'] = self.name
+    cmd.flags['source-disk-zone'] = self.zone
+    cmd.flags['force'] = True
+    cmd.IssueRetryable()
+    return image_name
+
+  def DeleteImage(self, image):
+    cmd = util.GcloudCommand(self, 'compute', 'images', 'delete', image)
+    cmd.flags.pop('zone', None)
+    cmd.Issue()
+
+  def UseImage(self, image):
+    super(GceVirtualMachine, self).UseImage(image)
+    self.image_project = self.project
+
   def _CreateDependencies(self):
     super(GceVirtualMachine, self)._CreateDependencies()
     # GCE firewall rules are created for all instances in a network.
@@ -351,13 +402,21 @@ class GceVirtualMachine(virtual_machine.BaseVirtualMachine):
     # doesn't affect boot time.
     self.AllowRemoteAccessPorts()
 
+  def _GetInstance(self):
+    """Returns the description of the instance, or None if it doesn't exist.
+
+    The instances of all VMs in a zone are listed together.
+    """
+    return _INSTANCE_POLLER.GetStatus(_InstanceScope(self.project, self.zone),
+                                      self.name)
+
   @vm_util.Retry()
   def _PostCreate(self):
     """Get the instance's data."""
-    getinstance_cmd = util.GcloudCommand(self, 'compute', 'instances',
-                                         'describe', self.name)
-    stdout, _, _ = getinstance_cmd.Issue()
-    response = json.loads(stdout)
+    response = self._GetInstance()
+    if response is None:
+      raise errors.Resource.RetryableCreationError(
+          'Instance %s not found.' % self.name)
     network_interface = response['networkInterfaces'][0]
     self.internal_ip = network_interface['networkIP']
     self.ip_address = network_interface['accessConfigs'][0]['natIP']
@@ -370,14 +429,7 @@ class GceVirtualMachine(virtual_machine.BaseVirtualMachine):
 
   def _Exists(self):
     """Returns true if the VM exists."""
-    getinstance_cmd = util.GcloudCommand(self, 'compute', 'instances',
-                                         'describe', self.name)
-    stdout, _, _ = getinstance_cmd.Issue(suppress_warning=True)
-    try:
-      json.loads(stdout)
-    except ValueError:
-      return False
-    return True
+    return self._GetInstance() is not None
 
   def CreateScratchDisk(self, disk_spec):
     """Create a VM's scratch disk.
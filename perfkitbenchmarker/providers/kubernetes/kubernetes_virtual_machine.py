@@ -19,6 +19,7 @@ import random
 
 from perfkitbenchmarker import disk
 from perfkitbenchmarker import flags
+from perfkitbenchmarker import status_poller
 from perfkitbenchmarker import virtual_machine, linux_virtual_machine
 from perfkitbenchmarker import vm_util
 from perfkitbenchmarker import providers
@@ -34,6 +35,26 @@ UBUNTU_IMAGE = 'ubuntu-upstart'
 SELECTOR_PREFIX = 'pkb'
 
 
+def _ListPods(kubeconfig, names):
+  """Lists the PODs of a cluster, for status_poller.StatusPoller.
+
+  Args:
+    kubeconfig: string. Path to the kubeconfig of the cluster.
+    names: frozenset of the names of the PODs to list.
+
+  Returns:
+    dict mapping the names of the PODs that exist to their descriptions.
+  """
+  list_cmd = [FLAGS.kubectl, '--kubeconfig=%s' % kubeconfig, 'get', 'pods',
+              '-o=json']
+  stdout, _ = vm_util.IssueRetryableCommand(list_cmd)
+  return {pod['metadata']['name']: pod for pod in json.loads(stdout)['items']
+          if pod['metadata']['name'] in names}
+
+
+_POD_POLLER = status_poller.StatusPoller(_ListPods)
+
+
 class KubernetesVirtualMachine(virtual_machine.BaseVirtualMachine):
   """
   Object representing a Kubernetes POD.
@@ -123,17 +144,21 @@ class KubernetesVirtualMachine(virtual_machine.BaseVirtualMachine):
       raise Exception("Creating Service failed: %s" % output[STDERR])
     logging.info(output[STDOUT].rstrip())
 
+  def _GetPod(self):
+    """Returns the description of the POD, or None if it doesn't exist.
+
+    The PODs of all VMs are listed together.
+    """
+    return _POD_POLLER.GetStatus(FLAGS.kubeconfig, self.name)
+
   @vm_util.Retry(poll_interval=10, max_retries=100, log_errors=False)
   def _WaitForPodBootCompletion(self):
     """
     Need to wait for the PODs to get up  - PODs are created with a little delay.
     """
-    exists_cmd = [FLAGS.kubectl, '--kubeconfig=%s' % FLAGS.kubeconfig, 'get',
-                  'pod', '-o=json', self.name]
     logging.info("Waiting for POD %s" % self.name)
-    pod_info, _, _ = vm_util.IssueCommand(exists_cmd, suppress_warning=True)
+    pod_info = self._GetPod()
     if pod_info:
-      pod_info = json.loads(pod_info)
       containers = pod_info['spec']['containers']
       if len(containers) == 1:
         pod_status = pod_info['status']['phase']
@@ -187,12 +212,7 @@ class KubernetesVirtualMachine(virtual_machine.BaseVirtualMachine):
     """
     POD should have been already created but this is a double check.
     """
-    exists_cmd = [FLAGS.kubectl, '--kubeconfig=%s' % FLAGS.kubeconfig, 'get',
-                  'pod', '-o=json', self.name]
-    pod_info, _, _ = vm_util.IssueCommand(exists_cmd, suppress_warning=True)
-    if pod_info:
-      return True
-    return False
+    return self._GetPod() is not None
 
   def _CreateVolumes(self):
     """
@@ -15,20 +15,35 @@
 """Classes to collect and publish performance samples to various sinks."""
 
 import abc
-import copy
+import array
+import base64
+import cPickle
 import csv
-import io
-import itertools
+import errno
+import gzip
+import hashlib
+import httplib
 import json
 import logging
 import math
-import operator
+import os
 import pprint
+import shutil
+import socket
+import struct
 import sys
+import tempfile
+import threading
 import time
+import urllib
+import urlparse
 import uuid
 
+from concurrent import futures
+
+from perfkitbenchmarker import columnar
 from perfkitbenchmarker import disk
+from perfkitbenchmarker import errors
 from perfkitbenchmarker import flags
 from perfkitbenchmarker import flag_util
 from perfkitbenchmarker import version
@@ -72,6 +87,11 @@ flags.DEFINE_string(
     'csv_path',
     None,
     'A path to write CSV-format results')
+flags.DEFINE_string(
+    'columnar_path',
+    None,
+    'A path to write results to as a compressed columnar file, with '
+    'dictionary-encoded metadata columns. See perfkitbenchmarker/columnar.py.')
 
 flags.DEFINE_string(
     'bigquery_table',
@@ -88,6 +108,19 @@ flags.DEFINE_string(
     'service_account_private_key', None,
     'Service private key for authenticating with BQ.')
 
+flags.DEFINE_integer(
+    'bq_load_threads', 4,
+    'The number of "bq load" commands that load samples into BigQuery at '
+    'once.', lower_bound=1)
+flags.DEFINE_integer(
+    'bq_load_max_retries', 3,
+    'The number of times a failed "bq load" is retried.', lower_bound=0)
+flags.DEFINE_boolean(
+    'bq_stream_samples', False,
+    'Whether each batch of --sample_batch_size samples that a benchmark '
+    'spools is loaded into BigQuery right away, while the benchmark is still '
+    'running, rather than when the samples are published.')
+
 flags.DEFINE_string(
     'gsutil_path', 'gsutil', 'path to the "gsutil" executable')
 flags.DEFINE_string(
@@ -104,6 +137,30 @@ flags.DEFINE_string(
 
 flags.DEFINE_string('es_type', 'result', 'Elasticsearch document type')
 
+flags.DEFINE_integer(
+    'es_bulk_size', 500,
+    'The number of samples sent to Elasticsearch per bulk request.',
+    lower_bound=1)
+
+flags.DEFINE_integer(
+    'es_bulk_threads', 4,
+    'The number of bulk requests to Elasticsearch in flight at once.',
+    lower_bound=1)
+
+flags.DEFINE_integer(
+    'es_bulk_max_retries', 3,
+    'The number of times samples that Elasticsearch rejected because it was '
+    'overloaded or failing are sent again.', lower_bound=0)
+
+flags.DEFINE_integer(
+    'sample_batch_size', 10000,
+    'The maximum number of samples a benchmark holds in memory. Once a '
+    'benchmark has produced this many samples they are appended to a spool '
+    'file in the run\'s temporary directory, and publishers receive samples in '
+    'batches of at most this size. The spooled samples are published once all '
+    'benchmarks have finished, except by publishers that stream them as they '
+    'are spooled, e.g. with --bq_stream_samples.', lower_bound=1)
+
 flags.DEFINE_multistring(
     'metadata',
     [],
@@ -114,6 +171,22 @@ flags.DEFINE_multistring(
 DEFAULT_JSON_OUTPUT_NAME = 'perfkitbenchmarker_results.json'
 DEFAULT_CREDENTIALS_JSON = 'credentials.json'
 GCS_OBJECT_NAME_LENGTH = 20
+_ES_TIMEOUT_SECONDS = 60
+_ES_RETRY_SLEEP_SECONDS = 1
+# The size of the write buffer of JSON output files.
+_JSON_BUFFER_SIZE = 1 << 20
+# The size up to which PrettyPrintStreamPublisher keeps the formatted samples
+# of a benchmark in memory rather than in a temporary file.
+_PRETTY_PRINT_SPOOL_SIZE = 1 << 20
+# Not in httplib's status codes.
+_HTTP_TOO_MANY_REQUESTS = 429
+# The directory in the run's temporary directory that BigQuery shards are
+# written to, and the file in it that lists the shards that have been loaded.
+_BQ_SHARD_DIR = 'bigquery'
+_BQ_LOADED_SHARDS_FILE = 'loaded_shards'
+_BQ_RETRY_SLEEP_SECONDS = 5
+# bq's error when a job with the same ID was already started.
+_BQ_ALREADY_EXISTS = 'Already Exists'
 
 
 def GetLabelsFromDict(metadata):
@@ -125,10 +198,7 @@ def GetLabelsFromDict(metadata):
   Returns:
     A string of labels in the format that Perfkit uses.
   """
-  labels = []
-  for k, v in metadata.iteritems():
-    labels.append('|%s:%s|' % (k, v))
-  return ','.join(labels)
+  return ','.join(['|%s:%s|' % item for item in metadata.iteritems()])
 
 
 class MetadataProvider(object):
@@ -140,7 +210,10 @@ class MetadataProvider(object):
   def AddMetadata(self, metadata, benchmark_spec):
     """Add metadata to a dictionary.
 
-    Existing values will be overwritten.
+    Existing values will be overwritten. SampleCollector calls this once per
+    batch of samples from a benchmark spec and merges the result into the
+    metadata of each sample, so it must not depend on the metadata of
+    individual samples.
 
     Args:
       metadata: dict. Dictionary of metadata to update.
@@ -226,15 +299,47 @@ class SamplePublisher(object):
   def PublishSamples(self, samples):
     """Publishes 'samples'.
 
-    PublishSamples will be called exactly once. Calling
-    SamplePublisher.PublishSamples multiple times may result in data being
-    overwritten.
-
     Args:
       samples: list of dicts to publish.
     """
     raise NotImplementedError()
 
+  def PublishSampleBatches(self, batches):
+    """Publishes samples that are delivered in batches.
+
+    SampleCollector.PublishSamples calls PublishSampleBatches exactly once per
+    run, with every sample of the run, after all benchmarks have finished. The
+    batches keep the samples from having to be held in memory at the same
+    time. Calling it multiple times may result in data being overwritten.
+
+    The default implementation calls PublishSamples once per batch, so
+    PublishSamples may be called several times per run. Publishers that write
+    a whole output on each PublishSamples call, e.g. a file or an object, or
+    that need to see every sample before writing anything, should override
+    PublishSampleBatches to write a single output.
+
+    Args:
+      batches: iterable of lists of dicts to publish. It may be iterated more
+          than once.
+    """
+    for batch in batches:
+      self.PublishSamples(batch)
+
+  def StreamSamples(self, samples):
+    """Receives a batch of samples as soon as a benchmark has spooled it.
+
+    The batch is still published by PublishSampleBatches later on. Publishers
+    that can tell which samples they already published may publish it now,
+    without blocking the benchmark. The default implementation does nothing.
+
+    Args:
+      samples: iterable of dicts.
+    """
+    pass
+
+  def FinishStreaming(self):
+    """Waits until the samples passed to StreamSamples have been published."""
+    pass
 
 
 class CSVPublisher(SamplePublisher):
@@ -252,21 +357,78 @@ class CSVPublisher(SamplePublisher):
     self._path = path
 
   def PublishSamples(self, samples):
-    samples = list(samples)
+    self.PublishSampleBatches([list(samples)])
+
+  def PublishSampleBatches(self, batches):
     # Union of all metadata keys.
-    meta_keys = sorted(
-        set(key for sample in samples for key in sample['metadata']))
+    meta_keys = sorted(set(key for samples in batches
+                           for sample in samples
+                           for key in sample['metadata']))
 
     logging.info('Writing CSV results to %s', self._path)
     with open(self._path, 'w') as fp:
       writer = csv.DictWriter(fp, list(self._DEFAULT_FIELDS) + meta_keys)
       writer.writeheader()
 
-      for sample in samples:
-        d = {}
-        d.update(sample)
-        d.update(d.pop('metadata'))
-        writer.writerow(d)
+      for samples in batches:
+        for sample in samples:
+          d = {}
+          d.update(sample)
+          d.update(d.pop('metadata'))
+          writer.writerow(d)
+
+
+class ColumnarPublisher(SamplePublisher):
+  """Publisher which writes results to a compressed columnar file.
+
+  Each metadata key gets its own dictionary-encoded column, so the metadata
+  of the samples can be loaded without parsing labels. See columnar.ReadFiles
+  to read the files of many runs at once.
+  """
+
+  def __init__(self, path):
+    self._path = path
+
+  def __repr__(self):
+    return '<{0} path="{1}">'.format(type(self).__name__, self._path)
+
+  def PublishSamples(self, samples):
+    self.PublishSampleBatches([samples])
+
+  def PublishSampleBatches(self, batches):
+    writer = columnar.ColumnarWriter()
+    for samples in batches:
+      writer.Add(samples)
+    logging.info('Writing %d samples to %s', len(writer), self._path)
+    writer.Write(self._path)
+
+
+class _ConstantMetadataTracker(object):
+  """Tracks which metadata keys have the same value in every sample seen."""
+
+  def __init__(self):
+    self._num_samples = 0
+    self._key_counts = {}
+    self._unique_values = {}
+
+  def Add(self, metadata):
+    """Records the metadata dict of a sample."""
+    self._num_samples += 1
+    for k, v in metadata.iteritems():
+      self._key_counts[k] = self._key_counts.get(k, 0) + 1
+      if len(self._unique_values.setdefault(k, set())) < 2 and v.__hash__:
+        self._unique_values[k].add(v)
+
+  def GetConstantKeys(self):
+    """Returns the frozenset of keys with a single value across all samples."""
+    constant_keys = []
+    for k, values in self._unique_values.iteritems():
+      # Keys which are not present in all samples count as having None.
+      if self._key_counts[k] < self._num_samples:
+        values = values | set([None])
+      if len(values) == 1:
+        constant_keys.append(k)
+    return frozenset(constant_keys)
 
 
 class PrettyPrintStreamPublisher(SamplePublisher):
@@ -314,19 +476,10 @@ class PrettyPrintStreamPublisher(SamplePublisher):
       The set of metadata keys for which all samples in 'samples' have the same
       value.
     """
-    unique_values = {}
-
+    tracker = _ConstantMetadataTracker()
     for sample in samples:
-      for k, v in sample['metadata'].iteritems():
-        if len(unique_values.setdefault(k, set())) < 2 and v.__hash__:
-          unique_values[k].add(v)
-
-    # Find keys which are not present in all samples
-    for sample in samples:
-      for k in frozenset(unique_values) - frozenset(sample['metadata']):
-        unique_values[k].add(None)
-
-    return frozenset(k for k, v in unique_values.iteritems() if len(v) == 1)
+      tracker.Add(sample['metadata'])
+    return tracker.GetConstantKeys()
 
   def _FormatMetadata(self, metadata):
     """Format 'metadata' as space-delimited key="value" pairs."""
@@ -334,60 +487,80 @@ class PrettyPrintStreamPublisher(SamplePublisher):
                     for k, v in sorted(metadata.iteritems()))
 
   def PublishSamples(self, samples):
-    # result will store the formatted text, then be emitted to self.stream and
-    # logged.
-    result = io.BytesIO()
-    dashes = '-' * 25
-    result.write('\n' + dashes +
-                 'PerfKitBenchmarker Results Summary' +
-                 dashes + '\n')
-
-    if not samples:
-      logging.debug('Pretty-printing results to %s:\n%s', self.stream,
-                    result.getvalue())
-      self.stream.write(result.getvalue())
-      return
-
-    key = operator.itemgetter('test')
-    samples = sorted(samples, key=key)
-    globally_constant_keys = self._FindConstantMetadataKeys(samples)
-
-    for benchmark, test_samples in itertools.groupby(samples, key):
-      test_samples = list(test_samples)
-      # Drop end-to-end runtime: it always has no metadata.
-      non_endtoend_samples = [i for i in test_samples
-                              if i['metric'] != 'End to End Runtime']
-      locally_constant_keys = (
-          self._FindConstantMetadataKeys(non_endtoend_samples) -
-          globally_constant_keys)
-      all_constant_meta = globally_constant_keys.union(locally_constant_keys)
-
-      benchmark_meta = {k: v for k, v in test_samples[0]['metadata'].iteritems()
-                        if k in locally_constant_keys}
-      result.write('{0}:\n'.format(benchmark.upper()))
-
-      if benchmark_meta:
-        result.write('  {0}\n'.format(
-            self._FormatMetadata(benchmark_meta)))
-
-      for sample in test_samples:
-        meta = {k: v for k, v in sample['metadata'].iteritems()
-                if k not in all_constant_meta}
-        result.write('  {0:<30s} {1:>15f} {2:<30s}'.format(
-            sample['metric'], sample['value'], sample['unit']))
-        if meta:
-          result.write(' ({0})'.format(self._FormatMetadata(meta)))
-        result.write('\n')
-
-    global_meta = {k: v for k, v in samples[0]['metadata'].iteritems()
-                   if k in globally_constant_keys}
-    result.write('\n' + dashes + '\n')
-    result.write('For all tests: {0}\n'.format(
-        self._FormatMetadata(global_meta)))
-
-    value = result.getvalue()
-    logging.debug('Pretty-printing results to %s:\n%s', self.stream, value)
-    self.stream.write(value)
+    self.PublishSampleBatches([samples])
+
+  def PublishSampleBatches(self, batches):
+    # The first pass finds the constant metadata, so that only the samples of
+    # a single batch are held in memory.
+    global_tracker = _ConstantMetadataTracker()
+    test_trackers = {}
+    first_metadata = {}
+    for samples in batches:
+      for sample in samples:
+        benchmark = sample['test']
+        global_tracker.Add(sample['metadata'])
+        if benchmark not in test_trackers:
+          test_trackers[benchmark] = _ConstantMetadataTracker()
+          first_metadata[benchmark] = sample['metadata']
+        # Drop end-to-end runtime: it always has no metadata.
+        if sample['metric'] != 'End to End Runtime':
+          test_trackers[benchmark].Add(sample['metadata'])
+
+    globally_constant_keys = global_tracker.GetConstantKeys()
+    all_constant_meta = {}
+    for benchmark, tracker in test_trackers.iteritems():
+      all_constant_meta[benchmark] = globally_constant_keys.union(
+          tracker.GetConstantKeys())
+
+    # The second pass formats the samples of each benchmark into a temporary
+    # file of its own, since the summary groups them by benchmark.
+    sample_lines = {}
+    try:
+      for samples in batches:
+        for sample in samples:
+          benchmark = sample['test']
+          if benchmark not in sample_lines:
+            sample_lines[benchmark] = tempfile.SpooledTemporaryFile(
+                max_size=_PRETTY_PRINT_SPOOL_SIZE)
+          fp = sample_lines[benchmark]
+          meta = {k: v for k, v in sample['metadata'].iteritems()
+                  if k not in all_constant_meta[benchmark]}
+          fp.write('  {0:<30s} {1:>15f} {2:<30s}'.format(
+              sample['metric'], sample['value'], sample['unit']))
+          if meta:
+            fp.write(' ({0})'.format(self._FormatMetadata(meta)))
+          fp.write('\n')
+
+      logging.debug('Pretty-printing results to %s.', self.stream)
+      dashes = '-' * 25
+      self.stream.write('\n' + dashes +
+                        'PerfKitBenchmarker Results Summary' +
+                        dashes + '\n')
+      if not test_trackers:
+        return
+
+      for benchmark in sorted(test_trackers):
+        benchmark_meta = {
+            k: v for k, v in first_metadata[benchmark].iteritems()
+            if k in all_constant_meta[benchmark] and
+            k not in globally_constant_keys}
+        self.stream.write('{0}:\n'.format(benchmark.upper()))
+        if benchmark_meta:
+          self.stream.write('  {0}\n'.format(
+              self._FormatMetadata(benchmark_meta)))
+        fp = sample_lines[benchmark]
+        fp.seek(0)
+        shutil.copyfileobj(fp, self.stream)
+
+      global_meta = {k: v for k, v in
+                     first_metadata[min(test_trackers)].iteritems()
+                     if k in globally_constant_keys}
+      self.stream.write('\n' + dashes + '\n')
+      self.stream.write('For all tests: {0}\n'.format(
+          self._FormatMetadata(global_meta)))
+    finally:
+      for fp in sample_lines.itervalues():
+        fp.close()
 
 
 class LogPublisher(SamplePublisher):
@@ -416,7 +589,78 @@ class LogPublisher(SamplePublisher):
     self.logger.log(self.level, ''.join(data))
 
 
-# TODO: Extract a function to write delimited JSON to a stream.
+def _MakeJsonEncoder():
+  """Returns a function that encodes an object as JSON, like json.dumps.
+
+  json.dumps sets up a new encoder on every call, which takes longer than
+  encoding a sample. If json's C speedups are available, the C encoder is
+  instead set up once, with the same options as json.dumps except that
+  circular references are not checked for.
+  """
+  c_make_encoder = getattr(json.encoder, 'c_make_encoder', None)
+  if c_make_encoder is None:
+    return json.dumps
+  encoder = json.JSONEncoder()
+  c_encoder = c_make_encoder(
+      None, encoder.default, json.encoder.encode_basestring_ascii, None,
+      encoder.key_separator, encoder.item_separator, encoder.sort_keys,
+      encoder.skipkeys, encoder.allow_nan)
+  return lambda obj: ''.join(c_encoder(obj, 0))
+
+
+# Types of metadata values that _JsonLinesWriter compares to reuse labels.
+_SCALAR_TYPES = frozenset([bool, float, int, long, str, unicode, type(None)])
+
+
+class _JsonLinesWriter(object):
+  """Writes sample dicts to a file as newline delimited JSON.
+
+  Consecutive samples usually have the same metadata, e.g. all samples of a
+  benchmark run, so the labels of the last metadata are kept and reused for
+  the next sample if its metadata has the same scalar values, of the same
+  types (1 and 1.0 are equal, but have different labels). The lines of each
+  batch of samples are written at once.
+
+  Attributes:
+    fp: file-like object.
+    collapse_labels: boolean. If true, metadata is converted to a string with
+        key 'labels' by GetLabelsFromDict.
+  """
+
+  def __init__(self, fp, collapse_labels=True):
+    self.fp = fp
+    self.collapse_labels = collapse_labels
+    self._encode = _MakeJsonEncoder()
+    self._last_metadata = None
+    self._last_types = None
+    self._last_labels = None
+
+  def _GetLabels(self, metadata):
+    types = map(type, metadata.itervalues())
+    # Containers may hold equal values of different types, so only metadata
+    # of scalars is compared.
+    same = (all(t in _SCALAR_TYPES for t in types) and
+            types == self._last_types and metadata == self._last_metadata)
+    if not same:
+      self._last_labels = GetLabelsFromDict(metadata)
+      self._last_metadata = metadata
+      self._last_types = types
+    return self._last_labels
+
+  def Write(self, samples):
+    """Writes an iterable of sample dicts."""
+    encode = self._encode
+    lines = []
+    for sample in samples:
+      if self.collapse_labels:
+        sample = sample.copy()
+        sample['labels'] = self._GetLabels(sample.pop('metadata', {}))
+      lines.append(encode(sample))
+    if lines:
+      lines.append('')
+      self.fp.write('\n'.join(lines))
+
+
 class NewlineDelimitedJSONPublisher(SamplePublisher):
   """Publishes samples to a file as newline delimited JSON.
 
@@ -442,19 +686,38 @@ class NewlineDelimitedJSONPublisher(SamplePublisher):
         type(self).__name__, self.file_path, self.mode)
 
   def PublishSamples(self, samples):
-    logging.info('Publishing %d samples to %s', len(samples),
-                 self.file_path)
-    with open(self.file_path, self.mode) as fp:
-      for sample in samples:
-        sample = sample.copy()
-        if self.collapse_labels:
-          sample['labels'] = GetLabelsFromDict(sample.pop('metadata', {}))
-        fp.write(json.dumps(sample) + '\n')
+    self.PublishSampleBatches([samples])
+
+  def PublishSampleBatches(self, batches):
+    with open(self.file_path, self.mode, _JSON_BUFFER_SIZE) as fp:
+      writer = _JsonLinesWriter(fp, collapse_labels=self.collapse_labels)
+      for samples in batches:
+        logging.info('Publishing %d samples to %s', len(samples),
+                     self.file_path)
+        writer.Write(samples)
 
 
 class BigQueryPublisher(SamplePublisher):
   """Publishes samples to BigQuery.
 
+  Each batch of samples is written to a gzipped newline delimited JSON shard
+  in the run's temporary directory, and the shards are loaded with up to
+  load_threads concurrent 'bq load' commands. A failed load is retried up to
+  max_retries times.
+
+  Shards are named after a hash of the table and of their samples, and so are
+  the BigQuery jobs that load them. Once a shard has been loaded its name is
+  appended to a file of loaded shards, so if the samples are published again,
+  e.g. by a run that resumes after a crash, it is skipped. If PKB died between
+  a load and that append, the load is retried with the same job ID, which
+  BigQuery rejects as a duplicate, and the outcome of the existing job is
+  used instead.
+
+  If stream is True, the batches that benchmarks spool are loaded as soon as
+  they have been spooled (see SampleCollector.FlushSamples), while the
+  benchmark keeps running, and are then skipped when the samples are
+  published.
+
   Attributes:
     bigquery_table: string. The bigquery table to publish to, of the form
       '[project_name:]dataset_name.table_name'
@@ -464,16 +727,26 @@ class BigQueryPublisher(SamplePublisher):
       authorization. For example, 1234567890@developer.gserviceaccount.com
     service_account_private_key: Filename that contains the service account
       private key. Must be specified if service_account is specified.
+    load_threads: int. The number of 'bq load' commands run at once.
+    max_retries: int. The number of times a failed load is retried.
+    stream: boolean. Whether spooled batches are loaded while benchmarks run.
   """
 
   def __init__(self, bigquery_table, project_id=None, bq_path='bq',
-               service_account=None, service_account_private_key_file=None):
+               service_account=None, service_account_private_key_file=None,
+               load_threads=4, max_retries=3, stream=False):
     self.bigquery_table = bigquery_table
     self.project_id = project_id
     self.bq_path = bq_path
     self.service_account = service_account
     self.service_account_private_key_file = service_account_private_key_file
+    self.load_threads = load_threads
+    self.max_retries = max_retries
+    self.stream = stream
     self._credentials_file = vm_util.PrependTempDir(DEFAULT_CREDENTIALS_JSON)
+    self._lock = threading.Lock()
+    self._stream_executor = None
+    self._streamed_loads = []
 
     if ((self.service_account is None) !=
         (self.service_account_private_key_file is None)):
@@ -483,42 +756,176 @@ class BigQueryPublisher(SamplePublisher):
   def __repr__(self):
     return '<{0} table="{1}">'.format(type(self).__name__, self.bigquery_table)
 
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    state.update(_lock=None, _stream_executor=None, _streamed_loads=[])
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self._lock = threading.Lock()
+
+  def _GetShardDir(self):
+    shard_dir = os.path.join(vm_util.GetTempDir(), _BQ_SHARD_DIR)
+    try:
+      os.makedirs(shard_dir)
+    except OSError as e:
+      if e.errno != errno.EEXIST:
+        raise
+    return shard_dir
+
+  def _ReadLoadedShards(self):
+    """Returns the set of names of the shards that have been loaded."""
+    path = os.path.join(self._GetShardDir(), _BQ_LOADED_SHARDS_FILE)
+    if not os.path.isfile(path):
+      return set()
+    with open(path) as fp:
+      return set(line.strip() for line in fp)
+
+  def _GetShardName(self, samples):
+    """Returns the name of the shard of a list of sample dicts."""
+    digest = hashlib.sha1(self.bigquery_table)
+    for sample in samples:
+      # Sample URIs identify samples across processes, while the order of the
+      # keys of serialized metadata may differ.
+      digest.update(sample.get('sample_uri') or
+                    json.dumps(sample, sort_keys=True))
+    return 'pkb_' + digest.hexdigest()
+
+  def _WriteShard(self, name, samples):
+    """Writes a list of sample dicts to a gzipped shard and returns its path."""
+    path = os.path.join(self._GetShardDir(), name + '.json.gz')
+    with gzip.open(path, 'wb') as fp:
+      _JsonLinesWriter(fp).Write(samples)
+    return path
+
+  def _GetBqCommand(self, *args):
+    cmd = [self.bq_path]
+    if self.project_id:
+      cmd.append('--project_id=' + self.project_id)
+    if self.service_account:
+      assert self.service_account_private_key_file is not None
+      cmd.extend(['--service_account=' + self.service_account,
+                  '--service_account_credential_file=' +
+                  self._credentials_file,
+                  '--service_account_private_key_file=' +
+                  self.service_account_private_key_file])
+    cmd.extend(args)
+    return cmd
+
+  def _LoadShard(self, name, path):
+    """Loads a shard unless it has already been loaded.
+
+    Args:
+      name: string. The name of the shard.
+      path: string. The path of the shard.
+
+    Returns:
+      None if the shard was loaded, or a string describing the last error.
+    """
+    job_index = 0
+    for attempt in xrange(self.max_retries + 1):
+      if attempt:
+        time.sleep(_BQ_RETRY_SLEEP_SECONDS * 2 ** (attempt - 1))
+      job_id = '%s_%d' % (name, job_index)
+      stdout, stderr, retcode = vm_util.IssueCommand(self._GetBqCommand(
+          '--job_id=' + job_id, 'load',
+          '--source_format=NEWLINE_DELIMITED_JSON', self.bigquery_table,
+          path))
+      error = stdout + stderr
+      if retcode and _BQ_ALREADY_EXISTS in error:
+        # An earlier attempt started the job. If it failed, the next attempt
+        # needs a new job ID.
+        stdout, stderr, retcode = vm_util.IssueCommand(
+            self._GetBqCommand('wait', job_id))
+        error = stdout + stderr
+        job_index += 1
+      if not retcode:
+        with self._lock:
+          with open(os.path.join(self._GetShardDir(),
+                                 _BQ_LOADED_SHARDS_FILE), 'a') as fp:
+            fp.write(name + '\n')
+        os.remove(path)
+        return None
+    return error
+
+  def StreamSamples(self, samples):
+    if not self.stream or not len(samples):
+      return
+    samples = list(samples)
+    name = self._GetShardName(samples)
+    path = self._WriteShard(name, samples)
+    with self._lock:
+      if self._stream_executor is None:
+        self._stream_executor = futures.ThreadPoolExecutor(
+            max_workers=self.load_threads)
+      self._streamed_loads.append(
+          (name, self._stream_executor.submit(self._LoadShard, name, path)))
+
+  def FinishStreaming(self):
+    with self._lock:
+      executor, self._stream_executor = self._stream_executor, None
+      loads, self._streamed_loads = self._streamed_loads, []
+    if executor is None:
+      return
+    executor.shutdown(wait=True)
+    for name, future in loads:
+      error = future.exception() or future.result()
+      if error:
+        # The shard is loaded again when the samples are published.
+        logging.warning('Could not load %s into %s while the run was going: '
+                        '%s', name, self.bigquery_table, error)
+
   def PublishSamples(self, samples):
-    if not samples:
+    self.PublishSampleBatches([samples])
+
+  def PublishSampleBatches(self, batches):
+    self.FinishStreaming()
+    loaded_shards = self._ReadLoadedShards()
+    failures = []
+    count = 0
+    skipped = 0
+    with futures.ThreadPoolExecutor(max_workers=self.load_threads) as executor:
+      # Shards are written while earlier ones load, but only a few are
+      # written ahead.
+      in_flight = {}
+      for samples in batches:
+        if not samples:
+          continue
+        if len(in_flight) >= 2 * self.load_threads:
+          done, _ = futures.wait(in_flight,
+                                 return_when=futures.FIRST_COMPLETED)
+          for future in done:
+            failures.append((in_flight.pop(future), future.result()))
+        name = self._GetShardName(samples)
+        count += len(samples)
+        if name in loaded_shards:
+          skipped += len(samples)
+          continue
+        path = self._WriteShard(name, samples)
+        in_flight[executor.submit(self._LoadShard, name, path)] = name
+      for future, name in in_flight.iteritems():
+        failures.append((name, future.result()))
+    failures = [(name, error) for name, error in failures if error]
+    if not count:
       logging.warn('No samples: not publishing to BigQuery')
       return
-
-    with vm_util.NamedTemporaryFile(prefix='perfkit-bq-pub',
-                                    dir=vm_util.GetTempDir(),
-                                    suffix='.json') as tf:
-      json_publisher = NewlineDelimitedJSONPublisher(tf.name,
-                                                     collapse_labels=True)
-      json_publisher.PublishSamples(samples)
-      tf.close()
-      logging.info('Publishing %d samples to %s', len(samples),
-                   self.bigquery_table)
-      load_cmd = [self.bq_path]
-      if self.project_id:
-        load_cmd.append('--project_id=' + self.project_id)
-      if self.service_account:
-        assert self.service_account_private_key_file is not None
-        load_cmd.extend(['--service_account=' + self.service_account,
-                         '--service_account_credential_file=' +
-                         self._credentials_file,
-                         '--service_account_private_key_file=' +
-                         self.service_account_private_key_file])
-      load_cmd.extend(['load',
-                       '--source_format=NEWLINE_DELIMITED_JSON',
-                       self.bigquery_table,
-                       tf.name])
-      vm_util.IssueRetryableCommand(load_cmd)
+    logging.info('Published %d samples to %s, of which %d had already been '
+                 'loaded.', count, self.bigquery_table, skipped)
+    if failures:
+      raise errors.Publisher.PublishError(
+          'Could not load %d shards into %s. They are kept in %s. First '
+          'error: %s: %s' % (len(failures), self.bigquery_table,
+                             self._GetShardDir(), failures[0][0],
+                             failures[0][1]))
 
 
 class CloudStoragePublisher(SamplePublisher):
   """Publishes samples to a Google Cloud Storage bucket using gsutil.
 
-  Samples are formatted using a NewlineDelimitedJSONPublisher, and written to a
-  the destination file within the specified bucket named:
+  Samples are formatted using a NewlineDelimitedJSONPublisher, and all the
+  samples of a run are written to a single destination file within the
+  specified bucket named:
 
     <time>_<uri>
 
@@ -542,32 +949,112 @@ class CloudStoragePublisher(SamplePublisher):
       return object_name[:GCS_OBJECT_NAME_LENGTH]
 
   def PublishSamples(self, samples):
+    self.PublishSampleBatches([samples])
+
+  def PublishSampleBatches(self, batches):
     with vm_util.NamedTemporaryFile(prefix='perfkit-gcs-pub',
                                     dir=vm_util.GetTempDir(),
                                     suffix='.json') as tf:
       json_publisher = NewlineDelimitedJSONPublisher(tf.name)
-      json_publisher.PublishSamples(samples)
+      json_publisher.PublishSampleBatches(batches)
       tf.close()
       object_name = self._GenerateObjectName()
       storage_uri = 'gs://{0}/{1}'.format(self.bucket, object_name)
-      logging.info('Publishing %d samples to %s', len(samples), storage_uri)
+      logging.info('Publishing samples in %s to %s', tf.name, storage_uri)
       copy_cmd = [self.gsutil_path, 'cp', tf.name, storage_uri]
       vm_util.IssueRetryableCommand(copy_cmd)
 
 
+class _HttpConnectionPool(object):
+  """Persistent HTTP connections to a server, shared by threads.
+
+  Connections are returned to the pool after each request, so that requests
+  reuse them rather than opening a connection each.
+  """
+
+  def __init__(self, uri, timeout=None):
+    if '://' not in uri:
+      uri = 'http://' + uri
+    parsed = urlparse.urlparse(uri)
+    if parsed.scheme == 'https':
+      self._connection_class = httplib.HTTPSConnection
+    else:
+      self._connection_class = httplib.HTTPConnection
+    self._host = parsed.hostname
+    self._port = parsed.port
+    self._path = parsed.path.rstrip('/')
+    self._headers = {'Content-Type': 'application/json'}
+    if parsed.username:
+      credentials = '%s:%s' % (parsed.username, parsed.password or '')
+      self._headers['Authorization'] = 'Basic ' + base64.b64encode(
+          credentials)
+    self._timeout = timeout
+    self._idle = []
+    self._lock = threading.Lock()
+
+  def Request(self, method, path, body=None):
+    """Sends a request and reads the response.
+
+    Args:
+      method: string. The HTTP method.
+      path: string. The path of the request, relative to the URI of the pool.
+      body: string or None. The body of the request.
+
+    Returns:
+      A tuple of the status and the body of the response.
+
+    Raises:
+      httplib.HTTPException or socket.error: If the request failed. The
+          connection is closed rather than reused.
+    """
+    with self._lock:
+      connection = self._idle.pop() if self._idle else None
+    if connection is None:
+      connection = self._connection_class(self._host, self._port,
+                                          timeout=self._timeout)
+    try:
+      connection.request(method, self._path + path, body, self._headers)
+      response = connection.getresponse()
+      data = response.read()
+    except:
+      connection.close()
+      raise
+    with self._lock:
+      self._idle.append(connection)
+    return response.status, data
+
+  def Close(self):
+    with self._lock:
+      connections, self._idle = self._idle, []
+    for connection in connections:
+      connection.close()
+
+
 class ElasticsearchPublisher(SamplePublisher):
   """Publish samples to an Elasticsearch server. Index and document type
   will be created if they do not exist.
 
+  Samples are sent with the bulk API, in requests of bulk_size documents of
+  which bulk_threads are in flight at once, over persistent connections.
+  Documents that fail because the server is overloaded are sent again up to
+  max_retries times.
+
   Attributes:
     es_uri: String. e.g. "http://localhost:9200"
     es_index: String. Default "perfkit"
     es_type: String. Default "result"
+    bulk_size: Integer. The number of documents per bulk request.
+    bulk_threads: Integer. The number of bulk requests in flight at once.
+    max_retries: Integer. The number of times failed documents are resent.
   """
-  def __init__(self, es_uri=None, es_index=None, es_type=None):
+  def __init__(self, es_uri=None, es_index=None, es_type=None, bulk_size=500,
+               bulk_threads=4, max_retries=3):
     self.es_uri = es_uri
     self.es_index = es_index.lower()
     self.es_type = es_type
+    self.bulk_size = bulk_size
+    self.bulk_threads = bulk_threads
+    self.max_retries = max_retries
     self.mapping = {
         "mappings": {
             "result": {
@@ -598,32 +1085,135 @@ class ElasticsearchPublisher(SamplePublisher):
             }
         }
     }
+    self._pool = None
+    self._index_exists = False
+
+  def __repr__(self):
+    return '<{0} es_uri="{1}" es_index="{2}">'.format(
+        type(self).__name__, self.es_uri, self.es_index)
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    state['_pool'] = None
+    return state
+
+  def _GetPool(self):
+    if self._pool is None:
+      self._pool = _HttpConnectionPool(self.es_uri,
+                                       timeout=_ES_TIMEOUT_SECONDS)
+    return self._pool
+
+  def _CreateIndexIfMissing(self):
+    if self._index_exists:
+      return
+    pool = self._GetPool()
+    path = '/' + urllib.quote(self.es_index)
+    status, _ = pool.Request('HEAD', path)
+    if status == httplib.NOT_FOUND:
+      status, data = pool.Request('PUT', path, json.dumps(self.mapping))
+      # Another run may have created the index in the meantime.
+      if status >= 300 and 'already_exists' not in data:
+        raise errors.Publisher.PublishError(
+            'Could not create Elasticsearch index %s: HTTP %d: %s' %
+            (self.es_index, status, data))
+      logging.info('Create index %s and default mappings', self.es_index)
+    elif status >= 300:
+      raise errors.Publisher.PublishError(
+          'Could not look up Elasticsearch index %s: HTTP %d' %
+          (self.es_index, status))
+    self._index_exists = True
+
+  def _FormatDocument(self, sample):
+    """Returns the bulk action and the document of a sample, as JSON lines."""
+    document = _SanitizeKeys(sample)
+    # Make timestamp understandable by ES and human.
+    document['timestamp'] = self._FormatTimestampForElasticsearch(
+        sample['timestamp'])
+    # Add sample to the "perfkit index" of "result type" and using sample_uri
+    # as each ES's document's unique _id
+    action = {'create': {'_index': self.es_index, '_type': self.es_type,
+                         '_id': sample['sample_uri']}}
+    return '%s\n%s\n' % (json.dumps(action), json.dumps(document))
+
+  def _SendBulk(self, samples):
+    """Creates the documents of samples, retrying those that may succeed.
+
+    Args:
+      samples: list of sample dicts.
+
+    Returns:
+      A list of (sample_uri, error) tuples, one per document that could not
+      be created.
+    """
+    pending = [(sample['sample_uri'], self._FormatDocument(sample))
+               for sample in samples]
+    failures = []
+    error = None
+    for attempt in xrange(self.max_retries + 1):
+      if attempt:
+        time.sleep(_ES_RETRY_SLEEP_SECONDS * 2 ** (attempt - 1))
+      body = ''.join(document for _, document in pending)
+      try:
+        status, data = self._GetPool().Request('POST', '/_bulk', body)
+      except (httplib.HTTPException, socket.error) as e:
+        error = 'Request failed: %s' % e
+        continue
+      if status == _HTTP_TOO_MANY_REQUESTS or status >= 500:
+        error = 'HTTP %d: %s' % (status, data)
+        continue
+      if status >= 300:
+        error = 'HTTP %d: %s' % (status, data)
+        break
+      retry = []
+      for (sample_uri, document), item in zip(
+          pending, json.loads(data)['items']):
+        result = item.values()[0]
+        item_status = result['status']
+        # A conflict after a retry means that an earlier attempt created the
+        # document.
+        if item_status < 300 or (item_status == httplib.CONFLICT and attempt):
+          continue
+        error = result.get('error')
+        if item_status == _HTTP_TOO_MANY_REQUESTS or item_status >= 500:
+          retry.append((sample_uri, document))
+        else:
+          failures.append((sample_uri, error))
+      pending = retry
+      if not pending:
+        break
+    failures.extend((sample_uri, error) for sample_uri, _ in pending)
+    return failures
 
   def PublishSamples(self, samples):
     """Publish samples to Elasticsearch service"""
-    try:
-      from elasticsearch import Elasticsearch
-    except ImportError:
-      raise ImportError('The "elasticsearch" package is required to use '
-                        'the Elasticsearch publisher. Please make sure it '
-                        'is installed.')
-
-    es = Elasticsearch([self.es_uri])
-    if not es.indices.exists(index=self.es_index):
-      es.indices.create(index=self.es_index, body=self.mapping)
-      logging.info('Create index %s and default mappings', self.es_index)
-    for s in samples:
-      sample = copy.deepcopy(s)
-      # Make timestamp understandable by ES and human.
-      sample['timestamp'] = self._FormatTimestampForElasticsearch(
-          sample['timestamp']
-      )
-      # Keys cannot have dots for ES
-      sample = self._deDotKeys(sample)
-      # Add sample to the "perfkit index" of "result type" and using sample_uri
-      # as each ES's document's unique _id
-      es.create(index=self.es_index, doc_type=self.es_type,
-                id=sample['sample_uri'], body=json.dumps(sample))
+    self.PublishSampleBatches([samples])
+
+  def PublishSampleBatches(self, batches):
+    self._CreateIndexIfMissing()
+    failures = []
+    count = 0
+    with futures.ThreadPoolExecutor(max_workers=self.bulk_threads) as executor:
+      # Only a few requests are queued, so that only those samples are held
+      # in memory.
+      in_flight = set()
+      for samples in batches:
+        for i in xrange(0, len(samples), self.bulk_size):
+          if len(in_flight) >= 2 * self.bulk_threads:
+            done, in_flight = futures.wait(
+                in_flight, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+              failures.extend(future.result())
+          chunk = samples[i:i + self.bulk_size]
+          count += len(chunk)
+          in_flight.add(executor.submit(self._SendBulk, chunk))
+      for future in in_flight:
+        failures.extend(future.result())
+    logging.info('Published %d samples to Elasticsearch index %s', count,
+                 self.es_index)
+    if failures:
+      raise errors.Publisher.PublishError(
+          'Could not publish %d of %d samples to Elasticsearch. First error: '
+          '%s: %s' % (len(failures), count, failures[0][0], failures[0][1]))
 
   def _FormatTimestampForElasticsearch(self, epoch_us):
     """Convert the floating epoch timestamp in micro seconds epoch_us to
@@ -634,15 +1224,220 @@ class ElasticsearchPublisher(SamplePublisher):
     new_ts = '%s.%s' % (ts, num_dec)
     return new_ts
 
-  def _deDotKeys(self, res):
-    """Recursively replace dot with underscore in all keys in a dictionary."""
-    for key, value in res.items():
-      if isinstance(value, dict):
-        self._deDotKeys(value)
-      new_key = key.replace('.', '_')
-      if new_key != key:
-        res[new_key] = res.pop(key)
-    return res
+
+def _SanitizeKeys(value):
+  """Replaces dots, which Elasticsearch doesn't allow, in keys of dicts.
+
+  Only dicts are copied, so the sample itself isn't modified.
+  """
+  if isinstance(value, dict):
+    return {key.replace('.', '_'): _SanitizeKeys(item)
+            for key, item in value.iteritems()}
+  return value
+
+
+class SampleSpool(object):
+  """An append-only file of annotated samples.
+
+  Samples are appended in batches. Each batch is written as a length-prefixed
+  pickle and the file is closed after every append, so if the process writing
+  the spool dies only the batch it was writing is lost.
+
+  Attributes:
+    path: string. Path of the spool file.
+  """
+
+  _LENGTH_FORMAT = '>I'
+  _LENGTH_SIZE = struct.calcsize(_LENGTH_FORMAT)
+
+  def __init__(self, path):
+    self.path = path
+
+  def __repr__(self):
+    return '<{0} path="{1}">'.format(type(self).__name__, self.path)
+
+  def Append(self, samples):
+    """Appends a batch of sample dicts to the spool."""
+    data = cPickle.dumps(samples, cPickle.HIGHEST_PROTOCOL)
+    with open(self.path, 'ab') as fp:
+      fp.write(struct.pack(self._LENGTH_FORMAT, len(data)) + data)
+
+  def HasSamples(self):
+    """Returns whether any batch has been appended to the spool."""
+    return os.path.isfile(self.path) and os.path.getsize(self.path) > 0
+
+  def ReadBatches(self):
+    """Yields the batches of sample dicts in the order they were appended.
+
+    A batch that was only partially written is skipped.
+    """
+    if not os.path.isfile(self.path):
+      return
+    with open(self.path, 'rb') as fp:
+      while True:
+        header = fp.read(self._LENGTH_SIZE)
+        if not header:
+          return
+        data = ''
+        if len(header) == self._LENGTH_SIZE:
+          length, = struct.unpack(self._LENGTH_FORMAT, header)
+          data = fp.read(length)
+        if not data or len(data) != length:
+          logging.warning('Skipping a partially written batch of samples at '
+                          'the end of %s.', self.path)
+          return
+        yield cPickle.loads(data)
+
+  def Clear(self):
+    """Removes every batch from the spool."""
+    try:
+      os.remove(self.path)
+    except OSError as e:
+      if e.errno != errno.ENOENT:
+        raise
+
+
+class SampleStore(object):
+  """Annotated samples stored in compact columns.
+
+  The metric, unit, value, timestamp and sample URI of each sample are stored
+  in arrays. Everything else about a sample (its metadata merged with the
+  metadata of the benchmark spec, and the annotations such as 'test' and
+  'run_uri') is stored once per distinct sample metadata dict: samples that
+  share a metadata dict, like the histogram samples of a benchmark, share a
+  single entry.
+
+  Iterating over a store yields plain sample dicts, as published by
+  SamplePublishers.
+  """
+
+  def __init__(self):
+    # Interned metric and unit strings, and a map to their indexes.
+    self._strings = []
+    self._string_indexes = {}
+    self._metric_indexes = array.array('l')
+    self._unit_indexes = array.array('l')
+    self._values = array.array('d')
+    # 1 if the value is an int, so that it is published as one.
+    self._value_is_int = bytearray()
+    # Maps sample index to values that do not fit in a double.
+    self._other_values = {}
+    self._timestamps = array.array('d')
+    # 16 random bytes per sample, formatted as a version 4 UUID.
+    self._sample_uris = bytearray()
+    # Entries of (annotations, metadata) dicts, and the entry of each sample.
+    self._entries = []
+    self._entry_indexes = array.array('l')
+
+  def __len__(self):
+    return len(self._values)
+
+  def __iter__(self):
+    return iter(self.GetSamples(0, len(self)))
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    for key, value in state.iteritems():
+      if isinstance(value, array.array):
+        state[key] = (value.typecode, value.tostring())
+    return state
+
+  def __setstate__(self, state):
+    for key, value in state.iteritems():
+      if isinstance(value, tuple):
+        typecode, data = value
+        value = array.array(typecode)
+        value.fromstring(data)
+      setattr(self, key, value)
+
+  def _Intern(self, string):
+    index = self._string_indexes.get(string)
+    if index is None:
+      index = self._string_indexes[string] = len(self._strings)
+      self._strings.append(string)
+    return index
+
+  def Add(self, samples, annotations, metadata):
+    """Adds samples to the store.
+
+    Args:
+      samples: list of Sample objects.
+      annotations: dict. Fields added to each sample dict, e.g. 'test'.
+      metadata: dict. Metadata merged into the metadata of each sample,
+          overwriting existing values.
+    """
+    # Maps the id of a sample's metadata dict to its entry. The samples keep
+    # the dicts alive until this method returns, so ids are not reused.
+    entry_indexes = {}
+    self._sample_uris.extend(os.urandom(16 * len(samples)))
+    for s in samples:
+      key = id(s.metadata) if s.metadata else None
+      entry_index = entry_indexes.get(key)
+      if entry_index is None:
+        merged_metadata = dict(s.metadata)
+        merged_metadata.update(metadata)
+        entry_index = entry_indexes[key] = len(self._entries)
+        self._entries.append((annotations, merged_metadata))
+
+      value = s.value
+      if isinstance(value, float):
+        is_int = 0
+      elif isinstance(value, (int, long)) and float(value) == value:
+        is_int = 1
+      else:
+        self._other_values[len(self)] = value
+        value = is_int = 0
+      self._metric_indexes.append(self._Intern(s.metric))
+      self._unit_indexes.append(self._Intern(s.unit))
+      self._value_is_int.append(is_int)
+      self._timestamps.append(s.timestamp)
+      self._entry_indexes.append(entry_index)
+      self._values.append(value)
+
+  def GetSamples(self, start, stop):
+    """Returns the samples in [start, stop) as a list of sample dicts."""
+    samples = []
+    strings = self._strings
+    for i in xrange(start, min(stop, len(self))):
+      annotations, metadata = self._entries[self._entry_indexes[i]]
+      value = self._values[i]
+      if self._value_is_int[i]:
+        value = int(value)
+      elif i in self._other_values:
+        value = self._other_values[i]
+      sample = annotations.copy()
+      sample.update(
+          metric=strings[self._metric_indexes[i]],
+          value=value,
+          unit=strings[self._unit_indexes[i]],
+          metadata=metadata.copy(),
+          timestamp=self._timestamps[i],
+          sample_uri=str(uuid.UUID(
+              bytes=str(self._sample_uris[i * 16:(i + 1) * 16]), version=4)))
+      samples.append(sample)
+    return samples
+
+
+class _SampleBatches(object):
+  """The spooled and buffered samples of a SampleCollector.
+
+  Unlike a generator, this can be iterated more than once.
+  """
+
+  def __init__(self, spools, store, batch_size):
+    self._spools = spools
+    self._store = store
+    self._batch_size = batch_size
+
+  def __iter__(self):
+    for spool in self._spools:
+      for batch in spool.ReadBatches():
+        # Batches are spooled as SampleStores or lists of sample dicts.
+        batch = list(batch)
+        if batch:
+          yield batch
+    for i in xrange(0, len(self._store), self._batch_size):
+      yield self._store.GetSamples(i, i + self._batch_size)
 
 
 class SampleCollector(object):
@@ -651,8 +1446,20 @@ class SampleCollector(object):
   Supports incorporating additional metadata into samples, and publishing
   results via any number of SamplePublishers.
 
+  If the collector has a spool, samples are appended to it whenever
+  FLAGS.sample_batch_size samples have been added, so that a collector never
+  holds more than one batch of samples in memory. Each spooled batch is passed
+  to the publishers' StreamSamples right away, but is otherwise only published
+  by PublishSamples, which pkb calls once every benchmark has finished. That
+  way publishers that rewrite their output, like CSVPublisher, still see
+  every sample of the run.
+
+  Samples are held in a SampleStore, and the metadata providers are run once
+  per AddSamples call rather than once per sample.
+
+  The samples held in memory are returned by GetSamples.
+
   Attributes:
-    samples: A list of Sample objects.
     metadata_providers: A list of MetadataProvider objects. Metadata providers
       to use.  Defaults to DEFAULT_METADATA_PROVIDERS.
     publishers: A list of SamplePublisher objects. If not specified, defaults to
@@ -660,10 +1467,15 @@ class SampleCollector(object):
       a BigQueryPublisher if FLAGS.bigquery_table is specified, and a
       CloudStoragePublisher if FLAGS.cloud_storage_bucket is specified. See
       SampleCollector._DefaultPublishers.
-    run_uri: A unique tag for the run.
+    spool: A SampleSpool that samples are appended to, or None to keep all
+      samples in memory until they are published.
   """
-  def __init__(self, metadata_providers=None, publishers=None):
-    self.samples = []
+  def __init__(self, metadata_providers=None, publishers=None,
+               spool_path=None):
+    self._store = SampleStore()
+    self.spool = SampleSpool(spool_path) if spool_path else None
+    # Spools written by other collectors, e.g. in benchmark processes.
+    self._other_spools = []
 
     if metadata_providers is not None:
       self.metadata_providers = metadata_providers
@@ -692,21 +1504,36 @@ class SampleCollector(object):
           project_id=FLAGS.bq_project,
           bq_path=FLAGS.bq_path,
           service_account=FLAGS.service_account,
-          service_account_private_key_file=FLAGS.service_account_private_key))
+          service_account_private_key_file=FLAGS.service_account_private_key,
+          load_threads=FLAGS.bq_load_threads,
+          max_retries=FLAGS.bq_load_max_retries,
+          stream=FLAGS.bq_stream_samples))
 
     if FLAGS.cloud_storage_bucket:
       publishers.append(CloudStoragePublisher(FLAGS.cloud_storage_bucket,
                                               gsutil_path=FLAGS.gsutil_path))
     if FLAGS.csv_path:
       publishers.append(CSVPublisher(FLAGS.csv_path))
+    if FLAGS.columnar_path:
+      publishers.append(ColumnarPublisher(FLAGS.columnar_path))
 
     if FLAGS.es_uri:
-      publishers.append(ElasticsearchPublisher(es_uri=FLAGS.es_uri,
-                                               es_index=FLAGS.es_index,
-                                               es_type=FLAGS.es_type))
+      publishers.append(ElasticsearchPublisher(
+          es_uri=FLAGS.es_uri, es_index=FLAGS.es_index, es_type=FLAGS.es_type,
+          bulk_size=FLAGS.es_bulk_size, bulk_threads=FLAGS.es_bulk_threads,
+          max_retries=FLAGS.es_bulk_max_retries))
 
     return publishers
 
+  def GetSamples(self):
+    """Returns the annotated samples that are held in memory.
+
+    Returns:
+      A list of sample dicts that have been neither spooled nor published.
+      The dicts are built on each call.
+    """
+    return list(self._store)
+
   def AddSamples(self, samples, benchmark, benchmark_spec):
     """Adds data samples to the publisher.
 
@@ -715,24 +1542,71 @@ class SampleCollector(object):
       benchmark: string. The name of the benchmark.
       benchmark_spec: BenchmarkSpec. Benchmark specification.
     """
-    for s in samples:
-      # Annotate the sample.
-      sample = dict(s.asdict())
-      sample['test'] = benchmark
+    samples = list(samples)
+    if not samples:
+      return
+    metadata = {}
+    for meta_provider in self.metadata_providers:
+      metadata = meta_provider.AddMetadata(metadata, benchmark_spec)
+    annotations = {'test': benchmark,
+                   'product_name': FLAGS.product_name,
+                   'official': FLAGS.official,
+                   'owner': FLAGS.owner,
+                   'run_uri': benchmark_spec.uuid}
+
+    start = 0
+    while start < len(samples):
+      if self.spool:
+        stop = start + FLAGS.sample_batch_size - len(self._store)
+      else:
+        stop = len(samples)
+      self._store.Add(samples[start:stop], annotations, metadata)
+      start = stop
+      if self.spool and len(self._store) >= FLAGS.sample_batch_size:
+        self.FlushSamples()
+
+  def FlushSamples(self):
+    """Appends the samples held in memory to the spool, if there is one.
+
+    The spooled samples are also passed to each publisher's StreamSamples.
+    """
+    if self.spool and len(self._store):
+      self.spool.Append(self._store)
+      for publisher in self.publishers:
+        publisher.StreamSamples(self._store)
+      self._store = SampleStore()
+
+  def FinishStreaming(self):
+    """Waits until the publishers have published the streamed samples."""
+    for publisher in self.publishers:
+      publisher.FinishStreaming()
+
+  def AddSpooledSamples(self, spool_path):
+    """Adds the samples spooled by another collector.
+
+    They are read when the samples are published, and the spool is cleared
+    afterwards.
+
+    Args:
+      spool_path: string. Path of the other collector's spool.
+    """
+    self._other_spools.append(SampleSpool(spool_path))
 
-      for meta_provider in self.metadata_providers:
-        sample['metadata'] = meta_provider.AddMetadata(
-            sample['metadata'], benchmark_spec)
+  def _GetSpools(self):
+    return self._other_spools + ([self.spool] if self.spool else [])
 
-      sample['product_name'] = FLAGS.product_name
-      sample['official'] = FLAGS.official
-      sample['owner'] = FLAGS.owner
-      sample['run_uri'] = benchmark_spec.uuid
-      sample['sample_uri'] = str(uuid.uuid4())
-      self.samples.append(sample)
+  def HasSamples(self):
+    """Returns whether there are any samples to publish."""
+    return len(self._store) > 0 or any(spool.HasSamples()
+                                       for spool in self._GetSpools())
 
   def PublishSamples(self):
     """Publish samples via all registered publishers."""
+    spools = self._GetSpools()
+    batches = _SampleBatches(spools, self._store, FLAGS.sample_batch_size)
     for publisher in self.publishers:
-      publisher.PublishSamples(self.samples)
-    self.samples = []
+      publisher.PublishSampleBatches(batches)
+    for spool in spools:
+      spool.Clear()
+    self._other_spools = []
+    self._store = SampleStore()
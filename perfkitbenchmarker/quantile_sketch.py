@@ -0,0 +1,286 @@
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Mergeable sketches of the distribution of non-negative values.
+
+A QuantileSketch counts values in bins whose width grows exponentially, like an
+HDR histogram: bin i holds the values in (gamma ** (i - 1), gamma ** i], where
+gamma = (1 + relative_accuracy) / (1 - relative_accuracy). Each quantile is
+estimated to within relative_accuracy of a value in the bin that holds it, no
+matter how many values were added.
+
+Sketches with the same relative accuracy are merged by adding their bin counts,
+so per-client sketches can be combined in time and space proportional to the
+number of bins instead of the number of values. The number of bins is capped
+by max_bins; past that, the lowest bins are collapsed, which preserves the
+accuracy of the high quantiles that matter for latencies.
+
+Sketches are published in the 'sketch' metadata field of a Sample as JSON (see
+CreateSample), and can be restored with FromJson to be merged with the
+sketches of other runs.
+"""
+
+import json
+import math
+
+import numpy
+
+from perfkitbenchmarker import sample
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+DEFAULT_MAX_BINS = 2048
+
+# Values at most this large are counted in a separate zero bin.
+_MIN_POSITIVE_VALUE = 1e-9
+
+
+class QuantileSketch(object):
+  """Approximate distribution of a set of non-negative values.
+
+  Attributes:
+    relative_accuracy: float. Bound on the relative error of quantiles.
+    max_bins: int. The maximum number of bins kept.
+    count: int. Number of values added.
+    sum: float. Sum of the values added.
+    min: Smallest value added, or None.
+    max: Largest value added, or None.
+  """
+
+  def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY,
+               max_bins=DEFAULT_MAX_BINS):
+    if not 0 < relative_accuracy < 1:
+      raise ValueError('Invalid relative accuracy: {0}'.format(
+          relative_accuracy))
+    self.relative_accuracy = relative_accuracy
+    self.max_bins = max_bins
+    self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+    self._log_gamma = math.log(self._gamma)
+    # Maps bin index to the number of values in the bin.
+    self._bins = {}
+    self._zero_count = 0
+    self.count = 0
+    self.sum = 0.0
+    self.min = None
+    self.max = None
+
+  def __len__(self):
+    """Returns the number of non-empty bins."""
+    return len(self._bins) + (1 if self._zero_count else 0)
+
+  def _GetIndex(self, value):
+    return int(math.ceil(math.log(value) / self._log_gamma))
+
+  def _GetValue(self, index):
+    """Returns the estimate for values in a bin."""
+    return 2 * self._gamma ** index / (self._gamma + 1)
+
+  def _UpdateRange(self, count, total, minimum, maximum):
+    self.count += count
+    self.sum += total
+    self.min = minimum if self.min is None else min(self.min, minimum)
+    self.max = maximum if self.max is None else max(self.max, maximum)
+
+  def Add(self, value, count=1):
+    """Adds a value to the sketch.
+
+    Args:
+      value: Non-negative number.
+      count: int. The number of times the value occurred.
+
+    Raises:
+      ValueError: If value is negative.
+    """
+    if value < 0:
+      raise ValueError('Negative value: {0}'.format(value))
+    if count <= 0:
+      return
+    if value <= _MIN_POSITIVE_VALUE:
+      self._zero_count += count
+    else:
+      index = self._GetIndex(value)
+      self._bins[index] = self._bins.get(index, 0) + count
+    self._UpdateRange(count, float(value) * count, value, value)
+    self._Collapse()
+
+  def AddMany(self, values, counts=None):
+    """Adds a sequence of values, e.g. a NumPy array, to the sketch.
+
+    Args:
+      values: sequence of non-negative numbers.
+      counts: sequence of the number of times each value occurred, or None if
+          each occurred once.
+
+    Raises:
+      ValueError: If any value is negative.
+    """
+    values = numpy.asarray(values, dtype=float)
+    if counts is not None:
+      counts = numpy.asarray(counts)
+      values = values[counts > 0]
+      counts = counts[counts > 0]
+    if not values.size:
+      return
+    if values.min() < 0:
+      raise ValueError('Negative value: {0}'.format(values.min()))
+    is_positive = values > _MIN_POSITIVE_VALUE
+    indexes, inverse = numpy.unique(
+        numpy.ceil(numpy.log(values[is_positive]) /
+                   self._log_gamma).astype(int),
+        return_inverse=True)
+    if counts is None:
+      bin_counts = numpy.bincount(inverse)
+      count = values.size
+      zero_count = values.size - inverse.size
+      total = values.sum()
+    else:
+      bin_counts = numpy.bincount(inverse, weights=counts[is_positive])
+      bin_counts = bin_counts.astype(counts.dtype)
+      count = counts.sum().item()
+      zero_count = count - counts[is_positive].sum().item()
+      total = (values * counts).sum()
+    for index, bin_count in zip(indexes.tolist(), bin_counts.tolist()):
+      self._bins[index] = self._bins.get(index, 0) + bin_count
+    self._zero_count += zero_count
+    self._UpdateRange(count, float(total), values.min().item(),
+                      values.max().item())
+    self._Collapse()
+
+  def Merge(self, other):
+    """Adds the values of another sketch to this one.
+
+    Raises:
+      ValueError: If the sketches have different relative accuracies.
+    """
+    if other.relative_accuracy != self.relative_accuracy:
+      raise ValueError('Cannot merge sketches with relative accuracies {0} and '
+                       '{1}.'.format(self.relative_accuracy,
+                                     other.relative_accuracy))
+    if not other.count:
+      return
+    for index, count in other._bins.iteritems():
+      self._bins[index] = self._bins.get(index, 0) + count
+    self._zero_count += other._zero_count
+    self._UpdateRange(other.count, other.sum, other.min, other.max)
+    self._Collapse()
+
+  def _Collapse(self):
+    """Merges the lowest bins until there are at most max_bins bins."""
+    if len(self._bins) <= self.max_bins:
+      return
+    indexes = sorted(self._bins)
+    excess = len(indexes) - self.max_bins
+    collapsed = sum(self._bins.pop(index) for index in indexes[:excess])
+    self._bins[indexes[excess]] += collapsed
+
+  def GetPercentiles(self, percentiles):
+    """Estimates percentiles of the values added.
+
+    The p-th percentile of n values is the value with index int(n * p / 100)
+    in sorted order, like stats_util.RANK. The smallest and largest values
+    are tracked exactly, so the 0th and 100th percentiles are exact.
+
+    Args:
+      percentiles: iterable of numbers in [0, 100].
+
+    Returns:
+      dict mapping 'p<percentile>' (e.g. 'p99.9') to the estimated value.
+
+    Raises:
+      ValueError: If the sketch is empty or a percentile is outside of
+          [0, 100].
+    """
+    if not self.count:
+      raise ValueError("Can't compute percentiles of an empty sketch.")
+    ranks = []
+    for percentile in percentiles:
+      if percentile < 0 or percentile > 100:
+        raise ValueError('Invalid percentile: {0}'.format(percentile))
+      ranks.append((min(int(self.count * float(percentile) / 100.0),
+                        self.count - 1), percentile))
+    ranks.sort()
+
+    result = {}
+    bins = [(0.0, self._zero_count)] + [
+        (self._GetValue(index), self._bins[index])
+        for index in sorted(self._bins)]
+    cumulative_count = 0
+    rank_iter = iter(ranks)
+    rank, percentile = next(rank_iter, (None, None))
+    for value, count in bins:
+      cumulative_count += count
+      while rank is not None and rank < cumulative_count:
+        if rank == 0:
+          estimate = self.min
+        elif rank == self.count - 1:
+          estimate = self.max
+        else:
+          estimate = min(max(value, self.min), self.max)
+        result['p%s' % str(percentile)] = estimate
+        rank, percentile = next(rank_iter, (None, None))
+    return result
+
+  def ToJson(self):
+    """Serializes the sketch to a JSON string."""
+    return json.dumps({
+        'relative_accuracy': self.relative_accuracy,
+        'max_bins': self.max_bins,
+        'count': self.count,
+        'sum': self.sum,
+        'min': self.min,
+        'max': self.max,
+        'zero_count': self._zero_count,
+        'bins': self._bins}, sort_keys=True)
+
+  @classmethod
+  def FromJson(cls, json_string):
+    """Restores a sketch serialized by ToJson."""
+    d = json.loads(json_string)
+    sketch = cls(d['relative_accuracy'], d['max_bins'])
+    sketch._bins = {int(index): count for index, count in d['bins'].iteritems()}
+    sketch._zero_count = d['zero_count']
+    sketch.count = d['count']
+    sketch.sum = d['sum']
+    sketch.min = d['min']
+    sketch.max = d['max']
+    return sketch
+
+  @classmethod
+  def FromHistogram(cls, histogram, **kwargs):
+    """Creates a sketch from (value, count) pairs.
+
+    Args:
+      histogram: iterable of (value, count) tuples.
+      **kwargs: Passed to the QuantileSketch constructor.
+    """
+    sketch = cls(**kwargs)
+    histogram = list(histogram)
+    if histogram:
+      values, counts = zip(*histogram)
+      sketch.AddMany(values, counts)
+    return sketch
+
+  def CreateSample(self, metric, unit, metadata=None):
+    """Creates a Sample publishing the sketch.
+
+    Args:
+      metric: string. Name of the metric.
+      unit: string. Unit of the values in the sketch.
+      metadata: dict. Additional metadata to include with the sample.
+
+    Returns:
+      A Sample with the value 0, whose 'sketch' metadata field holds the
+      sketch as JSON.
+    """
+    sketch_metadata = {'sketch': self.ToJson()}
+    sketch_metadata.update(metadata or {})
+    return sample.Sample(metric, 0, unit, sketch_metadata)
@@ -0,0 +1,273 @@
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Runs long commands on Linux VMs through a persistent agent.
+
+RobustRemoteCommand used to start every command with one ssh call and wait for
+it with another, while the command wrote its output to files on the VM. With
+--remote_command_agent, each VM instead runs a single agent process (see
+scripts/command_agent.py), which is started by the first RobustRemoteCommand
+and reached over one long-lived ssh connection. Commands from all threads are
+multiplexed over that connection, and their output is streamed back as it is
+written.
+
+Commands run by the agent don't depend on the ssh connection. If it drops, a
+new connection is opened, and the output of running commands is resumed from
+the last byte that was received.
+"""
+
+import json
+import logging
+import posixpath
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+
+from perfkitbenchmarker import data
+from perfkitbenchmarker import errors
+from perfkitbenchmarker import flags
+from perfkitbenchmarker import vm_util
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_boolean('remote_command_agent', True,
+                     'Whether RobustRemoteCommand runs commands on Linux VMs '
+                     'through a persistent agent on each VM, which streams '
+                     'their output over a single ssh connection. If false, '
+                     'each command is started and awaited with separate ssh '
+                     'calls, and its output is written to files on the VM.')
+flags.DEFINE_integer('remote_command_agent_idle_timeout', 3600,
+                     'The number of seconds after which the agent on a VM '
+                     'exits if it has no connections and runs no commands.',
+                     lower_bound=1)
+
+AGENT_SCRIPT = 'command_agent.py'
+AGENT_PATH = posixpath.join(vm_util.VM_TMP_DIR, AGENT_SCRIPT)
+SOCKET_PATH = posixpath.join(vm_util.VM_TMP_DIR, 'command_agent.sock')
+
+# The number of times in a row the connection to an agent may fail before the
+# commands waiting on it fail.
+_MAX_CONNECTION_FAILURES = 10
+_RECONNECT_SLEEP_SECONDS = 5
+_WAIT_POLL_SECONDS = 1
+
+
+class _AgentCommand(object):
+  """A command sent to the agent, and the output received so far.
+
+  Attributes:
+    id: string. Identifies the command to the agent.
+    command: string. The command.
+    stdout_callback: function called with each chunk of stdout, or None.
+    output: dict mapping 'stdout' and 'stderr' to lists of received chunks.
+    offsets: dict mapping 'stdout' and 'stderr' to the number of bytes
+        received.
+    status: int. The return code of the command, once it exited.
+    error: string. Set if the command could not be run or was lost.
+    done: threading.Event. Set once status or error is set.
+  """
+
+  def __init__(self, command, stdout_callback=None):
+    self.id = uuid.uuid4().hex
+    self.command = command
+    self.stdout_callback = stdout_callback
+    self.output = {'stdout': [], 'stderr': []}
+    self.offsets = {'stdout': 0, 'stderr': 0}
+    self.status = None
+    self.error = None
+    self.done = threading.Event()
+
+  def GetRunMessage(self):
+    return {'op': 'run', 'id': self.id, 'command': self.command,
+            'stdout_offset': self.offsets['stdout'],
+            'stderr_offset': self.offsets['stderr']}
+
+
+class RemoteAgent(object):
+  """The PKB side of the connection to the agent on a VM."""
+
+  def __init__(self, vm):
+    self._vm = vm
+    self._Reset()
+
+  def _Reset(self):
+    self._lock = threading.Lock()
+    self._process = None
+    self._commands = {}
+    self._failures = 0
+    self._pushed = False
+    self._closed = False
+
+  def __getstate__(self):
+    return {'_vm': self._vm}
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self._Reset()
+
+  def _ConnectLocked(self):
+    """Opens a connection to the agent, starting it if necessary.
+
+    Must be called while holding self._lock.
+    """
+    if self._process is not None:
+      return
+    if not self._pushed:
+      self._vm.RemoteCommand('mkdir -p %s' % vm_util.VM_TMP_DIR)
+      self._vm.PushFiles([(data.ResourcePath(AGENT_SCRIPT), AGENT_PATH)])
+      self._pushed = True
+    cmd = self._vm.GetSshCommand() + [
+        'python %s connect --socket %s --idle_timeout %s' % (
+            AGENT_PATH, SOCKET_PATH, FLAGS.remote_command_agent_idle_timeout)]
+    logging.info('Connecting to the command agent on %s: %s', self._vm.name,
+                 ' '.join(cmd))
+    stderr_file = tempfile.TemporaryFile()
+    self._process = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE,
+                                     stderr=stderr_file)
+    reader = threading.Thread(target=self._Read,
+                              args=(self._process, stderr_file))
+    reader.daemon = True
+    reader.start()
+
+  def _SendLocked(self, message):
+    """Sends a message to the agent. Must be called holding self._lock.
+
+    Messages that can't be sent because the connection dropped are resent
+    by _Reconnect, so errors are ignored.
+    """
+    if self._process is None:
+      return
+    try:
+      self._process.stdin.write(json.dumps(message) + '\n')
+      self._process.stdin.flush()
+    except IOError:
+      pass
+
+  def _Read(self, process, stderr_file):
+    """Dispatches the messages from the agent until the connection drops."""
+    for line in iter(process.stdout.readline, b''):
+      try:
+        message = json.loads(line)
+      except ValueError:
+        logging.warning('Unexpected output from the command agent on %s: %s',
+                        self._vm.name, line)
+        continue
+      with self._lock:
+        self._failures = 0
+        command = self._commands.get(message.get('id'))
+      if command is not None:
+        self._Dispatch(command, message)
+    process.wait()
+    stderr_file.seek(0)
+    self._Reconnect(process, stderr_file.read())
+    stderr_file.close()
+
+  def _Dispatch(self, command, message):
+    for name in 'stdout', 'stderr':
+      if name in message:
+        chunk = message[name].encode('latin-1')
+        command.output[name].append(chunk)
+        command.offsets[name] += len(chunk)
+        if name == 'stdout' and command.stdout_callback:
+          try:
+            command.stdout_callback(chunk)
+          except Exception:  # pylint: disable=broad-except
+            # The reader thread must keep serving the other commands.
+            logging.exception('Error in the stdout callback of %s.',
+                              command.command)
+    if 'status' in message:
+      command.status = message['status']
+      command.done.set()
+    elif 'error' in message:
+      command.error = message['error']
+      command.done.set()
+
+  def _Reconnect(self, process, stderr):
+    """Reconnects after a connection dropped, if commands are running."""
+    with self._lock:
+      if self._process is process:
+        self._process = None
+      pending = [command for command in self._commands.itervalues()
+                 if not command.done.is_set()]
+      if self._closed or not pending or self._process is not None:
+        return
+      self._failures += 1
+      failures = self._failures
+    if failures > _MAX_CONNECTION_FAILURES:
+      for command in pending:
+        command.error = ('Lost the connection to the command agent on %s: %s'
+                         % (self._vm.name, stderr))
+        command.done.set()
+      return
+    logging.warning('Lost the connection to the command agent on %s, '
+                    'reconnecting: %s', self._vm.name, stderr)
+    time.sleep(_RECONNECT_SLEEP_SECONDS)
+    with self._lock:
+      self._ConnectLocked()
+      for command in pending:
+        self._SendLocked(command.GetRunMessage())
+
+  def Run(self, command, stdout_callback=None):
+    """Runs a command through the agent and waits for it to exit.
+
+    Args:
+      command: string. A valid bash command.
+      stdout_callback: function called with each chunk of stdout as it is
+          received, or None.
+
+    Returns:
+      A tuple of stdout, stderr and the return code of the command.
+
+    Raises:
+      RemoteCommandError: If the command could not be run, or the connection
+          to the agent could not be restored.
+    """
+    agent_command = _AgentCommand(command, stdout_callback)
+    with self._lock:
+      self._commands[agent_command.id] = agent_command
+    try:
+      with self._lock:
+        self._ConnectLocked()
+        self._SendLocked(agent_command.GetRunMessage())
+      while not agent_command.done.wait(_WAIT_POLL_SECONDS):
+        pass
+    finally:
+      with self._lock:
+        del self._commands[agent_command.id]
+        self._SendLocked({'op': 'forget', 'id': agent_command.id})
+    if agent_command.error:
+      raise errors.VirtualMachine.RemoteCommandError(
+          'Command agent on %s failed to run %s: %s' %
+          (self._vm.name, command, agent_command.error))
+    return (''.join(agent_command.output['stdout']),
+            ''.join(agent_command.output['stderr']), agent_command.status)
+
+  def Close(self):
+    """Stops the agent and closes the connection to it."""
+    with self._lock:
+      self._closed = True
+      process = self._process
+      self._SendLocked({'op': 'shutdown'})
+      self._process = None
+    if process is not None:
+      process.stdin.close()
+      process.wait()
+
+
+def GetAgents(vms):
+  """Returns the agents that have been started on VMs."""
+  return [vm.remote_command_agent for vm in vms
+          if getattr(vm, 'remote_command_agent', None) is not None]
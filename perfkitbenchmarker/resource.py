@@ -26,6 +26,11 @@ from perfkitbenchmarker import errors
 from perfkitbenchmarker import vm_util
 
 
+def _GetRetryBudgetName(resource):
+  """Returns the provider whose retry budget admits retries of a resource."""
+  return getattr(resource, 'CLOUD', None)
+
+
 class BaseResource(object):
   """An object representing a cloud resource.
 
@@ -110,7 +115,15 @@ class BaseResource(object):
     """
     pass
 
-  @vm_util.Retry(retryable_exceptions=(errors.Resource.RetryableCreationError,))
+  def GetResourceDependencies(self):
+    """Returns the objects that must be created before this resource.
+
+    Used by resource_graph.ResourceGraph to decide when creation can start.
+    """
+    return []
+
+  @vm_util.Retry(retryable_exceptions=(errors.Resource.RetryableCreationError,),
+                 budget=_GetRetryBudgetName)
   def _CreateResource(self):
     """Reliably creates the underlying resource."""
     if self.created:
@@ -128,7 +141,8 @@ class BaseResource(object):
     if not self.create_end_time:
       self.create_end_time = time.time()
 
-  @vm_util.Retry(retryable_exceptions=(errors.Resource.RetryableDeletionError,))
+  @vm_util.Retry(retryable_exceptions=(errors.Resource.RetryableDeletionError,),
+                 budget=_GetRetryBudgetName)
   def _DeleteResource(self):
     """Reliably deletes the underlying resource."""
     if not self.delete_start_time:
@@ -150,7 +164,8 @@ class BaseResource(object):
     # property of the class.  We don't currently need that.
     @vm_util.Retry(poll_interval=5, fuzz=0,
                    retryable_exceptions=(
-                       errors.Resource.RetryableCreationError,))
+                       errors.Resource.RetryableCreationError,),
+                   budget=_GetRetryBudgetName(self))
     def WaitUntilReady():
       if not self._IsReady():
         raise errors.Resource.RetryableCreationError('Not yet ready')
@@ -0,0 +1,356 @@
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Creates resources concurrently, each as soon as its dependencies exist.
+
+Resources declare what they depend on with GetResourceDependencies (e.g. a VM
+depends on its network, and an AWS zonal network on its regional network).
+ResourceGraph.Create starts creating each resource in its own thread as soon
+as all of its dependencies have been created, so a VM in one zone does not
+wait for an unrelated network in another zone.
+
+The number of resources of a kind that are created concurrently on a cloud
+can be limited with --resource_creation_limits, e.g. to stay below a cloud's
+API rate limits.
+"""
+
+import collections
+import logging
+import os
+import Queue
+import threading
+import time
+import traceback
+
+from perfkitbenchmarker import context
+from perfkitbenchmarker import errors
+from perfkitbenchmarker import flags
+from perfkitbenchmarker import flags_validators
+from perfkitbenchmarker import log_util
+from perfkitbenchmarker import sample
+
+FLAGS = flags.FLAGS
+
+# Kinds of resources.
+NETWORK = 'network'
+VM = 'vm'
+SPARK_SERVICE = 'spark_service'
+DPB_SERVICE = 'dpb_service'
+KINDS = [NETWORK, VM, SPARK_SERVICE, DPB_SERVICE]
+
+LIMITS_FLAG_NAME = 'resource_creation_limits'
+
+# Python's Queue.get cannot be interrupted without a timeout, so it is called
+# in a loop with a long one.
+_LONG_TIMEOUT = 1000.
+
+
+def _GetFinished(finished):
+  """Waits for a resource to finish creation, however long that takes."""
+  while True:
+    try:
+      return finished.get(True, _LONG_TIMEOUT)
+    except Queue.Empty:
+      continue
+
+
+def _ParseLimits(limit_strings):
+  """Parses the entries of --resource_creation_limits.
+
+  Args:
+    limit_strings: list of strings of the form [CLOUD:]KIND=LIMIT.
+
+  Returns:
+    dict mapping (cloud, kind) tuples to int limits. cloud is None for limits
+    that apply to every cloud.
+
+  Raises:
+    ValueError: If an entry is malformed.
+  """
+  limits = {}
+  for limit_string in limit_strings:
+    key, _, limit = limit_string.partition('=')
+    cloud, _, kind = key.rpartition(':')
+    if kind not in KINDS:
+      raise ValueError('%s: Kind must be one of %s.' % (
+          limit_string, ', '.join(KINDS)))
+    try:
+      limit = int(limit)
+    except ValueError:
+      limit = 0
+    if limit < 1:
+      raise ValueError('%s: Limit must be a positive integer.' % limit_string)
+    limits[cloud or None, kind] = limit
+  return limits
+
+
+def ValidateLimitsFlag(limit_strings):
+  """Verifies the value of --resource_creation_limits.
+
+  Raises:
+    flags_validators.Error: If an entry is malformed.
+  """
+  try:
+    _ParseLimits(limit_strings)
+  except ValueError as e:
+    raise flags_validators.Error(str(e))
+  return True
+
+
+flags.DEFINE_list(
+    LIMITS_FLAG_NAME, [],
+    'Comma-separated list of [CLOUD:]KIND=LIMIT entries limiting how many '
+    'resources of a kind are created concurrently on each cloud during '
+    'provisioning. KIND is one of <%s>. An entry that names a cloud overrides '
+    'an entry for the same kind without one, e.g. "vm=20,AWS:vm=5".' %
+    '|'.join(KINDS))
+flags.RegisterValidator(LIMITS_FLAG_NAME, ValidateLimitsFlag)
+flags.DEFINE_integer('max_concurrent_resource_creations', 200,
+                     'The maximum number of resources of any kind that are '
+                     'created concurrently during provisioning.',
+                     lower_bound=1)
+
+
+class _Node(object):
+  """A resource in a ResourceGraph.
+
+  Attributes:
+    resource: The object being created.
+    create: Function called with no arguments to create the resource.
+    name: string. Describes the resource in logs and samples.
+    kind: string. One of KINDS.
+    cloud: string or None. The resource's cloud.
+    dependencies: list of _Nodes that must be created first.
+    dependents: list of _Nodes that depend on this one.
+    ready_time: Time at which all dependencies had been created.
+    start_time: Time at which creation started.
+    end_time: Time at which creation finished.
+    traceback: The traceback string if creation raised an exception.
+  """
+
+  def __init__(self, resource, create, name, kind):
+    self.resource = resource
+    self.create = create
+    self.name = name
+    self.kind = kind
+    self.cloud = getattr(resource, 'CLOUD', None)
+    self.dependencies = []
+    self.dependents = []
+    self.ready_time = None
+    self.start_time = None
+    self.end_time = None
+    self.traceback = None
+
+
+class ResourceGraph(object):
+  """Resources to create and the dependencies between them."""
+
+  def __init__(self):
+    self._nodes = []
+    # Maps the id of each resource to its _Node.
+    self._nodes_by_id = {}
+    self._start_time = None
+
+  def AddResource(self, resource, create, name, kind):
+    """Adds a resource to the graph.
+
+    Args:
+      resource: The object being created. Its GetResourceDependencies method
+          returns the objects it depends on. Dependencies that were not added
+          to the graph are assumed to already exist.
+      create: Function called with no arguments to create the resource.
+      name: string. Describes the resource in logs and samples.
+      kind: string. One of KINDS.
+    """
+    node = _Node(resource, create, name, kind)
+    self._nodes.append(node)
+    self._nodes_by_id[id(resource)] = node
+
+  def _LinkDependencies(self):
+    for node in self._nodes:
+      node.dependencies = []
+      node.dependents = []
+    for node in self._nodes:
+      for dependency in node.resource.GetResourceDependencies():
+        dependency_node = self._nodes_by_id.get(id(dependency))
+        if (dependency_node and dependency_node is not node and
+            dependency_node not in node.dependencies):
+          node.dependencies.append(dependency_node)
+          dependency_node.dependents.append(node)
+
+  def _CheckForCycles(self):
+    """Raises ValueError if the dependencies contain a cycle."""
+    remaining = {node: len(node.dependencies) for node in self._nodes}
+    ready = [node for node in self._nodes if not node.dependencies]
+    while ready:
+      node = ready.pop()
+      del remaining[node]
+      for dependent in node.dependents:
+        remaining[dependent] -= 1
+        if not remaining[dependent]:
+          ready.append(dependent)
+    if remaining:
+      raise ValueError('Resources have circular dependencies: %s' % ', '.join(
+          sorted(node.name for node in remaining)))
+
+  def _CreateInThread(self, node, log_context, benchmark_spec, finished):
+    log_util.SetThreadLogContext(log_context)
+    context.SetThreadBenchmarkSpec(benchmark_spec)
+    try:
+      node.create()
+    except Exception:
+      node.traceback = traceback.format_exc()
+    finally:
+      node.end_time = time.time()
+      finished.put(node)
+
+  def _SkipDependents(self, failed_node):
+    """Marks every resource that depends on a failed one as not created.
+
+    Returns:
+      The number of skipped resources.
+    """
+    skipped = 0
+    to_skip = list(failed_node.dependents)
+    while to_skip:
+      node = to_skip.pop()
+      if node.traceback:
+        continue
+      node.traceback = 'Not created because %s could not be created.' % (
+          failed_node.name)
+      logging.error('Not creating %s because %s could not be created.',
+                    node.name, failed_node.name)
+      skipped += 1
+      to_skip.extend(node.dependents)
+    return skipped
+
+  def Create(self):
+    """Creates every resource once the resources it depends on exist.
+
+    Raises:
+      ValueError: If the dependencies contain a cycle.
+      errors.VmUtil.ThreadException: If any resource could not be created.
+          Resources that do not depend on it are still created.
+    """
+    self._LinkDependencies()
+    self._CheckForCycles()
+    limits = _ParseLimits(FLAGS[LIMITS_FLAG_NAME].value)
+    parent_log_context = log_util.GetThreadLogContext()
+    benchmark_spec = context.GetThreadBenchmarkSpec()
+    finished = Queue.Queue()
+    remaining_dependencies = {node: len(node.dependencies)
+                              for node in self._nodes}
+    self._start_time = time.time()
+    ready = [node for node in self._nodes if not node.dependencies]
+    for node in ready:
+      node.ready_time = self._start_time
+    running = collections.Counter()
+    running_count = 0
+    pending_count = len(self._nodes)
+    error_strings = []
+
+    try:
+      while pending_count:
+        for node in list(ready):
+          if running_count >= FLAGS.max_concurrent_resource_creations:
+            break
+          key = (node.cloud, node.kind)
+          limit = limits.get(key, limits.get((None, node.kind)))
+          if limit is not None and running[key] >= limit:
+            continue
+          ready.remove(node)
+          running[key] += 1
+          running_count += 1
+          node.start_time = time.time()
+          thread = threading.Thread(
+              target=self._CreateInThread,
+              args=(node, log_util.ThreadLogContext(parent_log_context),
+                    benchmark_spec, finished))
+          thread.daemon = True
+          thread.start()
+
+        node = _GetFinished(finished)
+        running[node.cloud, node.kind] -= 1
+        running_count -= 1
+        pending_count -= 1
+        if node.traceback:
+          msg = 'Exception occurred while creating {0}:{1}{2}'.format(
+              node.name, os.linesep, node.traceback)
+          logging.error(msg)
+          error_strings.append(msg)
+          pending_count -= self._SkipDependents(node)
+          continue
+        for dependent in node.dependents:
+          remaining_dependencies[dependent] -= 1
+          if not remaining_dependencies[dependent]:
+            dependent.ready_time = node.end_time
+            ready.append(dependent)
+    except KeyboardInterrupt:
+      logging.error('Received KeyboardInterrupt while creating resources. '
+                    'Waiting for %s creations to finish.', running_count)
+      while running_count:
+        _GetFinished(finished)
+        running_count -= 1
+      raise
+
+    if error_strings:
+      raise errors.VmUtil.ThreadException(
+          'The following exceptions occurred during parallel execution:'
+          '{0}{1}'.format(os.linesep, os.linesep.join(error_strings)))
+
+  def GetCriticalPath(self):
+    """Returns the chain of resources that determined the creation time.
+
+    Starting from the resource that finished last, each resource is preceded
+    by the dependency whose creation finished last.
+
+    Returns:
+      list of (name, kind, ready_time, start_time, end_time) tuples in the
+      order the resources were created, or an empty list if nothing was
+      created.
+    """
+    created = [node for node in self._nodes
+               if node.end_time is not None and node.start_time is not None]
+    if not created:
+      return []
+    path = [max(created, key=lambda node: node.end_time)]
+    while path[-1].dependencies:
+      path.append(max(path[-1].dependencies, key=lambda node: node.end_time))
+    return [(node.name, node.kind, node.ready_time, node.start_time,
+             node.end_time) for node in reversed(path)]
+
+  def GenerateSamples(self):
+    """Generates Samples describing the critical path of the last Create.
+
+    Returns:
+      A list of Samples: the time until the last resource was created, and the
+      creation time of each resource on the critical path.
+    """
+    critical_path = self.GetCriticalPath()
+    if not critical_path:
+      return []
+    end_time = critical_path[-1][4]
+    samples = [sample.Sample(
+        'Resource Creation Critical Path Time', end_time - self._start_time,
+        'seconds', {'critical_path': ' -> '.join(n[0] for n in critical_path),
+                    'num_resources': len(self._nodes)})]
+    for index, (name, kind, ready_time, start_time, end_time) in enumerate(
+            critical_path):
+      metadata = {'resource': name,
+                  'resource_kind': kind,
+                  'critical_path_index': index,
+                  'queued_time': start_time - ready_time}
+      samples.append(sample.Sample('Critical Path Resource Creation Time',
+                                   end_time - start_time, 'seconds',
+                                   metadata))
+    return samples
@@ -0,0 +1,228 @@
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Backoff policies, retry budgets and retry statistics for vm_util.Retry.
+
+A RetryPolicy decides how long vm_util.Retry sleeps before the next try. The
+'fixed' backoff sleeps the poll interval with uniform fuzz. The 'exponential'
+backoff uses decorrelated jitter: each sleep is drawn uniformly between the
+poll interval, reduced by the fuzz, and three times the previous sleep, and is
+capped at a multiple of the poll interval. Threads that failed at the same
+time therefore spread out instead of retrying in lockstep.
+
+A RetryBudget is a token bucket shared by all retries against one provider
+(e.g. 'GCP' or 'gcloud'). Every retry takes a token, and once the burst is
+used up, retries are admitted at a fixed rate, so hundreds of threads can't
+hammer a throttled API.
+
+RetryStats counts the attempts, sleep time and give-ups of every function
+wrapped by vm_util.Retry while running a benchmark, and is published as
+samples.
+"""
+
+import random
+import threading
+import time
+
+from perfkitbenchmarker import flags
+from perfkitbenchmarker import sample
+
+FLAGS = flags.FLAGS
+
+FIXED = 'fixed'
+EXPONENTIAL = 'exponential'
+
+flags.DEFINE_enum('retry_backoff', FIXED, [FIXED, EXPONENTIAL],
+                  'How long vm_util.Retry sleeps between tries. "fixed" '
+                  'sleeps the poll interval with random fuzz. "exponential" '
+                  'grows the sleep with decorrelated jitter, up to '
+                  '--retry_max_backoff_multiplier times the poll interval.')
+flags.DEFINE_float('retry_max_backoff_multiplier', 8,
+                   'With --retry_backoff=exponential, the maximum sleep '
+                   'between tries as a multiple of the poll interval.',
+                   lower_bound=1)
+flags.DEFINE_float('retry_budget_per_second', None,
+                   'If set, the rate at which retries against each provider '
+                   'are admitted once its burst of --retry_budget_burst '
+                   'retries is used up. Retries in excess of the budget wait '
+                   'for it.', lower_bound=0.001)
+flags.DEFINE_integer('retry_budget_burst', 50,
+                     'The number of retries against each provider admitted '
+                     'without waiting when --retry_budget_per_second is set.',
+                     lower_bound=1)
+
+# The factor by which the upper bound of exponential backoff grows per try.
+_EXPONENTIAL_GROWTH = 3
+
+
+class RetryPolicy(object):
+  """Decides how long to sleep between tries.
+
+  Attributes:
+    poll_interval: float. Base number of seconds between tries.
+    fuzz: float in [0, 1]. The fraction of the poll interval that is random.
+    backoff: string. FIXED, EXPONENTIAL, or None to use --retry_backoff.
+    max_interval: float. With exponential backoff, the maximum number of
+        seconds between tries, or None to use --retry_max_backoff_multiplier.
+  """
+
+  def __init__(self, poll_interval, fuzz, backoff=None, max_interval=None):
+    self.poll_interval = poll_interval
+    self.fuzz = fuzz
+    self.backoff = backoff
+    self.max_interval = max_interval
+
+  def GetSleepTime(self, previous_sleep_time=None):
+    """Returns the number of seconds to sleep before the next try.
+
+    Args:
+      previous_sleep_time: float. The sleep before the previous try under this
+          policy, or None if this is the first retry.
+    """
+    minimum = self.poll_interval * (1 - self.fuzz)
+    if (self.backoff or FLAGS.retry_backoff) != EXPONENTIAL:
+      return minimum + self.poll_interval * self.fuzz * random.random()
+    maximum = self.max_interval
+    if maximum is None:
+      maximum = self.poll_interval * FLAGS.retry_max_backoff_multiplier
+    upper = _EXPONENTIAL_GROWTH * max(previous_sleep_time or 0,
+                                      self.poll_interval)
+    return min(maximum, random.uniform(minimum, upper))
+
+
+class RetryBudget(object):
+  """A token bucket limiting the rate of retries.
+
+  Attributes:
+    rate: float. Tokens added per second.
+    burst: int. The maximum number of tokens.
+  """
+
+  def __init__(self, rate, burst):
+    self.rate = float(rate)
+    self.burst = burst
+    self._tokens = float(burst)
+    self._last_update = time.time()
+    self._lock = threading.Lock()
+
+  def Acquire(self):
+    """Takes a token, waiting for one if the bucket is empty.
+
+    Tokens are reserved in the order they are requested, so waiting threads
+    are admitted one at a time rather than all at once.
+
+    Returns:
+      float. The number of seconds waited.
+    """
+    with self._lock:
+      now = time.time()
+      self._tokens = min(float(self.burst),
+                         self._tokens + (now - self._last_update) * self.rate)
+      self._last_update = now
+      self._tokens -= 1
+      wait_time = -self._tokens / self.rate if self._tokens < 0 else 0
+    if wait_time:
+      time.sleep(wait_time)
+    return wait_time
+
+
+_budgets = {}
+_budgets_lock = threading.Lock()
+
+
+def GetBudget(name):
+  """Returns the RetryBudget shared by retries against a provider.
+
+  Args:
+    name: string. Name of the provider, or None.
+
+  Returns:
+    The RetryBudget, or None if name is None or --retry_budget_per_second is
+    not set.
+  """
+  if name is None or not FLAGS.retry_budget_per_second:
+    return None
+  with _budgets_lock:
+    budget = _budgets.get(name)
+    if (budget is None or budget.rate != FLAGS.retry_budget_per_second or
+        budget.burst != FLAGS.retry_budget_burst):
+      budget = RetryBudget(FLAGS.retry_budget_per_second,
+                           FLAGS.retry_budget_burst)
+      _budgets[name] = budget
+    return budget
+
+
+class _FunctionStats(object):
+
+  def __init__(self):
+    self.calls = 0
+    self.attempts = 0
+    self.sleep_time = 0.0
+    self.budget_wait_time = 0.0
+    self.give_ups = 0
+
+
+class RetryStats(object):
+  """Counts the tries of functions wrapped by vm_util.Retry."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._functions = {}
+
+  def Record(self, function_name, attempts, sleep_time, budget_wait_time,
+             gave_up):
+    """Records one call of a function wrapped by vm_util.Retry.
+
+    Args:
+      function_name: string. Name of the function.
+      attempts: int. The number of times the function was tried.
+      sleep_time: float. Seconds slept between tries.
+      budget_wait_time: float. Seconds waited for the retry budget.
+      gave_up: bool. Whether the call failed after running out of retries.
+    """
+    with self._lock:
+      stats = self._functions.get(function_name)
+      if stats is None:
+        stats = self._functions[function_name] = _FunctionStats()
+      stats.calls += 1
+      stats.attempts += attempts
+      stats.sleep_time += sleep_time
+      stats.budget_wait_time += budget_wait_time
+      stats.give_ups += int(gave_up)
+
+  def GenerateSamples(self):
+    """Generates samples for each function that was retried.
+
+    Returns:
+      A list of Samples with the attempts, sleep time and give-ups of each
+      function, or an empty list if nothing was retried.
+    """
+    samples = []
+    with self._lock:
+      functions = sorted(self._functions.iteritems())
+    for name, stats in functions:
+      if stats.attempts == stats.calls:
+        continue
+      metadata = {'function': name,
+                  'calls': stats.calls,
+                  'retry_backoff': FLAGS.retry_backoff,
+                  'retry_budget_per_second': FLAGS.retry_budget_per_second}
+      samples.extend([
+          sample.Sample('Retry attempts', stats.attempts, 'attempts',
+                        metadata),
+          sample.Sample('Retry sleep time',
+                        stats.sleep_time + stats.budget_wait_time, 'seconds',
+                        dict(metadata,
+                             budget_wait_time=stats.budget_wait_time)),
+          sample.Sample('Retry give ups', stats.give_ups, 'calls', metadata)])
+    return samples
@@ -13,5 +13,6 @@
 # limitations under the License.
 """Files to run *on the guest VM*.
 
-Nothing in this package should be imported.
+Nothing in this package should be imported, except stats_util, which is also
+used by PerfKitBenchmarker itself.
 """
@@ -0,0 +1,384 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# -*- coding: utf-8 -*-
+
+"""Runs commands on behalf of PKB and streams their output.
+
+"serve" runs the agent, a daemon listening on a Unix socket. It runs the
+commands it is sent, keeps their output in memory, and streams it to the
+connection that sent them. Commands keep running when that connection drops,
+and a new connection can pick up their output where the old one left off.
+The agent exits when it has had no connections and no running commands for
+--idle_timeout seconds.
+
+"connect" copies its stdin to the agent socket and the replies to its stdout,
+starting the agent first if it isn't running. PKB runs it over a single ssh
+connection per VM and multiplexes all commands over it.
+
+Messages are JSON objects, one per line. Requests:
+
+  {"op": "run", "id": ID, "command": COMMAND,
+   "stdout_offset": N, "stderr_offset": N}
+      Runs COMMAND in a shell, unless a command with the same ID is known,
+      and sends its output from the given offsets on.
+  {"op": "forget", "id": ID}
+      Drops the output of a finished command.
+  {"op": "shutdown"}
+      Kills running commands and stops the agent.
+
+Replies:
+
+  {"id": ID, "stdout": DATA} or {"id": ID, "stderr": DATA}
+  {"id": ID, "status": RETURN_CODE}
+  {"id": ID, "error": MESSAGE}
+
+Output is decoded as Latin-1, so any bytes survive the trip through JSON.
+
+*Runs on the guest VM. Supports Python 2.6, 2.7, and 3.x.*
+"""
+
+import errno
+import fcntl
+import json
+import logging
+import optparse
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+STREAMS = ('stdout', 'stderr')
+READ_SIZE = 1 << 16
+ACCEPT_TIMEOUT_IN_SEC = 1.0
+START_TIMEOUT_IN_SEC = 30.0
+START_SLEEP_IN_SEC = 0.1
+
+
+class Connection(object):
+  """A connection from PKB, to which replies are sent."""
+
+  def __init__(self, sock):
+    self.sock = sock
+    self.closed = False
+    self._lock = threading.Lock()
+
+  def Send(self, message):
+    data = (json.dumps(message) + '\n').encode('utf-8')
+    self._lock.acquire()
+    try:
+      if not self.closed:
+        try:
+          self.sock.sendall(data)
+        except socket.error:
+          self.closed = True
+    finally:
+      self._lock.release()
+
+
+class Command(object):
+  """A command run by the agent, and its output so far."""
+
+  def __init__(self, command_id, command, on_exit):
+    self.id = command_id
+    self.status = None
+    self._output = {'stdout': [], 'stderr': []}
+    self._subscribers = []
+    self._lock = threading.Lock()
+    devnull = open(os.devnull)
+    self.process = subprocess.Popen(command, shell=True, stdin=devnull,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE, close_fds=True)
+    devnull.close()
+    logging.info('Started pid %d: %s', self.process.pid, command)
+    readers = []
+    for name in STREAMS:
+      reader = threading.Thread(target=self._Read,
+                                args=(name, getattr(self.process, name)))
+      reader.daemon = True
+      reader.start()
+      readers.append(reader)
+    waiter = threading.Thread(target=self._Wait, args=(readers, on_exit))
+    waiter.daemon = True
+    waiter.start()
+
+  def _Read(self, name, pipe):
+    fd = pipe.fileno()
+    while True:
+      data = os.read(fd, READ_SIZE)
+      if not data:
+        break
+      text = data.decode('latin-1')
+      self._lock.acquire()
+      try:
+        self._output[name].append(text)
+        for connection in self._subscribers:
+          connection.Send({'id': self.id, name: text})
+      finally:
+        self._lock.release()
+    pipe.close()
+
+  def _Wait(self, readers, on_exit):
+    for reader in readers:
+      reader.join()
+    status = self.process.wait()
+    logging.info('Pid %d exited with %d.', self.process.pid, status)
+    self._lock.acquire()
+    try:
+      self.status = status
+      for connection in self._subscribers:
+        connection.Send({'id': self.id, 'status': status})
+      self._subscribers = []
+    finally:
+      self._lock.release()
+    on_exit()
+
+  def Attach(self, connection, offsets):
+    """Sends the output from the offsets on, and then as it is written."""
+    self._lock.acquire()
+    try:
+      for name in STREAMS:
+        text = ''.join(self._output[name])
+        self._output[name] = [text]
+        if len(text) > offsets[name]:
+          connection.Send({'id': self.id, name: text[offsets[name]:]})
+      if self.status is None:
+        self._subscribers.append(connection)
+      else:
+        connection.Send({'id': self.id, 'status': self.status})
+    finally:
+      self._lock.release()
+
+  def Detach(self, connection):
+    self._lock.acquire()
+    try:
+      if connection in self._subscribers:
+        self._subscribers.remove(connection)
+    finally:
+      self._lock.release()
+
+
+class Agent(object):
+  """Runs commands sent over connections to the agent socket."""
+
+  def __init__(self):
+    self.commands = {}
+    self.connections = 0
+    self.last_activity = time.time()
+    self.shutdown = False
+    self._lock = threading.Lock()
+
+  def _Touch(self):
+    self._lock.acquire()
+    self.last_activity = time.time()
+    self._lock.release()
+
+  def IsIdle(self, idle_timeout):
+    self._lock.acquire()
+    try:
+      running = [c for c in self.commands.values() if c.status is None]
+      return (not self.connections and not running and
+              time.time() - self.last_activity > idle_timeout)
+    finally:
+      self._lock.release()
+
+  def _Run(self, connection, message):
+    offsets = {}
+    for name in STREAMS:
+      offsets[name] = message.get(name + '_offset', 0)
+    command_id = message['id']
+    self._lock.acquire()
+    try:
+      command = self.commands.get(command_id)
+      if command is None:
+        if offsets['stdout'] or offsets['stderr']:
+          # The agent was restarted while the command was running.
+          connection.Send({'id': command_id,
+                           'error': 'Command was lost by the agent.'})
+          return
+        try:
+          command = Command(command_id, message['command'], self._Touch)
+        except OSError as e:
+          connection.Send({'id': command_id, 'error': str(e)})
+          return
+        self.commands[command_id] = command
+    finally:
+      self._lock.release()
+    command.Attach(connection, offsets)
+
+  def _Forget(self, message):
+    self._lock.acquire()
+    try:
+      command = self.commands.get(message['id'])
+      if command is not None and command.status is not None:
+        del self.commands[message['id']]
+    finally:
+      self._lock.release()
+
+  def _Shutdown(self):
+    self._lock.acquire()
+    try:
+      self.shutdown = True
+      for command in self.commands.values():
+        if command.status is None:
+          try:
+            command.process.kill()
+          except OSError:
+            pass
+    finally:
+      self._lock.release()
+
+  def Handle(self, sock):
+    """Handles the requests sent over a connection until it is closed."""
+    connection = Connection(sock)
+    self._lock.acquire()
+    self.connections += 1
+    self._lock.release()
+    try:
+      for line in sock.makefile('rb'):
+        message = json.loads(line.decode('utf-8'))
+        if message['op'] == 'run':
+          self._Run(connection, message)
+        elif message['op'] == 'forget':
+          self._Forget(message)
+        elif message['op'] == 'shutdown':
+          self._Shutdown()
+    finally:
+      connection.closed = True
+      self._lock.acquire()
+      self.connections -= 1
+      self.last_activity = time.time()
+      commands = list(self.commands.values())
+      self._lock.release()
+      for command in commands:
+        command.Detach(connection)
+      sock.close()
+
+
+def Serve(socket_path, idle_timeout):
+  """Runs the agent until it is shut down or idle."""
+  lock_file = open(socket_path + '.lock', 'w')
+  try:
+    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+  except IOError:
+    logging.info('Another agent is serving %s.', socket_path)
+    return 0
+  if os.path.exists(socket_path):
+    os.unlink(socket_path)
+  server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  server.bind(socket_path)
+  server.listen(16)
+  server.settimeout(ACCEPT_TIMEOUT_IN_SEC)
+  agent = Agent()
+  logging.info('Serving %s.', socket_path)
+  while not agent.shutdown and not agent.IsIdle(idle_timeout):
+    try:
+      sock, _ = server.accept()
+    except socket.timeout:
+      continue
+    sock.settimeout(None)
+    handler = threading.Thread(target=agent.Handle, args=(sock,))
+    handler.daemon = True
+    handler.start()
+  os.unlink(socket_path)
+  logging.info('Stopped serving %s.', socket_path)
+  return 0
+
+
+def _StartAgent(socket_path, idle_timeout):
+  """Starts the agent in a new session, so that it outlives ssh."""
+  devnull = open(os.devnull)
+  log = open(socket_path + '.log', 'a')
+  subprocess.Popen([sys.executable, os.path.abspath(__file__), 'serve',
+                    '--socket', socket_path,
+                    '--idle_timeout', str(idle_timeout)],
+                   stdin=devnull, stdout=log, stderr=subprocess.STDOUT,
+                   close_fds=True, preexec_fn=os.setsid)
+  devnull.close()
+  log.close()
+
+
+def _ConnectToAgent(socket_path, idle_timeout):
+  """Returns a socket connected to the agent, starting it if necessary."""
+  started = False
+  deadline = time.time() + START_TIMEOUT_IN_SEC
+  while True:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+      sock.connect(socket_path)
+      return sock
+    except socket.error as e:
+      sock.close()
+      if e.errno not in (errno.ENOENT, errno.ECONNREFUSED):
+        raise
+      if time.time() > deadline:
+        raise
+    if not started:
+      _StartAgent(socket_path, idle_timeout)
+      started = True
+    time.sleep(START_SLEEP_IN_SEC)
+
+
+def _CopyToStdout(sock):
+  while True:
+    data = sock.recv(READ_SIZE)
+    if not data:
+      break
+    while data:
+      data = data[os.write(sys.stdout.fileno(), data):]
+
+
+def Connect(socket_path, idle_timeout):
+  """Copies stdin to the agent and its replies to stdout."""
+  sock = _ConnectToAgent(socket_path, idle_timeout)
+  copier = threading.Thread(target=_CopyToStdout, args=(sock,))
+  copier.daemon = True
+  copier.start()
+  while True:
+    data = os.read(sys.stdin.fileno(), READ_SIZE)
+    if not data:
+      break
+    sock.sendall(data)
+  sock.shutdown(socket.SHUT_WR)
+  copier.join()
+  return 0
+
+
+def main():
+  p = optparse.OptionParser(usage='%prog serve|connect [options]')
+  p.add_option('-s', '--socket', dest='socket', metavar='PATH',
+               help='Path of the agent socket. Required.')
+  p.add_option('-i', '--idle_timeout', dest='idle_timeout', type='float',
+               default=3600.0, help='Seconds without connections and running '
+               'commands after which the agent exits.')
+  options, args = p.parse_args()
+  if len(args) != 1 or args[0] not in ('serve', 'connect'):
+    p.print_usage()
+    return 1
+  if options.socket is None:
+    p.print_usage()
+    sys.stderr.write('Missing required flag: --socket\n')
+    return 1
+  if args[0] == 'serve':
+    return Serve(options.socket, options.idle_timeout)
+  return Connect(options.socket, options.idle_timeout)
+
+if __name__ == '__main__':
+  logging.basicConfig(level=logging.INFO,
+                      format='%(asctime)s %(threadName)s %(message)s')
+  sys.exit(main())
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# -*- coding: utf-8 -*-
+
+"""Summarizes the latency, bandwidth and IOPS logs written by fio.
+
+fio writes one line per logged value, so on fast devices its logs grow to
+gigabytes. This script reduces them on the VM to a few kilobytes of JSON:
+
+  * For each latency log (lat, clat and slat), job and data direction, a
+    histogram of the logged values, their percentiles, and the percentiles
+    within each time window.
+  * For each bandwidth and IOPS log, job and data direction, the mean value in
+    each time window, summed over the clones of the job (see fio's numjobs).
+
+Log files are named <prefix>_<log>.<thread number>.log. fio numbers threads in
+the order of the jobs in the job file, clones right after their job, so if
+--job_file is given, thread numbers are mapped back to job names. Otherwise
+jobs are named 'job<thread number>'.
+
+Each log line is "<msec since the job started>, <value>, <direction>, <block
+size>". Latencies are in microseconds, bandwidth in KB/s. If fio was run with
+--log_avg_msec, each line holds the mean of that period, so the latency
+histograms are histograms of those means.
+
+The output is a JSON object:
+
+  {"latency": [{"log": LOG, "job": JOB, "direction": DIRECTION,
+                "histogram": {VALUE: COUNT, ...}, "stats": STATS,
+                "windows": [{"start": SEC, "end": SEC, "stats": STATS}]}],
+   "throughput": [{"log": LOG, "job": JOB, "direction": DIRECTION,
+                   "windows": [{"start": SEC, "end": SEC, "value": VALUE}]}]}
+
+where STATS maps 'p<percentile>', 'average' and 'stddev' to their values.
+
+*Runs on the guest VM. Supports Python 2.7. Imports stats_util, which must be
+copied next to it.*
+"""
+
+import collections
+import ConfigParser
+import json
+import optparse
+import os
+import re
+import sys
+
+import stats_util
+
+LATENCY_LOGS = ('lat', 'clat', 'slat')
+THROUGHPUT_LOGS = ('bw', 'iops')
+DIRECTIONS = ('read', 'write', 'trim')
+LOG_FILE_REGEX = re.compile(
+    r'_(?P<log>%s)(?:\.(?P<thread>\d+))?\.log$' %
+    '|'.join(LATENCY_LOGS + THROUGHPUT_LOGS))
+GLOBAL = 'global'
+# Values are kept with this many significant bits in the histograms, i.e. to
+# within 1/128 of their value.
+HISTOGRAM_PRECISION_BITS = 8
+
+
+def Bucket(value):
+  """Rounds a value down to the lower bound of its histogram bucket."""
+  value = int(value)
+  shift = 0
+  while value >> shift >= 1 << HISTOGRAM_PRECISION_BITS:
+    shift += 1
+  return value >> shift << shift
+
+
+def GetJobNames(job_file):
+  """Maps fio thread numbers to the names of the jobs in a job file.
+
+  Args:
+    job_file: string. Path of the fio job file.
+
+  Returns:
+    A dict mapping thread numbers, starting at 1, to job names.
+  """
+  config = ConfigParser.RawConfigParser(allow_no_value=True)
+  config.read(job_file)
+  default_num_jobs = 1
+  if config.has_option(GLOBAL, 'numjobs'):
+    default_num_jobs = int(config.get(GLOBAL, 'numjobs'))
+  job_names = {}
+  for section in config.sections():
+    if section == GLOBAL:
+      continue
+    num_jobs = default_num_jobs
+    if config.has_option(section, 'numjobs'):
+      num_jobs = int(config.get(section, 'numjobs'))
+    for _ in range(num_jobs):
+      job_names[len(job_names) + 1] = section
+  return job_names
+
+
+def _ReadLog(path):
+  """Yields the (time in msec, value, direction) of each line of a log."""
+  with open(path) as log_file:
+    for line in log_file:
+      fields = line.split(',')
+      if len(fields) < 3:
+        continue
+      yield int(fields[0]), int(fields[1]), int(fields[2])
+
+
+def _GetDirection(direction):
+  if 0 <= direction < len(DIRECTIONS):
+    return DIRECTIONS[direction]
+  return str(direction)
+
+
+class _LatencySeries(object):
+  """The histograms of a latency log, overall and per window."""
+
+  def __init__(self):
+    self.histogram = collections.defaultdict(int)
+    self.windows = collections.defaultdict(
+        lambda: collections.defaultdict(int))
+
+  def Add(self, window, value):
+    bucket = Bucket(value)
+    self.histogram[bucket] += 1
+    self.windows[window][bucket] += 1
+
+
+class _ThroughputSeries(object):
+  """The sums and counts of a bandwidth or IOPS log, per window and thread."""
+
+  def __init__(self):
+    self.windows = collections.defaultdict(
+        lambda: collections.defaultdict(lambda: [0, 0]))
+
+  def Add(self, window, thread, value):
+    total = self.windows[window][thread]
+    total[0] += value
+    total[1] += 1
+
+
+def ReduceLogs(paths, window_sec, percentiles, job_names=None):
+  """Summarizes fio logs.
+
+  Args:
+    paths: list of strings. Paths of the log files. Files whose names don't
+        match LOG_FILE_REGEX are ignored.
+    window_sec: number. The length of the time windows in seconds.
+    percentiles: list of numbers. The latency percentiles to compute.
+    job_names: dict mapping thread numbers to job names, or None.
+
+  Returns:
+    A dict as described in the module docstring.
+  """
+  job_names = job_names or {}
+  window_msec = window_sec * 1000.0
+  latency = collections.defaultdict(_LatencySeries)
+  throughput = collections.defaultdict(_ThroughputSeries)
+  for path in paths:
+    match = LOG_FILE_REGEX.search(os.path.basename(path))
+    if not match:
+      continue
+    log = match.group('log')
+    thread = int(match.group('thread') or 1)
+    job = job_names.get(thread, 'job%d' % thread)
+    for msec, value, direction in _ReadLog(path):
+      key = log, job, _GetDirection(direction)
+      window = int(msec // window_msec)
+      if log in LATENCY_LOGS:
+        latency[key].Add(window, value)
+      else:
+        throughput[key].Add(window, thread, value)
+
+  def WindowBounds(window):
+    return {'start': window * window_sec, 'end': (window + 1) * window_sec}
+
+  result = {'latency': [], 'throughput': []}
+  for (log, job, direction), series in sorted(latency.items()):
+    windows = []
+    for window, histogram in sorted(series.windows.items()):
+      bounds = WindowBounds(window)
+      bounds['stats'] = stats_util.CalculateHistogramStats(histogram,
+                                                           percentiles)
+      windows.append(bounds)
+    result['latency'].append({
+        'log': log, 'job': job, 'direction': direction,
+        'histogram': dict(series.histogram),
+        'stats': stats_util.CalculateHistogramStats(series.histogram,
+                                                    percentiles),
+        'windows': windows})
+  for (log, job, direction), series in sorted(throughput.items()):
+    windows = []
+    for window, threads in sorted(series.windows.items()):
+      bounds = WindowBounds(window)
+      # The throughput of a job is that of all of its clones.
+      bounds['value'] = sum(float(total) / count
+                            for total, count in threads.values())
+      windows.append(bounds)
+    result['throughput'].append({'log': log, 'job': job,
+                                 'direction': direction, 'windows': windows})
+  return result
+
+
+def _ParseNumber(string):
+  """Parses an int or a float, so that e.g. p50 isn't named p50.0."""
+  try:
+    return int(string)
+  except ValueError:
+    return float(string)
+
+
+def main():
+  p = optparse.OptionParser(usage='%prog [options] LOG_FILE...')
+  p.add_option('-w', '--window_sec', dest='window_sec', type='float',
+               default=10.0, help='Length of the time windows in seconds.')
+  p.add_option('-p', '--percentiles', dest='percentiles', default='50,90,99',
+               help='Comma-separated latency percentiles to compute.')
+  p.add_option('-j', '--job_file', dest='job_file', metavar='PATH',
+               help='fio job file, to name the jobs after.')
+  options, args = p.parse_args()
+  if options.window_sec <= 0:
+    p.error('--window_sec must be positive.')
+  percentiles = [_ParseNumber(percentile)
+                 for percentile in options.percentiles.split(',')]
+  job_names = None
+  if options.job_file:
+    job_names = GetJobNames(options.job_file)
+  json.dump(ReduceLogs(args, options.window_sec, percentiles, job_names),
+            sys.stdout)
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
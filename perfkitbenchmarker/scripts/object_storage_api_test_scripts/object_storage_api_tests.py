@@ -39,6 +39,7 @@ import gflags as flags
 
 import azure_flags  # noqa
 import s3_flags  # noqa
+import stats_util
 
 FLAGS = flags.FLAGS
 
@@ -162,6 +163,9 @@ BYTES_PER_KILOBYTE = 1024
 # every THREAD_STATUS_LOG_INTERVAL seconds.
 THREAD_STATUS_LOG_INTERVAL = 10
 
+# Percentiles of bandwidths and latencies that are logged.
+PERCENTILES = [0.1, 1, 5, 10, 50, 90, 95, 99, 99.9]
+
 
 # When a storage provider fails more than a threshold number of requests, we
 # stop the benchmarking tests and raise a low availability error back to the
@@ -235,29 +239,7 @@ def MaxSizeInDistribution(dist):
 # ### Utilities for data analysis ###
 
 def PercentileCalculator(numbers):
-  numbers_sorted = sorted(numbers)
-  count = len(numbers_sorted)
-  total = sum(numbers_sorted)
-  result = {}
-  result['p0.1'] = numbers_sorted[int(count * 0.001)]
-  result['p1'] = numbers_sorted[int(count * 0.01)]
-  result['p5'] = numbers_sorted[int(count * 0.05)]
-  result['p10'] = numbers_sorted[int(count * 0.1)]
-  result['p50'] = numbers_sorted[int(count * 0.5)]
-  result['p90'] = numbers_sorted[int(count * 0.9)]
-  result['p95'] = numbers_sorted[int(count * 0.95)]
-  result['p99'] = numbers_sorted[int(count * 0.99)]
-  result['p99.9'] = numbers_sorted[int(count * 0.999)]
-  if count > 0:
-    average = total / float(count)
-    result['average'] = average
-    if count > 1:
-      total_of_squares = sum([(i - average) ** 2 for i in numbers])
-      result['stddev'] = (total_of_squares / (count - 1)) ** 0.5
-    else:
-      result['stddev'] = 0
-
-  return result
+  return stats_util.CalculateStats(numbers, PERCENTILES)
 
 # ### Object naming schemes ###
 
@@ -0,0 +1,219 @@
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Percentiles, mean and standard deviation of samples and histograms.
+
+When NumPy is installed, percentiles are found by partial selection
+(numpy.partition) rather than by sorting, and histogram percentiles by
+searching the cumulative counts. Otherwise equivalent pure-Python code is used.
+
+*Runs on the guest VM and in PerfKitBenchmarker.* Scripts that run on VMs
+(e.g. object_storage_api_tests.py) import it, so it must not import anything
+from perfkitbenchmarker and must work without NumPy.
+"""
+
+import bisect
+import math
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+# Interpolation modes, i.e. how a percentile that falls between two samples is
+# computed. Except for RANK, they behave like the NumPy modes of the same
+# names, for which the p-th percentile of n sorted samples is at position
+# (n - 1) * p / 100.
+# RANK: The sample at index int(n * p / 100). This is PerfKitBenchmarker's
+# historical definition.
+RANK = 'rank'
+# LOWER, HIGHER: The sample before or after the position.
+LOWER = 'lower'
+HIGHER = 'higher'
+# NEAREST: The sample closest to the position. Ties go to the even index.
+NEAREST = 'nearest'
+# MIDPOINT: The mean of the samples before and after the position.
+MIDPOINT = 'midpoint'
+# LINEAR: Linear interpolation between the samples before and after the
+# position.
+LINEAR = 'linear'
+INTERPOLATIONS = [RANK, LOWER, HIGHER, NEAREST, MIDPOINT, LINEAR]
+
+
+def _CheckArguments(percentiles, interpolation):
+  """Raises ValueError if the percentiles or interpolation mode are invalid."""
+  if interpolation not in INTERPOLATIONS:
+    raise ValueError('Invalid interpolation %s' % interpolation)
+  for percentile in percentiles:
+    if (isinstance(percentile, bool) or
+        not isinstance(percentile, (int, long, float)) or
+        not 0 <= percentile <= 100):
+      raise ValueError('Invalid percentile %s' % percentile)
+
+
+def _GetRanks(count, percentile, interpolation):
+  """Finds the samples that a percentile is computed from.
+
+  Args:
+    count: int. The number of samples.
+    percentile: number in [0, 100].
+    interpolation: One of INTERPOLATIONS.
+
+  Returns:
+    (lower, upper, weight) tuple. The percentile is the sample with index
+    'lower' in sorted order, plus 'weight' times the difference between the
+    samples with indexes 'upper' and 'lower'.
+  """
+  if interpolation == RANK:
+    # min() handles the 100th percentile.
+    index = min(int(count * float(percentile) / 100.0), count - 1)
+    return index, index, 0
+  position = (count - 1) * float(percentile) / 100.0
+  lower = int(math.floor(position))
+  upper = min(lower + 1, count - 1)
+  fraction = position - lower
+  if interpolation == LOWER or not fraction:
+    return lower, lower, 0
+  elif interpolation == HIGHER:
+    return upper, upper, 0
+  elif interpolation == NEAREST:
+    if fraction > 0.5 or (fraction == 0.5 and lower % 2):
+      return upper, upper, 0
+    return lower, lower, 0
+  elif interpolation == MIDPOINT:
+    return lower, upper, 0.5
+  return lower, upper, fraction
+
+
+def _Interpolate(lower_value, upper_value, weight):
+  if not weight:
+    return lower_value
+  return lower_value + (upper_value - lower_value) * weight
+
+
+def _ToPython(value):
+  """Converts a NumPy scalar to the equivalent Python number."""
+  return value.item() if hasattr(value, 'item') else value
+
+
+def CalculateStats(numbers, percentiles, interpolation=RANK):
+  """Computes percentiles, mean and standard deviation of a set of numbers.
+
+  Args:
+    numbers: A sequence of numbers, e.g. a list or a NumPy array. It is not
+        modified.
+    percentiles: A list of percentiles to compute. Can be floats, ints or
+        longs.
+    interpolation: One of INTERPOLATIONS.
+
+  Returns:
+    A dict mapping 'p<percentile>' (e.g. 'p99.9'), 'average' and 'stddev' (the
+    sample standard deviation) to their values.
+
+  Raises:
+    ValueError: If numbers is empty, or a percentile is outside of [0, 100],
+        or interpolation is not one of INTERPOLATIONS.
+  """
+  _CheckArguments(percentiles, interpolation)
+  # 'if not numbers' would fail if numbers is a NumPy array or pd.Series.
+  count = len(numbers)
+  if not count:
+    raise ValueError("Can't compute percentiles of empty list.")
+  ranks = [_GetRanks(count, percentile, interpolation)
+           for percentile in percentiles]
+
+  if numpy is not None:
+    values = numpy.asarray(numbers)
+    indices = sorted(set(index for lower, upper, _ in ranks
+                         for index in (lower, upper)))
+    selected = numpy.partition(values, indices) if indices else values
+    average = values.mean()
+    variance = values.var(ddof=1) if count > 1 else 0
+  else:
+    selected = sorted(numbers)
+    # Welford's one-pass algorithm.
+    average = 0.0
+    total_of_squares = 0.0
+    for i, value in enumerate(selected):
+      delta = value - average
+      average += delta / (i + 1.0)
+      total_of_squares += delta * (value - average)
+    variance = total_of_squares / (count - 1) if count > 1 else 0
+
+  result = {}
+  for percentile, (lower, upper, weight) in zip(percentiles, ranks):
+    result['p%s' % str(percentile)] = _ToPython(_Interpolate(
+        selected[lower], selected[upper], weight))
+  result['average'] = float(average)
+  result['stddev'] = float(variance) ** 0.5 if count > 1 else 0
+  return result
+
+
+def CalculateHistogramStats(histogram, percentiles, interpolation=RANK):
+  """Computes percentiles, mean and standard deviation of a histogram.
+
+  Args:
+    histogram: A dict mapping values to the number of samples with that value.
+    percentiles: A list of percentiles to compute. Can be floats, ints or
+        longs.
+    interpolation: One of INTERPOLATIONS.
+
+  Returns:
+    A dict mapping 'p<percentile>' (e.g. 'p99.9'), 'average' and 'stddev' (the
+    sample standard deviation) to their values.
+
+  Raises:
+    ValueError: If the histogram holds no samples, or a percentile is outside
+        of [0, 100], or interpolation is not one of INTERPOLATIONS.
+  """
+  _CheckArguments(percentiles, interpolation)
+  by_value = sorted(item for item in histogram.items() if item[1])
+  total_count = sum(count for _, count in by_value)
+  if not total_count:
+    raise ValueError("Can't compute percentiles of empty histogram.")
+  ranks = [_GetRanks(total_count, percentile, interpolation)
+           for percentile in percentiles]
+  all_ranks = [rank for lower, upper, _ in ranks for rank in (lower, upper)]
+
+  # The sample with rank r is the first value whose cumulative count exceeds r.
+  if numpy is not None:
+    values = numpy.array([value for value, _ in by_value])
+    counts = numpy.array([count for _, count in by_value])
+    cumulative_counts = numpy.cumsum(counts)
+    indices = numpy.searchsorted(cumulative_counts, all_ranks, side='right')
+    values_at_ranks = [_ToPython(v) for v in values[indices]]
+    average = float(numpy.dot(values, counts)) / total_count
+    total_of_squares = float(numpy.dot((values - average) ** 2, counts))
+  else:
+    cumulative_counts = []
+    running_count = 0
+    for _, count in by_value:
+      running_count += count
+      cumulative_counts.append(running_count)
+    values_at_ranks = [by_value[bisect.bisect_right(cumulative_counts, rank)][0]
+                       for rank in all_ranks]
+    average = float(sum(value * count for value, count in by_value)) / (
+        total_count)
+    total_of_squares = sum((value - average) ** 2 * count
+                           for value, count in by_value)
+
+  result = {}
+  for i, (percentile, (_, _, weight)) in enumerate(zip(percentiles, ranks)):
+    result['p%s' % str(percentile)] = _Interpolate(
+        values_at_ranks[2 * i], values_at_ranks[2 * i + 1], weight)
+  result['average'] = average
+  if total_count > 1:
+    result['stddev'] = (total_of_squares / (total_count - 1)) ** 0.5
+  else:
+    result['stddev'] = 0
+  return result
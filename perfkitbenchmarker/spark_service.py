@@ -180,6 +180,9 @@ class PkbSparkService(BaseSparkService):
     assert self.cluster_id is None
     self.vms = {}
 
+  def GetResourceDependencies(self):
+    return [vm for group_vms in self.vms.itervalues() for vm in group_vms]
+
   def _Create(self):
     """Create an Apache Spark cluster."""
 
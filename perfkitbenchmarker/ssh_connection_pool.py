@@ -0,0 +1,363 @@
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Pools of multiplexed SSH connections to VMs.
+
+Without pooling, every RemoteHostCommand and RemoteHostCopy starts a fresh ssh
+or scp process which performs its own TCP handshake and key exchange. When
+--ssh_connection_pooling is enabled, each Linux VM owns an SshConnectionPool
+holding a small number of OpenSSH ControlMaster connections, and commands are
+multiplexed over them.
+
+Masters are established lazily by the first command that is assigned to a pool
+slot (ControlMaster=auto with ControlPersist), so no extra processes are
+spawned. When a command fails with ssh's 255 exit code, the master it used is
+retired with "ssh -O stop", which lets in-flight sessions finish but stops new
+sessions from using it. The next command assigned to that slot establishes a
+new master.
+"""
+
+import contextlib
+import hashlib
+import logging
+import os
+import threading
+
+from perfkitbenchmarker import command_tasks
+from perfkitbenchmarker import flags
+from perfkitbenchmarker import sample
+from perfkitbenchmarker import vm_util
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_boolean('ssh_connection_pooling', False,
+                     'Whether to multiplex SSH commands and copies to each VM '
+                     'over a pool of persistent OpenSSH ControlMaster '
+                     'connections instead of opening a new connection for '
+                     'every command.')
+flags.DEFINE_integer('ssh_connections_per_vm', 2,
+                     'The maximum number of master connections pooled per VM '
+                     'when --ssh_connection_pooling is enabled. Commands '
+                     'issued while every master is busy use a dedicated '
+                     'connection.', lower_bound=1)
+flags.DEFINE_integer('ssh_sessions_per_connection', 8,
+                     'The maximum number of concurrent sessions multiplexed '
+                     'over a single pooled master connection. OpenSSH servers '
+                     'refuse more than 10 by default (see MaxSessions in '
+                     'sshd_config).', lower_bound=1)
+flags.DEFINE_integer('ssh_control_persist', 600,
+                     'The number of seconds an idle pooled master connection '
+                     'is kept open.', lower_bound=1)
+
+# Unix domain socket paths are limited to 104 bytes on some platforms, and ssh
+# appends a 17 character suffix to the path while binding the control socket.
+_MAX_CONTROL_PATH_LENGTH = 80
+
+_CONTROL_DIR = 'ssh'
+
+
+def PoolingEnabled():
+  """Returns whether SSH commands should be multiplexed over pooled masters."""
+  return FLAGS.ssh_connection_pooling and not vm_util.RunningOnWindows()
+
+
+class _Lease(object):
+  """Options for a single ssh or scp invocation.
+
+  Attributes:
+    options: list of strings. Options to add to the ssh or scp command line.
+    failed: bool. Whether the command reported a failure of its connection.
+  """
+
+  def __init__(self, options):
+    self.options = options
+    self.failed = False
+
+  def MarkFailed(self):
+    """Records that ssh failed (i.e. exited with 255) using this lease."""
+    self.failed = True
+
+
+@contextlib.contextmanager
+def DirectConnection():
+  """Yields a lease for a command that opens its own connection."""
+  yield _Lease([])
+
+
+class _Slot(object):
+  """A single master connection in a pool.
+
+  Attributes:
+    index: int. Position of the slot in the pool.
+    generation: int. Incremented every time the master is retired, so that a
+        new master never reuses the control socket of a retired one.
+    sessions: int. Number of commands currently using the master.
+    established: bool. Whether a command has set up the master.
+    establishing: bool. Whether the command setting up the master is still
+        running. No other command is assigned to the slot until it finishes.
+  """
+
+  def __init__(self, index):
+    self.index = index
+    self.generation = 0
+    self.sessions = 0
+    self.established = False
+    self.establishing = False
+
+
+class SshConnectionPool(object):
+  """Pool of multiplexed SSH master connections to a single host.
+
+  Attributes:
+    user_name: string. User that SSH connections log in as.
+    ip_address: string. Address of the host.
+    port: int. SSH port of the host.
+    new_connections: int. Number of masters that have been established.
+    reused_connections: int. Number of commands multiplexed over an already
+        established master.
+    retired_connections: int. Number of masters retired after an ssh failure
+        or a failed health check.
+    unpooled_connections: int. Number of commands that opened a dedicated
+        connection because every slot was busy.
+  """
+
+  def __init__(self, user_name, ip_address, port, max_connections=None,
+               max_sessions=None):
+    self.user_name = user_name
+    self.ip_address = ip_address
+    self.port = port
+    self._max_connections = max_connections or FLAGS.ssh_connections_per_vm
+    self._max_sessions = max_sessions or FLAGS.ssh_sessions_per_connection
+    self._key = hashlib.sha1(
+        '%s@%s:%s' % (user_name, ip_address, port)).hexdigest()[:12]
+    self._lock = threading.Lock()
+    self._slots = []
+    self.new_connections = 0
+    self.reused_connections = 0
+    self.retired_connections = 0
+    self.unpooled_connections = 0
+
+  @property
+  def user_host(self):
+    return '%s@%s' % (self.user_name, self.ip_address)
+
+  def _GetControlPath(self, slot):
+    return os.path.join(vm_util.GetTempDir(), _CONTROL_DIR, '%s-%d-%d' % (
+        self._key, slot.index, slot.generation))
+
+  def _GetOptions(self, slot):
+    return ['-o', 'ControlMaster=auto',
+            '-o', 'ControlPath=%s' % self._GetControlPath(slot),
+            '-o', 'ControlPersist=%d' % FLAGS.ssh_control_persist]
+
+  def _AcquireSlot(self):
+    """Assigns a command to a slot.
+
+    Returns:
+      The _Slot the command should use, or None if it should open a dedicated
+      connection.
+    """
+    with self._lock:
+      candidates = [s for s in self._slots
+                    if not s.establishing and s.sessions < self._max_sessions]
+      # Prefer multiplexing over an existing master to establishing a new one.
+      established = [s for s in candidates if s.established]
+      if established:
+        slot = min(established, key=lambda s: s.sessions)
+        if os.path.exists(self._GetControlPath(slot)):
+          slot.sessions += 1
+          self.reused_connections += 1
+          return slot
+        # The master exited (e.g. ControlPersist expired); set it up again.
+        slot.established = False
+      idle = [s for s in candidates if not s.established]
+      if idle:
+        slot = idle[0]
+      elif len(self._slots) < self._max_connections:
+        slot = _Slot(len(self._slots))
+        self._slots.append(slot)
+      else:
+        self.unpooled_connections += 1
+        return None
+      slot.establishing = True
+      slot.sessions += 1
+      self.new_connections += 1
+      return slot
+
+  def _RetireSlot(self, slot):
+    """Stops new sessions from using the slot's current master.
+
+    Must be called with self._lock held.
+
+    Returns:
+      The control path of the retired master.
+    """
+    control_path = self._GetControlPath(slot)
+    slot.generation += 1
+    slot.established = False
+    self.retired_connections += 1
+    return control_path
+
+  def _StopMaster(self, control_path, operation='stop'):
+    """Sends a control command to a master and removes its socket."""
+    vm_util.IssueCommand(
+        ['ssh', '-O', operation, '-o', 'ControlPath=%s' % control_path,
+         '-p', str(self.port), self.user_host], suppress_warning=True)
+    try:
+      os.remove(control_path)
+    except OSError:
+      pass
+
+  @contextlib.contextmanager
+  def Connection(self):
+    """Leases a pooled connection for a single ssh or scp invocation.
+
+    Yields:
+      _Lease whose options should be added to the command line. If the command
+      exits with 255, the caller should call MarkFailed on the lease.
+    """
+    slot = self._AcquireSlot()
+    if slot is None:
+      lease = _Lease(['-o', 'ControlPath=none'])
+    else:
+      _CreateControlDir()
+      lease = _Lease(self._GetOptions(slot))
+    try:
+      yield lease
+    finally:
+      if slot is not None:
+        self._ReleaseSlot(slot, lease.failed)
+
+  def _ReleaseSlot(self, slot, failed):
+    retired_path = None
+    with self._lock:
+      slot.sessions -= 1
+      if slot.establishing:
+        slot.establishing = False
+        slot.established = not failed
+        if failed:
+          slot.generation += 1
+      elif failed and slot.established:
+        retired_path = self._RetireSlot(slot)
+    if retired_path:
+      logging.info('Retiring SSH master connection %s to %s after an SSH '
+                   'failure.', retired_path, self.user_host)
+      self._StopMaster(retired_path)
+
+  def CheckHealth(self):
+    """Checks every idle master and retires the ones that are not running.
+
+    Returns:
+      int. The number of healthy masters.
+    """
+    return command_tasks.RunSync(self.CheckHealthTask())
+
+  def CheckHealthTask(self):
+    """Task version of CheckHealth (see command_tasks)."""
+    with self._lock:
+      idle = [(slot, self._GetControlPath(slot)) for slot in self._slots
+              if slot.established and not slot.sessions]
+    healthy = 0
+    for slot, control_path in idle:
+      _, _, retcode = yield command_tasks.Command(
+          ['ssh', '-O', 'check', '-o', 'ControlPath=%s' % control_path,
+           '-p', str(self.port), self.user_host], suppress_warning=True)
+      if not retcode:
+        healthy += 1
+        continue
+      with self._lock:
+        if self._GetControlPath(slot) != control_path or slot.sessions:
+          continue
+        self._RetireSlot(slot)
+      logging.info('SSH master connection %s to %s failed its health check.',
+                   control_path, self.user_host)
+      try:
+        os.remove(control_path)
+      except OSError:
+        pass
+    raise command_tasks.Return(healthy)
+
+  def Close(self):
+    """Closes all masters in the pool."""
+    with self._lock:
+      control_paths = [self._GetControlPath(slot) for slot in self._slots
+                       if slot.established]
+      self._slots = []
+    for control_path in control_paths:
+      if os.path.exists(control_path):
+        self._StopMaster(control_path, operation='exit')
+
+  def GetCounters(self):
+    """Returns a dict mapping counter name to value."""
+    return {'new': self.new_connections,
+            'reused': self.reused_connections,
+            'retired': self.retired_connections,
+            'unpooled': self.unpooled_connections}
+
+
+def _CreateControlDir():
+  path = os.path.join(vm_util.GetTempDir(), _CONTROL_DIR)
+  try:
+    os.makedirs(path)
+  except OSError:
+    if not os.path.isdir(path):
+      raise
+
+
+def CreatePool(user_name, ip_address, port):
+  """Creates an SshConnectionPool if pooling is enabled and possible.
+
+  Returns:
+    An SshConnectionPool, or None if commands should open their own
+    connections.
+  """
+  if not PoolingEnabled():
+    return None
+  pool = SshConnectionPool(user_name, ip_address, port)
+  longest_path = pool._GetControlPath(_Slot(FLAGS.ssh_connections_per_vm))
+  if len(longest_path) > _MAX_CONTROL_PATH_LENGTH:
+    logging.warning('Not pooling SSH connections to %s because the control '
+                    'socket path %s is too long. Use a shorter --temp_dir.',
+                    pool.user_host, longest_path)
+    return None
+  return pool
+
+
+def GetPools(vms):
+  """Returns the SshConnectionPools of the VMs that have one."""
+  return [vm.ssh_connection_pool for vm in vms
+          if getattr(vm, 'ssh_connection_pool', None)]
+
+
+def GenerateSamples(vms):
+  """Generates samples summarizing connection reuse across the VMs.
+
+  Args:
+    vms: list of BaseVirtualMachines.
+
+  Returns:
+    A list of Samples, or an empty list if no VM pooled its connections.
+  """
+  pools = GetPools(vms)
+  if not pools:
+    return []
+  totals = {}
+  for pool in pools:
+    for name, value in pool.GetCounters().iteritems():
+      totals[name] = totals.get(name, 0) + value
+  metadata = {'ssh_connections_per_vm': FLAGS.ssh_connections_per_vm,
+              'ssh_sessions_per_connection': FLAGS.ssh_sessions_per_connection,
+              'num_vms': len(pools)}
+  return [sample.Sample('SSH Connections %s' % name.title(), totals[name],
+                        'connections', metadata)
+          for name in ('new', 'reused', 'retired', 'unpooled')]
@@ -0,0 +1,181 @@
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Batched polling of the status of many cloud resources.
+
+Resources check whether they exist or are ready by polling in a vm_util.Retry
+loop. If each resource issues its own describe command, provisioning N VMs
+runs N CLI processes per poll interval, which is limited by the cloud API quota
+and by the CPU cost of starting the CLIs.
+
+A StatusPoller answers those polls with one list command per scope (e.g. a
+zone, region or Kubernetes namespace). A caller of GetStatus waits for the
+next listing of its scope, so the status it gets is never older than the call.
+All callers that are waiting when a listing starts share its result. The keys
+they are waiting for are passed to the list function, so providers can filter
+the listing on them.
+
+Listings of a scope are started at most once per interval. The interval starts
+at min_interval and doubles, up to max_interval, after each listing that does
+not change any status or that fails, so that resources that take a long time
+to become ready don't use up the API quota. It is reset whenever a status
+changes or new keys are requested.
+"""
+
+import logging
+import threading
+import time
+
+DEFAULT_MIN_INTERVAL = 1
+DEFAULT_MAX_INTERVAL = 16
+
+
+class _Scope(object):
+  """The polling state of one scope.
+
+  Attributes:
+    condition: threading.Condition protecting the other attributes.
+    started: int. The number of listings started.
+    completed: int. The number of listings completed.
+    listing: bool. Whether a caller is running a listing.
+    pending_keys: set of keys requested since the last listing started.
+    keys: frozenset of the keys passed to the last listing.
+    statuses: dict mapping keys to statuses returned by the last listing.
+    error: Exception raised by the last listing, or None.
+    last_start: float. Time when the last listing started.
+    interval: float. Minimum seconds between the starts of listings.
+  """
+
+  def __init__(self, interval):
+    self.condition = threading.Condition()
+    self.started = 0
+    self.completed = 0
+    self.listing = False
+    self.pending_keys = set()
+    self.keys = frozenset()
+    self.statuses = {}
+    self.error = None
+    self.last_start = None
+    self.interval = interval
+
+
+class StatusPoller(object):
+  """Polls the status of resources with one list command per scope.
+
+  Attributes:
+    list_count: int. Number of listings issued.
+  """
+
+  def __init__(self, list_function, min_interval=DEFAULT_MIN_INTERVAL,
+               max_interval=DEFAULT_MAX_INTERVAL):
+    """Initializes the StatusPoller.
+
+    Args:
+      list_function: function taking a scope and a frozenset of keys, and
+          returning a dict mapping the keys of existing resources in the scope
+          to their statuses. Statuses may be any value that can be compared
+          for equality, e.g. the parsed JSON description of the resource. Keys
+          missing from the dict are reported as not existing.
+      min_interval: float. Minimum seconds between listings of a scope.
+      max_interval: float. Maximum seconds between listings of a scope while
+          callers are waiting.
+    """
+    self._list_function = list_function
+    self._min_interval = min_interval
+    self._max_interval = max_interval
+    self._lock = threading.Lock()
+    self._scopes = {}
+    self.list_count = 0
+
+  def Reset(self):
+    """Forgets the state of all scopes."""
+    with self._lock:
+      self._scopes.clear()
+
+  def _GetScope(self, scope):
+    with self._lock:
+      if scope not in self._scopes:
+        self._scopes[scope] = _Scope(self._min_interval)
+      return self._scopes[scope]
+
+  def GetStatus(self, scope, key):
+    """Returns the status of a resource from the next listing of its scope.
+
+    Args:
+      scope: hashable. The scope passed to the list function.
+      key: hashable. Identifies the resource in the listing.
+
+    Returns:
+      The status of the resource, or None if it doesn't exist.
+
+    Raises:
+      Exception: Whatever the list function raised.
+    """
+    state = self._GetScope(scope)
+    with state.condition:
+      state.pending_keys.add(key)
+      target = state.started + 1
+      while state.completed < target:
+        if state.listing:
+          state.condition.wait()
+          continue
+        state.listing = True
+        state.condition.release()
+        try:
+          self._List(scope, state)
+        finally:
+          state.condition.acquire()
+          state.listing = False
+          state.condition.notify_all()
+      if state.error is not None:
+        raise state.error
+      return state.statuses.get(key)
+
+  def _List(self, scope, state):
+    """Runs the next listing of a scope once its interval has passed.
+
+    Must be called without holding state.condition, by the only caller that
+    is listing the scope.
+    """
+    with state.condition:
+      last_start, interval = state.last_start, state.interval
+    if last_start is not None:
+      delay = last_start + interval - time.time()
+      if delay > 0:
+        time.sleep(delay)
+
+    with state.condition:
+      keys = frozenset(state.pending_keys)
+      state.pending_keys.clear()
+      state.started += 1
+      state.last_start = time.time()
+    with self._lock:
+      self.list_count += 1
+
+    statuses = error = None
+    try:
+      statuses = self._list_function(scope, keys)
+    except Exception as e:
+      logging.info('Listing %s failed: %s', scope, e)
+      error = e
+
+    with state.condition:
+      if error is None and (statuses != state.statuses or
+                            not keys <= state.keys):
+        state.interval = self._min_interval
+      else:
+        state.interval = min(state.interval * 2, self._max_interval)
+      state.keys = keys
+      state.statuses = statuses or {}
+      state.error = error
+      state.completed += 1
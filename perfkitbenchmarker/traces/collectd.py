@@ -43,7 +43,9 @@ class _CollectdCollector(object):
     # On the remote host, CSV files are in:
     # self.csv_dir/<fqdn>/<category>.
     # Since AWS VMs have a FQDN different from the VM name, we rename locally.
-    vm.PullFile(local_dir, posixpath.join(collectd.CSV_DIR, '*', ''))
+    vm.PullFiles(local_dir, ['.'],
+                 remote_dir=posixpath.join(collectd.CSV_DIR, '*'),
+                 compress=True)
 
   def Before(self, unused_sender, benchmark_spec):
     """Install collectd.
@@ -26,6 +26,7 @@ import time
 import threading
 import uuid
 
+from perfkitbenchmarker import command_tasks
 from perfkitbenchmarker import events
 from perfkitbenchmarker import flags
 from perfkitbenchmarker import sample
@@ -73,13 +74,18 @@ class _DStatCollector(object):
       raise IOError('dstat output directory does not exist: {0}'.format(
           self.output_directory))
 
-  def _StartOnVm(self, vm, suffix='-dstat'):
+  def _InstallOnVm(self, vm):
     vm.Install('dstat')
+    # Reading the CPU count may run a remote command, so do it before dstat is
+    # started by multiplexed tasks that should not block.
+    return vm.num_cpus
 
+  def _StartOnVm(self, vm, suffix='-dstat'):
+    """Task that starts dstat on 'vm' (see command_tasks)."""
     num_cpus = vm.num_cpus
 
     # List block devices so that I/O to each block device can be recorded.
-    block_devices, _ = vm.RemoteCommand(
+    block_devices, _ = yield vm.RemoteCommandTask(
         'lsblk --nodeps --output NAME --noheadings')
     block_devices = block_devices.splitlines()
     dstat_file = posixpath.join(
@@ -94,13 +100,13 @@ class _DStatCollector(object):
                block_devices=','.join(block_devices),
                output=dstat_file,
                dstat_interval=self.interval or '')
-    stdout, _ = vm.RemoteCommand(cmd)
+    stdout, _ = yield vm.RemoteCommandTask(cmd)
     with self._lock:
       self._pids[vm.name] = stdout.strip()
       self._file_names[vm.name] = dstat_file
 
   def _StopOnVm(self, vm, vm_role):
-    """Stop dstat on 'vm', copy the results to the run temporary directory."""
+    """Task that stops dstat on 'vm' and fetches its results."""
     if vm.name not in self._pids:
       logging.warn('No dstat PID for %s', vm.name)
       return
@@ -109,9 +115,9 @@ class _DStatCollector(object):
         pid = self._pids.pop(vm.name)
         file_name = self._file_names.pop(vm.name)
     cmd = 'kill {0} || true'.format(pid)
-    vm.RemoteCommand(cmd)
+    yield vm.RemoteCommandTask(cmd)
     try:
-      vm.PullFile(self.output_directory, file_name)
+      yield vm.RemoteCopyTask(self.output_directory, file_name, copy_to=False)
       self._role_mapping[vm_role] = file_name
     except Exception:
       logging.exception('Failed fetching dstat result from %s.', vm.name)
@@ -120,8 +126,9 @@ class _DStatCollector(object):
     """Install and start dstat on all VMs in 'benchmark_spec'."""
     suffix = '-{0}-{1}-dstat'.format(benchmark_spec.uid,
                                      str(uuid.uuid4())[:8])
+    vm_util.RunThreaded(self._InstallOnVm, benchmark_spec.vms)
     start_on_vm = functools.partial(self._StartOnVm, suffix=suffix)
-    vm_util.RunThreaded(start_on_vm, benchmark_spec.vms)
+    command_tasks.RunMultiplexed(start_on_vm, benchmark_spec.vms)
     self._start_time = time.time()
 
   def Stop(self, sender, benchmark_spec):
@@ -134,7 +141,7 @@ class _DStatCollector(object):
     for role, vms in benchmark_spec.vm_groups.iteritems():
       args.extend([((
           vm, '%s_%s' % (role, idx)), {}) for idx, vm in enumerate(vms)])
-    vm_util.RunThreaded(self._StopOnVm, args)
+    command_tasks.RunMultiplexed(self._StopOnVm, args)
 
   def Analyze(self, sender, benchmark_spec, samples):
     """Analyze dstat file and record samples."""
@@ -19,12 +19,16 @@ operate on the VM: boot, shutdown, etc.
 """
 
 import abc
+import collections
 import os.path
+import posixpath
 import threading
 
 import jinja2
 
+from perfkitbenchmarker import artifact_cache
 from perfkitbenchmarker import background_workload
+from perfkitbenchmarker import command_tasks
 from perfkitbenchmarker import data
 from perfkitbenchmarker import disk
 from perfkitbenchmarker import errors
@@ -249,6 +253,9 @@ class BaseVirtualMachine(resource.BaseResource):
       return self.ip_address
     return super(BaseVirtualMachine, self).__str__()
 
+  def GetResourceDependencies(self):
+    return [self.network] if self.network else []
+
   def CreateScratchDisk(self, disk_spec):
     """Create a VM's scratch disk.
 
@@ -263,6 +270,35 @@ class BaseVirtualMachine(resource.BaseResource):
       if scratch_disk.disk_type != disk.LOCAL:
         scratch_disk.Delete()
 
+  def CreateImage(self, image_name):
+    """Creates an image of the VM's boot disk.
+
+    Args:
+      image_name: string. Name of the image.
+
+    Returns:
+      The image, which can be passed to UseImage.
+
+    Raises:
+      NotImplementedError: If the provider doesn't support creating images.
+    """
+    raise NotImplementedError()
+
+  def DeleteImage(self, image):
+    """Deletes an image created by CreateImage.
+
+    Raises:
+      NotImplementedError: If the provider doesn't support creating images.
+    """
+    raise NotImplementedError()
+
+  def UseImage(self, image):
+    """Boots the VM from an image created by CreateImage.
+
+    Must be called before the VM is created.
+    """
+    self.image = image
+
   def GetScratchDir(self, disk_num=0):
     """Gets the path to the scratch directory.
 
@@ -325,6 +361,9 @@ class BaseOsMixin(object):
   Attributes:
     bootable_time: The time when the VM finished booting.
     hostname: The VM's hostname.
+    package_install_times: OrderedDict mapping the names of the PerfKit
+        packages installed on the VM to the seconds it took to install them,
+        including their dependencies.
     remote_access_ports: A list of ports which must be opened on the firewall
         in order to access the VM.
   """
@@ -335,6 +374,7 @@ class BaseOsMixin(object):
   def __init__(self):
     super(BaseOsMixin, self).__init__()
     self._installed_packages = set()
+    self.package_install_times = collections.OrderedDict()
 
     self.bootable_time = None
     self.hostname = None
@@ -374,6 +414,15 @@ class BaseOsMixin(object):
     """
     raise NotImplementedError()
 
+  def RemoteCommandTask(self, *args, **kwargs):
+    """Returns a task that runs RemoteCommand (see command_tasks).
+
+    Accepts the same arguments as RemoteCommand. This implementation calls
+    RemoteCommand directly, blocking any other multiplexed tasks until it
+    returns, so OS mixins that run commands locally should override it.
+    """
+    return command_tasks.BlockingTask(self.RemoteCommand, *args, **kwargs)
+
   def TryRemoteCommand(self, command, **kwargs):
     """Runs a remote command and returns True iff it succeeded."""
     try:
@@ -444,6 +493,15 @@ class BaseOsMixin(object):
     """Perform OS specific setup on any local disks that exist."""
     pass
 
+  def RemoteCopyTask(self, *args, **kwargs):
+    """Returns a task that runs RemoteCopy (see command_tasks).
+
+    Accepts the same arguments as RemoteCopy. This implementation calls
+    RemoteCopy directly, blocking any other multiplexed tasks until it returns,
+    so OS mixins that copy files with local commands should override it.
+    """
+    return command_tasks.BlockingTask(self.RemoteCopy, *args, **kwargs)
+
   def PushFile(self, source_path, remote_path=''):
     """Copies a file or a directory to the VM.
 
@@ -465,6 +523,40 @@ class BaseOsMixin(object):
     """
     self.RemoteCopy(local_path, remote_path, copy_to=False)
 
+  def PushFiles(self, files, compress=False):
+    """Copies many files or directories to the VM.
+
+    This implementation copies them one at a time with RemoteCopy. OS mixins
+    that can copy them in a single stream should override it.
+
+    Args:
+      files: list of (local path, remote path) tuples. A remote path that is
+          empty or ends with '/' is a directory to copy the file into.
+          Relative remote paths are relative to the home directory.
+      compress: bool. Whether to compress the files while copying them.
+    """
+    for local_path, remote_path in files:
+      self.RemoteCopy(local_path, remote_path)
+
+  def PullFiles(self, local_dir, remote_paths, remote_dir='.',
+                compress=False):
+    """Copies many files or directories from the VM to a local directory.
+
+    This implementation copies them one at a time with RemoteCopy. OS mixins
+    that can copy them in a single stream should override it.
+
+    Args:
+      local_dir: string. The local directory to copy the files to.
+      remote_paths: list of strings. Paths or globs of the files, relative to
+          remote_dir. Files keep these relative paths in local_dir.
+      remote_dir: string. The directory on the VM that remote_paths are
+          relative to.
+      compress: bool. Whether to compress the files while copying them.
+    """
+    for remote_path in remote_paths:
+      self.RemoteCopy(local_dir, posixpath.join(remote_dir, remote_path),
+                      copy_to=False)
+
   def PushDataFile(self, data_file, remote_path=''):
     """Upload a file in perfkitbenchmarker.data directory to the VM.
 
@@ -476,7 +568,7 @@ class BaseOsMixin(object):
       perfkitbenchmarker.data.ResourceNotFound: if 'data_file' does not exist.
     """
     file_path = data.ResourcePath(data_file)
-    self.PushFile(file_path, remote_path)
+    artifact_cache.PushFile(self, file_path, remote_path)
 
   def RenderTemplate(self, template_path, remote_path, context):
     """Renders a local Jinja2 template and copies it to the remote host.
@@ -15,11 +15,13 @@
 """Set of utility functions for working with virtual machines."""
 
 import contextlib
+import errno
 import functools32
 import logging
 import os
 import random
 import re
+import select
 import string
 import subprocess
 import tempfile
@@ -29,9 +31,11 @@ import time
 import jinja2
 
 from perfkitbenchmarker import background_tasks
+from perfkitbenchmarker import context
 from perfkitbenchmarker import data
 from perfkitbenchmarker import errors
 from perfkitbenchmarker import flags
+from perfkitbenchmarker import retry_policy
 from perfkitbenchmarker import temp_dir
 
 FLAGS = flags.FLAGS
@@ -54,6 +58,16 @@ TIMEOUT = 1200
 FUZZ = .5
 MAX_RETRIES = -1
 
+# Substrings of the error output of cloud CLIs when a request was throttled.
+THROTTLING_ERROR_PATTERNS = ('RequestLimitExceeded', 'Throttling',
+                             'TooManyRequests', 'rateLimitExceeded',
+                             'RATE_LIMIT_EXCEEDED', 'Rate Limit Exceeded')
+# Throttled requests are retried with exponential backoff, whatever
+# --retry_backoff is.
+THROTTLING_RETRY_POLICY = retry_policy.RetryPolicy(
+    poll_interval=5, fuzz=1, backoff=retry_policy.EXPONENTIAL,
+    max_interval=120)
+
 WINDOWS = 'nt'
 PASSWORD_LENGTH = 15
 
@@ -61,6 +75,14 @@ OUTPUT_STDOUT = 0
 OUTPUT_STDERR = 1
 OUTPUT_EXIT_CODE = 2
 
+# Maximum number of bytes read from a command's stdout or stderr at once.
+_READ_SIZE = 65536
+# Maximum time in seconds to wait for output before checking whether the
+# command has exited. Output pipes can be held open by the command's own
+# background children, so EOF alone does not indicate that it has finished.
+_EXIT_CHECK_INTERVAL = 1.0
+_MIN_EXIT_CHECK_INTERVAL = 0.001
+
 flags.DEFINE_integer('default_timeout', TIMEOUT, 'The default timeout for '
                      'retryable commands in seconds.')
 flags.DEFINE_integer('burn_cpu_seconds', 0,
@@ -195,14 +217,25 @@ RunParallelThreads = background_tasks.RunParallelThreads
 RunThreaded = background_tasks.RunThreaded
 
 
+def _GetRetriedFunctionName(f, args):
+  """Returns the name of a function wrapped by Retry, for its statistics."""
+  if args and getattr(type(args[0]), f.__name__, None) is not None:
+    return '%s.%s' % (type(args[0]).__name__, f.__name__)
+  return '%s.%s' % (f.__module__.rsplit('.', 1)[-1], f.__name__)
+
+
 def Retry(poll_interval=POLL_INTERVAL, max_retries=MAX_RETRIES,
           timeout=None, fuzz=FUZZ, log_errors=True,
-          retryable_exceptions=None):
+          retryable_exceptions=None, policies=(), budget=None):
   """A function decorator that will retry when exceptions are thrown.
 
+  Tries are counted in the RetryStats of the current thread's benchmark spec,
+  which are published as samples.
+
   Args:
     poll_interval: The time between tries in seconds. This is the maximum poll
-        interval when fuzz is specified.
+        interval when fuzz is specified. With --retry_backoff=exponential, it
+        is the base of the backoff.
     max_retries: The maximum number of retries before giving up. If -1, this
         means continue until the timeout is reached. The function will stop
         retrying when either max_retries is met or timeout is reached.
@@ -217,6 +250,14 @@ def Retry(poll_interval=POLL_INTERVAL, max_retries=MAX_RETRIES,
     retryable_exceptions: A tuple of exceptions that should be retried. By
         default, this is None, which indicates that all exceptions should
         be retried.
+    policies: A sequence of (exception class, retry_policy.RetryPolicy)
+        pairs. A retryable exception is retried according to the policy of
+        the first class it is an instance of. Other retryable exceptions are
+        retried according to poll_interval and fuzz.
+    budget: The name of the provider whose retry_policy.RetryBudget admits
+        the retries, or a function taking the arguments of the wrapped
+        function and returning that name. None means retries are not
+        limited by a budget.
 
   Returns:
     A function that wraps functions in retry logic. It can be
@@ -224,6 +265,7 @@ def Retry(poll_interval=POLL_INTERVAL, max_retries=MAX_RETRIES,
   """
   if retryable_exceptions is None:
     retryable_exceptions = Exception
+  default_policy = retry_policy.RetryPolicy(poll_interval, fuzz)
 
   def Wrap(f):
     """Wraps the supplied function with retry logic."""
@@ -237,26 +279,326 @@ def Retry(poll_interval=POLL_INTERVAL, max_retries=MAX_RETRIES,
         deadline = float('inf')
 
       tries = 0
+      sleep_time = 0.0
+      budget_wait_time = 0.0
+      previous_sleep_times = {}
+      retry_budget = None
+
+      def RecordStats(gave_up):
+        stats = getattr(context.GetThreadBenchmarkSpec(), 'retry_stats', None)
+        if stats is not None:
+          stats.Record(_GetRetriedFunctionName(f, args), tries, sleep_time,
+                       budget_wait_time, gave_up)
+
       while True:
         try:
           tries += 1
-          return f(*args, **kwargs)
+          result = f(*args, **kwargs)
         except retryable_exceptions as e:
-          fuzz_multiplier = 1 - fuzz + random.random() * fuzz
-          sleep_time = poll_interval * fuzz_multiplier
-          if ((time.time() + sleep_time) >= deadline or
+          policy = next((p for exception_class, p in policies
+                         if isinstance(e, exception_class)), default_policy)
+          next_sleep_time = policy.GetSleepTime(
+              previous_sleep_times.get(policy))
+          previous_sleep_times[policy] = next_sleep_time
+          if ((time.time() + next_sleep_time) >= deadline or
               (max_retries >= 0 and tries > max_retries)):
+            RecordStats(gave_up=True)
             raise e
           else:
             if log_errors:
               logging.error('Got exception running %s: %s', f.__name__, e)
-            time.sleep(sleep_time)
+            time.sleep(next_sleep_time)
+            sleep_time += next_sleep_time
+            if tries == 1:
+              retry_budget = retry_policy.GetBudget(
+                  budget(*args, **kwargs) if callable(budget) else budget)
+            if retry_budget is not None:
+              budget_wait_time += retry_budget.Acquire()
+        else:
+          RecordStats(gave_up=False)
+          return result
     return WrappedFunction
   return Wrap
 
 
+class _LineBuffer(object):
+  """Splits chunks of a command's output into complete lines."""
+
+  def __init__(self):
+    self._partial = ''
+
+  def Feed(self, chunk):
+    """Returns the lines completed by chunk, without their line endings."""
+    data = self._partial + chunk
+    end = data.rfind('\n') + 1
+    self._partial = data[end:]
+    return data[:end].splitlines()
+
+  def Flush(self):
+    """Returns any trailing output that was not terminated by a newline."""
+    lines = [self._partial] if self._partial else []
+    self._partial = ''
+    return lines
+
+
+def _Decode(output):
+  return output.decode('ascii', 'ignore')
+
+
+def _WaitForFds(read_fds, write_fds, timeout):
+  """Waits until any of the file descriptors is ready.
+
+  Uses poll where it is available, since select cannot wait on file
+  descriptors numbered above FD_SETSIZE.
+
+  Args:
+    read_fds: list of file descriptors to wait on for reading.
+    write_fds: list of file descriptors to wait on for writing.
+    timeout: float. Maximum number of seconds to wait.
+
+  Returns:
+    A (readable, writable) tuple of lists of ready file descriptors. A file
+    descriptor is also considered ready if it is at EOF or closed by the other
+    end, so that the following read or write does not block.
+  """
+  while True:
+    try:
+      if hasattr(select, 'poll'):
+        poller = select.poll()
+        for fd in read_fds:
+          poller.register(fd, select.POLLIN | select.POLLPRI)
+        for fd in write_fds:
+          poller.register(fd, select.POLLOUT)
+        events = poller.poll(timeout * 1000)
+        ready = set(fd for fd, _ in events)
+        return ([fd for fd in read_fds if fd in ready],
+                [fd for fd in write_fds if fd in ready])
+      readable, writable, _ = select.select(read_fds, write_fds, [], timeout)
+      return readable, writable
+    except (select.error, IOError, OSError) as e:
+      if e.args[0] != errno.EINTR:
+        raise
+
+
+class _ProcessIo(object):
+  """Writes a running command's input and reads its output without blocking.
+
+  Every call to Update handles the file descriptors that _WaitForFds reported
+  as ready, so a single thread can service many commands by waiting on all of
+  their file descriptors at once.
+
+  Attributes:
+    process: subprocess.Popen object whose stdin, stdout, and stderr are pipes.
+    read_fds: dict mapping each output file descriptor that is still open to
+        OUTPUT_STDOUT or OUTPUT_STDERR.
+    write_fds: list containing the stdin file descriptor while there is input
+        left to write.
+  """
+
+  def __init__(self, process, full_cmd, timeout, input=None):
+    """Initializes the _ProcessIo.
+
+    Args:
+      process: subprocess.Popen object whose stdin, stdout, and stderr are
+          pipes.
+      full_cmd: string. The command line, used when logging a timeout.
+      timeout: Timeout for the command in seconds, or None. If the command has
+          not finished before the timeout is reached, it is killed.
+      input: string or None. Data written to the command's stdin. If provided,
+          stdin is closed once it has been written.
+    """
+    self.process = process
+    self._full_cmd = full_cmd
+    self._timeout = timeout
+    self._deadline = None if timeout is None else time.time() + timeout
+    self.read_fds = {process.stdout.fileno(): OUTPUT_STDOUT,
+                     process.stderr.fileno(): OUTPUT_STDERR}
+    self._pending_input = input or ''
+    self.write_fds = [process.stdin.fileno()] if input is not None else []
+    if input is not None and not self._pending_input:
+      process.stdin.close()
+      self.write_fds = []
+    self._exited = False
+    self._exit_check_delay = _MIN_EXIT_CHECK_INTERVAL
+
+  def GetWaitTime(self):
+    """Returns how many seconds to wait at most before calling Update."""
+    if self._exited:
+      return 0
+    if self.read_fds:
+      wait_time = _EXIT_CHECK_INTERVAL
+    else:
+      # The command closed its output pipes, so it should exit shortly.
+      wait_time = self._exit_check_delay
+      self._exit_check_delay = min(self._exit_check_delay * 2,
+                                   _EXIT_CHECK_INTERVAL)
+    if self._deadline is not None:
+      wait_time = min(wait_time, max(self._deadline - time.time(), 0))
+    return wait_time
+
+  def Update(self, readable, writable):
+    """Handles ready file descriptors and checks whether the command finished.
+
+    Args:
+      readable: list of file descriptors in read_fds that are ready.
+      writable: list of file descriptors in write_fds that are ready.
+
+    Returns:
+      A (finished, chunks) tuple. finished is True once the command has exited
+      and its output has been read, and chunks is a list of
+      (OUTPUT_STDOUT or OUTPUT_STDERR, string) tuples containing undecoded
+      output in the order it was read.
+    """
+    if writable:
+      try:
+        written = os.write(self.write_fds[0],
+                           self._pending_input[:select.PIPE_BUF])
+        self._pending_input = self._pending_input[written:]
+      except OSError as e:
+        if e.errno != errno.EPIPE:
+          raise
+        self._pending_input = ''
+      if not self._pending_input:
+        self.process.stdin.close()
+        self.write_fds = []
+    chunks = []
+    for fd in readable:
+      chunk = os.read(fd, _READ_SIZE)
+      if chunk:
+        chunks.append((self.read_fds[fd], chunk))
+      else:
+        del self.read_fds[fd]
+    if self._exited and not readable:
+      # Whatever is still holding the pipes open outlived the command.
+      self.read_fds.clear()
+
+    self._exited = self.process.poll() is not None
+    if (not self._exited and self._deadline is not None and
+        time.time() >= self._deadline):
+      logging.error('IssueCommand timed out after %d seconds. '
+                    'Killing command "%s".', self._timeout, self._full_cmd)
+      self.process.kill()
+      self._deadline = None
+    return self._exited and not self.read_fds, chunks
+
+
+def _ReadProcessOutput(process, full_cmd, timeout, input=None):
+  """Yields a running command's output as it is produced.
+
+  Args:
+    process: subprocess.Popen object whose stdin, stdout, and stderr are pipes.
+    full_cmd: string. The command line, used when logging a timeout.
+    timeout: Timeout for the command in seconds, or None. If the command has
+        not finished before the timeout is reached, it is killed.
+    input: string or None. Data written to the command's stdin. If provided,
+        stdin is closed once it has been written.
+
+  Yields:
+    (OUTPUT_STDOUT or OUTPUT_STDERR, string) tuples containing chunks of
+    undecoded output, in the order they were read.
+  """
+  process_io = _ProcessIo(process, full_cmd, timeout, input)
+  finished = False
+  while not finished:
+    readable, writable = _WaitForFds(list(process_io.read_fds),
+                                     process_io.write_fds,
+                                     process_io.GetWaitTime())
+    finished, chunks = process_io.Update(readable, writable)
+    for stream_and_chunk in chunks:
+      yield stream_and_chunk
+
+
+def _Popen(cmd, env, stdout=subprocess.PIPE, stderr=subprocess.PIPE):
+  """Starts a command whose stdin is a pipe."""
+  on_windows = RunningOnWindows()
+  # Without close_fds, a command would inherit the pipes of any other command
+  # started concurrently and keep them open until it exits.
+  return subprocess.Popen(cmd, env=env, shell=on_windows,
+                          stdin=subprocess.PIPE, stdout=stdout,
+                          stderr=stderr, close_fds=not on_windows)
+
+
+def _CleanUpProcess(process):
+  """Waits for a process to exit and closes its pipes."""
+  process.wait()
+  for pipe in (process.stdin, process.stdout, process.stderr):
+    if pipe and not pipe.closed:
+      pipe.close()
+
+
+@contextlib.contextmanager
+def _StartProcess(cmd, env, stdout=subprocess.PIPE, stderr=subprocess.PIPE):
+  """Starts a command, killing it if the enclosed block raises or exits early.
+
+  Yields:
+    The subprocess.Popen object.
+  """
+  process = _Popen(cmd, env, stdout=stdout, stderr=stderr)
+  try:
+    yield process
+  except BaseException:
+    # Also reached if a generator reading the output is closed early.
+    if process.poll() is None:
+      process.kill()
+    raise
+  finally:
+    _CleanUpProcess(process)
+
+
+def _IssueCommandWithTempFiles(cmd, full_cmd, env, timeout):
+  """Runs a command, capturing its output in temporary files.
+
+  Used when running on Windows, where select cannot wait on pipes.
+
+  Returns:
+    A tuple of undecoded stdout, undecoded stderr, and retcode.
+  """
+  with tempfile.TemporaryFile() as tf_out, tempfile.TemporaryFile() as tf_err:
+    with _StartProcess(cmd, env, stdout=tf_out, stderr=tf_err) as process:
+
+      def _KillProcess():
+        logging.error('IssueCommand timed out after %d seconds. '
+                      'Killing command "%s".', timeout, full_cmd)
+        process.kill()
+
+      timer = threading.Timer(timeout, _KillProcess)
+      timer.start()
+
+      try:
+        process.wait()
+      finally:
+        timer.cancel()
+
+    tf_out.seek(0)
+    stdout = tf_out.read()
+    tf_err.seek(0)
+    stderr = tf_err.read()
+  return stdout, stderr, process.returncode
+
+
+def _LogCommandResult(full_cmd, stdout, stderr, retcode, force_info_log,
+                      suppress_warning):
+  """Decodes and logs the result of a command.
+
+  Returns:
+    A tuple of decoded stdout, decoded stderr, and retcode.
+  """
+  stdout = _Decode(stdout)
+  stderr = _Decode(stderr)
+
+  debug_text = ('Ran %s. Got return code (%s).\nSTDOUT: %s\nSTDERR: %s' %
+                (full_cmd, retcode, stdout, stderr))
+  if force_info_log or (retcode and not suppress_warning):
+    logging.info(debug_text)
+  else:
+    logging.debug(debug_text)
+
+  return stdout, stderr, retcode
+
+
 def IssueCommand(cmd, force_info_log=False, suppress_warning=False,
-                 env=None, timeout=DEFAULT_TIMEOUT, input=None):
+                 env=None, timeout=DEFAULT_TIMEOUT, input=None,
+                 stdout_callback=None, stderr_callback=None):
   """Tries running the provided command once.
 
   Args:
@@ -277,6 +619,12 @@ def IssueCommand(cmd, force_info_log=False, suppress_warning=False,
         return code will indicate an error, and stdout and stderr will
         contain what had already been written to them before the process was
         killed.
+    input: A string written to the command's stdin, or None to leave stdin
+        open and empty.
+    stdout_callback: Optional function called with each line of stdout
+        (without its line ending) as soon as the line has been read.
+    stderr_callback: Optional function called with each line of stderr
+        (without its line ending) as soon as the line has been read.
 
   Returns:
     A tuple of stdout, stderr, and retcode from running the provided command.
@@ -286,38 +634,190 @@ def IssueCommand(cmd, force_info_log=False, suppress_warning=False,
   full_cmd = ' '.join(cmd)
   logging.info('Running: %s', full_cmd)
 
-  shell_value = RunningOnWindows()
-  with tempfile.TemporaryFile() as tf_out, tempfile.TemporaryFile() as tf_err:
-    process = subprocess.Popen(cmd, env=env, shell=shell_value,
-                               stdin=subprocess.PIPE, stdout=tf_out,
-                               stderr=tf_err)
-
-    def _KillProcess():
-      logging.error('IssueCommand timed out after %d seconds. '
-                    'Killing command "%s".', timeout, full_cmd)
-      process.kill()
+  callbacks = {OUTPUT_STDOUT: stdout_callback, OUTPUT_STDERR: stderr_callback}
+  if RunningOnWindows():
+    stdout, stderr, retcode = _IssueCommandWithTempFiles(
+        cmd, full_cmd, env, timeout)
+    for output, callback in ((stdout, stdout_callback),
+                             (stderr, stderr_callback)):
+      if callback:
+        for line in output.splitlines():
+          callback(_Decode(line))
+  else:
+    chunks = {OUTPUT_STDOUT: [], OUTPUT_STDERR: []}
+    line_buffers = {OUTPUT_STDOUT: _LineBuffer(), OUTPUT_STDERR: _LineBuffer()}
+    with _StartProcess(cmd, env) as process:
+      for stream, chunk in _ReadProcessOutput(process, full_cmd, timeout,
+                                              input):
+        chunks[stream].append(chunk)
+        if callbacks[stream]:
+          for line in line_buffers[stream].Feed(chunk):
+            callbacks[stream](_Decode(line))
+    for stream, callback in callbacks.iteritems():
+      if callback:
+        for line in line_buffers[stream].Flush():
+          callback(_Decode(line))
+    stdout = ''.join(chunks[OUTPUT_STDOUT])
+    stderr = ''.join(chunks[OUTPUT_STDERR])
+    retcode = process.returncode
+  return _LogCommandResult(full_cmd, stdout, stderr, retcode, force_info_log,
+                           suppress_warning)
+
+
+def StreamCommand(cmd, env=None, timeout=DEFAULT_TIMEOUT, input=None):
+  """Runs a command and yields its output line by line as it is produced.
+
+  Unlike IssueCommand, the output is not retained, so this is suitable for
+  commands whose output is too large to hold in memory. If the caller stops
+  iterating before the command has finished, the command is killed.
 
-    timer = threading.Timer(timeout, _KillProcess)
-    timer.start()
+  Args:
+    cmd: A list of strings such as is given to the subprocess.Popen()
+        constructor.
+    env: A dict of key/value strings, such as is given to the subprocess.Popen()
+        constructor, that contains environment variables to be injected.
+    timeout: Timeout for the command in seconds, or None to let the command
+        run indefinitely. If the command has not finished before the timeout
+        is reached, it will be killed.
+    input: A string written to the command's stdin, or None to leave stdin
+        open and empty.
+
+  Yields:
+    (OUTPUT_STDOUT or OUTPUT_STDERR, line) tuples, where line does not include
+    its line ending, followed by a single (OUTPUT_EXIT_CODE, retcode) tuple.
+  """
+  full_cmd = ' '.join(cmd)
+  logging.info('Streaming: %s', full_cmd)
+
+  if RunningOnWindows():
+    stdout, stderr, retcode = _IssueCommandWithTempFiles(
+        cmd, full_cmd, env, timeout)
+    for stream, output in ((OUTPUT_STDOUT, stdout), (OUTPUT_STDERR, stderr)):
+      for line in output.splitlines():
+        yield stream, _Decode(line)
+    yield OUTPUT_EXIT_CODE, retcode
+    return
+
+  line_buffers = {OUTPUT_STDOUT: _LineBuffer(), OUTPUT_STDERR: _LineBuffer()}
+  with _StartProcess(cmd, env) as process:
+    for stream, chunk in _ReadProcessOutput(process, full_cmd, timeout, input):
+      for line in line_buffers[stream].Feed(chunk):
+        yield stream, _Decode(line)
+  for stream in (OUTPUT_STDOUT, OUTPUT_STDERR):
+    for line in line_buffers[stream].Flush():
+      yield stream, _Decode(line)
+  logging.debug('Ran %s. Got return code (%s).', full_cmd, process.returncode)
+  yield OUTPUT_EXIT_CODE, process.returncode
+
+
+class CommandGroup(object):
+  """Runs commands concurrently, servicing all of them from a single thread.
+
+  Each command's result is logged just like IssueCommand's and then passed to
+  the callback given to Start. Not supported on Windows, where select cannot
+  wait on pipes.
+  """
 
+  def __init__(self):
+    # Maps each running command's _ProcessIo to a _GroupedCommand.
+    self._commands = {}
+
+  def __len__(self):
+    return len(self._commands)
+
+  def Start(self, cmd, callback, force_info_log=False, suppress_warning=False,
+            env=None, timeout=DEFAULT_TIMEOUT, input=None):
+    """Starts a command.
+
+    Args:
+      cmd: A list of strings such as is given to the subprocess.Popen()
+          constructor.
+      callback: Function called by Wait with the decoded stdout, decoded
+          stderr, and retcode of the command once it has finished.
+      force_info_log: See IssueCommand.
+      suppress_warning: See IssueCommand.
+      env: See IssueCommand.
+      timeout: See IssueCommand.
+      input: See IssueCommand.
+    """
+    logging.debug('Environment variables: %s' % env)
+
+    full_cmd = ' '.join(cmd)
+    logging.info('Running: %s', full_cmd)
+
+    process = _Popen(cmd, env)
     try:
-      process.wait()
-    finally:
-      timer.cancel()
-
-    tf_out.seek(0)
-    stdout = tf_out.read().decode('ascii', 'ignore')
-    tf_err.seek(0)
-    stderr = tf_err.read().decode('ascii', 'ignore')
-
-  debug_text = ('Ran %s. Got return code (%s).\nSTDOUT: %s\nSTDERR: %s' %
-                (full_cmd, process.returncode, stdout, stderr))
-  if force_info_log or (process.returncode and not suppress_warning):
-    logging.info(debug_text)
-  else:
-    logging.debug(debug_text)
-
-  return stdout, stderr, process.returncode
+      process_io = _ProcessIo(process, full_cmd, timeout, input)
+    except BaseException:
+      process.kill()
+      _CleanUpProcess(process)
+      raise
+    self._commands[process_io] = _GroupedCommand(
+        full_cmd, callback, force_info_log, suppress_warning)
+
+  def Wait(self, timeout=None):
+    """Waits for the commands to make progress.
+
+    Calls the callbacks of the commands that finished while waiting.
+
+    Args:
+      timeout: Maximum number of seconds to wait, or None to wait until a
+          command produces output, finishes, or needs to be checked.
+    """
+    if not self._commands:
+      if timeout:
+        time.sleep(timeout)
+      return
+    read_fds = []
+    write_fds = []
+    wait_time = timeout
+    for process_io in self._commands:
+      read_fds.extend(process_io.read_fds)
+      write_fds.extend(process_io.write_fds)
+      process_wait_time = process_io.GetWaitTime()
+      if wait_time is None or process_wait_time < wait_time:
+        wait_time = process_wait_time
+    readable, writable = _WaitForFds(read_fds, write_fds, wait_time)
+    readable = set(readable)
+    writable = set(writable)
+
+    for process_io in self._commands.keys():
+      command = self._commands[process_io]
+      finished, chunks = process_io.Update(
+          [fd for fd in process_io.read_fds if fd in readable],
+          [fd for fd in process_io.write_fds if fd in writable])
+      for stream, chunk in chunks:
+        command.chunks[stream].append(chunk)
+      if not finished:
+        continue
+      del self._commands[process_io]
+      _CleanUpProcess(process_io.process)
+      result = _LogCommandResult(
+          command.full_cmd, ''.join(command.chunks[OUTPUT_STDOUT]),
+          ''.join(command.chunks[OUTPUT_STDERR]),
+          process_io.process.returncode, command.force_info_log,
+          command.suppress_warning)
+      command.callback(*result)
+
+  def KillAll(self):
+    """Kills every running command without calling its callback."""
+    while self._commands:
+      process_io, command = self._commands.popitem()
+      logging.info('Killing command "%s".', command.full_cmd)
+      if process_io.process.poll() is None:
+        process_io.process.kill()
+      _CleanUpProcess(process_io.process)
+
+
+class _GroupedCommand(object):
+  """State of a command started by a CommandGroup."""
+
+  def __init__(self, full_cmd, callback, force_info_log, suppress_warning):
+    self.full_cmd = full_cmd
+    self.callback = callback
+    self.force_info_log = force_info_log
+    self.suppress_warning = suppress_warning
+    self.chunks = {OUTPUT_STDOUT: [], OUTPUT_STDERR: []}
 
 
 def IssueBackgroundCommand(cmd, stdout_path, stderr_path, env=None):
@@ -341,10 +841,34 @@ def IssueBackgroundCommand(cmd, stdout_path, stderr_path, env=None):
                    stdout=outfile, stderr=errfile, close_fds=True)
 
 
-@Retry()
+def RaiseIfThrottled(stderr):
+  """Raises ThrottledCommandError if a command's error output is throttling.
+
+  Raises:
+    errors.VmUtil.ThrottledCommandError: If stderr contains one of
+        THROTTLING_ERROR_PATTERNS.
+  """
+  for pattern in THROTTLING_ERROR_PATTERNS:
+    if pattern in stderr:
+      raise errors.VmUtil.ThrottledCommandError(
+          'The command was throttled:\n%s' % stderr)
+
+
+def GetCommandRetryBudgetName(cmd, env=None):
+  """Returns the name of the retry budget of a command: its executable."""
+  return os.path.basename(cmd[0])
+
+
+@Retry(policies=((errors.VmUtil.ThrottledCommandError,
+                  THROTTLING_RETRY_POLICY),),
+       budget=GetCommandRetryBudgetName)
 def IssueRetryableCommand(cmd, env=None):
   """Tries running the provided command until it succeeds or times out.
 
+  Commands that were throttled by the API they call are retried with
+  exponential backoff. All retries of commands running the same executable
+  (e.g. gcloud) share a retry budget.
+
   Args:
     cmd: A list of strings such as is given to the subprocess.Popen()
         constructor.
@@ -355,6 +879,7 @@ def IssueRetryableCommand(cmd, env=None):
   """
   stdout, stderr, retcode = IssueCommand(cmd, env=env)
   if retcode:
+    RaiseIfThrottled(stderr)
     raise errors.VmUtil.CalledProcessException(
         'Command returned a non-zero exit code.\n')
   return stdout, stderr
@@ -0,0 +1,87 @@
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the script that summarizes fio logs on VMs."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import fio_reduce_logs
+
+
+class FioReduceLogsTestCase(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+  def _WriteFile(self, name, lines):
+    path = os.path.join(self.tmp_dir, name)
+    with open(path, 'w') as fp:
+      fp.write(''.join(line + '\n' for line in lines))
+    return path
+
+  def testBucket(self):
+    self.assertEqual(255, fio_reduce_logs.Bucket(255))
+    self.assertEqual(256, fio_reduce_logs.Bucket(257))
+    self.assertEqual(1000000 >> 12 << 12, fio_reduce_logs.Bucket(1000000))
+
+  def testGetJobNames(self):
+    job_file = self._WriteFile('fio.job', [
+        '[global]', 'numjobs=2', '[seq]', 'stonewall', '[rand]', 'numjobs=1'])
+    self.assertEqual({1: 'seq', 2: 'seq', 3: 'rand'},
+                     fio_reduce_logs.GetJobNames(job_file))
+
+  def testLatency(self):
+    path = self._WriteFile('pkb_fio_avg_1_clat.1.log', [
+        '500, 10, 0, 4096', '1500, 20, 0, 4096', '2500, 40, 0, 4096',
+        '2600, 300, 1, 4096'])
+    result = fio_reduce_logs.ReduceLogs([path], 2, [50, 100], {1: 'seq'})
+    self.assertEqual([], result['throughput'])
+    read, write = result['latency']
+    self.assertEqual(('clat', 'seq', 'read'),
+                     (read['log'], read['job'], read['direction']))
+    self.assertEqual({10: 1, 20: 1, 40: 1}, read['histogram'])
+    self.assertEqual(20, read['stats']['p50'])
+    self.assertEqual(40, read['stats']['p100'])
+    self.assertEqual([(0, 2, 20), (2, 4, 40)],
+                     [(w['start'], w['end'], w['stats']['p100'])
+                      for w in read['windows']])
+    self.assertEqual('write', write['direction'])
+    self.assertEqual({300: 1}, write['histogram'])
+
+  def testJobsWithoutJobFile(self):
+    path = self._WriteFile('pkb_iops.3.log', ['0, 7, 1, 4096'])
+    series, = fio_reduce_logs.ReduceLogs([path], 10, [50])['throughput']
+    self.assertEqual(('iops', 'job3', 'write'),
+                     (series['log'], series['job'], series['direction']))
+
+  def testThroughputIsSummedOverClones(self):
+    paths = [self._WriteFile('pkb_bw.1.log', ['0, 100, 0, 4096',
+                                              '1000, 300, 0, 4096']),
+             self._WriteFile('pkb_bw.2.log', ['0, 50, 0, 4096']),
+             self._WriteFile('unrelated.log', ['0, 1, 0, 4096'])]
+    result = fio_reduce_logs.ReduceLogs(paths, 10, [50], {1: 'seq', 2: 'seq'})
+    self.assertEqual([], result['latency'])
+    series, = result['throughput']
+    self.assertEqual(('bw', 'seq', 'read'),
+                     (series['log'], series['job'], series['direction']))
+    self.assertEqual([{'start': 0, 'end': 10, 'value': 250.0}],
+                     series['windows'])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,174 @@
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.archive."""
+
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import unittest
+
+import mock
+
+from perfkitbenchmarker import archive
+from perfkitbenchmarker import errors
+
+
+class _FakeCopyProcess(object):
+  """Stands in for a 'gsutil cp' process, recording what it uploads."""
+
+  def __init__(self, uploads, failing_objects, cmd, stdin=None):
+    self._uploads = uploads
+    self._destination = cmd[-1]
+    self._failed = self._destination in failing_objects
+    self.stdin = _UploadStream(self) if cmd[-2] == '-' else None
+    if self.stdin is None:
+      with open(cmd[-2]) as fp:
+        self.Upload(fp.read())
+
+  def Upload(self, data):
+    if not self._failed:
+      self._uploads[self._destination] = data
+
+  def wait(self):
+    return 1 if self._failed else 0
+
+
+class _UploadStream(io.BytesIO):
+
+  def __init__(self, process):
+    super(_UploadStream, self).__init__()
+    self._process = process
+
+  def close(self):
+    self._process.Upload(self.getvalue())
+    super(_UploadStream, self).close()
+
+
+class ArchiveRunTestCase(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.temp_dir)
+    self.run_dir = os.path.join(self.temp_dir, 'run_abc')
+    os.makedirs(os.path.join(self.run_dir, 'traces'))
+    self._WriteFile('pkb.log', 'log')
+    self._WriteFile('traces/dstat.csv', 'd' * 100)
+    self._WriteFile('traces/collectd.csv', 'c' * 100)
+    self.uploads = {}
+    self.failing_objects = set()
+    self.lock = threading.Lock()
+    p = mock.patch(archive.__name__ + '.subprocess.Popen',
+                   side_effect=self._Popen)
+    p.start()
+    self.addCleanup(p.stop)
+    p = mock.patch(archive.__name__ + '.subprocess.call',
+                   side_effect=lambda cmd: self._Popen(cmd).wait())
+    p.start()
+    self.addCleanup(p.stop)
+
+  def _Popen(self, cmd, stdin=None):
+    with self.lock:
+      return _FakeCopyProcess(self.uploads, self.failing_objects, cmd)
+
+  def _WriteFile(self, name, contents):
+    with open(os.path.join(self.run_dir, name), 'w') as fp:
+      fp.write(contents)
+
+  def _GetArchivedFiles(self):
+    """Returns a dict mapping archived file names to their contents."""
+    files = {}
+    for name, data in self.uploads.iteritems():
+      if not name.endswith('.tar.gz'):
+        continue
+      with tarfile.open(fileobj=io.BytesIO(data), mode='r:gz') as tar:
+        for member in tar.getmembers():
+          if member.isfile():
+            files[member.name] = tar.extractfile(member).read()
+    return files
+
+  def _ArchiveInChunks(self):
+    archive.ArchiveRun(self.run_dir, 'gs://bucket', prefix='abc_',
+                       chunk_size=150, max_concurrency=2)
+
+  def testStream(self):
+    archive.ArchiveRun(self.run_dir, 'gs://bucket', prefix='abc_')
+    self.assertEqual(1, len(self.uploads))
+    self.assertRegexpMatches(self.uploads.keys()[0],
+                             r'^gs://bucket/abc_\d+\.tar\.gz$')
+    self.assertEqual('log', self._GetArchivedFiles()['run_abc/pkb.log'])
+
+  def testUnsupportedBucket(self):
+    with self.assertRaises(ValueError):
+      archive.ArchiveRun(self.run_dir, 'ftp://bucket')
+
+  def testChunks(self):
+    self._ArchiveInChunks()
+    chunks = sorted(name for name in self.uploads if name.endswith('.tar.gz'))
+    self.assertEqual(2, len(chunks))
+    for chunk in chunks:
+      self.assertRegexpMatches(chunk,
+                               r'^gs://bucket/abc_archive/\d+-\d{5}\.tar\.gz$')
+    self.assertEqual({'run_abc/pkb.log': 'log',
+                      'run_abc/traces/dstat.csv': 'd' * 100,
+                      'run_abc/traces/collectd.csv': 'c' * 100},
+                     self._GetArchivedFiles())
+    manifest = json.loads(
+        self.uploads['gs://bucket/abc_archive/archive_manifest.json'])
+    self.assertItemsEqual(['pkb.log', 'traces/dstat.csv',
+                           'traces/collectd.csv'], manifest['files'])
+
+  def testUnchangedFilesAreSkipped(self):
+    self._ArchiveInChunks()
+    self.uploads.clear()
+    self._ArchiveInChunks()
+    self.assertEqual({}, self.uploads)
+
+    self._WriteFile('pkb.log', 'longer log')
+    self._WriteFile('traces/new.csv', 'n')
+    self._ArchiveInChunks()
+    self.assertEqual({'run_abc/pkb.log': 'longer log',
+                      'run_abc/traces/new.csv': 'n'},
+                     self._GetArchivedFiles())
+    manifest = json.loads(
+        self.uploads['gs://bucket/abc_archive/archive_manifest.json'])
+    self.assertEqual(4, len(manifest['files']))
+
+  def testResumeAfterFailure(self):
+    with mock.patch.object(archive.datetime, 'datetime') as mock_datetime:
+      mock_datetime.now.return_value.strftime.return_value = '1'
+      self.failing_objects.add('gs://bucket/abc_archive/1-00001.tar.gz')
+      with self.assertRaises(errors.VmUtil.ThreadException):
+        self._ArchiveInChunks()
+    self.assertEqual({'run_abc/pkb.log': 'log',
+                      'run_abc/traces/collectd.csv': 'c' * 100},
+                     self._GetArchivedFiles())
+    self.uploads.clear()
+    self._ArchiveInChunks()
+    self.assertEqual({'run_abc/traces/dstat.csv': 'd' * 100},
+                     self._GetArchivedFiles())
+
+  def testManifestForAnotherDestinationIsIgnored(self):
+    self._ArchiveInChunks()
+    self.uploads.clear()
+    archive.ArchiveRun(self.run_dir, 's3://bucket', prefix='abc_',
+                       chunk_size=150)
+    self.assertEqual(3, len(self._GetArchivedFiles()))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,170 @@
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.artifact_cache."""
+
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from perfkitbenchmarker import artifact_cache
+from perfkitbenchmarker import context
+from perfkitbenchmarker import errors
+from perfkitbenchmarker import os_types
+from perfkitbenchmarker import vm_util
+from tests import mock_flags
+
+
+class _FakeVm(object):
+  """Records how a VM got each staged file."""
+
+  OS_TYPE = os_types.DEBIAN
+
+  def __init__(self, name, log, fail_moves=False):
+    self.name = name
+    self.log = log
+    self.fail_moves = fail_moves
+
+  def RemoteCommand(self, command):
+    pass
+
+  def RemoteCopy(self, local_path, remote_path):
+    self.log.append(('pkb', self.name))
+
+  def MoveFile(self, target, source_path, remote_path):
+    if self.fail_moves:
+      raise errors.VirtualMachine.RemoteCommandError('unreachable')
+    self.log.append((self.name, target.name))
+
+
+class FetchTestCase(unittest.TestCase):
+
+  def setUp(self):
+    self.mocked_flags = mock_flags.PatchTestCaseFlags(self)
+    self.mocked_flags.package_cache_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.mocked_flags.package_cache_dir)
+    self.contents = 'tarball'
+    p = mock.patch.object(vm_util, 'IssueRetryableCommand',
+                          side_effect=self._Download)
+    self.download = p.start()
+    self.addCleanup(p.stop)
+
+  def _Download(self, cmd):
+    with open(cmd[3], 'w') as fp:
+      fp.write(self.contents)
+
+  def testDownloadsOnce(self):
+    path = artifact_cache.Fetch('http://a/x.tar.gz')
+    self.assertEqual(path, artifact_cache.Fetch('http://a/x.tar.gz'))
+    self.assertEqual(1, self.download.call_count)
+    self.assertEqual(hashlib.sha256('tarball').hexdigest(),
+                     os.path.basename(path))
+
+  def testSameContentsAreStoredOnce(self):
+    self.assertEqual(artifact_cache.Fetch('http://a/x.tar.gz'),
+                     artifact_cache.Fetch('http://mirror/x.tar.gz'))
+    self.assertEqual(
+        1, len(os.listdir(os.path.join(self.mocked_flags.package_cache_dir,
+                                       'sha256'))))
+
+  def testHashMismatch(self):
+    with self.assertRaises(errors.Error):
+      artifact_cache.Fetch('http://a/x.tar.gz', sha256='0' * 64)
+
+  def testChangedHashIsDownloadedAgain(self):
+    artifact_cache.Fetch('http://a/x.tar.gz')
+    self.contents = 'new tarball'
+    path = artifact_cache.Fetch(
+        'http://a/x.tar.gz', sha256=hashlib.sha256('new tarball').hexdigest())
+    self.assertEqual(2, self.download.call_count)
+    with open(path) as fp:
+      self.assertEqual('new tarball', fp.read())
+
+
+class DistributorTestCase(unittest.TestCase):
+
+  def setUp(self):
+    self.mocked_flags = mock_flags.PatchTestCaseFlags(self)
+    self.mocked_flags.artifact_distribution = artifact_cache.PEER
+    self.mocked_flags.artifact_fanout = 1
+    self.log = []
+    self.distributor = artifact_cache.Distributor()
+    spec = mock.Mock(artifact_distributor=self.distributor)
+    context.SetThreadBenchmarkSpec(spec)
+    self.addCleanup(context.SetThreadBenchmarkSpec, None)
+    with tempfile.NamedTemporaryFile(delete=False) as tf:
+      tf.write('data')
+    self.local_path = tf.name
+    self.addCleanup(os.remove, self.local_path)
+
+  def testCopiesFromPeers(self):
+    vms = [_FakeVm(i, self.log) for i in xrange(4)]
+    for vm in vms:
+      artifact_cache.Stage(vm, self.local_path, 'data.txt')
+    self.assertEqual([('pkb', 0), (0, 1), (0, 2), (0, 3)], self.log)
+
+  def testStagesOncePerVm(self):
+    vm = _FakeVm(0, self.log)
+    path = artifact_cache.Stage(vm, self.local_path, 'data.txt')
+    self.assertEqual(path, artifact_cache.Stage(vm, self.local_path,
+                                                'data.txt'))
+    self.assertEqual([('pkb', 0)], self.log)
+    self.assertTrue(path.startswith(artifact_cache.STAGING_DIR))
+    self.assertTrue(path.endswith('/data.txt'))
+
+  def testTreeFanout(self):
+    vms = [_FakeVm(i, self.log) for i in xrange(7)]
+    vm_util.RunThreaded(
+        lambda vm: artifact_cache.Stage(vm, self.local_path, 'data.txt'), vms)
+    sources = [source for source, _ in self.log]
+    # Only a few copies are uploaded from PKB, and every VM gets a copy.
+    self.assertLess(sources.count('pkb'), len(vms))
+    self.assertItemsEqual(range(7), [target for _, target in self.log])
+
+  def testFailedPeerCopyFallsBackToController(self):
+    vms = [_FakeVm(0, self.log, fail_moves=True), _FakeVm(1, self.log)]
+    for vm in vms:
+      artifact_cache.Stage(vm, self.local_path, 'data.txt')
+    self.assertEqual([('pkb', 0), ('pkb', 1)], self.log)
+
+  def testControllerDistribution(self):
+    self.mocked_flags.artifact_distribution = artifact_cache.CONTROLLER
+    for i in xrange(3):
+      artifact_cache.Stage(_FakeVm(i, self.log), self.local_path, 'data.txt')
+    self.assertEqual([('pkb', 0), ('pkb', 1), ('pkb', 2)], self.log)
+
+  def testPushFile(self):
+    vm = mock.Mock(OS_TYPE=os_types.DEBIAN)
+    artifact_cache.PushFile(vm, self.local_path, '/opt/pkb/')
+    staging_path = vm.RemoteCopy.call_args[0][1]
+    vm.RemoteCommand.assert_called_with(
+        'cp -p {0} /opt/pkb/'.format(staging_path))
+
+  def testPushFileToWindows(self):
+    vm = mock.Mock(OS_TYPE=os_types.WINDOWS)
+    artifact_cache.PushFile(vm, self.local_path, 'C:\\')
+    vm.RemoteCopy.assert_called_once_with(self.local_path, 'C:\\')
+
+  def testPickle(self):
+    artifact_cache.Stage(_FakeVm(0, self.log), self.local_path, 'data.txt')
+    distributor = pickle.loads(pickle.dumps(self.distributor))
+    self.assertEqual(1, len(distributor._files))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -116,12 +116,24 @@ class AwsVirtualMachineExistsTestCase(unittest.TestCase):
     path = os.path.join(os.path.dirname(__file__),
                         'data', 'aws-describe-instance.json')
     with open(path) as f:
-      self.response = f.read()
+      response = json.load(f)
+    # Instances of all VMs in a region are described together, and matched to
+    # the VMs by their client tokens.
+    response['Reservations'][0]['Instances'][0]['ClientToken'] = (
+        self.vm.client_token)
+    self.response = json.dumps(response)
+    aws_virtual_machine._INSTANCE_POLLER.Reset()
 
   def testInstancePresent(self):
     util.IssueRetryableCommand.side_effect = [(self.response, None)]
     self.assertTrue(self.vm._Exists())
 
+  def testOtherInstance(self):
+    response = json.loads(self.response)
+    response['Reservations'][0]['Instances'][0]['ClientToken'] = 'other'
+    util.IssueRetryableCommand.side_effect = [(json.dumps(response), None)]
+    self.assertFalse(self.vm._Exists())
+
   def testInstanceDeleted(self):
     response = json.loads(self.response)
     state = response['Reservations'][0]['Instances'][0]['State']
@@ -0,0 +1,131 @@
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.bulk_copy."""
+
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+import mock
+
+from perfkitbenchmarker import bulk_copy
+from perfkitbenchmarker import errors
+from tests import mock_flags
+
+
+class TarballTestCase(unittest.TestCase):
+  """Streams tarballs through tar running locally instead of on a VM."""
+
+  def setUp(self):
+    self.mocked_flags = mock_flags.PatchTestCaseFlags(self)
+    self.tmp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.tmp_dir)
+    self.src_dir = os.path.join(self.tmp_dir, 'src')
+    os.makedirs(os.path.join(self.src_dir, 'logs'))
+    for name in 'a.log', os.path.join('logs', 'b.log'):
+      with open(os.path.join(self.src_dir, name), 'w') as fp:
+        fp.write(name)
+    self.dest_dir = os.path.join(self.tmp_dir, 'dest')
+    os.makedirs(self.dest_dir)
+
+  def _Read(self, *path):
+    with open(os.path.join(*path)) as fp:
+      return fp.read()
+
+  def _Send(self, paths, compress):
+    cmd = ['sh', '-c', 'cd {0} && tar -xP{1}f -'.format(
+        self.dest_dir, 'z' if compress else '')]
+    return bulk_copy.SendTarball(cmd, paths, compress)
+
+  def testSendTarball(self):
+    absolute_path = os.path.join(self.tmp_dir, 'abs', 'a.log')
+    for compress in False, True:
+      self.assertEqual(('', 0), self._Send(
+          [(os.path.join(self.src_dir, 'a.log'), absolute_path),
+           (os.path.join(self.src_dir, 'logs'), 'x/logs')], compress))
+      self.assertEqual('a.log', self._Read(absolute_path))
+      self.assertEqual('logs/b.log',
+                       self._Read(self.dest_dir, 'x', 'logs', 'b.log'))
+
+  def testSendTarballFailure(self):
+    stderr, retcode = bulk_copy.SendTarball(
+        ['sh', '-c', 'echo oops >&2; exit 3'],
+        [(os.path.join(self.src_dir, 'a.log'), 'a.log')])
+    self.assertEqual(('oops\n', 3), (stderr, retcode))
+
+  def testReceiveTarball(self):
+    for compress in False, True:
+      cmd = ['sh', '-c', 'cd {0} && tar -c{1}f - *.log logs'.format(
+          self.src_dir, 'z' if compress else '')]
+      local_dir = os.path.join(self.dest_dir, str(compress))
+      self.assertEqual(('', 0),
+                       bulk_copy.ReceiveTarball(cmd, local_dir, compress))
+      self.assertEqual('a.log', self._Read(local_dir, 'a.log'))
+      self.assertEqual('logs/b.log', self._Read(local_dir, 'logs', 'b.log'))
+
+  def testReceiveTarballFailure(self):
+    stderr, retcode = bulk_copy.ReceiveTarball(
+        ['sh', '-c', 'echo oops >&2; exit 2'], self.dest_dir)
+    self.assertEqual(('oops\n', 2), (stderr, retcode))
+
+  def testReceiveTarballRefusesParentDirectories(self):
+    tarball_path = os.path.join(self.tmp_dir, 'evil.tar')
+    with tarfile.open(tarball_path, 'w') as tar:
+      tar.add(os.path.join(self.src_dir, 'a.log'), '../a.log')
+    with self.assertRaises(errors.VirtualMachine.RemoteCommandError):
+      bulk_copy.ReceiveTarball(['cat', tarball_path], self.dest_dir)
+    self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, 'a.log')))
+
+
+class ThrottleTestCase(unittest.TestCase):
+
+  def testSharedRate(self):
+    throttle = bulk_copy._Throttle(1000)
+    with mock.patch.object(bulk_copy.time, 'time', return_value=100.0), \
+            mock.patch.object(bulk_copy.time, 'sleep') as sleep:
+      throttle._next_time = 100.0
+      throttle.Acquire(500)
+      throttle.Acquire(1000)
+    self.assertEqual([mock.call(0.5), mock.call(1.5)], sleep.call_args_list)
+
+  def testFlag(self):
+    mocked_flags = mock_flags.PatchTestCaseFlags(self)
+    self.assertIsNone(bulk_copy._GetThrottle())
+    mocked_flags.bulk_copy_max_mbps = 8
+    self.assertEqual(1e6, bulk_copy._GetThrottle().rate)
+    self.assertIs(bulk_copy._GetThrottle(), bulk_copy._GetThrottle())
+
+
+class FanOutTestCase(unittest.TestCase):
+
+  def testPullFromVms(self):
+    vms = [mock.Mock(), mock.Mock()]
+    vms[0].name, vms[1].name = 'vm0', 'vm1'
+    bulk_copy.PullFromVms(vms, '/results', ['*.log'], compress=True)
+    for vm in vms:
+      vm.PullFiles.assert_called_once_with(
+          os.path.join('/results', vm.name), ['*.log'], remote_dir='.',
+          compress=True)
+
+  def testPushToVms(self):
+    vms = [mock.Mock(), mock.Mock()]
+    bulk_copy.PushToVms(vms, [('a', 'b')])
+    for vm in vms:
+      vm.PushFiles.assert_called_once_with([('a', 'b')], compress=False)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,112 @@
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.columnar."""
+
+import math
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from perfkitbenchmarker import columnar
+
+
+class ColumnarTestCase(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.temp_dir)
+
+  def _Write(self, name, samples):
+    path = os.path.join(self.temp_dir, name)
+    writer = columnar.ColumnarWriter()
+    writer.Add(samples)
+    writer.Write(path)
+    return path
+
+  def testRoundTrip(self):
+    path = self._Write('run1', [
+        {'metric': 'a', 'value': 1, 'unit': 'ms', 'timestamp': 10.5,
+         'official': False, 'metadata': {'zone': u'z\xe9', 'cpus': 4}},
+        {'metric': 'b', 'value': 'n/a', 'unit': 'ms', 'timestamp': 11.0,
+         'official': False, 'metadata': {'zone': u'z\xe9', 'disk': None}},
+        {'metric': 'a', 'value': 2.5, 'unit': 'ms', 'timestamp': 12.0,
+         'official': False, 'metadata': {}}])
+    columns = columnar.ReadFiles([path])
+    self.assertItemsEqual(
+        ['timestamp', 'value', 'metric', 'unit', 'official',
+         'metadata.zone', 'metadata.cpus', 'metadata.disk'], columns)
+    self.assertEqual([10.5, 11.0, 12.0], list(columns['timestamp']))
+    self.assertEqual(1.0, columns['value'][0])
+    self.assertTrue(math.isnan(columns['value'][1]))
+    self.assertEqual(['a', 'b', 'a'], list(columns['metric']))
+    self.assertEqual(['False'] * 3, list(columns['official']))
+    self.assertEqual(['z\xc3\xa9', 'z\xc3\xa9', None],
+                     list(columns['metadata.zone']))
+    self.assertEqual(['4', None, None], list(columns['metadata.cpus']))
+    self.assertEqual([None] * 3, list(columns['metadata.disk']))
+
+  def testMetadataIsDictionaryEncoded(self):
+    path = self._Write('run1', [{'metric': 'm', 'metadata': {'zone': 'z1'}},
+                                {'metric': 'm', 'metadata': {'zone': 'z1'}},
+                                {'metric': 'm', 'metadata': {}}])
+    column = columnar.ReadFiles([path], decode=False)['metadata.zone']
+    self.assertEqual(['z1'], list(column.dictionary))
+    self.assertEqual([0, 0, -1], list(column.codes))
+
+  def testDictionaryValuesAreNotPadded(self):
+    blob = 'x' * 100000
+    path = self._Write('run1', [{'metric': 'm', 'metadata': {'blob': blob}}] +
+                       [{'metric': 'm', 'metadata': {'blob': str(i)}}
+                        for i in range(100)])
+    with numpy.load(path) as npz:
+      self.assertLess(sum(npz[name].nbytes for name in npz.files),
+                      2 * len(blob))
+    column = columnar.ReadFiles([path], decode=False)['metadata.blob']
+    self.assertEqual([blob] + [str(i) for i in range(100)],
+                     list(column.dictionary))
+
+  def testReadFilesMergesDictionaries(self):
+    paths = [
+        self._Write('run1', [{'metric': 'a', 'value': 1,
+                              'metadata': {'zone': 'z1'}},
+                             {'metric': 'b', 'value': 2,
+                              'metadata': {'zone': 'z2'}}]),
+        self._Write('run2', [{'metric': 'b', 'value': 3,
+                              'metadata': {'disk': 'ssd'}}]),
+        self._Write('run3', [{'metric': 'c', 'value': 4,
+                              'metadata': {'zone': 'z2'}}])]
+    columns = columnar.ReadFiles(paths, decode=False)
+    self.assertEqual([1, 2, 3, 4], list(columns['value']))
+    metric = columns['metric']
+    self.assertEqual(['a', 'b', 'c'], list(metric.dictionary))
+    self.assertEqual([0, 1, 1, 2], list(metric.codes))
+    self.assertEqual(['z1', 'z2', None, 'z2'],
+                     list(columnar.Decode(columns['metadata.zone'])))
+    self.assertEqual([None, None, 'ssd', None],
+                     list(columnar.Decode(columns['metadata.disk'])))
+
+  def testNoSamples(self):
+    path = self._Write('empty', [])
+    self.assertEqual({'timestamp': [], 'value': []},
+                     {name: list(column) for name, column in
+                      columnar.ReadFiles([path]).iteritems()})
+    self.assertEqual(['timestamp', 'value'],
+                     sorted(columnar.ReadFiles([])))
+
+
+if __name__ == '__main__':
+  unittest.main()
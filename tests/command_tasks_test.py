@@ -0,0 +1,211 @@
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.command_tasks."""
+
+import threading
+import time
+import unittest
+
+import mock
+
+from perfkitbenchmarker import command_tasks
+from perfkitbenchmarker import context
+from perfkitbenchmarker import errors
+from perfkitbenchmarker import log_util
+from perfkitbenchmarker import vm_util
+from tests import mock_flags
+
+
+def _Echo(text):
+  stdout, _, _ = yield command_tasks.Command(['echo', text])
+  raise command_tasks.Return(stdout.strip())
+
+
+def _SleepAndEcho(seconds, text):
+  yield command_tasks.Command(['sleep', str(seconds)])
+  result = yield _Echo(text)
+  raise command_tasks.Return(result)
+
+
+def _Fail():
+  _, _, retcode = yield command_tasks.Command(['false'])
+  raise ValueError('retcode %s' % retcode)
+
+
+def _CatchFailure():
+  try:
+    yield _Fail()
+  except ValueError as e:
+    raise command_tasks.Return(str(e))
+
+
+def _GetLabel():
+  yield command_tasks.Command(['true'])
+  raise command_tasks.Return(log_util.GetThreadLogContext().label)
+
+
+def _LabelAndGetLabel(label):
+  with log_util.GetThreadLogContext().ExtendLabel(label):
+    result = yield _GetLabel()
+  raise command_tasks.Return(result)
+
+
+class RunSyncTestCase(unittest.TestCase):
+
+  def testReturnValue(self):
+    self.assertEqual(command_tasks.RunSync(_SleepAndEcho(0, 'hi')), 'hi')
+
+  def testExceptionsPropagateThroughTasks(self):
+    self.assertEqual(command_tasks.RunSync(_CatchFailure()), 'retcode 1')
+    with self.assertRaises(ValueError):
+      command_tasks.RunSync(_Fail())
+
+  def testUsesIssueCommand(self):
+    with mock.patch(vm_util.__name__ + '.IssueCommand',
+                    return_value=('mocked\n', '', 0)) as issue_command:
+      self.assertEqual(command_tasks.RunSync(_Echo('hi')), 'mocked')
+    self.assertEqual(issue_command.call_args[0][0], ['echo', 'hi'])
+
+  def testBlockingTask(self):
+    task = command_tasks.BlockingTask(lambda a, b=0: a + b, 1, b=2)
+    self.assertEqual(command_tasks.RunSync(task), 3)
+
+
+class RunMultiplexedTestCase(unittest.TestCase):
+
+  def setUp(self):
+    self.mocked_flags = mock_flags.PatchTestCaseFlags(self)
+    self.mocked_flags.command_task_executor = command_tasks.MULTIPLEXED
+
+  def testResultsInOrder(self):
+    params = [((0.2, 'a'), {}), ((0, 'b'), {}), ((0.1, 'c'), {})]
+    self.assertEqual(command_tasks.RunMultiplexed(_SleepAndEcho, params),
+                     ['a', 'b', 'c'])
+
+  def testSingleThread(self):
+    thread_count = threading.active_count()
+    observed = []
+
+    def _CountThreads(_):
+      observed.append(threading.active_count())
+      yield command_tasks.Command(['sleep', '0.1'])
+      observed.append(threading.active_count())
+
+    command_tasks.RunMultiplexed(_CountThreads, range(10))
+    self.assertEqual(set(observed), set([thread_count]))
+
+  def testCommandsRunConcurrently(self):
+    start_time = time.time()
+    command_tasks.RunMultiplexed(_SleepAndEcho,
+                                 [((1, str(i)), {}) for i in range(20)])
+    self.assertLess(time.time() - start_time, 5)
+
+  def testMaxConcurrency(self):
+    running = [0]
+    max_running = [0]
+
+    def _Track(_):
+      running[0] += 1
+      max_running[0] = max(max_running[0], running[0])
+      yield command_tasks.Command(['true'])
+      running[0] -= 1
+
+    command_tasks.RunMultiplexed(_Track, range(10), max_concurrent_tasks=3)
+    self.assertEqual(max_running[0], 3)
+
+  def testExceptionsAreAggregated(self):
+    with self.assertRaises(errors.VmUtil.ThreadException) as cm:
+      command_tasks.RunMultiplexed(lambda _: _Fail(), range(2))
+    self.assertEqual(str(cm.exception).count('ValueError: retcode 1'), 2)
+
+  def testPlainFunctionTarget(self):
+    self.assertEqual(command_tasks.RunMultiplexed(lambda x: x * 2, [1, 2]),
+                     [2, 4])
+
+  def testInvalidYield(self):
+    def _YieldString():
+      yield 'echo'
+
+    with self.assertRaises(errors.VmUtil.ThreadException) as cm:
+      command_tasks.RunMultiplexed(lambda _: _YieldString(), [None])
+    self.assertIn('TypeError', str(cm.exception))
+
+  def testLogContextAndBenchmarkSpec(self):
+    spec = object()
+    context.SetThreadBenchmarkSpec(spec)
+    self.addCleanup(context.SetThreadBenchmarkSpec, None)
+    specs = []
+
+    def _Task(label):
+      specs.append(context.GetThreadBenchmarkSpec())
+      result = yield _LabelAndGetLabel(label)
+      raise command_tasks.Return(result)
+
+    labels = command_tasks.RunMultiplexed(_Task, ['a', 'b'])
+    self.assertEqual(labels, ['a ', 'b '])
+    self.assertEqual(specs, [spec, spec])
+    self.assertEqual(log_util.GetThreadLogContext().label, '')
+
+  def testLockSerializesCommands(self):
+    lock = threading.Lock()
+
+    def _Locked(_):
+      start_time = time.time()
+      yield command_tasks.Command(['sleep', '0.3'], lock=lock)
+      raise command_tasks.Return(start_time)
+
+    start_time = time.time()
+    command_tasks.RunMultiplexed(_Locked, range(3))
+    self.assertGreaterEqual(time.time() - start_time, 0.9)
+    self.assertFalse(lock.locked())
+
+  def testKeyboardInterruptKillsCommands(self):
+    patch_kill_all = mock.patch.object(
+        vm_util.CommandGroup, 'KillAll', autospec=True,
+        side_effect=vm_util.CommandGroup.KillAll)
+    with mock.patch.object(vm_util.CommandGroup, 'Wait',
+                           side_effect=KeyboardInterrupt):
+      with patch_kill_all as kill_all:
+        with self.assertRaises(KeyboardInterrupt):
+          command_tasks.RunMultiplexed(_SleepAndEcho, [((10, 'a'), {})])
+    self.assertEqual(kill_all.call_count, 1)
+
+  def testThreadsExecutor(self):
+    self.mocked_flags.command_task_executor = command_tasks.THREADS
+    with mock.patch(vm_util.__name__ + '.CommandGroup') as command_group:
+      self.assertEqual(command_tasks.RunMultiplexed(_Echo, ['a', 'b']),
+                       ['a', 'b'])
+    self.assertFalse(command_group.called)
+
+
+class CommandGroupTestCase(unittest.TestCase):
+
+  def testTimeout(self):
+    results = []
+    group = vm_util.CommandGroup()
+    group.Start(['sleep', '10'], lambda *r: results.append(r), timeout=0.1)
+    group.Start(['echo', 'hi'], lambda *r: results.append(r), timeout=10)
+    while group:
+      group.Wait()
+    self.assertEqual(results, [('hi\n', '', 0), ('', '', -9)])
+
+  def testKillAll(self):
+    group = vm_util.CommandGroup()
+    group.Start(['sleep', '10'], lambda *r: self.fail('Unexpected callback.'))
+    group.KillAll()
+    self.assertEqual(len(group), 0)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -15,6 +15,7 @@
 """Tests for perfkitbenchmarker.providers.gcp.gce_virtual_machine"""
 
 import contextlib
+import json
 import mock
 import re
 import unittest
@@ -277,6 +278,24 @@ class GCEVMFlagsTestCase(unittest.TestCase):
       self.assertIn('--image-project bar',
                     ' '.join(issue_command.call_args[0][0]))
 
+  def testPreparedImage(self):
+    with self._PatchCriticalObjects() as issue_command:
+      issue_command.return_value = '', '', 0
+      vm_spec = gce_virtual_machine.GceVmSpec(
+          'test_vm_spec.GCP', self._mocked_flags, image='image',
+          machine_type='test_machine_type', project='p', zone='z')
+      vm = gce_virtual_machine.GceVirtualMachine(vm_spec)
+      self.assertEqual('prepared', vm.CreateImage('prepared'))
+      command = ' '.join(issue_command.call_args[0][0])
+      self.assertIn('compute images create prepared', command)
+      self.assertIn('--source-disk-zone z', command)
+      self.assertNotIn('--zone', command)
+      vm.UseImage('prepared')
+      vm._Create()
+      command = ' '.join(issue_command.call_args[0][0])
+      self.assertIn('--image prepared', command)
+      self.assertIn('--image-project p', command)
+
   def testGcpInstanceMetadataFlag(self):
     with self._PatchCriticalObjects() as issue_command:
       self._mocked_flags.gcp_instance_metadata = ['k1:v1', 'k2:v2,k3:v3']
@@ -312,6 +331,25 @@ class GCEVMFlagsTestCase(unittest.TestCase):
       self.assertIn('k2=p2', actual_metadata_from_file)
       self.assertIn('k3=p3', actual_metadata_from_file)
 
+  def testExistsListsInstancesInZone(self):
+    gce_virtual_machine._INSTANCE_POLLER.Reset()
+    self.addCleanup(gce_virtual_machine._INSTANCE_POLLER.Reset)
+    with self._PatchCriticalObjects(), mock.patch(
+            vm_util.__name__ + '.IssueRetryableCommand') as issue_command:
+      vm_spec = gce_virtual_machine.GceVmSpec(
+          'test_vm_spec.GCP', self._mocked_flags, image='image',
+          machine_type='test_machine_type', project='p', zone='z')
+      vm = gce_virtual_machine.GceVirtualMachine(vm_spec)
+      issue_command.return_value = (
+          json.dumps([{'name': vm.name}, {'name': 'other'}]), '')
+      self.assertTrue(vm._Exists())
+      issue_command.return_value = ('[]', '')
+      self.assertFalse(vm._Exists())
+      command = ' '.join(issue_command.call_args[0][0])
+      self.assertIn('compute instances list', command)
+      self.assertIn('--zones z', command)
+      self.assertIn('--project p', command)
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -14,6 +14,8 @@
 
 """Tests for fio_benchmark."""
 
+import os
+import posixpath
 import unittest
 
 import mock
@@ -153,8 +155,11 @@ blocksize = 8k
             mock.patch('__builtin__.open'), \
             mock.patch(vm_util.__name__ + '.GetTempDir'), \
             mock.patch(fio_benchmark.__name__ + '.fio.ParseResults'), \
+            mock.patch(fio_benchmark.__name__ + '.fio.ReduceLogs'), \
             mock.patch(fio_benchmark.__name__ + '.FLAGS') as fio_FLAGS:
       fio_FLAGS.fio_target_mode = mode
+      fio_FLAGS.fio_status_interval = 0
+      fio_FLAGS.fio_all_disks = False
       benchmark_spec = mock.MagicMock()
       benchmark_spec.vms = [mock.MagicMock()]
       benchmark_spec.vms[0].RobustRemoteCommand = (
@@ -204,5 +209,165 @@ blocksize = 8k
                           expect_format_disk=False)
 
 
+class TestRunWithStatusInterval(unittest.TestCase):
+
+  def testIntervalSamples(self):
+    report = ('{"jobs": [{"jobname": "job", "read": {"io_bytes": 10, '
+              '"runtime": 1000, "total_ios": 5, "iops": 5, '
+              '"clat": {"percentile": {}}}}]}')
+
+    def RobustRemoteCommand(command, stdout_callback):
+      for i in xrange(0, len(report), 10):
+        stdout_callback(report[i:i + 10])
+      return report, ''
+
+    with mock.patch(fio_benchmark.__name__ + '.GetOrGenerateJobFileString',
+                    return_value='[job]\n'), \
+            mock.patch('__builtin__.open'), \
+            mock.patch(vm_util.__name__ + '.GetTempDir'), \
+            mock.patch(fio_benchmark.__name__ + '.fio.ParseResults',
+                       return_value=[]) as parse_results, \
+            mock.patch(fio_benchmark.__name__ + '.FLAGS') as fio_flags:
+      fio_flags.fio_target_mode = 'against_device_without_fill'
+      fio_flags.fio_status_interval = 5
+      fio_flags.fio_all_disks = False
+      fio_flags.fio_lat_log = fio_flags.fio_bw_log = False
+      fio_flags.fio_iops_log = False
+      benchmark_spec = mock.MagicMock()
+      vm = benchmark_spec.vms[0]
+      vm.RobustRemoteCommand.side_effect = RobustRemoteCommand
+      samples = fio_benchmark.Run(benchmark_spec)
+
+    command = vm.RobustRemoteCommand.call_args[0][0]
+    self.assertTrue(command.endswith(' --status-interval=5'))
+    self.assertEqual('job', parse_results.call_args[0][1]['jobs'][0]['jobname'])
+    self.assertEqual(['job:read:interval:bandwidth', 'job:read:interval:iops'],
+                     [s.metric for s in samples])
+
+
+class TestRunWithLogs(unittest.TestCase):
+
+  def _Run(self, archive_logs):
+    with mock.patch(fio_benchmark.__name__ + '.GetOrGenerateJobFileString',
+                    return_value='[job]\n'), \
+            mock.patch('__builtin__.open'), \
+            mock.patch(vm_util.__name__ + '.GetTempDir',
+                       return_value='/tmp/pkb'), \
+            mock.patch(fio_benchmark.__name__ + '.fio.ParseResults',
+                       return_value=[]), \
+            mock.patch(fio_benchmark.__name__ + '.fio.ReduceLogs',
+                       return_value=['log sample']) as reduce_logs, \
+            mock.patch(fio_benchmark.__name__ + '.FLAGS') as fio_flags:
+      fio_flags.fio_target_mode = 'against_device_without_fill'
+      fio_flags.fio_status_interval = 0
+      fio_flags.fio_all_disks = False
+      fio_flags.fio_lat_log = True
+      fio_flags.fio_bw_log = fio_flags.fio_iops_log = False
+      fio_flags.fio_log_avg_msec = 1000
+      fio_flags.fio_log_window_sec = 10
+      fio_flags.fio_archive_logs = archive_logs
+      benchmark_spec = mock.MagicMock()
+      vm = benchmark_spec.vms[0]
+      vm.RobustRemoteCommand.return_value = ('{}', '')
+      samples = fio_benchmark.Run(benchmark_spec)
+    self.assertEqual(['log sample'], samples)
+    log_file_base = reduce_logs.call_args[0][3]
+    self.assertIn('--write_lat_log=%s ' % log_file_base,
+                  vm.RobustRemoteCommand.call_args[0][0])
+    reduce_logs.assert_called_once_with(
+        vm, '[job]\n', fio_benchmark.REMOTE_JOB_FILE_PATH, log_file_base, 10,
+        base_metadata=None)
+    vm.RemoteCommand.assert_called_with('rm -f %s_*.log' % log_file_base)
+    return vm, log_file_base
+
+  def testLogsAreReduced(self):
+    vm, _ = self._Run(archive_logs=False)
+    self.assertFalse(vm.PullFiles.called)
+
+  def testArchiveLogs(self):
+    vm, log_file_base = self._Run(archive_logs=True)
+    vm.PullFiles.assert_called_once_with(
+        '/tmp/pkb', ['%s_*.log' % log_file_base], compress=True)
+
+
+class TestAllDisks(unittest.TestCase):
+
+  def setUp(self):
+    data_dir = os.path.join(os.path.dirname(__file__), '..', 'data')
+    with open(os.path.join(data_dir, 'fio-parser-sample-result.json')) as fp:
+      result = fp.read()
+    with open(os.path.join(data_dir, 'fio.job')) as fp:
+      self.job_file = fp.read()
+    self.vms = []
+    for vm_index in range(2):
+      vm = mock.MagicMock()
+      vm.name = 'vm%d' % vm_index
+      vm.scratch_disks = []
+      for disk_index in range(2):
+        disk = mock.MagicMock()
+        disk.GetDevicePath.return_value = '/dev/sd%s' % 'bc'[disk_index]
+        vm.scratch_disks.append(disk)
+      vm.RobustRemoteCommand.return_value = (result, '')
+      # Mocks create their children on first access, which isn't thread safe,
+      # so the methods that the fio threads call are created up front.
+      vm.PushFile = mock.MagicMock()
+      vm.RemoteCommand = mock.MagicMock()
+      self.vms.append(vm)
+    self.benchmark_spec = mock.MagicMock(vms=self.vms)
+    p = mock.patch(fio_benchmark.__name__ + '.FLAGS')
+    self.flags = p.start()
+    self.addCleanup(p.stop)
+    self.flags.fio_all_disks = True
+    self.flags.fio_target_mode = 'against_device_with_fill'
+    self.flags.fio_fill_size = '100%'
+    self.flags.fio_status_interval = 0
+    self.flags.fio_lat_log = self.flags.fio_bw_log = False
+    self.flags.fio_iops_log = False
+    self.flags.fio_start_delay_sec = 5
+
+  def testPrepareFillsAllDisks(self):
+    with mock.patch(fio_benchmark.__name__ + '.FillDevice') as fill_device:
+      fio_benchmark.Prepare(self.benchmark_spec)
+    self.assertItemsEqual(
+        [mock.call(vm, disk, '100%')
+         for vm in self.vms for disk in vm.scratch_disks],
+        fill_device.call_args_list)
+    for vm in self.vms:
+      vm.Install.assert_called_once_with('fio')
+
+  def testRun(self):
+    with mock.patch(fio_benchmark.__name__ + '.GetOrGenerateJobFileString',
+                    return_value=self.job_file), \
+            mock.patch('__builtin__.open'), \
+            mock.patch(vm_util.__name__ + '.GetTempDir'), \
+            mock.patch(fio_benchmark.__name__ + '.time') as time_mock:
+      time_mock.time.return_value = 100.0
+      samples = fio_benchmark.Run(self.benchmark_spec)
+
+    for vm in self.vms:
+      self.assertItemsEqual(
+          [fio_benchmark.REMOTE_JOB_FILE_PATH,
+           posixpath.join(vm_util.VM_TMP_DIR, 'fio-1.job')],
+          [c[0][1] for c in vm.PushFile.call_args_list])
+      for c in vm.RobustRemoteCommand.call_args_list:
+        self.assertTrue(c[0][0].startswith(
+            'sleep $((105 - $(date +%s))) 2>/dev/null; sudo '))
+    bandwidth = [s for s in samples
+                 if s.metric == 'sequential_read:read:bandwidth']
+    self.assertEqual(
+        [('vm0', '/dev/sdb'), ('vm0', '/dev/sdc'), ('vm1', '/dev/sdb'),
+         ('vm1', '/dev/sdc')],
+        [(s.metadata['fio_vm'], s.metadata['fio_disk']) for s in bandwidth])
+    aggregate = {s.metric: s for s in samples if ':aggregate:' in s.metric}
+    self.assertEqual(
+        4 * 129836, aggregate['sequential_read:read:aggregate:bandwidth'].value)
+    self.assertEqual(4 * 253,
+                     aggregate['sequential_read:read:aggregate:iops'].value)
+    self.assertEqual(4, aggregate[
+        'sequential_read:read:aggregate:bandwidth'].metadata['fio_disks'])
+    self.assertIn('sketch', aggregate[
+        'sequential_read:read:aggregate:latency'].metadata)
+
+
 if __name__ == '__main__':
   unittest.main()
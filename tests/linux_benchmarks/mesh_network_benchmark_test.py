@@ -0,0 +1,158 @@
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for mesh_network_benchmark."""
+
+import itertools
+import json
+import re
+import threading
+import unittest
+
+import mock
+
+from perfkitbenchmarker import errors
+from perfkitbenchmarker.linux_benchmarks import mesh_network_benchmark
+from tests import mock_flags
+
+
+class RoundRobinRoundsTestCase(unittest.TestCase):
+
+  def _CheckRounds(self, num_vms, expected_num_rounds):
+    rounds = mesh_network_benchmark.GetRoundRobinRounds(num_vms)
+    self.assertEqual(expected_num_rounds, len(rounds))
+    for pairs in rounds:
+      vms = [vm for pair in pairs for vm in pair]
+      self.assertEqual(len(set(vms)), len(vms))
+    self.assertItemsEqual(itertools.combinations(range(num_vms), 2),
+                          [pair for pairs in rounds for pair in pairs])
+
+  def testEven(self):
+    self._CheckRounds(2, 1)
+    self._CheckRounds(8, 7)
+    self._CheckRounds(64, 63)
+
+  def testOdd(self):
+    self._CheckRounds(3, 3)
+    self._CheckRounds(9, 9)
+
+
+class MeshNetworkBenchmarkTestCase(unittest.TestCase):
+
+  def setUp(self):
+    self.mocked_flags = mock_flags.PatchTestCaseFlags(self)
+    self.mocked_flags.num_connections = 2
+    self.mocked_flags.num_iterations = 1
+    self.mocked_flags.duration_in_seconds = 10
+    self.mocked_flags.mesh_network_schedule = 'concurrent'
+    self.mocked_flags.mesh_network_concurrency = 0
+    self.lock = threading.Lock()
+    self.running = set()
+    self.max_running = 0
+    self.vms = [self._CreateVm(i) for i in range(4)]
+    self.spec = mock.MagicMock(vms=self.vms)
+
+  def _CreateVm(self, index):
+    vm = mock.MagicMock(internal_ip='10.0.0.%d' % index)
+    vm.name = 'vm%d' % index
+
+    def RemoteCommand(cmd):
+      # Each connection from vm i to vm j reports 100 * i + j transactions or
+      # Mbits per second, except from vm0 to vm3, which reports 1.
+      connections = [(int(server), prefix) for server, prefix in re.findall(
+          r'-H 10\.0\.0\.(\d+) .*? sed "s/\^/(\d+) /"', cmd)]
+      pairs = set((index, server) for server, _ in connections)
+      with self.lock:
+        self.running.update(pairs)
+        self.max_running = max(self.max_running, len(self.running))
+      lines = []
+      for server, prefix in connections:
+        value = 1 if (index, server) == (0, 3) else 100 * index + server
+        lines.append('%s Throughput' % prefix)
+        lines.append('%s %d.00' % (prefix, value))
+      with self.lock:
+        self.running.difference_update(pairs)
+      return '\n'.join(lines) + '\n', ''
+    vm.RemoteCommand.side_effect = RemoteCommand
+    return vm
+
+  def _GetSamples(self, results, metric):
+    return [s for s in results if s.metric == metric]
+
+  def testConcurrent(self):
+    results = mesh_network_benchmark.Run(self.spec)
+    commands = [call[0][0] for vm in self.vms
+                for call in vm.RemoteCommand.call_args_list]
+    # One command per client and benchmark, with a netperf per connection.
+    self.assertEqual(8, len(commands))
+    self.assertEqual(6, commands[0].count('./netperf'))
+
+    total, = self._GetSamples(results, 'TCP_STREAM_Total_Throughput')
+    self.assertEqual(2 * (sum(100 * i + j for i in range(4) for j in range(4)
+                              if i != j) - 3 + 1), total.value)
+    self.assertEqual(4, total.metadata['number_machines'])
+    self.assertEqual(1, total.metadata['number_rounds'])
+    self.assertEqual(12, total.metadata['max_concurrent_pairs'])
+
+    matrix, = self._GetSamples(results, 'TCP_STREAM_Throughput_Matrix')
+    self.assertEqual([[None, 2, 4, 2], [200, None, 204, 206],
+                      [400, 402, None, 406], [600, 602, 604, None]],
+                     json.loads(matrix.metadata['matrix']))
+    self.assertEqual(['vm0', 'vm1', 'vm2', 'vm3'],
+                     json.loads(matrix.metadata['vms']))
+    slowest, = self._GetSamples(results, 'TCP_STREAM_Throughput_Slowest_Pair')
+    self.assertEqual((2, 'vm0', 'vm1'),
+                     (slowest.value, slowest.metadata['sending_vm'],
+                      slowest.metadata['receiving_vm']))
+    p50, = self._GetSamples(results, 'TCP_STREAM_Throughput_p50')
+    self.assertEqual(400, p50.value)
+
+    # TCP_RR latencies are the inverse of the transaction rates.
+    slowest, = self._GetSamples(results, 'TCP_RR_Latency_Slowest_Pair')
+    self.assertEqual((1000.0, 'vm0', 'vm3'),
+                     (slowest.value, slowest.metadata['sending_vm'],
+                      slowest.metadata['receiving_vm']))
+    matrix, = self._GetSamples(results, 'TCP_RR_Latency_Matrix')
+    self.assertEqual(1000.0 / 302, json.loads(matrix.metadata['matrix'])[3][2])
+
+  def testConcurrencyLimit(self):
+    self.mocked_flags.mesh_network_concurrency = 5
+    results = mesh_network_benchmark.Run(self.spec)
+    self.assertLessEqual(self.max_running, 5)
+    total, = self._GetSamples(results, 'TCP_STREAM_Total_Throughput')
+    self.assertEqual(3, total.metadata['number_rounds'])
+
+  def testRoundRobin(self):
+    self.mocked_flags.mesh_network_schedule = 'round_robin'
+    results = mesh_network_benchmark.Run(self.spec)
+    # Each VM runs one netperf test per round and benchmark.
+    for vm in self.vms:
+      self.assertEqual(6, vm.RemoteCommand.call_count)
+      for call in vm.RemoteCommand.call_args_list:
+        self.assertEqual(1, len(set(re.findall(r'-H (\S+)', call[0][0]))))
+    matrix, = self._GetSamples(results, 'TCP_STREAM_Throughput_Matrix')
+    self.assertEqual([[None, 2, 4, 2], [200, None, 204, 206],
+                      [400, 402, None, 406], [600, 602, 604, None]],
+                     json.loads(matrix.metadata['matrix']))
+    self.assertEqual(3, matrix.metadata['number_rounds'])
+    self.assertEqual(4, matrix.metadata['max_concurrent_pairs'])
+
+  def testUnreachableServer(self):
+    self.vms[1].RemoteCommand.side_effect = None
+    self.vms[1].RemoteCommand.return_value = ('0 12.00\n', '')
+    with self.assertRaises(errors.VmUtil.ThreadException):
+      mesh_network_benchmark.Run(self.spec)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -21,7 +21,9 @@ import mock
 
 from perfkitbenchmarker import sample
 from perfkitbenchmarker import test_util
+from perfkitbenchmarker import vm_util
 from perfkitbenchmarker.linux_packages import fio
+from tests import mock_flags
 
 
 class FioTestCase(unittest.TestCase, test_util.SamplesTestMixin):
@@ -428,5 +430,176 @@ class FioTestCase(unittest.TestCase, test_util.SamplesTestMixin):
             'filename'))
 
 
+def _StatusReport(runtime, io_bytes, total_ios, p99):
+  return {'jobs': [{
+      'jobname': 'sequential_read',
+      'read': {'io_bytes': io_bytes, 'runtime': runtime, 'iops': 0,
+               'total_ios': total_ios,
+               'clat': {'percentile': {'50.000000': 10, '99.000000': p99}}},
+      'write': {'io_bytes': 0, 'runtime': 0}}]}
+
+
+class StatusParserTestCase(unittest.TestCase):
+
+  def setUp(self):
+    with mock.patch(fio.__name__ + '.ParseJobFile',
+                    return_value={'sequential_read': {'rw': 'read'}}):
+      self.parser = fio.StatusParser('', base_metadata={'foo': 'bar'})
+
+  def testIntervalSamples(self):
+    output = 'fio: some warning\n' + '\n'.join(
+        json.dumps(_StatusReport(*report))
+        for report in ((1000, 1000, 250, 50), (3000, 5000, 1250, 70)))
+    # fio's output arrives in arbitrary chunks.
+    for i in xrange(0, len(output), 7):
+      self.parser.Feed(output[i:i + 7])
+
+    self.assertEqual(3000,
+                     self.parser.last_result['jobs'][0]['read']['runtime'])
+    values = [(s.metric, s.value, s.metadata['interval_start'],
+               s.metadata['interval_end']) for s in self.parser.samples]
+    self.assertEqual([
+        ('sequential_read:read:interval:bandwidth', 1000.0, 0, 1.0),
+        ('sequential_read:read:interval:iops', 250.0, 0, 1.0),
+        ('sequential_read:read:interval:latency:p50', 10, 0, 1.0),
+        ('sequential_read:read:interval:latency:p99', 50, 0, 1.0),
+        ('sequential_read:read:interval:bandwidth', 2000.0, 1.0, 3.0),
+        ('sequential_read:read:interval:iops', 500.0, 1.0, 3.0),
+        ('sequential_read:read:interval:latency:p50', 10, 1.0, 3.0),
+        ('sequential_read:read:interval:latency:p99', 70, 1.0, 3.0)],
+        values)
+    self.assertDictContainsSubset(
+        {'foo': 'bar', 'rw': 'read', 'fio_job': 'sequential_read'},
+        self.parser.samples[0].metadata)
+
+  def testRepeatedReportIsSkipped(self):
+    report = json.dumps(_StatusReport(1000, 1000, 250, 50))
+    self.parser.Feed(report + report)
+    self.assertEqual(4, len(self.parser.samples))
+
+  def testIopsWithoutTotalIos(self):
+    # Older versions of fio only report the mean IOPS since the job started.
+    for runtime, iops in (2000, 100), (4000, 150):
+      report = _StatusReport(runtime, 1000, None, 50)
+      del report['jobs'][0]['read']['total_ios']
+      report['jobs'][0]['read']['iops'] = iops
+      self.parser.Feed(json.dumps(report))
+    self.assertEqual(
+        [100.0, 200.0],
+        [s.value for s in self.parser.samples
+         if s.metric == 'sequential_read:read:interval:iops'])
+
+
+class AggregateResultsTestCase(unittest.TestCase):
+
+  def _Stats(self, bw, p50, p99, maximum):
+    return {'io_bytes': 10, 'bw': bw, 'iops': 100, 'runtime': 1000,
+            'total_ios': 100,
+            'clat': {'max': maximum, 'percentile': {'50.000000': p50,
+                                                    '99.000000': p99}}}
+
+  def testGetLatencySketch(self):
+    sketch = fio.GetLatencySketch(self._Stats(1, 10, 20, 100))
+    self.assertEqual(100, sketch.count)
+    self.assertEqual(100, sketch.max)
+    percentiles = sketch.GetPercentiles([25, 75, 99.5])
+    self.assertAlmostEqual(10, percentiles['p25'], delta=0.1)
+    self.assertAlmostEqual(20, percentiles['p75'], delta=0.2)
+    self.assertEqual(100, percentiles['p99.5'])
+
+  def testGetLatencySketchFromBins(self):
+    stats = self._Stats(1, 10, 20, 100)
+    stats['clat']['bins'] = {'5': 3, '7': 1}
+    sketch = fio.GetLatencySketch(stats)
+    self.assertEqual(4, sketch.count)
+    self.assertEqual(7, sketch.max)
+
+  def testAggregateResults(self):
+    results = [
+        {'jobs': [{'jobname': 'seq', 'read': self._Stats(100, 10, 20, 30),
+                   'write': {'io_bytes': 0}, 'trim': {'io_bytes': 0}}]},
+        {'jobs': [{'jobname': 'seq', 'read': self._Stats(300, 50, 60, 70),
+                   'write': {'io_bytes': 0}, 'trim': {'io_bytes': 0}}]}]
+    samples = fio.AggregateResults('[seq]\nrw=read\n', results,
+                                   base_metadata={'foo': 'bar'})
+    by_metric = {s.metric: s for s in samples}
+    self.assertEqual(
+        ['seq:read:aggregate:bandwidth', 'seq:read:aggregate:iops',
+         'seq:read:aggregate:latency', 'seq:read:aggregate:latency:p50',
+         'seq:read:aggregate:latency:p90', 'seq:read:aggregate:latency:p99',
+         'seq:read:aggregate:latency:p99.9'], [s.metric for s in samples])
+    self.assertEqual(400, by_metric['seq:read:aggregate:bandwidth'].value)
+    self.assertEqual(200, by_metric['seq:read:aggregate:iops'].value)
+    # The IOs of the first disk are all faster than those of the second.
+    self.assertAlmostEqual(
+        50, by_metric['seq:read:aggregate:latency:p50'].value, delta=0.5)
+    self.assertEqual(70, by_metric['seq:read:aggregate:latency:p99.9'].value)
+    self.assertDictContainsSubset(
+        {'foo': 'bar', 'rw': 'read', 'fio_job': 'seq', 'fio_disks': 2},
+        by_metric['seq:read:aggregate:iops'].metadata)
+
+
+class ReducedLogsTestCase(unittest.TestCase):
+
+  def setUp(self):
+    stats = {'p50': 20, 'p90': 30, 'p99': 40, 'p99.9': 40, 'average': 25,
+             'stddev': 5}
+    self.reduced_logs = {
+        'latency': [{'log': 'clat', 'job': 'seq', 'direction': 'read',
+                     'histogram': {'10': 1, '40': 2}, 'stats': stats,
+                     'windows': [{'start': 0, 'end': 10, 'stats': stats}]}],
+        'throughput': [{'log': 'bw', 'job': 'seq', 'direction': 'read',
+                        'windows': [{'start': 0, 'end': 10, 'value': 100.0},
+                                    {'start': 10, 'end': 20, 'value': 300.0}]}]}
+
+  def testParseReducedLogs(self):
+    samples = fio.ParseReducedLogs('[seq]\nrw=read\n', self.reduced_logs,
+                                   base_metadata={'foo': 'bar'})
+    values = [(s.metric, s.value, s.unit, s.metadata.get('interval_start'))
+              for s in samples]
+    self.assertEqual([
+        ('seq:read:clat_log:histogram', 0, 'usec', None),
+        ('seq:read:clat_log:p50', 20, 'usec', None),
+        ('seq:read:clat_log:p90', 30, 'usec', None),
+        ('seq:read:clat_log:p99', 40, 'usec', None),
+        ('seq:read:clat_log:p99.9', 40, 'usec', None),
+        ('seq:read:clat_log:average', 25, 'usec', None),
+        ('seq:read:clat_log:stddev', 5, 'usec', None),
+        ('seq:read:clat_log:window:p50', 20, 'usec', 0),
+        ('seq:read:clat_log:window:p90', 30, 'usec', 0),
+        ('seq:read:clat_log:window:p99', 40, 'usec', 0),
+        ('seq:read:clat_log:window:p99.9', 40, 'usec', 0),
+        ('seq:read:clat_log:window:average', 25, 'usec', 0),
+        ('seq:read:clat_log:window:stddev', 5, 'usec', 0),
+        ('seq:read:bw_log:mean', 200.0, 'KB/s', None),
+        ('seq:read:bw_log:min', 100.0, 'KB/s', None),
+        ('seq:read:bw_log:max', 300.0, 'KB/s', None),
+        ('seq:read:bw_log:window', 100.0, 'KB/s', 0),
+        ('seq:read:bw_log:window', 300.0, 'KB/s', 10)], values)
+    self.assertEqual({10: 1, 40: 2},
+                     {int(value): count for value, count in json.loads(
+                         samples[0].metadata['histogram']).iteritems()})
+    self.assertDictContainsSubset(
+        {'foo': 'bar', 'rw': 'read', 'fio_job': 'seq', 'fio_log': 'clat'},
+        samples[1].metadata)
+
+  def testReduceLogs(self):
+    mocked_flags = mock_flags.PatchTestCaseFlags(self)
+    mocked_flags.data_search_paths = []
+    vm = mock.Mock()
+    vm.RemoteCommand.side_effect = [('', ''),
+                                    (json.dumps(self.reduced_logs), '')]
+    samples = fio.ReduceLogs(vm, '[seq]\n', '/tmp/fio.job', 'pkb_fio_avg_1',
+                             10)
+    self.assertEqual(18, len(samples))
+    pushed = [remote for _, remote in vm.PushFiles.call_args[0][0]]
+    self.assertEqual([vm_util.VM_TMP_DIR + '/fio_reduce_logs.py',
+                      vm_util.VM_TMP_DIR + '/stats_util.py'], pushed)
+    self.assertEqual(
+        'python %s/fio_reduce_logs.py --window_sec 10 --percentiles '
+        '50,90,99,99.9 --job_file /tmp/fio.job pkb_fio_avg_1_*.log' %
+        vm_util.VM_TMP_DIR, vm.RemoteCommand.call_args[0][0])
+
+
 if __name__ == '__main__':
   unittest.main()
@@ -14,11 +14,14 @@
 """Tests for perfkitbenchmarker.packages.ycsb"""
 
 import copy
+import io
 import os
 import unittest
 
+import mock
 
 from perfkitbenchmarker.linux_packages import ycsb
+from tests import mock_flags
 
 
 class SimpleResultParserTestCase(unittest.TestCase):
@@ -84,6 +87,64 @@ class SimpleResultParserTestCase(unittest.TestCase):
         },
         self.results['groups']['overall'])
 
+  def testParseFromFile(self):
+    self.assertEqual(self.results,
+                     ycsb.ParseResults(io.BytesIO(self.contents)))
+
+  def testNoResults(self):
+    with self.assertRaises(IOError):
+      ycsb.ParseResults('Error: could not connect\n')
+
+  def testParseInChunks(self):
+    parser = ycsb.ResultParser()
+    for i in xrange(0, len(self.contents), 7):
+      parser.Feed(self.contents[i:i + 7])
+    self.assertEqual(self.results, parser.Finish())
+
+  def testHeaderFromStderr(self):
+    header, _, stdout = self.contents.partition('[OVERALL]')
+    parser = ycsb.ResultParser()
+    parser.Feed('[OVERALL]' + stdout)
+    self.assertEqual(self.results, parser.Finish(stderr=header))
+
+  def testParserWithoutResults(self):
+    parser = ycsb.ResultParser()
+    parser.Feed('Error: could not connect\n')
+    with self.assertRaises(IOError):
+      parser.Finish(stderr='Loading workload...\n')
+
+
+class ResultLineParserTestCase(unittest.TestCase):
+
+  def testSkipsUnrelatedLines(self):
+    contents = '\n'.join([
+        'Loading workload...',
+        '[OVERALL], RunTime(ms), 80.0',
+        '2016-01-01 00:00:00 [INFO] connected, 1 host, 2 racks',
+        '[READ], Operations, 3',
+        '[READ], AverageLatency(us), 1500',
+        '[READ],0, 2 ',
+        '[READ], 1, 0',
+        '[READ], >1000, 1\r',
+        '[CLEANUP], Operations, 1',
+        '[CLEANUP], 0, 1',
+        ''])
+    results = ycsb.ParseResults(contents)
+    self.assertEqual(['overall', 'read'], list(results['groups']))
+    self.assertEqual(
+        {'group': 'read',
+         'statistics': {'Operations': 3, 'AverageLatency(ms)': 1.5},
+         'histogram': [(0, 2), (1000, 1)]},
+        results['groups']['read'])
+
+  def testTimeseries(self):
+    results = ycsb.ParseResults(
+        '[OVERALL], RunTime(ms), 80.0\n'
+        '[READ], 0, 1.25\n'
+        '[READ], 10, 0.0\n'
+        '[READ], 20, 3\n', 'timeseries')
+    self.assertEqual([(0, 1.25), (20, 3)],
+                     results['groups']['read']['timeseries'])
 
 
 class DetailedResultParserTestCase(unittest.TestCase):
@@ -107,6 +168,61 @@ class DetailedResultParserTestCase(unittest.TestCase):
     self.assertEqual(1, percentiles['p50'])
     self.assertEqual(7, percentiles['p99'])
 
+  def testParseOutputToArrays(self):
+    result = ycsb._ParseOutputToArrays(self.contents)
+    expected = ycsb._ParseOutput(self.contents)
+    for group_name, group in result['groups'].iteritems():
+      self.assertIsInstance(group['histogram'][0], str)
+      self.assertEqual(expected['groups'][group_name]['histogram'],
+                       ycsb._HistogramFromArrays(*group['histogram']))
+
+
+class ParallelParsingTestCase(unittest.TestCase):
+
+  def setUp(self):
+    path = os.path.join(os.path.dirname(__file__), '..', 'data',
+                        'ycsb-test-run-2.dat')
+    with open(path) as fp:
+      self.contents = fp.read()
+    self.flags = mock_flags.PatchTestCaseFlags(self)
+    self.flags.ycsb_run_parameters = []
+    self.vms = [mock.Mock(), mock.Mock()]
+    for vm in self.vms:
+      vm.RobustRemoteCommand.side_effect = self._RobustRemoteCommand
+    p = mock.patch.object(ycsb.vm_util, 'RunParallelProcesses', side_effect=(
+        lambda calls, _: [f(*args, **kwargs) for f, args, kwargs in calls]))
+    self.run_parallel_processes = p.start()
+    self.addCleanup(p.stop)
+
+  def _RobustRemoteCommand(self, command, stdout_callback=None):
+    if stdout_callback:
+      for line in io.BytesIO(self.contents):
+        stdout_callback(line)
+    return self.contents, ''
+
+  def assertResultsParsed(self, results):
+    expected = ycsb.ParseResults(self.contents)
+    self.assertEqual(2, len(results))
+    for result in results:
+      self.assertItemsEqual(expected['groups'], result['groups'])
+      for group_name, group in result['groups'].iteritems():
+        self.assertEqual(group['latency_sketch'].count,
+                         sum(count for _, count in group['histogram']))
+        del group['latency_sketch']
+        self.assertEqual(expected['groups'][group_name], group)
+
+  def testParseInThreads(self):
+    self.flags.ycsb_result_parse_processes = 1
+    results = ycsb.YCSBExecutor('basic')._RunThreaded(self.vms, threads=1)
+    self.assertFalse(self.run_parallel_processes.called)
+    self.assertResultsParsed(results)
+
+  def testParseInProcesses(self):
+    self.flags.ycsb_result_parse_processes = 2
+    results = ycsb.YCSBExecutor('basic')._RunThreaded(self.vms, threads=1)
+    self.run_parallel_processes.assert_called_once_with(mock.ANY, 2)
+    self.assertResultsParsed(results)
+
 
 class WeightedQuantileTestCase(unittest.TestCase):
 
@@ -233,3 +349,28 @@ class CombineResultsTestCase(unittest.TestCase):
     self.assertEqual(r, r_copy)
     r['groups']['read']['statistics'] = {}
     self.assertEqual(r, combined)
+
+  def testCombineHistogramsAndSketches(self):
+    results = []
+    for histogram in ([(0, 5), (3, 1)], [(1, 2), (3, 2)], [(0, 1)]):
+      results.append(ycsb._AddLatencySketches({
+          'client': '',
+          'command_line': '',
+          'groups': {
+              'read': {
+                  'group': 'read',
+                  'statistics': {},
+                  'histogram': histogram
+              }
+          }
+      }))
+    combined = ycsb._CombineResults(results)
+    read = combined['groups']['read']
+    self.assertEqual([(0, 6), (1, 2), (3, 3)], read['histogram'])
+    self.assertEqual(11, read['latency_sketch'].count)
+    self.assertEqual(6, results[0]['groups']['read']['latency_sketch'].count)
+    self.assertEqual({'p50': 0, 'p100': 3},
+                     read['latency_sketch'].GetPercentiles([50, 100]))
+    sketch_samples = [s for s in ycsb._CreateSamples(combined)
+                      if s.metric == 'read latency sketch']
+    self.assertEqual(1, len(sketch_samples))
@@ -0,0 +1,106 @@
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.linux_packages."""
+
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from perfkitbenchmarker import linux_packages
+from perfkitbenchmarker import vm_util
+from tests import mock_flags
+
+_URL = 'https://example.com/dist/foo-1.0.tar.gz'
+
+
+class ResolveDependenciesTestCase(unittest.TestCase):
+
+  def testDependenciesComeFirst(self):
+    self.assertEqual(
+        ['openjdk', 'curl', 'ycsb', 'wget'],
+        linux_packages.ResolveDependencies(['ycsb', 'curl', 'wget', 'ycsb']))
+
+  def testGetOsPackages(self):
+    self.assertEqual('libboost-all-dev',
+                     linux_packages.GetOsPackages('boost', 'Apt'))
+    self.assertIsNone(linux_packages.GetOsPackages('ycsb', 'Yum'))
+
+
+class ExtractTarballTestCase(unittest.TestCase):
+
+  def setUp(self):
+    self.mocked_flags = mock_flags.PatchTestCaseFlags(self)
+    self.cache_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.cache_dir)
+    self.vm = mock.Mock()
+
+  def testWithoutCache(self):
+    linux_packages.ExtractTarball(self.vm, _URL, '/opt/pkb/foo')
+    self.vm.RemoteCommand.assert_called_once_with(
+        'mkdir -p /opt/pkb/foo && curl -L {0} | '
+        'tar -C /opt/pkb/foo --strip-components=1 -xzf -'.format(_URL))
+    self.assertFalse(self.vm.RemoteCopy.called)
+
+  def testCacheDownloadsOnce(self):
+    self.mocked_flags.package_cache_dir = self.cache_dir
+
+    def Download(cmd):
+      with open(cmd[3], 'w') as fp:
+        fp.write('tarball')
+
+    with mock.patch.object(vm_util, 'IssueRetryableCommand',
+                           side_effect=Download) as download:
+      linux_packages.ExtractTarball(self.vm, _URL, '/opt/pkb/foo')
+      other_vm = mock.Mock()
+      linux_packages.ExtractTarball(other_vm, _URL, '/opt/pkb/foo')
+
+    self.assertEqual(1, download.call_count)
+    for vm in self.vm, other_vm:
+      local_path, remote_path = vm.RemoteCopy.call_args[0]
+      with open(local_path) as fp:
+        self.assertEqual('tarball', fp.read())
+      self.assertTrue(remote_path.endswith('/foo-1.0.tar.gz'))
+      self.assertEqual(
+          'mkdir -p /opt/pkb/foo && tar -C /opt/pkb/foo --strip-components=1 '
+          '-xzf {0}'.format(remote_path),
+          vm.RemoteCommand.call_args[0][0])
+
+  def testDownloadFileFromCache(self):
+    self.mocked_flags.package_cache_dir = self.cache_dir
+    with mock.patch.object(vm_util, 'IssueRetryableCommand',
+                           side_effect=lambda cmd: open(cmd[3], 'w').close()):
+      linux_packages.DownloadFile(self.vm, _URL, '/opt/pkb/lib')
+    _, remote_path = self.vm.RemoteCopy.call_args[0]
+    self.vm.RemoteCommand.assert_called_with(
+        'cp {0} /opt/pkb/lib'.format(remote_path))
+
+
+class GenerateInstallTimeSamplesTestCase(unittest.TestCase):
+
+  def testMaxAcrossVms(self):
+    vms = [mock.Mock(package_install_times={'ycsb': 10.0, 'curl': 1.0}),
+           mock.Mock(package_install_times={'ycsb': 20.0})]
+    samples = linux_packages.GenerateInstallTimeSamples(vms)
+    self.assertEqual(
+        [('Package install time', 1.0, 'seconds',
+          {'package': 'curl', 'num_vms': 1, 'mean_install_time': 1.0}),
+         ('Package install time', 20.0, 'seconds',
+          {'package': 'ycsb', 'num_vms': 2, 'mean_install_time': 15.0})],
+        [tuple(s)[:4] for s in samples])
+
+
+if __name__ == '__main__':
+  unittest.main()
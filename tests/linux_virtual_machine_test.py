@@ -18,7 +18,13 @@ import unittest
 
 import mock
 
+from perfkitbenchmarker import bulk_copy
+from perfkitbenchmarker import errors
+from perfkitbenchmarker import linux_packages
 from perfkitbenchmarker import linux_virtual_machine
+from perfkitbenchmarker import remote_agent
+from perfkitbenchmarker import vm_util
+from perfkitbenchmarker.linux_packages import ycsb
 from tests import mock_flags
 
 
@@ -100,5 +106,149 @@ class TestSysctl(unittest.TestCase):
         [])
 
 
+
+class DebianVM(linux_virtual_machine.DebianMixin):
+
+  install_packages = True
+
+  def Uninstall(self):
+    pass
+
+
+class TestInstallAll(unittest.TestCase):
+
+  def setUp(self):
+    self.vm = DebianVM()
+    for method in ('AptUpdate', 'InstallPackages', 'RemoteCommand'):
+      p = mock.patch.object(self.vm, method)
+      p.start()
+      self.addCleanup(p.stop)
+    p = mock.patch.object(linux_virtual_machine.time, 'time',
+                          side_effect=range(0, 100, 2))
+    p.start()
+    self.addCleanup(p.stop)
+
+  def testOsPackagesAreInstalledTogether(self):
+    self.vm.InstallAll(['wget', 'build_tools', 'numactl'])
+    self.vm.AptUpdate.assert_called_once_with()
+    self.vm.InstallPackages.assert_called_once_with(
+        'wget build-essential git libtool autoconf automake numactl')
+    self.assertEqual(
+        [linux_packages.BATCHED_OS_PACKAGES],
+        self.vm.package_install_times.keys())
+
+    self.vm.Install('wget')
+    self.vm.InstallPackages.assert_called_once_with(mock.ANY)
+
+  def testDependenciesAreInstalledFirst(self):
+    with mock.patch.object(linux_packages.PACKAGES['openjdk'],
+                           'AptInstall') as openjdk_install:
+      self.vm.InstallAll(['ycsb'])
+    self.vm.InstallPackages.assert_called_once_with('curl')
+    openjdk_install.assert_called_once_with(self.vm)
+    self.assertEqual(1, self.vm.RemoteCommand.call_count)
+    self.assertIn(ycsb.YCSB_TAR_URL, self.vm.RemoteCommand.call_args[0][0])
+    self.assertEqual([linux_packages.BATCHED_OS_PACKAGES, 'openjdk', 'ycsb'],
+                     self.vm.package_install_times.keys())
+
+  def testInstallBatchesDependencies(self):
+    with mock.patch.object(linux_packages.PACKAGES['openjdk'], 'AptInstall'):
+      self.vm.Install('ycsb')
+    self.vm.InstallPackages.assert_called_once_with('curl')
+    self.assertIn(linux_packages.BATCHED_OS_PACKAGES,
+                  self.vm.package_install_times)
+
+  def testInstallRecordsTime(self):
+    self.vm.Install('numactl')
+    self.vm.InstallPackages.assert_called_once_with('numactl')
+    self.assertEqual({'numactl': 2}, dict(self.vm.package_install_times))
+
+  def testInstallPackagesDisabled(self):
+    self.vm.install_packages = False
+    self.vm.InstallAll(['wget'])
+    self.assertFalse(self.vm.InstallPackages.called)
+
+
+class TestBulkCopy(unittest.TestCase):
+
+  def setUp(self):
+    self.mocked_flags = mock_flags.PatchTestCaseFlags(self)
+    self.vm = LinuxVM()
+    self.vm.user_name = 'perfkit'
+    self.vm.ip_address = '1.2.3.4'
+    self.vm.ssh_port = 22
+    self.vm.ssh_private_key = 'key'
+    p = mock.patch.object(vm_util, 'GetSshOptions', return_value=['-opt'])
+    p.start()
+    self.addCleanup(p.stop)
+
+  def testPushFiles(self):
+    with mock.patch.object(bulk_copy, 'SendTarball',
+                           return_value=('', 0)) as send:
+      self.vm.PushFiles([('/local/a.py', '/tmp/pkb/a.py'),
+                         ('/local/b.py', ''),
+                         ('/local/dir/', 'opt/')], compress=True)
+    send.assert_called_once_with(
+        ['ssh', '-A', '-p', '22', 'perfkit@1.2.3.4', '-opt',
+         'tar -xPzf -'],
+        [('/local/a.py', '/tmp/pkb/a.py'), ('/local/b.py', 'b.py'),
+         ('/local/dir/', 'opt/dir')], True)
+
+  def testPullFilesRetriesSshFailures(self):
+    with mock.patch.object(bulk_copy, 'ReceiveTarball',
+                           side_effect=[('', 255), ('', 0)]) as receive:
+      self.vm.PullFiles('/local', ['a_*.log', 'b'], remote_dir='/logs')
+    self.assertEqual(2, receive.call_count)
+    command, local_dir, compress = receive.call_args[0]
+    self.assertEqual(
+        'cd /logs && { tar -cf - a_*.log b; [ $? -le 1 ]; }', command[-1])
+    self.assertEqual(('/local', False), (local_dir, compress))
+
+  def testPullFilesFailure(self):
+    with mock.patch.object(bulk_copy, 'ReceiveTarball',
+                           return_value=('No such file', 2)):
+      with self.assertRaises(errors.VirtualMachine.RemoteCommandError):
+        self.vm.PullFiles('/local', ['missing'])
+
+
+class TestRobustRemoteCommand(unittest.TestCase):
+
+  def setUp(self):
+    self.mocked_flags = mock_flags.PatchTestCaseFlags(self)
+    self.mocked_flags.remote_command_agent = True
+    self.vm = LinuxVM()
+    self.vm.name = 'vm0'
+    p = mock.patch.object(remote_agent.RemoteAgent, 'Run')
+    self.run = p.start()
+    self.addCleanup(p.stop)
+
+  def testRunsThroughAgent(self):
+    self.run.return_value = 'out', 'err', 0
+    self.assertEqual(('out', 'err'),
+                     self.vm.RobustRemoteCommand(['fio', '--version']))
+    self.run.assert_called_once_with('fio --version', stdout_callback=None)
+    agent = self.vm.remote_command_agent
+    self.vm.RobustRemoteCommand('true')
+    self.assertIs(agent, self.vm.remote_command_agent)
+
+  def testFailure(self):
+    self.run.return_value = '', 'oops', 1
+    with self.assertRaises(errors.VirtualMachine.RemoteCommandError):
+      self.vm.RobustRemoteCommand('false')
+
+  def testWithoutAgent(self):
+    self.mocked_flags.remote_command_agent = False
+    self.mocked_flags.data_search_paths = []
+    with mock.patch.object(self.vm, 'PushFiles'), \
+        mock.patch.object(self.vm, 'RemoteCommand',
+                          return_value=('out', '')) as remote_command:
+      callback = mock.Mock()
+      self.assertEqual(('out', ''), self.vm.RobustRemoteCommand(
+          'true', stdout_callback=callback))
+    self.assertEqual(2, remote_command.call_count)
+    callback.assert_called_once_with('out')
+    self.assertFalse(self.run.called)
+
+
 if __name__ == '__main__':
   unittest.main()
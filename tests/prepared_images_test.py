@@ -0,0 +1,137 @@
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.prepared_images."""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from perfkitbenchmarker import linux_virtual_machine
+from perfkitbenchmarker import prepared_images
+from perfkitbenchmarker.linux_benchmarks import iperf_benchmark
+from tests import mock_flags
+
+_IMAGES = {}
+
+
+class _LocalVm(linux_virtual_machine.DebianMixin):
+  """Stands in for a cloud VM, keeping images in memory."""
+
+  CLOUD = 'Local'
+  is_static = False
+  install_packages = True
+  zone = 'local-zone'
+
+  def __init__(self, name, image='base'):
+    super(_LocalVm, self).__init__()
+    self.name = name
+    self.image = image
+    self.installed = []
+    self.RemoteCommand = mock.Mock()
+    self.AptUpdate = mock.Mock()
+
+  def InstallPackages(self, packages):
+    self.installed.append(packages)
+
+  def Uninstall(self, package_name):
+    pass
+
+  def CreateImage(self, image_name):
+    _IMAGES[image_name] = sorted(self._installed_packages)
+    return image_name
+
+  def DeleteImage(self, image):
+    del _IMAGES[image]
+
+  def UseImage(self, image):
+    self.image = image
+
+
+class PreparedImagesTestCase(unittest.TestCase):
+
+  def setUp(self):
+    self.mocked_flags = mock_flags.PatchTestCaseFlags(self)
+    self.temp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.temp_dir)
+    self.mocked_flags.temp_dir = self.temp_dir
+    self.mocked_flags.run_uri = 'run1'
+    self.addCleanup(_IMAGES.clear)
+
+  def _Run(self, packages, image='base'):
+    """Provisions and prepares a VM the way pkb does."""
+    vm = _LocalVm('vm', image)
+    spec = mock.Mock(vm_groups={'default': [vm]},
+                     BenchmarkPrepare=iperf_benchmark.Prepare)
+    spec.name = 'iperf'
+    prepared_images.UsePreparedImages(spec)
+    vm.InstallAll(packages)
+    prepared_images.CaptureImages(spec)
+    return vm
+
+  def _GetRegistry(self):
+    with open(os.path.join(self.temp_dir, 'prepared_images.json')) as fp:
+      return json.load(fp)
+
+  def testCaptureThenUse(self):
+    first = self._Run(['wget', 'numactl'])
+    self.assertEqual(['wget numactl'], first.installed)
+    self.assertEqual(1, len(_IMAGES))
+    image = _IMAGES.keys()[0]
+    self.assertEqual(['numactl', 'wget'], _IMAGES[image])
+
+    self.mocked_flags.run_uri = 'run2'
+    second = self._Run(['wget', 'numactl'])
+    self.assertEqual(image, second.image)
+    self.assertEqual([], second.installed)
+    self.assertEqual([image], _IMAGES.keys())
+
+  def testNewPackagesAreInstalled(self):
+    self._Run(['wget'])
+    self.mocked_flags.run_uri = 'run2'
+    vm = self._Run(['wget', 'numactl'])
+    self.assertEqual(['numactl'], vm.installed)
+
+  def testOtherBaseImage(self):
+    self._Run(['wget'])
+    self.mocked_flags.run_uri = 'run2'
+    vm = self._Run(['wget'], image='other')
+    self.assertEqual('other', vm.image)
+    self.assertEqual(2, len(self._GetRegistry()))
+
+  def testChangedFlagInvalidatesImage(self):
+    self._Run(['wget'])
+    self.mocked_flags.run_uri = 'run2'
+    with mock.patch.object(prepared_images, '_GetModuleFingerprint',
+                           return_value=['changed']):
+      vm = self._Run(['wget'])
+    self.assertEqual('base', vm.image)
+    self.assertEqual(['wget'], vm.installed)
+    # The stale image is replaced.
+    self.assertEqual(['pkb-prepared-{0}-run2'.format(
+        self._GetRegistry().keys()[0][:10])], _IMAGES.keys())
+
+  def testUnsupportedProvider(self):
+    with mock.patch.object(_LocalVm, 'CreateImage',
+                           side_effect=NotImplementedError):
+      self._Run(['wget'])
+    self.assertFalse(os.path.exists(
+        os.path.join(self.temp_dir, 'prepared_images.json')))
+
+
+if __name__ == '__main__':
+  unittest.main()
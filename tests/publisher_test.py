@@ -13,17 +13,29 @@
 # limitations under the License.
 """Tests for perfkitbenchmarker.publisher."""
 
+import BaseHTTPServer
 import collections
+import cPickle
 import csv
 import io
 import json
+import logging
+import math
+import os
 import re
+import shutil
+import SocketServer
+import sys
 import tempfile
+import threading
+import time
 import uuid
 import unittest
 
 import mock
 
+from perfkitbenchmarker import columnar
+from perfkitbenchmarker import errors
 from perfkitbenchmarker import publisher
 from perfkitbenchmarker import sample
 from perfkitbenchmarker import vm_util
@@ -58,6 +70,32 @@ class PrettyPrintStreamPublisherTestCase(unittest.TestCase):
     value = stream.getvalue()
     self.assertRegexpMatches(value, re.compile(r'TESTA.*TESTB', re.DOTALL))
 
+  def testBatchesMatchSingleCall(self):
+    samples = [{'test': 'testb', 'metric': '1', 'value': 1.0, 'unit': 'MB',
+                'metadata': {'a': 1, 'b': 1}},
+               {'test': 'testa', 'metric': '2', 'value': 14.0, 'unit': 'MB',
+                'metadata': {'a': 1, 'b': 2}},
+               {'test': 'testb', 'metric': '3', 'value': 47.0, 'unit': 'us',
+                'metadata': {'a': 1, 'b': 3}}]
+    stream = io.BytesIO()
+    publisher.PrettyPrintStreamPublisher(stream).PublishSamples(samples)
+    batch_stream = io.BytesIO()
+    publisher.PrettyPrintStreamPublisher(batch_stream).PublishSampleBatches(
+        [samples[:1], samples[1:]])
+    self.assertEqual(batch_stream.getvalue(), stream.getvalue())
+    self.assertIn('For all tests: a="1"', stream.getvalue())
+
+  def testReadsBatchesTwice(self):
+    samples = [{'test': test, 'metric': 'm', 'value': 1.0, 'unit': 'MB',
+                'metadata': {}} for test in ('testa', 'testb', 'testc')]
+    batches = mock.MagicMock()
+    batches.__iter__.side_effect = lambda: iter([samples[:2], samples[2:]])
+    stream = io.BytesIO()
+    publisher.PrettyPrintStreamPublisher(stream).PublishSampleBatches(batches)
+    self.assertEqual(2, batches.__iter__.call_count)
+    self.assertRegexpMatches(stream.getvalue(),
+                             re.compile(r'TESTA.*TESTB.*TESTC', re.DOTALL))
+
 
 class LogPublisherTestCase(unittest.TestCase):
 
@@ -103,6 +141,64 @@ class NewlineDelimitedJSONPublisherTestCase(unittest.TestCase):
                           {u'test': u'testb', u'labels': u'|key2:val2|'}],
                          result)
 
+  def testBatchesAreNotOverwritten(self):
+    self.instance.PublishSampleBatches([[{'test': 'testa', 'metadata': {}}],
+                                        [{'test': 'testb', 'metadata': {}}]])
+    result = [json.loads(i)['test'] for i in self.fp]
+    self.assertListEqual([u'testa', u'testb'], result)
+
+  def testLabelsAreReusedForTheSameMetadata(self):
+    metadata = {'key': 'val', 'n': 1}
+    samples = [{'test': 'testa', 'metadata': metadata.copy()}
+               for _ in xrange(3)]
+    samples.append({'test': 'testa', 'metadata': {'key': 'val', 'n': 1.0}})
+    samples.append({'test': 'testa', 'metadata': {'key': ['val']}})
+    with mock.patch.object(publisher, 'GetLabelsFromDict',
+                           wraps=publisher.GetLabelsFromDict) as mock_labels:
+      self.instance.PublishSampleBatches([samples[:2], samples[2:]])
+    # Equal values of different types are formatted differently.
+    self.assertEqual(3, mock_labels.call_count)
+    self.assertEqual([publisher.GetLabelsFromDict(s['metadata'])
+                      for s in samples],
+                     [json.loads(line)['labels'] for line in self.fp])
+    self.assertIn('|n:1.0|', publisher.GetLabelsFromDict(
+        samples[3]['metadata']))
+
+  def testLabelsAreNotReusedForContainersOfOtherTypes(self):
+    samples = [{'test': 'testa', 'metadata': {'k': [1]}},
+               {'test': 'testa', 'metadata': {'k': [1.0]}}]
+    self.instance.PublishSamples(samples)
+    self.assertEqual([publisher.GetLabelsFromDict(s['metadata'])
+                      for s in samples],
+                     [json.loads(line)['labels'] for line in self.fp])
+    self.assertIn('|k:[1.0]|', publisher.GetLabelsFromDict(
+        samples[1]['metadata']))
+
+  def testMicrobenchmark(self):
+    """Compares the publisher to encoding each sample on its own."""
+    metadata = {'key%d' % i: 'value%d' % i for i in xrange(30)}
+    metadata.update(num_cpus=8, threshold=0.95)
+    samples = [{'test': 'test', 'metric': 'latency', 'value': i * 0.5,
+                'unit': 'ms', 'timestamp': 1.5 + i, 'run_uri': 'uri',
+                'sample_uri': str(i), 'metadata': metadata.copy()}
+               for i in xrange(20000)]
+
+    start = time.time()
+    expected = []
+    for s in samples:
+      s = s.copy()
+      s['labels'] = publisher.GetLabelsFromDict(s.pop('metadata'))
+      expected.append(json.dumps(s) + '\n')
+    reference_time = time.time() - start
+    start = time.time()
+    self.instance.PublishSampleBatches(
+        [samples[i:i + 5000] for i in xrange(0, len(samples), 5000)])
+    publish_time = time.time() - start
+
+    self.assertEqual(''.join(expected), self.fp.read())
+    logging.info('Encoded %d samples in %.3fs, or %.3fs one by one.',
+                 len(samples), publish_time, reference_time)
+
 
 class BigQueryPublisherTestCase(unittest.TestCase):
 
@@ -110,7 +206,10 @@ class BigQueryPublisherTestCase(unittest.TestCase):
     p = mock.patch(publisher.__name__ + '.vm_util', spec=publisher.vm_util)
     self.mock_vm_util = p.start()
     publisher.vm_util.NamedTemporaryFile = vm_util.NamedTemporaryFile
-    self.mock_vm_util.GetTempDir.return_value = tempfile.gettempdir()
+    temp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, temp_dir)
+    self.mock_vm_util.GetTempDir.return_value = temp_dir
+    self.mock_vm_util.IssueCommand.return_value = ('', '', 0)
     self.addCleanup(p.stop)
 
     self.samples = [{'test': 'testa', 'metadata': {}},
@@ -120,13 +219,14 @@ class BigQueryPublisherTestCase(unittest.TestCase):
   def testNoSamples(self):
     instance = publisher.BigQueryPublisher(self.table)
     instance.PublishSamples([])
-    self.assertEqual([], self.mock_vm_util.IssueRetryableCommand.mock_calls)
+    self.assertEqual([], self.mock_vm_util.IssueCommand.mock_calls)
 
   def testNoProject(self):
     instance = publisher.BigQueryPublisher(self.table)
     instance.PublishSamples(self.samples)
-    self.mock_vm_util.IssueRetryableCommand.assert_called_once_with(
+    self.mock_vm_util.IssueCommand.assert_called_once_with(
         ['bq',
+         mock.ANY,
          'load',
          '--source_format=NEWLINE_DELIMITED_JSON',
          self.table,
@@ -150,7 +250,293 @@ class BigQueryPublisherTestCase(unittest.TestCase):
         service_account=mock.MagicMock(),
         service_account_private_key_file=mock.MagicMock())
     instance.PublishSamples(self.samples)  # No error
-    self.mock_vm_util.IssueRetryableCommand.assert_called_once_with(mock.ANY)
+    self.mock_vm_util.IssueCommand.assert_called_once_with(mock.ANY)
+
+
+# Stands in for bq. Jobs are recorded in the directory of the script, and rows
+# are appended to its 'rows' file when they are loaded. A load fails without
+# starting a job while the 'fail' file holds a positive count, and starts a
+# job but fails anyway, as if the reply was lost, while 'lose_reply' does.
+_FAKE_BQ = """#!%s
+import gzip
+import os
+import sys
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def Decrement(name):
+  path = os.path.join(DIR, name)
+  count = int(open(path).read()) if os.path.exists(path) else 0
+  if count > 0:
+    open(path, 'w').write(str(count - 1))
+  return count > 0
+
+
+args = [arg for arg in sys.argv[1:] if not arg.startswith('--project_id')]
+if args[0] == 'wait':
+  sys.exit(0 if os.path.exists(os.path.join(DIR, 'job_' + args[1])) else 1)
+job_id = args[0].split('=')[1]
+assert args[1:3] == ['load', '--source_format=NEWLINE_DELIMITED_JSON']
+job_path = os.path.join(DIR, 'job_' + job_id)
+if os.path.exists(job_path):
+  print 'BigQuery error in load operation: Already Exists: Job ' + job_id
+  sys.exit(1)
+if Decrement('fail'):
+  print 'BigQuery error in load operation: Backend error'
+  sys.exit(1)
+with open(os.path.join(DIR, 'rows'), 'a') as rows:
+  rows.write(gzip.open(args[4]).read())
+open(job_path, 'w').close()
+sys.exit(1 if Decrement('lose_reply') else 0)
+"""
+
+
+class FakeBqPublisherTestCase(unittest.TestCase):
+  """Loads shards with a script that stands in for bq."""
+
+  def setUp(self):
+    self.bq_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.bq_dir)
+    self.bq_path = os.path.join(self.bq_dir, 'bq')
+    with open(self.bq_path, 'w') as fp:
+      fp.write(_FAKE_BQ % sys.executable)
+    os.chmod(self.bq_path, 0o755)
+    temp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, temp_dir)
+    self.shard_dir = os.path.join(temp_dir, publisher._BQ_SHARD_DIR)
+    for p in (mock.patch.object(publisher.vm_util, 'GetTempDir',
+                                return_value=temp_dir),
+              mock.patch.object(publisher, '_BQ_RETRY_SLEEP_SECONDS', 0)):
+      p.start()
+      self.addCleanup(p.stop)
+
+  def _Publisher(self, **kwargs):
+    return publisher.BigQueryPublisher(
+        'dataset.table', project_id='project', bq_path=self.bq_path,
+        load_threads=2, **kwargs)
+
+  def _Samples(self, start, stop):
+    return [{'sample_uri': str(i), 'metric': 'm', 'value': i,
+             'metadata': {'key': 'val'}} for i in xrange(start, stop)]
+
+  def _SetCount(self, name, count):
+    with open(os.path.join(self.bq_dir, name), 'w') as fp:
+      fp.write(str(count))
+
+  def _GetLoadedValues(self):
+    path = os.path.join(self.bq_dir, 'rows')
+    if not os.path.exists(path):
+      return []
+    with open(path) as fp:
+      rows = [json.loads(line) for line in fp]
+    for row in rows:
+      self.assertEqual('|key:val|', row['labels'])
+    return sorted(row['value'] for row in rows)
+
+  def _GetJobs(self):
+    return [name for name in os.listdir(self.bq_dir)
+            if name.startswith('job_')]
+
+  def testBatchesAreLoadedAsShards(self):
+    self._Publisher().PublishSampleBatches(
+        [self._Samples(0, 3), [], self._Samples(3, 5), self._Samples(5, 6)])
+    self.assertEqual(range(6), self._GetLoadedValues())
+    self.assertEqual(3, len(self._GetJobs()))
+    # Only the list of loaded shards is left.
+    self.assertEqual([publisher._BQ_LOADED_SHARDS_FILE],
+                     os.listdir(self.shard_dir))
+
+  def testLoadedShardsAreSkipped(self):
+    self._Publisher().PublishSampleBatches([self._Samples(0, 2)])
+    self._Publisher().PublishSampleBatches(
+        [self._Samples(0, 2), self._Samples(2, 3)])
+    self.assertEqual(range(3), self._GetLoadedValues())
+
+  def testFailedLoadIsRetried(self):
+    self._SetCount('fail', 2)
+    self._Publisher().PublishSamples(self._Samples(0, 2))
+    self.assertEqual(range(2), self._GetLoadedValues())
+
+  def testLostReplyIsNotLoadedTwice(self):
+    self._SetCount('lose_reply', 1)
+    self._Publisher().PublishSamples(self._Samples(0, 2))
+    self.assertEqual(range(2), self._GetLoadedValues())
+    self.assertEqual(1, len(self._GetJobs()))
+
+  def testUnrecordedLoadIsNotLoadedTwice(self):
+    self._Publisher().PublishSamples(self._Samples(0, 2))
+    # As if PKB died right after the load.
+    os.remove(os.path.join(self.shard_dir, publisher._BQ_LOADED_SHARDS_FILE))
+    self._Publisher().PublishSamples(self._Samples(0, 2))
+    self.assertEqual(range(2), self._GetLoadedValues())
+
+  def testPermanentFailure(self):
+    self._SetCount('fail', 2)
+    instance = self._Publisher(max_retries=1)
+    with self.assertRaises(errors.Publisher.PublishError):
+      instance.PublishSamples(self._Samples(0, 2))
+    self.assertEqual([], self._GetLoadedValues())
+    # The shard is kept, and loaded when the samples are published again.
+    self.assertEqual(1, len(os.listdir(self.shard_dir)))
+    instance.PublishSamples(self._Samples(0, 2))
+    self.assertEqual(range(2), self._GetLoadedValues())
+
+  def testStreamedSamplesAreNotPublishedAgain(self):
+    instance = self._Publisher(stream=True)
+    instance.StreamSamples(self._Samples(0, 2))
+    instance.StreamSamples(self._Samples(2, 4))
+    instance.FinishStreaming()
+    self.assertEqual(range(4), self._GetLoadedValues())
+    instance.PublishSampleBatches(
+        [self._Samples(0, 2), self._Samples(2, 4), self._Samples(4, 5)])
+    self.assertEqual(range(5), self._GetLoadedValues())
+
+  def testStreamingIsOptional(self):
+    instance = self._Publisher()
+    instance.StreamSamples(self._Samples(0, 2))
+    instance.FinishStreaming()
+    self.assertEqual([], self._GetLoadedValues())
+
+
+class _ElasticsearchHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  """Stands in for an Elasticsearch server, see ElasticsearchPublisherTestCase.
+  """
+
+  protocol_version = 'HTTP/1.1'
+
+  def log_message(self, *args):
+    pass
+
+  def _Reply(self, status, body=''):
+    self.send_response(status)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def do_HEAD(self):
+    self.server.requests.append(('HEAD', self.path, None))
+    self._Reply(200 if self.server.index_exists else 404)
+
+  def do_PUT(self):
+    body = self.rfile.read(int(self.headers['Content-Length']))
+    self.server.requests.append(('PUT', self.path, json.loads(body)))
+    self.server.index_exists = True
+    self._Reply(200, '{"acknowledged": true}')
+
+  def do_POST(self):
+    body = self.rfile.read(int(self.headers['Content-Length']))
+    lines = body.splitlines()
+    actions = [json.loads(line) for line in lines[::2]]
+    documents = [json.loads(line) for line in lines[1::2]]
+    with self.server.lock:
+      self.server.requests.append(('POST', self.path, documents))
+      self.server.ports.add(self.client_address[1])
+      if self.server.request_statuses:
+        status = self.server.request_statuses.pop(0)
+        self._Reply(status, '{"error": "busy"}')
+        return
+      items = []
+      for action in actions:
+        doc_id = action['create']['_id']
+        status = self.server.item_statuses.get(doc_id, [201]).pop(0)
+        if status == 201:
+          self.server.documents[doc_id] = documents[len(items)]
+        items.append({'create': {'_id': doc_id, 'status': status,
+                                 'error': 'status %d' % status}})
+    self._Reply(200, json.dumps({'errors': True, 'items': items}))
+
+
+class _ElasticsearchServer(SocketServer.ThreadingMixIn,
+                           BaseHTTPServer.HTTPServer):
+  daemon_threads = True
+
+
+class ElasticsearchPublisherTestCase(unittest.TestCase):
+  """Publishes to a local HTTP server that stands in for Elasticsearch."""
+
+  def setUp(self):
+    self.server = _ElasticsearchServer(('127.0.0.1', 0),
+                                       _ElasticsearchHandler)
+    self.server.lock = threading.Lock()
+    self.server.index_exists = False
+    self.server.requests = []
+    self.server.ports = set()
+    self.server.documents = {}
+    # Statuses of whole bulk requests, and of the documents with each id.
+    self.server.request_statuses = []
+    self.server.item_statuses = {}
+    thread = threading.Thread(target=self.server.serve_forever,
+                              kwargs={'poll_interval': 0.05})
+    thread.daemon = True
+    thread.start()
+    self.addCleanup(self.server.server_close)
+    self.addCleanup(self.server.shutdown)
+    p = mock.patch.object(publisher, '_ES_RETRY_SLEEP_SECONDS', 0)
+    p.start()
+    self.addCleanup(p.stop)
+    self.publisher = publisher.ElasticsearchPublisher(
+        es_uri='localhost:%d' % self.server.server_address[1],
+        es_index='PerfKit', es_type='result', bulk_size=10, bulk_threads=2,
+        max_retries=2)
+
+  def _Samples(self, count):
+    return [{'sample_uri': str(i), 'metric': 'm', 'value': i, 'unit': 'ms',
+             'timestamp': 1.5, 'metadata': {'a.b': {'c.d': [1, 2]}}}
+            for i in xrange(count)]
+
+  def testPublishSampleBatches(self):
+    samples = self._Samples(45)
+    self.publisher.PublishSampleBatches([samples[:5], samples[5:]])
+    self.publisher.PublishSamples(self._Samples(1))
+
+    self.assertEqual(('HEAD', '/perfkit', None), self.server.requests[0])
+    self.assertEqual(('PUT', '/perfkit', self.publisher.mapping),
+                     self.server.requests[1])
+    posts = [r for r in self.server.requests if r[0] == 'POST']
+    self.assertEqual([1, 5, 10, 10, 10, 10],
+                     sorted(len(documents) for _, _, documents in posts))
+    self.assertEqual('/_bulk', posts[0][1])
+    # The index is only looked up once, and connections are reused.
+    self.assertEqual(2, len(self.server.requests) - len(posts))
+    self.assertLessEqual(len(self.server.ports), 2)
+    self.assertEqual(45, len(self.server.documents))
+    self.assertEqual(
+        {'sample_uri': '7', 'metric': 'm', 'value': 7, 'unit': 'ms',
+         'timestamp': '1970-01-01 00:00:01.500000',
+         'metadata': {'a_b': {'c_d': [1, 2]}}},
+        self.server.documents['7'])
+    # The samples are not modified.
+    self.assertEqual({'a.b': {'c.d': [1, 2]}}, samples[7]['metadata'])
+    self.assertEqual(1.5, samples[7]['timestamp'])
+
+  def testExistingIndex(self):
+    self.server.index_exists = True
+    self.publisher.PublishSamples(self._Samples(1))
+    self.assertEqual(['HEAD', 'POST'], [r[0] for r in self.server.requests])
+
+  def testPartialFailureIsRetried(self):
+    self.server.item_statuses = {'3': [429, 503, 201]}
+    self.publisher.PublishSamples(self._Samples(5))
+    self.assertEqual(5, len(self.server.documents))
+    posts = [documents for method, _, documents in self.server.requests
+             if method == 'POST']
+    self.assertEqual([5, 1, 1], [len(documents) for documents in posts])
+    self.assertEqual('3', posts[2][0]['sample_uri'])
+
+  def testFailedRequestIsRetried(self):
+    self.server.request_statuses = [503]
+    # The documents were created before the request failed.
+    self.server.item_statuses = {'0': [409]}
+    self.publisher.PublishSamples(self._Samples(2))
+    self.assertEqual(['1'], self.server.documents.keys())
+
+  def testPermanentFailures(self):
+    self.server.item_statuses = {'1': [409], '2': [429, 429, 429]}
+    with self.assertRaises(errors.Publisher.PublishError) as cm:
+      self.publisher.PublishSamples(self._Samples(4))
+    self.assertIn('Could not publish 2 of 4 samples', str(cm.exception))
+    self.assertItemsEqual(['0', '3'], self.server.documents.keys())
 
 
 class CloudStoragePublisherTestCase(unittest.TestCase):
@@ -183,6 +569,21 @@ class CloudStoragePublisherTestCase(unittest.TestCase):
         ['gsutil', 'cp', mock.ANY,
          'gs://test-bucket/141764776338_be428eb'])
 
+  def testPublishSampleBatchesUploadsOnce(self):
+    self.mock_time.time.return_value = 1417647763.387665
+    self.mock_uuid.uuid4.return_value = uuid.UUID(
+        'be428eb3-a54a-4615-b7ca-f962b729c7ab')
+    uploaded = []
+
+    def Upload(cmd):
+      with open(cmd[2]) as fp:
+        uploaded.append([json.loads(line)['test'] for line in fp])
+
+    self.mock_vm_util.IssueRetryableCommand.side_effect = Upload
+    instance = publisher.CloudStoragePublisher('test-bucket')
+    instance.PublishSampleBatches([self.samples[:1], self.samples[1:]])
+    self.assertEqual([['testa', 'testb']], uploaded)
+
 
 class SampleCollectorTestCase(unittest.TestCase):
 
@@ -202,8 +603,8 @@ class SampleCollectorTestCase(unittest.TestCase):
     self.mock_flags.product_name = 'PerfKitBenchmarker'
 
   def _VerifyResult(self, contains_metadata=True):
-    self.assertEqual(1, len(self.instance.samples))
-    collector_sample = self.instance.samples[0]
+    self.assertEqual(1, len(self.instance.GetSamples()))
+    collector_sample = self.instance.GetSamples()[0]
     metadata = collector_sample.pop('metadata')
     self.assertDictContainsSubset(
         {
@@ -232,7 +633,169 @@ class SampleCollectorTestCase(unittest.TestCase):
         {
             'timestamp': 1.0
         },
-        self.instance.samples[0])
+        self.instance.GetSamples()[0])
+
+
+  def testMetadataProvidersRunOncePerCall(self):
+    provider = mock.create_autospec(publisher.MetadataProvider)
+    provider.AddMetadata.return_value = {'foo': 'baz', 'vm': 'n1'}
+    self.instance.metadata_providers = [provider]
+    samples = [self.sample, self.sample._replace(metric='gadgets')]
+    self.instance.AddSamples(samples, self.benchmark, self.benchmark_spec)
+    provider.AddMetadata.assert_called_once_with({}, self.benchmark_spec)
+    self.assertEqual(['widgets', 'gadgets'],
+                     [s['metric'] for s in self.instance.GetSamples()])
+    for collector_sample in self.instance.GetSamples():
+      self.assertEqual({'foo': 'baz', 'vm': 'n1'}, collector_sample['metadata'])
+
+
+class SampleStoreTestCase(unittest.TestCase):
+
+  def setUp(self):
+    self.store = publisher.SampleStore()
+    self.annotations = {'test': 'test', 'run_uri': 'uri'}
+
+  def testSamplesAreYieldedAsDicts(self):
+    self.store.Add([sample.Sample('widgets', 100, 'oz', {'foo': 'bar'}, 1.5),
+                    sample.Sample('gadgets', 2.5, 'lb', {}, 2.0)],
+                   self.annotations, {'foo': 'baz', 'vm': 'n1'})
+    samples = list(self.store)
+    for s in samples:
+      self.assertEqual(4, uuid.UUID(s.pop('sample_uri')).version)
+    self.assertEqual([
+        {'metric': 'widgets', 'value': 100, 'unit': 'oz', 'timestamp': 1.5,
+         'metadata': {'foo': 'baz', 'vm': 'n1'}, 'test': 'test',
+         'run_uri': 'uri'},
+        {'metric': 'gadgets', 'value': 2.5, 'unit': 'lb', 'timestamp': 2.0,
+         'metadata': {'foo': 'baz', 'vm': 'n1'}, 'test': 'test',
+         'run_uri': 'uri'}], samples)
+    self.assertIsInstance(samples[0]['value'], int)
+
+  def testValuesArePreserved(self):
+    values = [1, 2 ** 70, 0.1, float('nan'), 'string', None]
+    self.store.Add([sample.Sample('m', v, '') for v in values], {}, {})
+    actual = [s['value'] for s in self.store]
+    self.assertTrue(math.isnan(actual.pop(3)))
+    del values[3]
+    self.assertEqual(values, actual)
+    self.assertEqual([type(v) for v in values], [type(v) for v in actual])
+
+  def testSharedMetadataIsStoredOnce(self):
+    metadata = {'foo': 'bar'}
+    self.store.Add([sample.Sample('m', i, '', metadata) for i in range(100)] +
+                   [sample.Sample('m', i, '') for i in range(100)],
+                   self.annotations, {'vm': 'n1'})
+    self.assertEqual(2, len(self.store._entries))
+    samples = list(self.store)
+    samples[0]['metadata']['foo'] = 'baz'
+    self.assertEqual('bar', samples[1]['metadata']['foo'])
+    self.assertEqual(200, len(set(s['sample_uri'] for s in samples)))
+
+  def testPickle(self):
+    self.store.Add([sample.Sample('m', i, 'ms', {'i': i}) for i in range(3)],
+                   self.annotations, {})
+    restored = cPickle.loads(cPickle.dumps(self.store, 2))
+    self.assertEqual(list(self.store), list(restored))
+    self.assertEqual(self.store.GetSamples(1, 2), restored.GetSamples(1, 2))
+
+
+class SampleSpoolTestCase(unittest.TestCase):
+
+  def setUp(self):
+    temp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, temp_dir)
+    self.spool = publisher.SampleSpool(os.path.join(temp_dir, 'spool'))
+
+  def testEmpty(self):
+    self.assertFalse(self.spool.HasSamples())
+    self.assertEqual([], list(self.spool.ReadBatches()))
+
+  def testReadBatches(self):
+    self.spool.Append([{'test': 'a'}, {'test': 'b'}])
+    self.spool.Append([{'test': 'c'}])
+    self.assertTrue(self.spool.HasSamples())
+    self.assertEqual([[{'test': 'a'}, {'test': 'b'}], [{'test': 'c'}]],
+                     list(self.spool.ReadBatches()))
+
+  def testPartiallyWrittenBatchIsSkipped(self):
+    self.spool.Append([{'test': 'a'}])
+    self.spool.Append([{'test': 'b'}])
+    with open(self.spool.path, 'r+b') as fp:
+      fp.truncate(os.path.getsize(self.spool.path) - 1)
+    self.assertEqual([[{'test': 'a'}]], list(self.spool.ReadBatches()))
+
+  def testClear(self):
+    self.spool.Append([{'test': 'a'}])
+    self.spool.Clear()
+    self.assertFalse(self.spool.HasSamples())
+    self.spool.Clear()
+
+
+class SpoolingSampleCollectorTestCase(unittest.TestCase):
+
+  def setUp(self):
+    p = mock.patch(publisher.__name__ + '.FLAGS')
+    self.mock_flags = p.start()
+    self.addCleanup(p.stop)
+    self.mock_flags.sample_batch_size = 2
+    self.mock_flags.product_name = 'PerfKitBenchmarker'
+    self.mock_flags.official = False
+    self.mock_flags.owner = 'owner'
+    temp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, temp_dir)
+    self.spool_path = os.path.join(temp_dir, 'spool')
+    self.publisher = mock.create_autospec(publisher.SamplePublisher)
+    self.batches = []
+    self.publisher.PublishSampleBatches.side_effect = (
+        lambda batches: self.batches.extend(
+            [[s['metric'] for s in batch] for batch in batches]))
+    self.benchmark_spec = mock.MagicMock(uuid='uuid')
+
+  def _AddSamples(self, collector, metrics):
+    collector.AddSamples([sample.Sample(m, 1, 'oz') for m in metrics],
+                         'test', self.benchmark_spec)
+
+  def testSamplesAreSpooledInBatches(self):
+    collector = publisher.SampleCollector(
+        metadata_providers=[], publishers=[self.publisher],
+        spool_path=self.spool_path)
+    self._AddSamples(collector, ['a', 'b', 'c'])
+    self.assertEqual(['c'], [s['metric'] for s in collector.GetSamples()])
+    self.assertTrue(collector.spool.HasSamples())
+    collector.PublishSamples()
+    self.assertEqual([['a', 'b'], ['c']], self.batches)
+    # Spooled batches are streamed to the publishers.
+    streamed = self.publisher.StreamSamples.call_args_list
+    self.assertEqual(1, len(streamed))
+    self.assertEqual(['a', 'b'], [s['metric'] for s in streamed[0][0][0]])
+    self.assertFalse(collector.HasSamples())
+    self.assertFalse(collector.spool.HasSamples())
+
+  def testLargeAddIsSpooledInBatches(self):
+    collector = publisher.SampleCollector(
+        metadata_providers=[], publishers=[self.publisher],
+        spool_path=self.spool_path)
+    self._AddSamples(collector, ['a'])
+    self._AddSamples(collector, ['b', 'c', 'd', 'e'])
+    self.assertEqual(['e'], [s['metric'] for s in collector.GetSamples()])
+    self.assertEqual(2, len(list(collector.spool.ReadBatches())))
+    collector.PublishSamples()
+    self.assertEqual([['a', 'b'], ['c', 'd'], ['e']], self.batches)
+
+  def testPublishSpooledSamples(self):
+    worker = publisher.SampleCollector(
+        metadata_providers=[], publishers=[], spool_path=self.spool_path)
+    self._AddSamples(worker, ['a'])
+    worker.FlushSamples()
+    self.assertEqual([], worker.GetSamples())
+    collector = publisher.SampleCollector(metadata_providers=[],
+                                          publishers=[self.publisher])
+    self._AddSamples(collector, ['b', 'c', 'd'])
+    collector.AddSpooledSamples(self.spool_path)
+    self.assertTrue(collector.HasSamples())
+    collector.PublishSamples()
+    self.assertEqual([['a'], ['b', 'c'], ['d']], self.batches)
+    self.assertFalse(worker.spool.HasSamples())
 
 
 class DefaultMetadataProviderTestCase(unittest.TestCase):
@@ -371,6 +934,25 @@ class DefaultMetadataProviderTestCase(unittest.TestCase):
     self._RunTest(self.mock_spec, expected)
 
 
+class ColumnarPublisherTestCase(unittest.TestCase):
+
+  def testPublishSampleBatches(self):
+    temp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, temp_dir)
+    path = os.path.join(temp_dir, 'results')
+    instance = publisher.ColumnarPublisher(path)
+    instance.PublishSampleBatches([
+        [{'test': 'testb', 'metric': '1', 'value': 1.0, 'unit': 'MB',
+          'metadata': {'key1': 'value1'}}],
+        [{'test': 'testa', 'metric': '2', 'value': 47.0, 'unit': 'us',
+          'metadata': {'key2': 'value2'}}]])
+    columns = columnar.ReadFiles([path])
+    self.assertEqual(['1', '2'], list(columns['metric']))
+    self.assertEqual([1.0, 47.0], list(columns['value']))
+    self.assertEqual(['value1', None], list(columns['metadata.key1']))
+    self.assertEqual([None, 'value2'], list(columns['metadata.key2']))
+
+
 class CSVPublisherTestCase(unittest.TestCase):
   def setUp(self):
     self.tf = tempfile.NamedTemporaryFile(prefix='perfkit-csv-publisher',
@@ -404,3 +986,16 @@ class CSVPublisherTestCase(unittest.TestCase):
     rows = list(reader)
     self.assertEqual(['key1', 'key3'], reader.fieldnames[-2:])
     self.assertEqual(3, len(rows))
+
+  def testUsesUnionOfMetaKeysAcrossBatches(self):
+    instance = publisher.CSVPublisher(self.tf.name)
+    instance.PublishSampleBatches([
+        [{'test': 'testb', 'metric': '1', 'value': 1.0, 'unit': 'MB',
+          'metadata': {'key1': 'value1'}}],
+        [{'test': 'testa', 'metric': '2', 'value': 47.0, 'unit': 'us',
+          'metadata': {'key2': 'value2'}}]])
+    self.tf.seek(0)
+    reader = csv.DictReader(self.tf)
+    rows = list(reader)
+    self.assertEqual(['key1', 'key2'], reader.fieldnames[-2:])
+    self.assertEqual(['1', '2'], [i['metric'] for i in rows])
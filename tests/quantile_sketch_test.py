@@ -0,0 +1,122 @@
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.quantile_sketch."""
+
+import json
+import unittest
+
+import numpy
+
+from perfkitbenchmarker import quantile_sketch
+from perfkitbenchmarker.scripts import stats_util
+
+_PERCENTILES = [0, 1, 10, 50, 90, 99, 99.9, 100]
+
+
+class QuantileSketchTestCase(unittest.TestCase):
+
+  def setUp(self):
+    self.values = numpy.random.RandomState(0).lognormal(size=10000)
+
+  def assertWithinRelativeAccuracy(self, expected, actual, accuracy):
+    self.assertItemsEqual(expected, actual)
+    for key, value in expected.iteritems():
+      self.assertLessEqual(abs(actual[key] - value), value * accuracy, key)
+
+  def testPercentilesWithinRelativeAccuracy(self):
+    sketch = quantile_sketch.QuantileSketch(relative_accuracy=0.02)
+    sketch.AddMany(self.values)
+    self.assertEqual(sketch.count, len(self.values))
+    self.assertAlmostEqual(sketch.sum, self.values.sum())
+    expected = stats_util.CalculateStats(self.values, _PERCENTILES)
+    del expected['average'], expected['stddev']
+    self.assertWithinRelativeAccuracy(
+        expected, sketch.GetPercentiles(_PERCENTILES), 0.02)
+    self.assertEqual(sketch.GetPercentiles([0, 100]),
+                     {'p0': self.values.min(), 'p100': self.values.max()})
+
+  def testMergeEqualsAddingAllValues(self):
+    merged = quantile_sketch.QuantileSketch()
+    for values in numpy.split(self.values, 4):
+      client_sketch = quantile_sketch.QuantileSketch()
+      for value in values:
+        client_sketch.Add(value)
+      merged.Merge(client_sketch)
+    sketch = quantile_sketch.QuantileSketch()
+    sketch.AddMany(self.values)
+    self.assertEqual(merged.GetPercentiles(_PERCENTILES),
+                     sketch.GetPercentiles(_PERCENTILES))
+    self.assertEqual(len(merged), len(sketch))
+
+  def testAddManyWithCounts(self):
+    values = [0, 0.5, 1, 2, 100]
+    counts = [2, 0, 3, 1, 5]
+    sketch = quantile_sketch.QuantileSketch()
+    sketch.AddMany(values, counts)
+    expected = quantile_sketch.QuantileSketch()
+    for value, count in zip(values, counts):
+      expected.Add(value, count)
+    self.assertEqual(json.loads(expected.ToJson()),
+                     json.loads(sketch.ToJson()))
+    self.assertAlmostEqual(1, sketch.GetPercentiles([20])['p20'], delta=0.01)
+
+  def testMergeRequiresSameAccuracy(self):
+    with self.assertRaises(ValueError):
+      quantile_sketch.QuantileSketch(0.01).Merge(
+          quantile_sketch.QuantileSketch(0.02))
+
+  def testZeroValues(self):
+    sketch = quantile_sketch.QuantileSketch.FromHistogram([(0, 9), (10, 1)])
+    self.assertEqual(sketch.GetPercentiles([50, 100]),
+                     {'p50': 0, 'p100': 10})
+
+  def testMaxBinsPreservesHighPercentiles(self):
+    sketch = quantile_sketch.QuantileSketch(max_bins=100)
+    sketch.AddMany(self.values)
+    self.assertEqual(len(sketch), 100)
+    unbounded = quantile_sketch.QuantileSketch()
+    unbounded.AddMany(self.values)
+    self.assertEqual(sketch.GetPercentiles([99, 100]),
+                     unbounded.GetPercentiles([99, 100]))
+
+  def testJsonRoundTrip(self):
+    sketch = quantile_sketch.QuantileSketch.FromHistogram([(0, 1), (5, 3)])
+    restored = quantile_sketch.QuantileSketch.FromJson(sketch.ToJson())
+    self.assertEqual(restored.GetPercentiles(_PERCENTILES),
+                     sketch.GetPercentiles(_PERCENTILES))
+    restored.Merge(sketch)
+    self.assertEqual(restored.count, 8)
+
+  def testCreateSample(self):
+    sketch = quantile_sketch.QuantileSketch.FromHistogram([(1, 2)])
+    s = sketch.CreateSample('latency sketch', 'ms', {'foo': 'bar'})
+    self.assertEqual(s.metric, 'latency sketch')
+    self.assertEqual(s.metadata['foo'], 'bar')
+    self.assertEqual(json.loads(s.metadata['sketch'])['count'], 2)
+
+  def testInvalidArguments(self):
+    sketch = quantile_sketch.QuantileSketch()
+    with self.assertRaises(ValueError):
+      sketch.GetPercentiles([50])
+    with self.assertRaises(ValueError):
+      sketch.Add(-1)
+    with self.assertRaises(ValueError):
+      sketch.AddMany([1, -1])
+    sketch.Add(1)
+    with self.assertRaises(ValueError):
+      sketch.GetPercentiles([101])
+
+
+if __name__ == '__main__':
+  unittest.main()
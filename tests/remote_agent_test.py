@@ -0,0 +1,138 @@
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.remote_agent.
+
+The agent script runs locally, and is connected to without ssh.
+"""
+
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import mock
+
+from perfkitbenchmarker import data
+from perfkitbenchmarker import errors
+from perfkitbenchmarker import remote_agent
+from perfkitbenchmarker import vm_util
+from tests import mock_flags
+
+
+class _LocalVm(object):
+  """Runs the agent on the machine running the tests."""
+
+  name = 'local'
+
+  def __init__(self):
+    self.pushed_files = []
+
+  def RemoteCommand(self, command):
+    pass
+
+  def PushFiles(self, files):
+    self.pushed_files.extend(files)
+
+  def GetSshCommand(self):
+    return ['sh', '-c']
+
+
+class RemoteAgentTestCase(unittest.TestCase):
+
+  def setUp(self):
+    self.mocked_flags = mock_flags.PatchTestCaseFlags(self)
+    self.mocked_flags.remote_command_agent_idle_timeout = 60
+    self.mocked_flags.data_search_paths = []
+    self.tmp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.tmp_dir)
+    self.socket_path = os.path.join(self.tmp_dir, 'agent.sock')
+    for name, value in (
+        ('AGENT_PATH', data.ResourcePath(remote_agent.AGENT_SCRIPT)),
+        ('SOCKET_PATH', self.socket_path),
+        ('_RECONNECT_SLEEP_SECONDS', 0)):
+      p = mock.patch.object(remote_agent, name, value)
+      p.start()
+      self.addCleanup(p.stop)
+    self.vm = _LocalVm()
+    self.agent = remote_agent.RemoteAgent(self.vm)
+    self.addCleanup(self.agent.Close)
+
+  def testRun(self):
+    self.assertEqual(('out\n', 'err\n', 3),
+                     self.agent.Run('echo out; echo err >&2; exit 3'))
+    self.assertEqual(('again\n', '', 0), self.agent.Run('echo again'))
+    self.assertEqual(1, len(self.vm.pushed_files))
+
+  def testBinaryOutput(self):
+    stdout, _, _ = self.agent.Run(r"printf '\377\000\n'")
+    self.assertEqual('\xff\x00\n', stdout)
+
+  def testConcurrentCommands(self):
+    results = []
+    vm_util.RunThreaded(
+        lambda i: results.append(self.agent.Run('sleep 0.2; echo %d' % i)),
+        range(8))
+    self.assertItemsEqual([('%d\n' % i, '', 0) for i in range(8)], results)
+
+  def testStdoutCallback(self):
+    chunks = []
+    stdout, _, _ = self.agent.Run('echo 1; sleep 0.2; echo 2',
+                                  stdout_callback=chunks.append)
+    self.assertEqual(['1\n', '2\n'], chunks)
+    self.assertEqual('1\n2\n', stdout)
+
+  def testSurvivesDroppedConnection(self):
+    def DropConnection():
+      time.sleep(0.5)
+      self.agent._process.kill()
+    dropper = threading.Thread(target=DropConnection)
+    dropper.start()
+    self.addCleanup(dropper.join)
+    marker = os.path.join(self.tmp_dir, 'runs')
+    self.assertEqual(
+        ('before\nafter\n', '', 0),
+        self.agent.Run('echo >> {0}; echo before; sleep 1; echo after'.format(
+            marker)))
+    # The command ran once, and its output was resumed.
+    with open(marker) as fp:
+      self.assertEqual(1, len(fp.readlines()))
+
+  def testConnectionFailure(self):
+    self.vm.GetSshCommand = lambda: ['sh', '-c', 'exit 255', 'ssh']
+    with mock.patch.object(remote_agent, '_MAX_CONNECTION_FAILURES', 2):
+      with self.assertRaises(errors.VirtualMachine.RemoteCommandError):
+        self.agent.Run('true')
+
+  def testCloseStopsAgent(self):
+    self.agent.Run('true')
+    self.agent.Close()
+    for _ in range(100):
+      if not os.path.exists(self.socket_path):
+        break
+      time.sleep(0.2)
+    self.assertFalse(os.path.exists(self.socket_path))
+
+  def testPickle(self):
+    self.agent.Run('true')
+    agent = pickle.loads(pickle.dumps(self.agent))
+    self.assertIsNone(agent._process)
+    self.assertFalse(agent._pushed)
+    self.assertEqual(1, len(agent._vm.pushed_files))
+
+
+if __name__ == '__main__':
+  unittest.main()
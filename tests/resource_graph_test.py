@@ -0,0 +1,196 @@
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.resource_graph."""
+
+import threading
+import time
+import unittest
+
+import mock
+
+from perfkitbenchmarker import context
+from perfkitbenchmarker import errors
+from perfkitbenchmarker import flags_validators
+from perfkitbenchmarker import resource_graph
+from tests import mock_flags
+
+
+class _FakeResource(object):
+
+  def __init__(self, name, dependencies=(), cloud='GCP', duration=0,
+               wait_for=None, error=None):
+    self.CLOUD = cloud
+    self.name = name
+    self.dependencies = list(dependencies)
+    self.duration = duration
+    self.wait_for = wait_for
+    self.error = error
+    self.created = threading.Event()
+    self.benchmark_spec = None
+
+  def GetResourceDependencies(self):
+    return self.dependencies
+
+  def Create(self):
+    self.benchmark_spec = context.GetThreadBenchmarkSpec()
+    for dependency in self.dependencies:
+      assert dependency.created.is_set(), dependency.name
+    if self.wait_for:
+      assert self.wait_for.created.wait(5), self.wait_for.name
+    time.sleep(self.duration)
+    if self.error:
+      raise self.error
+    self.created.set()
+
+
+def _CreateGraph(resources, kind=resource_graph.VM):
+  graph = resource_graph.ResourceGraph()
+  for resource in resources:
+    graph.AddResource(resource, resource.Create, resource.name, kind)
+  return graph
+
+
+class ResourceGraphTestCase(unittest.TestCase):
+
+  def setUp(self):
+    self.mocked_flags = mock_flags.PatchTestCaseFlags(self)
+    self.mocked_flags.resource_creation_limits = []
+    self.mocked_flags.max_concurrent_resource_creations = 200
+
+  def testDependenciesAreCreatedFirst(self):
+    region = _FakeResource('region', duration=0.1)
+    zone = _FakeResource('zone', [region])
+    vm = _FakeResource('vm', [zone])
+    _CreateGraph([vm, zone, region]).Create()
+    self.assertTrue(vm.created.is_set())
+
+  def testUnrelatedResourcesDoNotWait(self):
+    # The network in zone B is only created once the VM in zone A exists.
+    network_a = _FakeResource('network_a')
+    vm_a = _FakeResource('vm_a', [network_a])
+    network_b = _FakeResource('network_b', wait_for=vm_a)
+    vm_b = _FakeResource('vm_b', [network_b])
+    _CreateGraph([network_a, network_b, vm_a, vm_b]).Create()
+    self.assertTrue(vm_b.created.is_set())
+
+  def testBenchmarkSpecIsInherited(self):
+    spec = object()
+    context.SetThreadBenchmarkSpec(spec)
+    self.addCleanup(context.SetThreadBenchmarkSpec, None)
+    vm = _FakeResource('vm')
+    _CreateGraph([vm]).Create()
+    self.assertIs(vm.benchmark_spec, spec)
+
+  def testFailureSkipsDependents(self):
+    network = _FakeResource('network', error=ValueError('no quota'))
+    vm = _FakeResource('vm', [network])
+    other_vm = _FakeResource('other_vm')
+    with self.assertRaises(errors.VmUtil.ThreadException) as cm:
+      _CreateGraph([network, vm, other_vm]).Create()
+    self.assertIn('no quota', str(cm.exception))
+    self.assertFalse(vm.created.is_set())
+    self.assertTrue(other_vm.created.is_set())
+
+  def testCreationLongerThanWaitTimeout(self):
+    vm = _FakeResource('vm', duration=0.3)
+    with mock.patch.object(resource_graph, '_LONG_TIMEOUT', 0.05):
+      _CreateGraph([vm]).Create()
+    self.assertTrue(vm.created.is_set())
+
+  def testCircularDependencies(self):
+    a = _FakeResource('a')
+    b = _FakeResource('b', [a])
+    a.dependencies.append(b)
+    with self.assertRaises(ValueError):
+      _CreateGraph([a, b]).Create()
+
+  def testUnknownDependenciesAreIgnored(self):
+    existing_network = _FakeResource('existing_network')
+    existing_network.created.set()
+    vm = _FakeResource('vm', [existing_network])
+    _CreateGraph([vm]).Create()
+    self.assertTrue(vm.created.is_set())
+
+  def _GetMaxConcurrency(self, resources):
+    active = [0]
+    max_active = [0]
+    lock = threading.Lock()
+    for resource in resources:
+      create = resource.Create
+
+      def _TrackedCreate(create=create):
+        with lock:
+          active[0] += 1
+          max_active[0] = max(max_active[0], active[0])
+        create()
+        with lock:
+          active[0] -= 1
+
+      resource.Create = _TrackedCreate
+    _CreateGraph(resources).Create()
+    return max_active[0]
+
+  def testLimitPerCloud(self):
+    self.mocked_flags.resource_creation_limits = ['vm=2', 'AWS:vm=1']
+    aws_vms = [_FakeResource('aws%d' % i, cloud='AWS', duration=0.05)
+               for i in range(3)]
+    self.assertEqual(self._GetMaxConcurrency(aws_vms), 1)
+    gcp_vms = [_FakeResource('gcp%d' % i, duration=0.05) for i in range(4)]
+    self.assertEqual(self._GetMaxConcurrency(gcp_vms), 2)
+
+  def testMaxConcurrency(self):
+    self.mocked_flags.max_concurrent_resource_creations = 3
+    vms = [_FakeResource('vm%d' % i, duration=0.05) for i in range(6)]
+    self.assertEqual(self._GetMaxConcurrency(vms), 3)
+
+  def testCriticalPathSamples(self):
+    region = _FakeResource('region', duration=0.2)
+    zone = _FakeResource('zone', [region])
+    other_zone = _FakeResource('other_zone')
+    vm = _FakeResource('vm', [zone, other_zone], duration=0.1)
+    graph = _CreateGraph([region, zone, other_zone, vm])
+    graph.Create()
+    self.assertEqual([name for name, _, _, _, _ in graph.GetCriticalPath()],
+                     ['region', 'zone', 'vm'])
+    samples = graph.GenerateSamples()
+    self.assertEqual(samples[0].metric,
+                     'Resource Creation Critical Path Time')
+    self.assertEqual(samples[0].metadata['critical_path'],
+                     'region -> zone -> vm')
+    self.assertGreaterEqual(samples[0].value, 0.3)
+    self.assertEqual([s.metadata['resource'] for s in samples[1:]],
+                     ['region', 'zone', 'vm'])
+
+  def testNoSamplesBeforeCreate(self):
+    self.assertEqual(resource_graph.ResourceGraph().GenerateSamples(), [])
+
+
+class ValidateLimitsFlagTestCase(unittest.TestCase):
+
+  def testValid(self):
+    self.assertTrue(resource_graph.ValidateLimitsFlag(
+        ['vm=2', 'AWS:network=1']))
+
+  def testInvalidKind(self):
+    with self.assertRaises(flags_validators.Error):
+      resource_graph.ValidateLimitsFlag(['disk=2'])
+
+  def testInvalidLimit(self):
+    for value in ('vm=0', 'vm=x', 'vm'):
+      with self.assertRaises(flags_validators.Error):
+        resource_graph.ValidateLimitsFlag([value])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,104 @@
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.retry_policy."""
+
+import unittest
+
+import mock
+
+from perfkitbenchmarker import retry_policy
+from tests import mock_flags
+
+
+class RetryPolicyTestCase(unittest.TestCase):
+
+  def setUp(self):
+    self.mocked_flags = mock_flags.PatchTestCaseFlags(self)
+    self.mocked_flags.retry_backoff = retry_policy.FIXED
+    self.mocked_flags.retry_max_backoff_multiplier = 8
+
+  def testFixed(self):
+    policy = retry_policy.RetryPolicy(10, 0.5)
+    for _ in xrange(100):
+      self.assertTrue(5 <= policy.GetSleepTime(1000) <= 10)
+
+  def testExponentialFromFlag(self):
+    self.mocked_flags.retry_backoff = retry_policy.EXPONENTIAL
+    policy = retry_policy.RetryPolicy(10, 0.5)
+    sleep_time = None
+    sleep_times = []
+    for _ in xrange(100):
+      sleep_time = policy.GetSleepTime(sleep_time)
+      sleep_times.append(sleep_time)
+    self.assertTrue(all(5 <= t <= 80 for t in sleep_times), sleep_times)
+    self.assertTrue(sleep_times[0] <= 30)
+    self.assertGreater(max(sleep_times), 30)
+
+  def testDecorrelatedJitter(self):
+    policy = retry_policy.RetryPolicy(
+        10, 1, backoff=retry_policy.EXPONENTIAL, max_interval=100)
+    with mock.patch(retry_policy.__name__ + '.random.uniform',
+                    side_effect=lambda a, b: b) as uniform:
+      self.assertEqual(30, policy.GetSleepTime())
+      self.assertEqual(90, policy.GetSleepTime(30))
+      self.assertEqual(100, policy.GetSleepTime(90))
+      # With full fuzz, the sleep grows again from at most 3 poll intervals.
+      self.assertEqual(30, policy.GetSleepTime(0.5))
+    self.assertEqual(mock.call(0, 30), uniform.call_args_list[0])
+
+
+class RetryBudgetTestCase(unittest.TestCase):
+
+  @mock.patch(retry_policy.__name__ + '.time')
+  def testAcquire(self, mock_time):
+    mock_time.time.return_value = 100
+    budget = retry_policy.RetryBudget(rate=2, burst=2)
+    self.assertEqual([0, 0, 0.5, 1],
+                     [budget.Acquire() for _ in xrange(4)])
+    self.assertEqual([mock.call(0.5), mock.call(1)],
+                     mock_time.sleep.call_args_list)
+    # Tokens are refilled at the rate, up to the burst.
+    mock_time.time.return_value = 110
+    self.assertEqual([0, 0, 0.5],
+                     [budget.Acquire() for _ in xrange(3)])
+
+  def testGetBudget(self):
+    mocked_flags = mock_flags.PatchTestCaseFlags(self)
+    self.assertIsNone(retry_policy.GetBudget('GCP'))
+    mocked_flags.retry_budget_per_second = 5
+    mocked_flags.retry_budget_burst = 10
+    self.assertIsNone(retry_policy.GetBudget(None))
+    budget = retry_policy.GetBudget('GCP')
+    self.assertEqual((5, 10), (budget.rate, budget.burst))
+    self.assertIs(budget, retry_policy.GetBudget('GCP'))
+    self.assertIsNot(budget, retry_policy.GetBudget('AWS'))
+
+
+class RetryStatsTestCase(unittest.TestCase):
+
+  def testGenerateSamples(self):
+    mock_flags.PatchTestCaseFlags(self)
+    stats = retry_policy.RetryStats()
+    stats.Record('Vm._Exists', 1, 0, 0, False)
+    stats.Record('Vm._PostCreate', 3, 20, 1.5, False)
+    stats.Record('Vm._PostCreate', 2, 10, 0, True)
+    self.assertEqual(
+        [('Retry attempts', 5, 'attempts'),
+         ('Retry sleep time', 31.5, 'seconds'),
+         ('Retry give ups', 1, 'calls')],
+        [(s.metric, s.value, s.unit) for s in stats.GenerateSamples()])
+
+
+if __name__ == '__main__':
+  unittest.main()
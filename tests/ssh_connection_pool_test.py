@@ -0,0 +1,206 @@
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.ssh_connection_pool."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from perfkitbenchmarker import linux_virtual_machine
+from perfkitbenchmarker import ssh_connection_pool
+from perfkitbenchmarker import vm_util
+from tests import mock_flags
+
+
+class _TestVm(linux_virtual_machine.BaseLinuxMixin):
+
+  def __init__(self):
+    super(_TestVm, self).__init__()
+    self.user_name = 'perfkit'
+    self.ip_address = '1.2.3.4'
+    self.ssh_private_key = 'key'
+
+  def Install(self):
+    pass
+
+  def Uninstall(self):
+    pass
+
+
+def _GetControlPath(options):
+  return next(o.split('=', 1)[1] for o in options
+              if o.startswith('ControlPath='))
+
+
+class SshConnectionPoolTestCase(unittest.TestCase):
+
+  def setUp(self):
+    self.mocked_flags = mock_flags.PatchTestCaseFlags(self)
+    self.mocked_flags.ssh_connection_pooling = True
+    self.mocked_flags.ssh_connections_per_vm = 2
+    self.mocked_flags.ssh_sessions_per_connection = 2
+    self.mocked_flags.ssh_control_persist = 60
+    self.temp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.temp_dir)
+    p = mock.patch(vm_util.__name__ + '.GetTempDir',
+                   return_value=self.temp_dir)
+    p.start()
+    self.addCleanup(p.stop)
+    p = mock.patch(vm_util.__name__ + '.IssueCommand',
+                   return_value=('', '', 0))
+    self.issue_command = p.start()
+    self.addCleanup(p.stop)
+    self.pool = ssh_connection_pool.CreatePool('perfkit', '1.2.3.4', 22)
+
+  def _EstablishMaster(self, options):
+    """Simulates ssh creating the control socket of a new master."""
+    open(_GetControlPath(options), 'w').close()
+
+  def testFirstCommandEstablishesMaster(self):
+    with self.pool.Connection() as connection:
+      self.assertIn('ControlMaster=auto', connection.options)
+      self.assertIn('ControlPersist=60', connection.options)
+      self._EstablishMaster(connection.options)
+    self.assertEqual(self.pool.new_connections, 1)
+    self.assertEqual(self.pool.reused_connections, 0)
+
+  def testLaterCommandsReuseMaster(self):
+    with self.pool.Connection() as connection:
+      self._EstablishMaster(connection.options)
+      first_path = _GetControlPath(connection.options)
+    for _ in range(3):
+      with self.pool.Connection() as connection:
+        self.assertEqual(_GetControlPath(connection.options), first_path)
+    self.assertEqual(self.pool.new_connections, 1)
+    self.assertEqual(self.pool.reused_connections, 3)
+
+  def testConcurrentCommandsDoNotShareEstablishingMaster(self):
+    with self.pool.Connection() as first:
+      with self.pool.Connection() as second:
+        self.assertNotEqual(_GetControlPath(first.options),
+                            _GetControlPath(second.options))
+        with self.pool.Connection() as third:
+          self.assertEqual(third.options, ['-o', 'ControlPath=none'])
+    self.assertEqual(self.pool.new_connections, 2)
+    self.assertEqual(self.pool.unpooled_connections, 1)
+
+  def testSessionLimit(self):
+    with self.pool.Connection() as connection:
+      self._EstablishMaster(connection.options)
+    with self.pool.Connection(), self.pool.Connection():
+      with self.pool.Connection() as connection:
+        self._EstablishMaster(connection.options)
+      self.assertEqual(self.pool.new_connections, 2)
+
+  def testFailureRetiresMaster(self):
+    with self.pool.Connection() as connection:
+      self._EstablishMaster(connection.options)
+      old_path = _GetControlPath(connection.options)
+    with self.pool.Connection() as connection:
+      connection.MarkFailed()
+    self.assertEqual(self.pool.retired_connections, 1)
+    self.assertFalse(os.path.exists(old_path))
+    self.issue_command.assert_called_once_with(
+        ['ssh', '-O', 'stop', '-o', 'ControlPath=%s' % old_path, '-p', '22',
+         'perfkit@1.2.3.4'], suppress_warning=True)
+    with self.pool.Connection() as connection:
+      self.assertNotEqual(_GetControlPath(connection.options), old_path)
+    self.assertEqual(self.pool.new_connections, 2)
+
+  def testExpiredMasterIsReestablished(self):
+    with self.pool.Connection() as connection:
+      self._EstablishMaster(connection.options)
+      os.remove(_GetControlPath(connection.options))
+    with self.pool.Connection():
+      pass
+    self.assertEqual(self.pool.new_connections, 2)
+    self.assertEqual(self.pool.reused_connections, 0)
+
+  def testCheckHealth(self):
+    with self.pool.Connection() as connection:
+      self._EstablishMaster(connection.options)
+    self.issue_command.return_value = ('', 'No such file', 255)
+    self.assertEqual(self.pool.CheckHealth(), 0)
+    self.assertEqual(self.pool.retired_connections, 1)
+
+  def testClose(self):
+    with self.pool.Connection() as connection:
+      self._EstablishMaster(connection.options)
+      path = _GetControlPath(connection.options)
+    self.pool.Close()
+    self.assertEqual(self.issue_command.call_args[0][0][:3],
+                     ['ssh', '-O', 'exit'])
+    self.assertFalse(os.path.exists(path))
+
+  def testGenerateSamples(self):
+    vm = _TestVm()
+    vm.ssh_connection_pool = self.pool
+    with self.pool.Connection() as connection:
+      self._EstablishMaster(connection.options)
+    with self.pool.Connection():
+      pass
+    samples = ssh_connection_pool.GenerateSamples([vm, _TestVm()])
+    values = {s.metric: s.value for s in samples}
+    self.assertEqual(values, {'SSH Connections New': 1,
+                              'SSH Connections Reused': 1,
+                              'SSH Connections Retired': 0,
+                              'SSH Connections Unpooled': 0})
+
+
+class RemoteHostCommandPoolingTestCase(unittest.TestCase):
+
+  def setUp(self):
+    self.mocked_flags = mock_flags.PatchTestCaseFlags(self)
+    self.mocked_flags.ssh_options = []
+    self.mocked_flags.ssh_connections_per_vm = 1
+    self.mocked_flags.ssh_sessions_per_connection = 4
+    self.mocked_flags.ssh_control_persist = 60
+    p = mock.patch(vm_util.__name__ + '.GetTempDir',
+                   return_value=tempfile.gettempdir())
+    p.start()
+    self.addCleanup(p.stop)
+
+  def testPoolingDisabled(self):
+    self.mocked_flags.ssh_connection_pooling = False
+    vm = _TestVm()
+    with mock.patch(vm_util.__name__ + '.IssueCommand',
+                    return_value=('host', '', 0)) as issue_command:
+      vm.RemoteHostCommand('hostname')
+    cmd = issue_command.call_args[0][0]
+    self.assertFalse([o for o in cmd if o.startswith('Control')])
+    self.assertEqual(cmd[-1], 'hostname')
+    self.assertIsNone(vm.ssh_connection_pool)
+
+  def testRetryAfterSshFailure(self):
+    self.mocked_flags.ssh_connection_pooling = True
+    vm = _TestVm()
+    results = [('', '', 255), ('', '', 0)]
+    with mock.patch(vm_util.__name__ + '.IssueCommand',
+                    side_effect=results) as issue_command:
+      vm.RemoteHostCommand('hostname')
+    commands = [c[0][0] for c in issue_command.call_args_list]
+    self.assertEqual(len(commands), 2)
+    self.assertIn('ControlMaster=auto', commands[0])
+    self.assertEqual(commands[0][-1], 'hostname')
+    self.assertEqual(commands[1][-1], 'hostname')
+    self.assertNotEqual(_GetControlPath(commands[0]),
+                        _GetControlPath(commands[1]))
+    self.assertEqual(vm.ssh_connection_pool.new_connections, 2)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,129 @@
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.scripts.stats_util."""
+
+import random
+import unittest
+
+import mock
+import numpy
+
+from perfkitbenchmarker.scripts import stats_util
+
+_PERCENTILES = [0, 0.1, 1, 10, 25, 50, 74, 90, 99, 99.9, 100]
+
+
+class _StatsTestCase(unittest.TestCase):
+
+  def assertStatsAlmostEqual(self, expected, actual):
+    self.assertItemsEqual(expected, actual)
+    for key, value in expected.iteritems():
+      self.assertAlmostEqual(value, actual[key], places=6, msg=key)
+
+
+class CalculateStatsTestCase(_StatsTestCase):
+
+  def setUp(self):
+    rand = random.Random(0)
+    self.numbers = [rand.randint(0, 1000) for _ in range(997)]
+
+  def testRank(self):
+    stats = stats_util.CalculateStats(range(1001), [0, 1, 99.9, 100])
+    self.assertEqual(stats, {'p0': 0, 'p1': 10, 'p99.9': 999, 'p100': 1000,
+                             'average': 500., 'stddev': stats['stddev']})
+    self.assertIsInstance(stats['p1'], int)
+
+  def testMatchesNumPyInterpolation(self):
+    for interpolation in stats_util.INTERPOLATIONS[1:]:
+      stats = stats_util.CalculateStats(self.numbers, _PERCENTILES,
+                                        interpolation)
+      for percentile in _PERCENTILES:
+        self.assertAlmostEqual(
+            stats['p%s' % percentile],
+            numpy.percentile(self.numbers, percentile,
+                             interpolation=interpolation),
+            msg='%s p%s' % (interpolation, percentile))
+
+  def testMeanAndStddev(self):
+    stats = stats_util.CalculateStats(self.numbers, [])
+    self.assertAlmostEqual(stats['average'], numpy.mean(self.numbers))
+    self.assertAlmostEqual(stats['stddev'], numpy.std(self.numbers, ddof=1))
+    self.assertEqual(stats_util.CalculateStats([3], [])['stddev'], 0)
+
+  def testInputIsNotModified(self):
+    numbers = numpy.array([3, 1, 2])
+    stats_util.CalculateStats(numbers, [50])
+    self.assertEqual(list(numbers), [3, 1, 2])
+
+  def testWithoutNumPy(self):
+    for interpolation in stats_util.INTERPOLATIONS:
+      expected = stats_util.CalculateStats(self.numbers, _PERCENTILES,
+                                           interpolation)
+      with mock.patch.object(stats_util, 'numpy', None):
+        actual = stats_util.CalculateStats(self.numbers, _PERCENTILES,
+                                           interpolation)
+      self.assertStatsAlmostEqual(expected, actual)
+
+  def testInvalidArguments(self):
+    with self.assertRaises(ValueError):
+      stats_util.CalculateStats([], [50])
+    with self.assertRaises(ValueError):
+      stats_util.CalculateStats([1], [100.1])
+    with self.assertRaises(ValueError):
+      stats_util.CalculateStats([1], ['50'])
+    with self.assertRaises(ValueError):
+      stats_util.CalculateStats([1], [50], interpolation='cubic')
+
+
+class CalculateHistogramStatsTestCase(_StatsTestCase):
+
+  def setUp(self):
+    self.histogram = {1: 5, 2: 10, 5: 5, 7: 0}
+    self.numbers = [1] * 5 + [2] * 10 + [5] * 5
+
+  def testRank(self):
+    stats = stats_util.CalculateHistogramStats(
+        self.histogram, [0, 20, 30, 74, 80, 100])
+    self.assertEqual(stats['p0'], 1)
+    self.assertEqual(stats['p20'], 1)
+    self.assertEqual(stats['p30'], 2)
+    self.assertEqual(stats['p74'], 2)
+    self.assertEqual(stats['p80'], 5)
+    self.assertEqual(stats['p100'], 5)
+    self.assertAlmostEqual(stats['average'], 2.5)
+    self.assertAlmostEqual(stats['stddev'], 1.539, places=3)
+
+  def testMatchesExpandedSamples(self):
+    for interpolation in stats_util.INTERPOLATIONS:
+      self.assertStatsAlmostEqual(
+          stats_util.CalculateStats(self.numbers, _PERCENTILES,
+                                    interpolation),
+          stats_util.CalculateHistogramStats(self.histogram, _PERCENTILES,
+                                             interpolation))
+
+  def testWithoutNumPy(self):
+    expected = stats_util.CalculateHistogramStats(self.histogram, _PERCENTILES,
+                                                  stats_util.LINEAR)
+    with mock.patch.object(stats_util, 'numpy', None):
+      actual = stats_util.CalculateHistogramStats(
+          self.histogram, _PERCENTILES, stats_util.LINEAR)
+    self.assertStatsAlmostEqual(expected, actual)
+
+  def testEmptyHistogram(self):
+    with self.assertRaises(ValueError):
+      stats_util.CalculateHistogramStats({1: 0}, [50])
+
+
+if __name__ == '__main__':
+  unittest.main()
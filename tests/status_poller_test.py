@@ -0,0 +1,124 @@
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.status_poller."""
+
+import threading
+import time
+import unittest
+
+import mock
+
+from perfkitbenchmarker import status_poller
+
+
+class StatusPollerTestCase(unittest.TestCase):
+
+  def setUp(self):
+    self.calls = []
+    self.statuses = {'a': 'RUNNING', 'b': 'PROVISIONING'}
+
+  def _List(self, scope, keys):
+    self.calls.append((scope, keys))
+    return {key: self.statuses[key] for key in keys if key in self.statuses}
+
+  def testGetStatus(self):
+    poller = status_poller.StatusPoller(self._List, min_interval=0)
+    self.assertEqual('RUNNING', poller.GetStatus('zone', 'a'))
+    self.assertIsNone(poller.GetStatus('zone', 'c'))
+    self.statuses['a'] = 'STOPPING'
+    self.assertEqual('STOPPING', poller.GetStatus('zone', 'a'))
+    self.assertEqual([('zone', frozenset(['a'])), ('zone', frozenset(['c'])),
+                      ('zone', frozenset(['a']))], self.calls)
+
+  def testWaitingCallersShareOneListing(self):
+    first_listing_started = threading.Event()
+    finish_first_listing = threading.Event()
+
+    def List(scope, keys):
+      if not self.calls:
+        first_listing_started.set()
+        finish_first_listing.wait()
+      return self._List(scope, keys)
+
+    poller = status_poller.StatusPoller(List, min_interval=0)
+    results = {}
+
+    def GetStatus(key):
+      results[key] = poller.GetStatus('zone', key)
+
+    threads = [threading.Thread(target=GetStatus, args=('a',))]
+    threads[0].start()
+    first_listing_started.wait()
+    keys = ['b', 'c', 'd']
+    threads.extend(threading.Thread(target=GetStatus, args=(key,))
+                   for key in keys)
+    for thread in threads[1:]:
+      thread.start()
+    # The other callers wait for the listing that follows the one in progress.
+    scope = poller._GetScope('zone')
+    while len(scope.pending_keys) < len(keys):
+      time.sleep(0.01)
+    finish_first_listing.set()
+    for thread in threads:
+      thread.join()
+
+    self.assertEqual([('zone', frozenset(['a'])),
+                      ('zone', frozenset(['b', 'c', 'd']))], self.calls)
+    self.assertEqual(2, poller.list_count)
+    self.assertEqual({'a': 'RUNNING', 'b': 'PROVISIONING', 'c': None,
+                      'd': None}, results)
+
+  def testScopesAreListedSeparately(self):
+    poller = status_poller.StatusPoller(self._List, min_interval=0)
+    poller.GetStatus('zone-1', 'a')
+    poller.GetStatus('zone-2', 'a')
+    self.assertEqual(['zone-1', 'zone-2'], [scope for scope, _ in self.calls])
+
+  def testListingErrorIsRaised(self):
+    poller = status_poller.StatusPoller(
+        mock.Mock(side_effect=[ValueError('quota'), {'a': 'RUNNING'}]),
+        min_interval=0)
+    with self.assertRaises(ValueError):
+      poller.GetStatus('zone', 'a')
+    self.assertEqual('RUNNING', poller.GetStatus('zone', 'a'))
+
+  @mock.patch(status_poller.__name__ + '.time')
+  def testAdaptiveInterval(self, mock_time):
+    mock_time.time.return_value = 100
+    poller = status_poller.StatusPoller(self._List, min_interval=1,
+                                        max_interval=4)
+    for _ in xrange(5):
+      poller.GetStatus('zone', 'b')
+    self.statuses['b'] = 'RUNNING'
+    poller.GetStatus('zone', 'b')
+    poller.GetStatus('zone', 'b')
+    poller.GetStatus('zone', 'a')
+    # The interval doubles while nothing changes, and is reset when a status
+    # changes or a new key is requested.
+    self.assertEqual([1, 2, 4, 4, 4, 1, 2],
+                     [c[0][0] for c in mock_time.sleep.call_args_list])
+    self.assertEqual(8, poller.list_count)
+
+  @mock.patch(status_poller.__name__ + '.time')
+  def testReset(self, mock_time):
+    mock_time.time.return_value = 100
+    poller = status_poller.StatusPoller(self._List)
+    poller.GetStatus('zone', 'a')
+    poller.Reset()
+    poller.GetStatus('zone', 'a')
+    self.assertFalse(mock_time.sleep.called)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -16,14 +16,17 @@
 
 import os
 import psutil
-import subprocess
 import threading
 import time
 import unittest
 
 import mock
 
+from perfkitbenchmarker import context
+from perfkitbenchmarker import errors
+from perfkitbenchmarker import retry_policy
 from perfkitbenchmarker import vm_util
+from tests import mock_flags
 
 
 class ShouldRunOnInternalIpAddressTestCase(unittest.TestCase):
@@ -137,12 +140,150 @@ class IssueCommandTestCase(unittest.TestCase):
     self.assertEqual(retcode, 0)
 
   def testNoTimeout_ExceptionRaised(self):
-    with mock.patch('subprocess.Popen', spec=subprocess.Popen) as mock_popen:
-      mock_popen.return_value.wait.side_effect = KeyboardInterrupt()
+    with mock.patch(vm_util.__name__ + '._WaitForFds',
+                    side_effect=KeyboardInterrupt()):
       with self.assertRaises(KeyboardInterrupt):
         vm_util.IssueCommand(['sleep', '2s'], timeout=None)
     self.assertFalse(HaveSleepSubprocess())
 
+  def testInput(self):
+    stdout, _, retcode = vm_util.IssueCommand(['cat'], input='a' * 100000)
+    self.assertEqual(retcode, 0)
+    self.assertEqual(stdout, 'a' * 100000)
+
+  def testOutputCallbacks(self):
+    stdout_lines = []
+    stderr_lines = []
+    stdout, stderr, retcode = vm_util.IssueCommand(
+        ['sh', '-c', 'printf "1\\n2\\n3"; echo err >&2'],
+        stdout_callback=stdout_lines.append,
+        stderr_callback=stderr_lines.append)
+    self.assertEqual(retcode, 0)
+    self.assertEqual(stdout, '1\n2\n3')
+    self.assertEqual(stderr, 'err\n')
+    self.assertEqual(stdout_lines, ['1', '2', '3'])
+    self.assertEqual(stderr_lines, ['err'])
+
+  def testBackgroundChildHoldsPipesOpen(self):
+    start_time = time.time()
+    stdout, _, retcode = vm_util.IssueCommand(
+        ['sh', '-c', 'echo started; sleep 5 &'])
+    self.assertEqual(retcode, 0)
+    self.assertEqual(stdout, 'started\n')
+    self.assertLess(time.time() - start_time, 4)
+
+
+class StreamCommandTestCase(unittest.TestCase):
+
+  def testLinesAndExitCode(self):
+    output = list(vm_util.StreamCommand(
+        ['sh', '-c', 'echo a; echo b >&2; echo c; exit 3']))
+    self.assertEqual(output[-1], (vm_util.OUTPUT_EXIT_CODE, 3))
+    self.assertEqual(
+        [line for stream, line in output
+         if stream == vm_util.OUTPUT_STDOUT], ['a', 'c'])
+    self.assertIn((vm_util.OUTPUT_STDERR, 'b'), output)
+
+  def testTimeout(self):
+    output = list(vm_util.StreamCommand(['sleep', '2s'], timeout=1))
+    self.assertEqual(output, [(vm_util.OUTPUT_EXIT_CODE, -9)])
+
+  def testClosingGeneratorKillsCommand(self):
+    stream = vm_util.StreamCommand(['sh', '-c', 'echo ready; sleep 2s'])
+    self.assertEqual(next(stream), (vm_util.OUTPUT_STDOUT, 'ready'))
+    stream.close()
+    self.assertFalse(HaveSleepSubprocess())
+
+
+class RetryTestCase(unittest.TestCase):
+
+  def setUp(self):
+    self.mocked_flags = mock_flags.PatchTestCaseFlags(self)
+    self.mocked_flags.default_timeout = 1000
+    p = mock.patch(vm_util.__name__ + '.time.sleep')
+    self.mock_sleep = p.start()
+    self.addCleanup(p.stop)
+    self.spec = mock.Mock(retry_stats=retry_policy.RetryStats())
+    context.SetThreadBenchmarkSpec(self.spec)
+    self.addCleanup(context.SetThreadBenchmarkSpec, None)
+
+  def _FailingFunction(self, exceptions, **retry_kwargs):
+    exceptions = list(exceptions)
+
+    @vm_util.Retry(**retry_kwargs)
+    def Function():
+      if exceptions:
+        raise exceptions.pop(0)
+      return 'done'
+    return Function
+
+  def testFixedBackoff(self):
+    function = self._FailingFunction([ValueError()] * 3, poll_interval=10,
+                                     fuzz=0)
+    self.assertEqual('done', function())
+    self.assertEqual([mock.call(10)] * 3, self.mock_sleep.call_args_list)
+
+  def testExceptionPolicies(self):
+    policy = mock.Mock(**{'GetSleepTime.side_effect': [1, 2]})
+    function = self._FailingFunction(
+        [IOError(), ValueError(), IOError()], poll_interval=10, fuzz=0,
+        policies=((IOError, policy),))
+    self.assertEqual('done', function())
+    self.assertEqual([mock.call(1), mock.call(10), mock.call(2)],
+                     self.mock_sleep.call_args_list)
+    # Each policy backs off from its own previous sleep.
+    self.assertEqual([mock.call(None), mock.call(1)],
+                     policy.GetSleepTime.call_args_list)
+
+  def testStats(self):
+    self._FailingFunction([ValueError()] * 2, poll_interval=10, fuzz=0)()
+    function = self._FailingFunction([ValueError()] * 5, poll_interval=10,
+                                     fuzz=0, max_retries=1)
+    with self.assertRaises(ValueError):
+      function()
+    self._FailingFunction([], poll_interval=10)()
+    samples = {s.metric: s for s in self.spec.retry_stats.GenerateSamples()}
+    self.assertEqual(6, samples['Retry attempts'].value)
+    self.assertEqual(30, samples['Retry sleep time'].value)
+    self.assertEqual(1, samples['Retry give ups'].value)
+    self.assertEqual(3, samples['Retry attempts'].metadata['calls'])
+    self.assertEqual('vm_util_test.Function',
+                     samples['Retry attempts'].metadata['function'])
+
+  def testBudget(self):
+    self.mocked_flags.retry_budget_per_second = 1
+    self.mocked_flags.retry_budget_burst = 1
+    budget_names = []
+
+    def GetBudgetName(*args):
+      budget_names.append(args)
+      return 'cli'
+
+    with mock.patch(retry_policy.__name__ + '.time') as mock_time:
+      mock_time.time.return_value = 100
+      function = self._FailingFunction([ValueError()] * 3, poll_interval=10,
+                                       fuzz=0, budget=GetBudgetName)
+      function()
+    self.assertEqual([()], budget_names)
+    # The first retry uses up the burst, and each following retry waits a
+    # second for its token.
+    self.assertEqual([mock.call(1), mock.call(2)],
+                     mock_time.sleep.call_args_list)
+
+  def testThrottledCommand(self):
+    with mock.patch(vm_util.__name__ + '.IssueCommand',
+                    side_effect=[('', 'Error: RequestLimitExceeded', 255),
+                                 ('out', '', 0)]):
+      self.assertEqual(('out', ''), vm_util.IssueRetryableCommand(['aws']))
+    self.assertEqual(1, self.mock_sleep.call_count)
+    self.assertLessEqual(self.mock_sleep.call_args[0][0], 15)
+
+  def testRaiseIfThrottled(self):
+    vm_util.RaiseIfThrottled('Permission denied')
+    with self.assertRaises(errors.VmUtil.ThrottledCommandError):
+      vm_util.RaiseIfThrottled('ERROR: (gcloud.compute.instances.list) '
+                               'Rate Limit Exceeded')
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+# Copyright 2016 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Measures how long it takes to parse the output of YCSB clients.
+
+Generates synthetic YCSB output with many histogram buckets and compares
+ycsb.ParseResults with the csv and itertools.groupby based parser it replaced,
+checking that both return the same results. Also times parsing the outputs of
+several clients and building their latency sketches in the client threads
+(the default) and in parallel processes, as YCSBExecutor does with
+--ycsb_result_parse_processes.
+
+Run from the root of the repository:
+
+  python tools/ycsb_parser_benchmark.py --buckets=200000 --clients=4
+"""
+
+import argparse
+import collections
+import csv
+import io
+import itertools
+import operator
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from perfkitbenchmarker import flags  # noqa
+from perfkitbenchmarker.linux_packages import ycsb  # noqa
+
+_OPERATIONS = 'READ', 'UPDATE', 'INSERT', 'SCAN'
+
+
+def LegacyParseResults(ycsb_result_string, data_type='histogram'):
+  """The previous implementation of ycsb.ParseResults."""
+  lines = []
+  client_string = 'YCSB'
+  command_line = 'unknown'
+  fp = io.BytesIO(ycsb_result_string)
+  result_string = next(fp).strip()
+
+  def IsHeadOfResults(line):
+    return line.startswith('YCSB Client 0.') or line.startswith('[OVERALL]')
+
+  while not IsHeadOfResults(result_string):
+    result_string = next(fp).strip()
+
+  if result_string.startswith('YCSB Client 0.'):
+    client_string = result_string
+    command_line = next(fp).strip()
+  else:
+    lines.append(result_string)
+
+  def LineFilter(line):
+    return re.search(r'^\[[A-Z]+\]', line) is not None
+  lines = itertools.chain(lines, itertools.ifilter(LineFilter, fp))
+  by_operation = itertools.groupby(csv.reader(lines), operator.itemgetter(0))
+
+  result = collections.OrderedDict([
+      ('client', client_string),
+      ('command_line', command_line),
+      ('groups', collections.OrderedDict())])
+  for operation, lines in by_operation:
+    operation = operation[1:-1].lower()
+    if operation == 'cleanup':
+      continue
+    op_result = {'group': operation, data_type: [], 'statistics': {}}
+    for _, name, val in lines:
+      name = name.strip()
+      val = val.strip()
+      if name.startswith('>'):
+        name = name[1:]
+      val = float(val) if '.' in val else int(val)
+      if name.isdigit():
+        if val:
+          op_result[data_type].append((int(name), val))
+      else:
+        if '(us)' in name:
+          name = name.replace('(us)', '(ms)')
+          val /= 1000.0
+        op_result['statistics'][name] = val
+    result['groups'][operation] = op_result
+  return result
+
+
+def GenerateOutput(buckets, seed):
+  """Returns synthetic YCSB output with the given number of buckets per op."""
+  rand = random.Random(seed)
+  lines = ['Loading workload...', 'Starting test.',
+           '[OVERALL], RunTime(ms), 1800413.0',
+           '[OVERALL], Throughput(ops/sec), 2740.503428935472']
+  for operation in _OPERATIONS:
+    lines.extend([
+        '[%s], Operations, %d' % (operation, buckets * 10),
+        '[%s], AverageLatency(us), 2218.8513395574005' % operation,
+        '[%s], MinLatency(us), 554' % operation,
+        '[%s], MaxLatency(us), 352634' % operation,
+        '[%s], Return=OK, %d' % (operation, buckets * 10)])
+    lines.extend('[%s], %d, %d' % (operation, i, rand.randint(0, 20))
+                 for i in xrange(buckets))
+    lines.append('[%s], >%d, 3' % (operation, buckets))
+  lines.append('[CLEANUP], Operations, 1')
+  return '\n'.join(lines) + '\n'
+
+
+def Time(function, repetitions):
+  """Returns the best wall time of calling function, and its return value."""
+  best = None
+  for _ in xrange(repetitions):
+    start = time.time()
+    value = function()
+    elapsed = time.time() - start
+    best = elapsed if best is None else min(best, elapsed)
+  return best, value
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--buckets', type=int, default=100000,
+                      help='Histogram buckets per operation.')
+  parser.add_argument('--clients', type=int, default=4,
+                      help='Number of client outputs to parse.')
+  parser.add_argument('--processes', type=int, default=4,
+                      help='Processes used to parse the client outputs.')
+  parser.add_argument('--repetitions', type=int, default=3)
+  args = parser.parse_args()
+  flags.FLAGS([sys.argv[0],
+               '--ycsb_result_parse_processes=%d' % args.processes])
+
+  outputs = [GenerateOutput(args.buckets, seed)
+             for seed in xrange(args.clients)]
+  print('%d outputs of %.1f MB each' % (
+      len(outputs), len(outputs[0]) / float(1 << 20)))
+
+  legacy_time, legacy_results = Time(
+      lambda: [LegacyParseResults(o) for o in outputs], args.repetitions)
+  parse_time, results = Time(
+      lambda: [ycsb.ParseResults(o) for o in outputs], args.repetitions)
+  if results != legacy_results:
+    sys.exit('ycsb.ParseResults and the legacy parser disagree.')
+  serial_time, serial_results = Time(
+      lambda: [ycsb._ParseOutput(o) for o in outputs], args.repetitions)
+  parallel_time, results = Time(lambda: ycsb._ParseOutputs(outputs),
+                                args.repetitions)
+  for serial_result, result in zip(serial_results, results):
+    for name, group in result['groups'].iteritems():
+      if group['histogram'] != serial_result['groups'][name]['histogram']:
+        sys.exit('Parsing in parallel processes returned different results.')
+
+  print('legacy parser:                %8.3f s' % legacy_time)
+  print('ycsb.ParseResults:            %8.3f s (%.1fx)' % (
+      parse_time, legacy_time / parse_time))
+  print('parse and sketch, serially:   %8.3f s' % serial_time)
+  print('parse and sketch, %2d procs:   %8.3f s (%.1fx)' % (
+      args.processes, parallel_time, serial_time / parallel_time))
+
+if __name__ == '__main__':
+  main()